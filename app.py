@@ -142,6 +142,15 @@ cache.init_app(app)
 from tasks import init_celery
 celery = init_celery(app)
 
+# 채팅 부수 쓰기(write-behind) 큐 초기화
+from services.write_behind import write_behind
+write_behind.init_app(app)
+
+# 부하 테스트용 요청별 DB 쿼리 수 헤더 (loadtest_chat.py가 수집)
+if os.environ.get("DB_QUERY_STATS") == "1":
+    from services.query_stats import init_query_stats
+    init_query_stats(app)
+
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -186,6 +195,18 @@ with app.app_context():
         ensure_column("persona_definition", "restrict_xai", "restrict_xai BOOLEAN DEFAULT FALSE")
         ensure_column("persona_definition", "model_xai", "model_xai VARCHAR(100) DEFAULT 'grok-4-1-fast-reasoning'")
         ensure_column("persona_definition", "sort_order", "sort_order INTEGER DEFAULT 0")
+        ensure_column("persona_definition", "history_token_budget", "history_token_budget INTEGER DEFAULT 6000")
+        ensure_column("chat_session", "summary", "summary TEXT")
+        ensure_column("chat_session", "summary_upto_message_id", "summary_upto_message_id INTEGER")
+        ensure_column("chat_session", "summary_tokens", "summary_tokens INTEGER DEFAULT 0")
+        ensure_column("chat_session", "summary_upto_timestamp", "summary_upto_timestamp TIMESTAMP")
+        ensure_column("message", "write_key", "write_key VARCHAR(32)")
+        ensure_column("persona_definition", "semantic_cache_enabled", "semantic_cache_enabled BOOLEAN DEFAULT FALSE")
+        ensure_column("persona_definition", "semantic_cache_threshold", "semantic_cache_threshold FLOAT DEFAULT 0.95")
+        ensure_column("persona_definition", "rag_search_quality", "rag_search_quality VARCHAR(10) DEFAULT 'balanced'")
+        ensure_column("document_chunk", "knowledge_base_id", "knowledge_base_id INTEGER")
+        ensure_column("document_chunk", "persona_id", "persona_id INTEGER")
+        ensure_column("document_chunk", "is_searchable", "is_searchable BOOLEAN NOT NULL DEFAULT FALSE")
 
         # 새 컬럼 기본값 보정(기존 레코드).
         with db.engine.begin() as conn:
@@ -201,6 +222,37 @@ with app.app_context():
             conn.execute(text("UPDATE persona_definition SET model_xai='grok-4-1-fast-reasoning' WHERE model_xai IS NULL"))
             # sort_order가 0인 기존 레코드를 id 순서로 초기화
             conn.execute(text("UPDATE persona_definition SET sort_order=id WHERE sort_order=0 OR sort_order IS NULL"))
+            conn.execute(text("UPDATE persona_definition SET history_token_budget=6000 WHERE history_token_budget IS NULL"))
+            # 대화 이력 윈도우 조회용 복합 인덱스 (기존 테이블에는 create_all이 인덱스를 추가하지 않음)
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_message_session_timestamp "
+                "ON message (session_id, timestamp, id)"
+            ))
+            conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_message_write_key ON message (write_key)"
+            ))
+            # 비정규화 검색 필터 컬럼 채우기 (migrations/010_chunk_filters.sql과 같은 조건)
+            conn.execute(text("""
+                UPDATE document_chunk SET
+                    knowledge_base_id = (SELECT kd.knowledge_base_id FROM knowledge_document kd
+                                         WHERE kd.id = document_chunk.document_id),
+                    persona_id = (SELECT pkb.persona_id FROM knowledge_document kd
+                                  JOIN persona_knowledge_base pkb ON kd.knowledge_base_id = pkb.id
+                                  WHERE kd.id = document_chunk.document_id),
+                    is_searchable = COALESCE((SELECT pkb.is_active AND kd.processing_status = 'completed'
+                                              FROM knowledge_document kd
+                                              JOIN persona_knowledge_base pkb ON kd.knowledge_base_id = pkb.id
+                                              WHERE kd.id = document_chunk.document_id), FALSE)
+                WHERE persona_id IS NULL
+            """))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_document_chunk_persona_searchable "
+                "ON document_chunk (persona_id, is_searchable)"
+            ))
+            # 하이브리드 검색용 청크 본문 키워드 색인 (PostgreSQL은 migrations/011_lexical_search.sql)
+            if db.engine.dialect.name == "sqlite":
+                from services.lexical_search import ensure_sqlite_fts
+                ensure_sqlite_fts(conn)
             # ai_illustrator, general 외 나머지 기본 페르소나의 is_system 해제
             conn.execute(text(
                 "UPDATE persona_definition SET is_system=FALSE "
@@ -215,6 +267,10 @@ with app.app_context():
             key = f"provider_status_{provider}"
             if not SystemConfig.query.filter_by(key=key).first():
                 db.session.add(SystemConfig(key=key, value="active"))
+            # 공급사별 동시 호출 한도 (0 = 무제한, 관리자 API로 조정)
+            key = f"provider_concurrency_{provider}"
+            if not SystemConfig.query.filter_by(key=key).first():
+                db.session.add(SystemConfig(key=key, value=os.environ.get("LLM_CONCURRENCY_DEFAULT", "0")))
 
         # 페르소나별 모델/토큰 기본값 시딩
         for role_key in AI_PERSONAS.keys():
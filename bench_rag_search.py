@@ -0,0 +1,278 @@
+"""
+RAG Soft Top-K 검색 벤치마크: 기존 2회 쿼리 vs 단일 쿼리
+
+pgvector가 설치된 PostgreSQL에 별도 스키마(rag_bench)를 만들고 청크 수를 늘려 가며
+services/rag_service.py의 _SOFT_TOPK_SQL(거리 1회 계산, 한 번 정렬, Python에서 threshold/min_k 적용)과
+이전 방식(threshold 조건 쿼리 → min_k 미만이면 threshold 없는 전체 재검색, 행마다 거리 3회 계산)을 비교합니다.
+운영 테이블은 건드리지 않으며, search_path만 바꿔 같은 SQL을 실행합니다.
+
+사용법 (앱과 같은 DB_HOST/DB_USER/DB_PASS/DB_NAME 환경 변수 또는 --dsn):
+    python bench_rag_search.py                                  # 기본: 10k,100k,1M 청크, 인덱스 없음
+    python bench_rag_search.py --sizes 10000,100000 --index hnsw --queries 100
+    python bench_rag_search.py --drop                           # 벤치 스키마 삭제
+
+주의: 1536차원 1M 청크는 벡터만 약 6GB입니다. 작은 환경에서는 --dim 256 등으로 줄여 실행하세요.
+
+출력: 청크 수별 쿼리 방식의 평균/p50/p95(ms)와, 이전 방식에서 재검색이 일어난 비율
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+SCHEMA = "rag_bench"
+_CHUNKS_PER_DOCUMENT = 100
+_CLUSTERS = 512
+
+# 이전 구현 (행마다 <=> 3회, min_k 미만이면 threshold 없이 전체 재검색)
+_LEGACY_THRESHOLD_SQL = """
+    SELECT dc.content, kd.filename, dc.chunk_metadata,
+           1 - (dc.embedding <=> CAST(:query_embedding AS vector)) AS similarity
+    FROM document_chunk dc
+    JOIN knowledge_document kd ON dc.document_id = kd.id
+    JOIN persona_knowledge_base pkb ON kd.knowledge_base_id = pkb.id
+    WHERE pkb.persona_id = :persona_id
+      AND pkb.is_active = TRUE
+      AND kd.processing_status = 'completed'
+      AND 1 - (dc.embedding <=> CAST(:query_embedding AS vector)) >= :threshold
+    ORDER BY dc.embedding <=> CAST(:query_embedding AS vector)
+    LIMIT :limit
+"""
+_LEGACY_FALLBACK_SQL = """
+    SELECT dc.content, kd.filename, dc.chunk_metadata,
+           1 - (dc.embedding <=> CAST(:query_embedding AS vector)) AS similarity
+    FROM document_chunk dc
+    JOIN knowledge_document kd ON dc.document_id = kd.id
+    JOIN persona_knowledge_base pkb ON kd.knowledge_base_id = pkb.id
+    WHERE pkb.persona_id = :persona_id
+      AND pkb.is_active = TRUE
+      AND kd.processing_status = 'completed'
+    ORDER BY dc.embedding <=> CAST(:query_embedding AS vector)
+    LIMIT :limit
+"""
+
+
+def _dsn(args):
+    if args.dsn:
+        return args.dsn
+    host, user, password, name = (os.environ.get(k) for k in ("DB_HOST", "DB_USER", "DB_PASS", "DB_NAME"))
+    if not (host and user and password and name):
+        sys.exit("PostgreSQL 접속 정보가 없습니다. --dsn 또는 DB_HOST/DB_USER/DB_PASS/DB_NAME을 지정하세요.")
+    return f"postgresql://{user}:{password}@{host}:5432/{name}"
+
+
+# ----------------------------------------------------------------------
+# 데이터 준비
+# ----------------------------------------------------------------------
+
+def create_schema(conn, dim):
+    conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS vector")
+    conn.exec_driver_sql(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}")
+    conn.exec_driver_sql(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.persona_knowledge_base (
+            id INTEGER PRIMARY KEY, persona_id INTEGER NOT NULL, is_active BOOLEAN DEFAULT TRUE
+        )""")
+    conn.exec_driver_sql(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.knowledge_document (
+            id INTEGER PRIMARY KEY, knowledge_base_id INTEGER NOT NULL,
+            filename VARCHAR(255), processing_status VARCHAR(20)
+        )""")
+    conn.exec_driver_sql(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.document_chunk (
+            id SERIAL PRIMARY KEY, document_id INTEGER NOT NULL, chunk_index INTEGER NOT NULL,
+            content TEXT NOT NULL, chunk_metadata JSON, embedding vector({dim})
+        )""")
+    # 운영 검색 SQL이 쓰는 비정규화 필터 컬럼 (벤치 데이터는 모두 페르소나 1의 처리 완료 청크)
+    conn.exec_driver_sql(f"""
+        ALTER TABLE {SCHEMA}.document_chunk
+          ADD COLUMN IF NOT EXISTS persona_id INTEGER NOT NULL DEFAULT 1,
+          ADD COLUMN IF NOT EXISTS is_searchable BOOLEAN NOT NULL DEFAULT TRUE""")
+    conn.exec_driver_sql(
+        f"CREATE INDEX IF NOT EXISTS ix_bench_chunk_document ON {SCHEMA}.document_chunk (document_id)"
+    )
+    conn.exec_driver_sql(
+        f"INSERT INTO {SCHEMA}.persona_knowledge_base (id, persona_id) VALUES (1, 1) ON CONFLICT DO NOTHING"
+    )
+
+
+def _centroids(dim, seed):
+    rng = np.random.default_rng(seed)
+    c = rng.normal(size=(_CLUSTERS, dim)).astype(np.float32)
+    return c / np.linalg.norm(c, axis=1, keepdims=True)
+
+
+def _sample(centroids, n, rng, noise):
+    """군집 중심 주변 벡터 (실제 문서처럼 유사도 분포가 고르지 않도록)"""
+    picks = centroids[rng.integers(0, len(centroids), size=n)]
+    v = picks + rng.normal(scale=noise, size=picks.shape).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def seed_chunks(engine, target, centroids, rng, batch=20000):
+    """청크 수를 target까지 채움 (COPY 사용, 문서당 100청크)"""
+    with engine.begin() as conn:
+        current = conn.exec_driver_sql(f"SELECT COUNT(*) FROM {SCHEMA}.document_chunk").scalar()
+    if current >= target:
+        return current
+
+    started = time.monotonic()
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        while current < target:
+            n = min(batch, target - current)
+            first_doc = current // _CHUNKS_PER_DOCUMENT
+            last_doc = (current + n - 1) // _CHUNKS_PER_DOCUMENT
+            docs = io.StringIO("".join(
+                f"{d}\t1\tdoc_{d}.pdf\tcompleted\n" for d in range(first_doc, last_doc + 1)
+            ))
+            cur.execute(f"DELETE FROM {SCHEMA}.knowledge_document WHERE id BETWEEN %s AND %s", (first_doc, last_doc))
+            cur.copy_expert(f"COPY {SCHEMA}.knowledge_document (id, knowledge_base_id, filename, processing_status) FROM STDIN", docs)
+
+            vectors = _sample(centroids, n, rng, noise=0.35)
+            buf = io.StringIO()
+            for i, vec in enumerate(vectors, start=current):
+                buf.write(f"{i // _CHUNKS_PER_DOCUMENT}\t{i % _CHUNKS_PER_DOCUMENT}\tchunk {i}\t{{}}\t[")
+                buf.write(",".join(f"{x:.6f}" for x in vec))
+                buf.write("]\n")
+            buf.seek(0)
+            cur.copy_expert(
+                f"COPY {SCHEMA}.document_chunk (document_id, chunk_index, content, chunk_metadata, embedding) FROM STDIN",
+                buf,
+            )
+            raw.commit()
+            current += n
+            print(f"  … {current:,} / {target:,} 청크", end="\r", flush=True)
+        cur.execute(f"ANALYZE {SCHEMA}.document_chunk")
+        raw.commit()
+    finally:
+        raw.close()
+    print(f"  {target:,} 청크 준비 완료 ({time.monotonic() - started:.0f}s)      ")
+    return current
+
+
+def build_index(engine, kind):
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"DROP INDEX IF EXISTS {SCHEMA}.ix_bench_chunk_embedding")
+        if kind == "none":
+            return
+        started = time.monotonic()
+        if kind == "hnsw":
+            conn.exec_driver_sql(
+                f"CREATE INDEX ix_bench_chunk_embedding ON {SCHEMA}.document_chunk "
+                "USING hnsw (embedding vector_cosine_ops)"
+            )
+        else:
+            rows = conn.exec_driver_sql(f"SELECT COUNT(*) FROM {SCHEMA}.document_chunk").scalar()
+            lists = max(10, int(rows ** 0.5))
+            conn.exec_driver_sql(
+                f"CREATE INDEX ix_bench_chunk_embedding ON {SCHEMA}.document_chunk "
+                f"USING ivfflat (embedding vector_cosine_ops) WITH (lists = {lists})"
+            )
+        print(f"  {kind} 인덱스 생성 {time.monotonic() - started:.0f}s")
+
+
+# ----------------------------------------------------------------------
+# 측정
+# ----------------------------------------------------------------------
+
+def _percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def run_queries(engine, queries, args):
+    from sqlalchemy import text
+    from services.rag_service import _SOFT_TOPK_SQL, select_soft_topk
+
+    legacy_sql, fallback_sql, single_sql = text(_LEGACY_THRESHOLD_SQL), text(_LEGACY_FALLBACK_SQL), text(_SOFT_TOPK_SQL)
+    timings = {"legacy": [], "single": []}
+    fallbacks = 0
+    with engine.connect() as conn:
+        conn.exec_driver_sql(f"SET search_path TO {SCHEMA}, public")
+        if args.index == "hnsw":
+            conn.exec_driver_sql(f"SET hnsw.ef_search = {max(40, args.max_k * 4)}")
+        for q in queries:
+            params = {"query_embedding": q.tolist(), "persona_id": 1}
+
+            started = time.perf_counter()
+            rows = conn.execute(legacy_sql, {**params, "threshold": args.threshold, "limit": args.max_k}).fetchall()
+            if len(rows) < args.min_k:
+                fallbacks += 1
+                rows = conn.execute(fallback_sql, {**params, "limit": args.min_k}).fetchall()
+            timings["legacy"].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            ranked = [
+                {"content": r[0], "filename": r[1], "metadata": r[2], "similarity": 1 - float(r[3])}
+                for r in conn.execute(single_sql, {**params, "limit": max(args.min_k, args.max_k)})
+            ]
+            docs = select_soft_topk(ranked, args.min_k, args.max_k, args.threshold)
+            timings["single"].append(time.perf_counter() - started)
+
+            if args.index == "none" and [d["content"] for d in docs] != [r[0] for r in rows]:
+                print("  ⚠️ 결과 불일치:", [d["content"] for d in docs], [r[0] for r in rows])
+    return timings, fallbacks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", help="PostgreSQL URL (기본: DB_* 환경 변수)")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="쉼표로 구분한 청크 수 (오름차순으로 누적 생성)")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--index", choices=("none", "hnsw", "ivfflat"), default="none")
+    parser.add_argument("--queries", type=int, default=50, help="청크 수별 질의 수")
+    parser.add_argument("--min-k", type=int, default=3)
+    parser.add_argument("--max-k", type=int, default=7)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--drop", action="store_true", help="벤치 스키마 삭제 후 종료")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from sqlalchemy import create_engine
+
+    engine = create_engine(_dsn(args))
+    if args.drop:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        print(f"{SCHEMA} 스키마 삭제 완료")
+        return
+
+    with engine.begin() as conn:
+        create_schema(conn, args.dim)
+
+    rng = np.random.default_rng(args.seed)
+    centroids = _centroids(args.dim, args.seed)
+    # 절반은 데이터와 같은 군집 근처(threshold 통과), 절반은 먼 질의(재검색 유발)
+    queries = np.concatenate([
+        _sample(centroids, args.queries - args.queries // 2, rng, noise=0.3),
+        _sample(_centroids(args.dim, args.seed + 1), args.queries // 2, rng, noise=0.3),
+    ])
+
+    results = []
+    for size in sorted(int(s) for s in args.sizes.split(",")):
+        print(f"[{size:,} 청크]")
+        seed_chunks(engine, size, centroids, rng)
+        build_index(engine, args.index)
+        run_queries(engine, queries[:3], args)  # 워밍업 (버퍼 캐시)
+        timings, fallbacks = run_queries(engine, queries, args)
+        results.append((size, timings, fallbacks))
+
+    print(f"\n=== Soft Top-K (min_k={args.min_k}, max_k={args.max_k}, threshold={args.threshold}, "
+          f"dim={args.dim}, index={args.index}) ===")
+    print(f"{'chunks':>10} {'query':<8} {'mean':>9} {'p50':>9} {'p95':>9}  재검색")
+    for size, timings, fallbacks in results:
+        for name, values in timings.items():
+            ms = [v * 1000 for v in values]
+            extra = f"{fallbacks}/{len(values)}" if name == "legacy" else ""
+            print(f"{size:>10,} {name:<8} {sum(ms) / len(ms):>9.1f} {_percentile(ms, 50):>9.1f} "
+                  f"{_percentile(ms, 95):>9.1f}  {extra}")
+
+
+if __name__ == "__main__":
+    main()
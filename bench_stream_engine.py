@@ -0,0 +1,160 @@
+"""
+스트리밍 엔진 벤치마크: 동기(gevent) 경로 vs asyncio 엔진
+
+로컬 모의 공급사(services/mock_provider.py)를 띄우고, 워커 프로세스 하나에서 동시 스트림 수를 늘려 가며
+ai_service.generate_ai_response_stream을 소비합니다. 엔진별로 별도 프로세스에서 실행하므로
+gevent monkey patch 상태가 섞이지 않으며, 실제 라우트와 같이 소비자는 그린렛(gevent 미설치 시 스레드)입니다.
+
+사용법:
+    python bench_stream_engine.py                       # 기본: 동시 50,200,500 스트림
+    python bench_stream_engine.py -c 100,1000 --tokens 200 --interval-ms 20
+
+출력: 엔진·동시 수별 완료 수, 소요 시간, TTFT p50/p95, 초당 청크 수, 최대 RSS
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+
+# ----------------------------------------------------------------------
+# 가짜 공급사 (services.mock_provider, OpenAI chat.completions 스트리밍 호환)
+# ----------------------------------------------------------------------
+
+def serve(port, tokens, interval):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from services.mock_provider import MockConfig, MockProviderServer
+
+    config = MockConfig(
+        ttft_ms=interval * 1000, ttft_jitter_ms=0, tokens=tokens,
+        tokens_per_sec=1.0 / interval if interval else 0, error_rate=0, rate_limit_rate=0, drop_rate=0,
+    )
+    asyncio.run(MockProviderServer(config).serve("127.0.0.1", port))
+
+
+# ----------------------------------------------------------------------
+# 워커 (엔진 하나, 동시 수 하나)
+# ----------------------------------------------------------------------
+
+def run_worker(engine, concurrency, base_url):
+    try:
+        import gevent.monkey
+        gevent.monkey.patch_all()
+    except ImportError:
+        pass
+    import resource
+    import threading
+
+    os.environ["LLM_STREAM_ENGINE"] = engine
+    os.environ["MOCK_LLM_URL"] = base_url
+    os.environ.setdefault("HTTP_MAX_CONNECTIONS", str(concurrency))
+    os.environ.setdefault("HTTP_MAX_KEEPALIVE", str(concurrency))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from services.ai_service import generate_ai_response_stream
+
+    ttfts, chunks, errors = [], [0], [0]
+
+    def consume():
+        started = time.monotonic()
+        first = None
+        try:
+            for text in generate_ai_response_stream(
+                "mock-llm", "bench", [{"role": "user", "content": "hi"}], 256, "",
+                raise_errors=True,
+            ):
+                if first is None:
+                    first = time.monotonic() - started
+                chunks[0] += 1
+            ttfts.append(first or 0.0)
+        except Exception:
+            errors[0] += 1
+
+    workers = [threading.Thread(target=consume) for _ in range(concurrency)]
+    started = time.monotonic()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.monotonic() - started
+
+    ttfts.sort()
+
+    def pct(p):
+        return round(ttfts[min(len(ttfts) - 1, int(len(ttfts) * p))] * 1000, 1) if ttfts else None
+
+    print(json.dumps({
+        "engine": engine,
+        "concurrency": concurrency,
+        "completed": len(ttfts),
+        "errors": errors[0],
+        "elapsed_s": round(elapsed, 2),
+        "ttft_p50_ms": pct(0.5),
+        "ttft_p95_ms": pct(0.95),
+        "chunks_per_s": round(chunks[0] / elapsed, 1) if elapsed else None,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }))
+
+
+# ----------------------------------------------------------------------
+# 드라이버
+# ----------------------------------------------------------------------
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-c", "--concurrency", default="50,200,500", help="쉼표로 구분한 동시 스트림 수")
+    parser.add_argument("--engines", default="sync,asyncio")
+    parser.add_argument("--tokens", type=int, default=100, help="스트림당 청크 수")
+    parser.add_argument("--interval-ms", type=float, default=20, help="청크 간격(ms)")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.tokens, args.interval_ms / 1000.0)
+        return
+    if args.worker:
+        run_worker(args.worker, int(args.concurrency), args.url)
+        return
+
+    port = _free_port()
+    server = subprocess.Popen([
+        sys.executable, __file__, "--serve", str(port),
+        "--tokens", str(args.tokens), "--interval-ms", str(args.interval_ms),
+    ])
+    try:
+        time.sleep(1.0)
+        url = f"http://127.0.0.1:{port}/v1"
+        print(f"{'engine':<8} {'conc':>6} {'done':>6} {'err':>5} {'time(s)':>8} "
+              f"{'ttft50':>8} {'ttft95':>8} {'chunk/s':>9} {'rss(MB)':>8}")
+        for concurrency in [int(c) for c in args.concurrency.split(",")]:
+            for engine in args.engines.split(","):
+                out = subprocess.run(
+                    [sys.executable, __file__, "--worker", engine, "-c", str(concurrency), "--url", url],
+                    capture_output=True, text=True,
+                )
+                lines = [l for l in out.stdout.splitlines() if l.startswith("{")]
+                if not lines:
+                    print(f"{engine:<8} {concurrency:>6} 실패: {out.stderr.strip()[-300:]}")
+                    continue
+                r = json.loads(lines[-1])
+                print(f"{r['engine']:<8} {r['concurrency']:>6} {r['completed']:>6} {r['errors']:>5} "
+                      f"{r['elapsed_s']:>8} {r['ttft_p50_ms']!s:>8} {r['ttft_p95_ms']!s:>8} "
+                      f"{r['chunks_per_s']!s:>9} {r['max_rss_mb']:>8}")
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+/chat 파이프라인 부하 테스트 (오프라인 모의 공급사 사용)
+
+동시 학생 N명이 각각 로그인 → /chat SSE 스트리밍 → /api/get_session 흐름을 반복하며
+TTFT(첫 청크까지), 전체 응답 시간, 세션 조회 시간의 p50/p95/p99와 요청별 DB 쿼리 수를 보고합니다.
+
+준비:
+    1) 모의 공급사 실행
+         python -m services.mock_provider --port 8090 --ttft-ms 400 --tokens-per-sec 60
+    2) 서버 실행 (모의 공급사 등록 + 쿼리 수 헤더)
+         MOCK_LLM_URL=http://127.0.0.1:8090/v1 DB_QUERY_STATS=1 gunicorn --worker-class gevent ... app:app
+    3) 테스트 학생 계정 생성 (서버와 같은 DB 설정으로 실행)
+         python loadtest_chat.py seed --users 100 --password loadtest
+
+실행:
+    python loadtest_chat.py run --base-url http://127.0.0.1:8080 --users 100 --turns 3 --persona general
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+LOADTEST_USER_PREFIX = "loadtest_student_"
+QUERY_COUNT_HEADER = "X-DB-Query-Count"
+
+_QUESTIONS = (
+    "광합성 과정을 단계별로 설명해 주세요.",
+    "이차방정식 근의 공식은 어떻게 유도하나요?",
+    "임진왜란이 일어난 배경을 알려주세요.",
+    "파이썬에서 리스트와 튜플의 차이는 무엇인가요?",
+    "뉴턴의 운동 제2법칙을 예시와 함께 설명해 주세요.",
+)
+
+
+# ----------------------------------------------------------------------
+# 계정 준비
+# ----------------------------------------------------------------------
+
+def seed_users(count, password):
+    """승인된 테스트 학생 계정을 만든다 (이미 있으면 비밀번호만 갱신)"""
+    from app import app
+    from extensions import db
+    from models import User
+
+    with app.app_context():
+        for i in range(count):
+            username = f"{LOADTEST_USER_PREFIX}{i}"
+            user = User.query.filter_by(username=username).first()
+            if user is None:
+                user = User(username=username, role="user", is_approved=True)
+                db.session.add(user)
+            user.set_password(password)
+            user.is_approved = True
+        db.session.commit()
+    print(f"✅ 테스트 계정 {count}개 준비 완료 ({LOADTEST_USER_PREFIX}0 ~ {LOADTEST_USER_PREFIX}{count - 1})")
+
+
+# ----------------------------------------------------------------------
+# 학생 시나리오
+# ----------------------------------------------------------------------
+
+class Results:
+    def __init__(self):
+        self.latencies = {"ttft": [], "chat_total": [], "get_session": [], "login": []}
+        self.queries = {"login": [], "chat": [], "get_session": []}
+        self.errors = {}
+        self.turns = 0
+
+    def error(self, stage, detail):
+        key = f"{stage}: {detail}"[:120]
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+    def record_queries(self, endpoint, response):
+        value = response.headers.get(QUERY_COUNT_HEADER)
+        if value is not None:
+            self.queries[endpoint].append(int(value))
+
+
+async def _chat_turn(client, args, results, session_id):
+    payload = {
+        "model": args.persona,
+        "provider": args.provider,
+        "message": random.choice(_QUESTIONS),
+    }
+    if session_id:
+        payload["session_id"] = session_id
+
+    started = time.monotonic()
+    first_chunk_at = None
+    done = False
+    async with client.stream("POST", "/chat", json=payload) as response:
+        results.record_queries("chat", response)
+        if response.status_code != 200:
+            results.error("chat", f"HTTP {response.status_code}")
+            return session_id
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[6:])
+            if event.get("session_id"):
+                session_id = event["session_id"]
+            if "chunk" in event and first_chunk_at is None:
+                first_chunk_at = time.monotonic()
+            if event.get("error"):
+                results.error("chat", event["error"])
+                return session_id
+            if event.get("done"):
+                done = True
+                break
+
+    if done and first_chunk_at is not None:
+        results.latencies["ttft"].append(first_chunk_at - started)
+        results.latencies["chat_total"].append(time.monotonic() - started)
+        results.turns += 1
+    elif not done:
+        results.error("chat", "스트림이 done 없이 종료됨")
+    return session_id
+
+
+async def run_student(index, args, results):
+    import httpx
+
+    username = f"{LOADTEST_USER_PREFIX}{index}"
+    timeout = httpx.Timeout(args.timeout, connect=10)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=timeout) as client:
+        started = time.monotonic()
+        response = await client.post("/login", data={"username": username, "password": args.password})
+        results.record_queries("login", response)
+        if response.status_code not in (302, 303) or "login" in response.headers.get("location", ""):
+            results.error("login", f"HTTP {response.status_code}")
+            return
+        results.latencies["login"].append(time.monotonic() - started)
+
+        session_id = None
+        for _ in range(args.turns):
+            try:
+                session_id = await _chat_turn(client, args, results, session_id)
+            except httpx.HTTPError as e:
+                results.error("chat", type(e).__name__)
+                continue
+            if not session_id:
+                continue
+            started = time.monotonic()
+            response = await client.get(f"/api/get_session/{session_id}")
+            results.record_queries("get_session", response)
+            if response.status_code != 200:
+                results.error("get_session", f"HTTP {response.status_code}")
+                continue
+            results.latencies["get_session"].append(time.monotonic() - started)
+            if args.think_time:
+                await asyncio.sleep(random.uniform(0, args.think_time))
+
+
+# ----------------------------------------------------------------------
+# 보고
+# ----------------------------------------------------------------------
+
+def _percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def report(results, elapsed, args):
+    print(f"\n=== /chat 부하 테스트: 학생 {args.users}명 × {args.turns}턴, 소요 {elapsed:.1f}s ===")
+    print(f"완료 턴: {results.turns}  ({results.turns / elapsed:.2f} turns/s)")
+    print(f"\n{'지표(ms)':<14} {'count':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for name in ("login", "ttft", "chat_total", "get_session"):
+        values = results.latencies[name]
+        cells = [_percentile(values, p) for p in (50, 95, 99, 100)]
+        print(f"{name:<14} {len(values):>7} " + " ".join(
+            f"{v * 1000:>9.1f}" if v is not None else f"{'-':>9}" for v in cells
+        ))
+    print(f"\n{'DB 쿼리/요청':<14} {'count':>7} {'mean':>9} {'p95':>9} {'max':>9}")
+    for name, values in results.queries.items():
+        if not values:
+            print(f"{name:<14} {0:>7}   (X-DB-Query-Count 헤더 없음 — 서버에 DB_QUERY_STATS=1 필요)")
+            continue
+        print(f"{name:<14} {len(values):>7} {sum(values) / len(values):>9.1f} "
+              f"{_percentile(values, 95):>9} {max(values):>9}")
+    if results.errors:
+        print("\n오류:")
+        for key, count in sorted(results.errors.items(), key=lambda kv: -kv[1]):
+            print(f"  {count:>5}  {key}")
+
+
+async def run(args):
+    results = Results()
+
+    async def ramped(index):
+        await asyncio.sleep(args.ramp_up * index / max(args.users, 1))
+        await run_student(index, args, results)
+
+    started = time.monotonic()
+    await asyncio.gather(*(ramped(i) for i in range(args.users)))
+    report(results, time.monotonic() - started, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    seed = sub.add_parser("seed", help="테스트 학생 계정 생성")
+    seed.add_argument("--users", type=int, default=100)
+    seed.add_argument("--password", default="loadtest")
+
+    run_parser = sub.add_parser("run", help="부하 테스트 실행")
+    run_parser.add_argument("--base-url", default="http://127.0.0.1:8080")
+    run_parser.add_argument("--users", type=int, default=50, help="동시 학생 수")
+    run_parser.add_argument("--turns", type=int, default=3, help="학생당 질문 수")
+    run_parser.add_argument("--persona", default="general", help="페르소나 role_key")
+    run_parser.add_argument("--provider", default="mock", help="공급사 (기본: 모의 공급사)")
+    run_parser.add_argument("--password", default="loadtest")
+    run_parser.add_argument("--ramp-up", type=float, default=5.0, help="전체 학생이 시작하기까지의 시간(초)")
+    run_parser.add_argument("--think-time", type=float, default=0.0, help="턴 사이 최대 대기(초)")
+    run_parser.add_argument("--timeout", type=float, default=180.0)
+    run_parser.add_argument("--seed", type=int)
+
+    args = parser.parse_args()
+    if args.command == "seed":
+        seed_users(args.users, args.password)
+        return
+    random.seed(args.seed)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+-- Migration 004: 토큰 예산 기반 대화 이력 윈도우
+-- 페르소나별 대화 이력 토큰 예산 + 최신 메시지 keyset 조회용 복합 인덱스
+ALTER TABLE persona_definition
+  ADD COLUMN IF NOT EXISTS history_token_budget INTEGER DEFAULT 6000;
+
+-- (session_id, timestamp DESC) 역순 조회 + LIMIT 페이지네이션
+CREATE INDEX IF NOT EXISTS idx_message_session_timestamp ON message (session_id, timestamp, id);
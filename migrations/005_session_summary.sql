@@ -0,0 +1,6 @@
+-- Migration 005: 채팅 세션 롤링 요약
+-- 긴 세션은 오래된 대화를 요약으로 접고, 요약 이후 메시지만 원문으로 전송한다.
+ALTER TABLE chat_session
+  ADD COLUMN IF NOT EXISTS summary TEXT,
+  ADD COLUMN IF NOT EXISTS summary_upto_message_id INTEGER,
+  ADD COLUMN IF NOT EXISTS summary_tokens INTEGER DEFAULT 0;
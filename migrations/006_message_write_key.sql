@@ -0,0 +1,6 @@
+-- Migration 006: write-behind 메시지 저장 중복 방지 키
+-- 배치 커밋 실패 후 재전송된 메시지가 두 번 저장되지 않도록 적재 시점에 발급한 키를 기록한다.
+ALTER TABLE message
+  ADD COLUMN IF NOT EXISTS write_key VARCHAR(32);
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_message_write_key ON message (write_key);
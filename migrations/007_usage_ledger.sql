@@ -0,0 +1,39 @@
+-- Migration 007: 토큰 사용량 원장과 일별 집계
+-- 공급사 응답의 usage 블록을 호출마다 기록하고, 사용자 × 페르소나 × 모델 × 기능별 일 합계를 UPSERT로 누적한다.
+CREATE TABLE IF NOT EXISTS usage_event (
+  id SERIAL PRIMARY KEY,
+  created_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc'),
+  user_id INTEGER,
+  role_key VARCHAR(50),
+  feature VARCHAR(20) NOT NULL,
+  provider VARCHAR(20),
+  model_id VARCHAR(100) NOT NULL,
+  input_tokens INTEGER DEFAULT 0,
+  output_tokens INTEGER DEFAULT 0,
+  cache_read_tokens INTEGER DEFAULT 0,
+  cache_write_tokens INTEGER DEFAULT 0,
+  cost_usd DOUBLE PRECISION DEFAULT 0,
+  estimated BOOLEAN DEFAULT FALSE
+);
+
+CREATE INDEX IF NOT EXISTS ix_usage_event_created_at ON usage_event (created_at);
+CREATE INDEX IF NOT EXISTS ix_usage_event_user_id ON usage_event (user_id);
+
+CREATE TABLE IF NOT EXISTS usage_daily (
+  id SERIAL PRIMARY KEY,
+  day DATE NOT NULL,
+  user_id INTEGER NOT NULL DEFAULT 0,
+  role_key VARCHAR(50) NOT NULL DEFAULT '',
+  model_id VARCHAR(100) NOT NULL,
+  feature VARCHAR(20) NOT NULL,
+  requests INTEGER NOT NULL DEFAULT 0,
+  estimated_requests INTEGER NOT NULL DEFAULT 0,
+  input_tokens BIGINT NOT NULL DEFAULT 0,
+  output_tokens BIGINT NOT NULL DEFAULT 0,
+  cache_read_tokens BIGINT NOT NULL DEFAULT 0,
+  cache_write_tokens BIGINT NOT NULL DEFAULT 0,
+  cost_usd DOUBLE PRECISION NOT NULL DEFAULT 0,
+  CONSTRAINT uq_usage_daily_key UNIQUE (day, user_id, role_key, model_id, feature)
+);
+
+CREATE INDEX IF NOT EXISTS idx_usage_daily_day ON usage_daily (day);
@@ -0,0 +1,22 @@
+-- Migration 008: 페르소나별 시맨틱 답변 캐시
+-- 첫 턴 질문 임베딩과 답변을 저장하고, 같은 네임스페이스(페르소나·모델·시스템 프롬프트) 안에서 코사인 유사도로 재사용한다.
+ALTER TABLE persona_definition
+  ADD COLUMN IF NOT EXISTS semantic_cache_enabled BOOLEAN DEFAULT FALSE,
+  ADD COLUMN IF NOT EXISTS semantic_cache_threshold DOUBLE PRECISION DEFAULT 0.95;
+
+CREATE TABLE IF NOT EXISTS semantic_cache_entry (
+  id SERIAL PRIMARY KEY,
+  namespace VARCHAR(32) NOT NULL,
+  role_key VARCHAR(50) NOT NULL,
+  question TEXT NOT NULL,
+  answer TEXT NOT NULL,
+  embedding vector(1536),
+  hits INTEGER NOT NULL DEFAULT 0,
+  created_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc'),
+  last_hit_at TIMESTAMP NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc'),
+  expires_at TIMESTAMP NOT NULL
+);
+
+-- 네임스페이스별 항목 수가 작으므로(기본 최대 200) ANN 인덱스 없이 네임스페이스 범위 내 정확 검색
+CREATE INDEX IF NOT EXISTS idx_semantic_cache_namespace ON semantic_cache_entry (namespace, expires_at);
+CREATE INDEX IF NOT EXISTS ix_semantic_cache_entry_role_key ON semantic_cache_entry (role_key);
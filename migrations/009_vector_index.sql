@@ -0,0 +1,9 @@
+-- Migration 009: document_chunk.embedding ANN 인덱스 관리
+-- 페르소나별 검색 품질(ANN 탐색 폭) 설정. 인덱스 자체는 services/vector_index.py가 청크 수에 맞춰
+-- CREATE INDEX CONCURRENTLY로 생성/교체한다 (관리자 API 또는 Celery beat 점검).
+ALTER TABLE persona_definition
+  ADD COLUMN IF NOT EXISTS rag_search_quality VARCHAR(10) DEFAULT 'balanced';
+
+-- 001에서 빈 테이블에 만든 IVFFlat(lists=100)은 중심점이 학습되지 않아 재현율이 낮다.
+-- 관리 기록이 없는 IVFFlat은 다음 점검에서 행 수 기준 lists로 재생성되며, 즉시 교체하려면:
+--   POST /api/admin/vector_index/rebuild {"kind": "hnsw"}
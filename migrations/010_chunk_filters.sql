@@ -0,0 +1,25 @@
+-- Migration 010: document_chunk 검색 필터 비정규화
+-- RAG 검색이 knowledge_document / persona_knowledge_base 조인 없이 document_chunk 단일 테이블에서
+-- 페르소나·활성 여부를 필터하도록 persona_id / knowledge_base_id / is_searchable을 청크에 저장한다.
+-- 값은 process_document_async(청크 저장, 재처리 시작)와 페르소나 삭제 경로에서 유지된다.
+ALTER TABLE document_chunk
+  ADD COLUMN IF NOT EXISTS knowledge_base_id INTEGER REFERENCES persona_knowledge_base(id) ON DELETE CASCADE,
+  ADD COLUMN IF NOT EXISTS persona_id INTEGER REFERENCES persona_definition(id) ON DELETE CASCADE,
+  ADD COLUMN IF NOT EXISTS is_searchable BOOLEAN NOT NULL DEFAULT FALSE;
+
+-- 기존 청크 채우기 (기존 검색 조건: 지식 베이스 활성 + 문서 처리 완료)
+UPDATE document_chunk dc
+SET knowledge_base_id = kd.knowledge_base_id,
+    persona_id = pkb.persona_id,
+    is_searchable = (pkb.is_active IS TRUE AND kd.processing_status = 'completed')
+FROM knowledge_document kd
+JOIN persona_knowledge_base pkb ON kd.knowledge_base_id = pkb.id
+WHERE dc.document_id = kd.id;
+
+CREATE INDEX IF NOT EXISTS idx_document_chunk_persona_searchable
+  ON document_chunk (persona_id, is_searchable);
+
+-- 페르소나 전용 부분 ANN 인덱스(idx_document_chunk_embedding_p<persona_id>)는
+-- services/vector_index.py가 청크 수(VECTOR_INDEX_PERSONA_MIN_ROWS)에 맞춰 CONCURRENTLY로 만든다:
+--   CREATE INDEX CONCURRENTLY idx_document_chunk_embedding_p12 ON document_chunk
+--     USING hnsw (embedding vector_cosine_ops) WHERE persona_id = 12 AND is_searchable;
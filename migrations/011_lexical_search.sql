@@ -0,0 +1,12 @@
+-- Migration 011: 하이브리드 검색(retrieval_strategy = 'hybrid')용 청크 본문 키워드 인덱스
+-- services/lexical_search.py의 검색 조건과 같은 식이어야 플래너가 인덱스를 사용한다:
+--   to_tsvector('simple', content) @@ to_tsquery('simple', '변수:* | 함수:*')
+--   content ILIKE '%np.linalg%'
+-- 대용량 테이블이면 운영 중 쓰기가 막히지 않도록 CONCURRENTLY로 생성 (트랜잭션 밖에서 실행).
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_document_chunk_content_tsv
+  ON document_chunk USING gin (to_tsvector('simple', content));
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_document_chunk_content_trgm
+  ON document_chunk USING gin (content gin_trgm_ops);
@@ -0,0 +1,11 @@
+-- Migration 012: 요약 경계를 (timestamp, id)로 저장
+-- write-behind 재시도/오버플로로 메시지 id가 시간순과 어긋날 수 있어, 요약 경계를 id만으로 비교하지 않는다.
+ALTER TABLE chat_session
+  ADD COLUMN IF NOT EXISTS summary_upto_timestamp TIMESTAMP;
+
+-- 기존 요약은 경계 메시지의 시각으로 채움
+UPDATE chat_session cs
+SET summary_upto_timestamp = m.timestamp
+FROM message m
+WHERE m.id = cs.summary_upto_message_id
+  AND cs.summary_upto_timestamp IS NULL;
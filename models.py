@@ -53,6 +53,12 @@ class ChatSession(db.Model):
     role_key = db.Column(db.String(50), nullable=False, index=True) # 사용된 AI 페르소나 (예: 'wangchobo_tutor')
     timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow) # 생성 시간
 
+    # 롤링 요약: 오래된 대화는 요약으로 접고, 이후 메시지만 원문으로 전송
+    summary = db.Column(db.Text, nullable=True)                      # 누적 대화 요약
+    summary_upto_message_id = db.Column(db.Integer, nullable=True)   # 요약에 포함된 마지막 메시지 ID
+    summary_upto_timestamp = db.Column(db.DateTime, nullable=True)   # 그 메시지의 timestamp ((timestamp, id) 경계)
+    summary_tokens = db.Column(db.Integer, default=0)                # 요약 토큰 수
+
 # ---------------------------------------------------------
 # [3] 메시지(Message) 모델
 # ---------------------------------------------------------
@@ -68,6 +74,12 @@ class Message(db.Model):
     image_path = db.Column(db.String(1024), nullable=True) # 이미지 경로 (콤마로 구분)
     provider = db.Column(db.String(20), nullable=True) # 답변을 생성한 AI 모델 (gpt, claude 등)
     timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    write_key = db.Column(db.String(32), nullable=True, unique=True)  # write-behind 재전송 중복 방지 키
+
+    # 대화 이력 윈도우 조회용 (session_id, timestamp DESC) keyset 인덱스
+    __table_args__ = (
+        db.Index('idx_message_session_timestamp', 'session_id', 'timestamp', 'id'),
+    )
 
 # ---------------------------------------------------------
 # [4] 파일(ChatFile) 모델
@@ -149,6 +161,7 @@ class PersonaDefinition(db.Model):
     model_google = db.Column(db.String(100), default='gemini-2.0-flash')
     model_xai = db.Column(db.String(100), default='grok-4-1-fast-reasoning')
     max_tokens = db.Column(db.Integer, default=4096)
+    history_token_budget = db.Column(db.Integer, default=6000)        # 대화 이력에 사용할 최대 토큰
     # 페르소나별 허용 모델 목록 + 노출 순서 (2단계 필터링)
     # JSON: {"openai": ["gpt-4o-mini", "gpt-4o"], "anthropic": [...], "google": [...], "xai": [...]}
     # null = 하위호환 모드 (위 model_* 단일 필드 사용)
@@ -164,11 +177,16 @@ class PersonaDefinition(db.Model):
 
     # RAG 설정
     use_rag = db.Column(db.Boolean, default=False)                    # RAG 사용 여부
-    retrieval_strategy = db.Column(db.String(20), default='soft_topk') # 'soft_topk' | 'gap_based'
+    retrieval_strategy = db.Column(db.String(20), default='soft_topk') # 'soft_topk' | 'gap_based' | 'hybrid'
     rag_top_k = db.Column(db.Integer, default=3)                      # Top-K (고정) 또는 Min-K (Soft)
     rag_max_k = db.Column(db.Integer, default=7)                      # Soft Top-K 최대값
     rag_similarity_threshold = db.Column(db.Float, default=0.5)       # 유사도 임계값
     rag_gap_threshold = db.Column(db.Float, default=0.1)              # Gap-based 전략용 임계값
+    rag_search_quality = db.Column(db.String(10), default='balanced') # ANN 탐색 폭: 'fast' | 'balanced' | 'accurate'
+
+    # 시맨틱 답변 캐시 (첫 턴 유사 질문에 이전 답변 재사용)
+    semantic_cache_enabled = db.Column(db.Boolean, default=False)
+    semantic_cache_threshold = db.Column(db.Float, default=0.95)      # 코사인 유사도 임계값
 
     # 관계
     system_prompts = db.relationship('PersonaSystemPrompt', backref='persona', cascade='all, delete-orphan', lazy='dynamic')
@@ -334,6 +352,15 @@ class DocumentChunk(db.Model):
     chunk_metadata = db.Column(db.JSON)  # 페이지 번호 등 추가 정보
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
 
+    # 검색 필터용 비정규화 컬럼 (knowledge_document/persona_knowledge_base 조인 없이 단일 테이블 스캔)
+    knowledge_base_id = db.Column(db.Integer, db.ForeignKey('persona_knowledge_base.id', ondelete='CASCADE'))
+    persona_id = db.Column(db.Integer, db.ForeignKey('persona_definition.id', ondelete='CASCADE'))
+    is_searchable = db.Column(db.Boolean, default=False, nullable=False)  # 지식 베이스 활성 + 문서 처리 완료
+
+    __table_args__ = (
+        db.Index('idx_document_chunk_persona_searchable', 'persona_id', 'is_searchable'),
+    )
+
 # ---------------------------------------------------------
 # [13] 조기 개입 알림(LearningAlert) 모델
 # ---------------------------------------------------------
@@ -357,4 +384,86 @@ class LearningAlert(db.Model):
     detail = db.Column(db.String(200))                        # 감지 요약 (키워드명 또는 반복 횟수)
     trigger_content = db.Column(db.Text)                      # 알림을 유발한 메시지 발췌
     created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, index=True)
-    is_read = db.Column(db.Boolean, default=False, index=True)
\ No newline at end of file
+    is_read = db.Column(db.Boolean, default=False, index=True)
+# ---------------------------------------------------------
+# [14] 토큰 사용량 원장(UsageEvent / UsageDaily) 모델
+# ---------------------------------------------------------
+class UsageEvent(db.Model):
+    """
+    LLM/임베딩 호출 1건의 실제 토큰 사용량 (추가 전용 원장).
+    공급사 응답의 usage 블록을 기록하며, usage를 받지 못한 호출은 추정치로 기록하고 estimated로 표시합니다.
+
+    feature:
+        'chat' | 'analysis' | 'rag_summary' | 'session_summary' | 'embedding' | 'image_prompt' | 'music_prompt'
+    """
+    __tablename__ = 'usage_event'
+
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, nullable=False, index=True)
+    user_id = db.Column(db.Integer, nullable=True, index=True)   # 시스템 작업은 NULL
+    role_key = db.Column(db.String(50), nullable=True)          # 페르소나 식별자
+    feature = db.Column(db.String(20), nullable=False)
+    provider = db.Column(db.String(20), nullable=True)
+    model_id = db.Column(db.String(100), nullable=False)
+    input_tokens = db.Column(db.Integer, default=0)              # 캐시 미적중 입력 토큰
+    output_tokens = db.Column(db.Integer, default=0)
+    cache_read_tokens = db.Column(db.Integer, default=0)
+    cache_write_tokens = db.Column(db.Integer, default=0)
+    cost_usd = db.Column(db.Float, default=0.0)                  # AVAILABLE_MODELS 단가 기준 산정 비용
+    estimated = db.Column(db.Boolean, default=False)             # usage 미수신 → 토큰 수 추정
+
+
+class UsageDaily(db.Model):
+    """
+    일별 사용량 집계 (사용자 × 페르소나 × 모델 × 기능).
+    원장 기록과 같은 트랜잭션에서 UPSERT로 누적하므로 관리자 조회는 이 테이블만 읽습니다.
+    사용자/페르소나가 없는 호출은 user_id=0, role_key=''로 집계합니다.
+    """
+    __tablename__ = 'usage_daily'
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False, default=0)
+    role_key = db.Column(db.String(50), nullable=False, default='')
+    model_id = db.Column(db.String(100), nullable=False)
+    feature = db.Column(db.String(20), nullable=False)
+    requests = db.Column(db.Integer, nullable=False, default=0)
+    estimated_requests = db.Column(db.Integer, nullable=False, default=0)
+    input_tokens = db.Column(db.BigInteger, nullable=False, default=0)
+    output_tokens = db.Column(db.BigInteger, nullable=False, default=0)
+    cache_read_tokens = db.Column(db.BigInteger, nullable=False, default=0)
+    cache_write_tokens = db.Column(db.BigInteger, nullable=False, default=0)
+    cost_usd = db.Column(db.Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        db.UniqueConstraint('day', 'user_id', 'role_key', 'model_id', 'feature', name='uq_usage_daily_key'),
+        db.Index('idx_usage_daily_day', 'day'),
+    )
+
+
+# ---------------------------------------------------------
+# [15] 시맨틱 답변 캐시(SemanticCacheEntry) 모델
+# ---------------------------------------------------------
+class SemanticCacheEntry(db.Model):
+    """
+    페르소나별 첫 턴 질문과 생성된 답변 (PostgreSQL 전용, SQLite는 프로세스 내부 인덱스 사용).
+
+    namespace는 role_key·공급사·모델·시스템 프롬프트 해시이므로 프롬프트가 바뀌면 이전 항목은 조회되지 않습니다.
+    expires_at이 지난 항목은 조회에서 제외되고, 네임스페이스별 최대 개수를 넘으면 last_hit_at 순으로 제거합니다.
+    """
+    __tablename__ = 'semantic_cache_entry'
+
+    id = db.Column(db.Integer, primary_key=True)
+    namespace = db.Column(db.String(32), nullable=False)
+    role_key = db.Column(db.String(50), nullable=False, index=True)
+    question = db.Column(db.Text, nullable=False)
+    answer = db.Column(db.Text, nullable=False)
+    embedding = db.Column(Vector(1536))
+    hits = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, nullable=False)
+    last_hit_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('idx_semantic_cache_namespace', 'namespace', 'expires_at'),
+    )
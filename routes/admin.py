@@ -10,6 +10,8 @@ from extensions import db
 from models import User, ChatSession, Message, ChatFile, PersonaConfig
 from prompts import AI_PERSONAS
 from services.ai_service import DEFAULT_MODELS, DEFAULT_MAX_TOKENS, AVAILABLE_MODELS
+from services.persona_cache import invalidate_all_persona_snapshots
+from services.image_service import derivative_source_name, remove_image_derivatives
 
 admin_bp = Blueprint("admin", __name__)
 
@@ -224,6 +226,7 @@ def admin_delete_user():
                         )
                     if os.path.exists(path):
                         os.remove(path)
+                        remove_image_derivatives(path)
                 except Exception:
                     pass
                 db.session.delete(f)
@@ -233,6 +236,8 @@ def admin_delete_user():
             ChatSession.query.filter_by(user_id=uid).delete()
             db.session.delete(u)
             db.session.commit()
+            # 배정 행은 FK CASCADE로 함께 삭제되므로 페르소나 스냅샷 무효화
+            invalidate_all_persona_snapshots()
             return jsonify({"success": True, "username": u.username})
         except Exception as e:
             # 일부라도 실패하면 롤백
@@ -321,6 +326,7 @@ def cleanup_orphaned_files():
                 if os.path.exists(path):
                     file_size = os.path.getsize(path)
                     os.remove(path)
+                    remove_image_derivatives(path)
                     cleaned_space_mb += file_size
             except Exception as e:
                 print(f"File delete error ({f.filename}): {e}")
@@ -356,8 +362,8 @@ def cleanup_orphaned_files():
                 if file_mtime >= cutoff_time:
                     continue
                     
-                # DB에 존재하지 않는 파일이면 삭제
-                if filename not in valid_db_files:
+                # DB에 존재하지 않는 파일이면 삭제 (AI 전송용 파생본은 원본이 DB에 있으면 유지)
+                if derivative_source_name(filename) not in valid_db_files:
                     try:
                         file_size = os.path.getsize(file_path)
                         os.remove(file_path)
@@ -431,6 +437,7 @@ def admin_bulk_delete_users():
                         )
                     if os.path.exists(path):
                         os.remove(path)
+                        remove_image_derivatives(path)
                 except Exception:
                     pass
                 db.session.delete(f)
@@ -441,6 +448,7 @@ def admin_bulk_delete_users():
             deleted_count += 1
             
         db.session.commit()
+        invalidate_all_persona_snapshots()
         return jsonify({"success": True, "deleted_count": deleted_count})
     except Exception as e:
         db.session.rollback()
@@ -20,6 +20,7 @@ Routes:
 
 import datetime
 import json
+import time
 from collections import defaultdict
 
 from flask import (Blueprint, Response, jsonify, redirect,
@@ -30,7 +31,12 @@ from extensions import db
 from models import (ChatSession, LearningAlert, Message, PersonaDefinition,
                     PersonaStudentPermission, PersonaTeacherPermission,
                     SystemConfig, User)
-from services.ai_service import generate_ai_response_stream
+from services.admission_service import LLMSlot
+from services.ai_service import AVAILABLE_MODELS, generate_ai_response_stream
+from services.history_service import count_tokens
+from services.sse_service import coalesce_deltas
+from services.telemetry import StreamSpan
+from services.usage_ledger import record_usage
 
 admin_analyze_bp = Blueprint("admin_analyze", __name__)
 
@@ -375,24 +381,49 @@ def _sse(event_type: str, text: str) -> str:
 # 분석 API (SSE 스트리밍)
 # ---------------------------------------------------------------------------
 
-def _analysis_chunks(prompt: str, model_id: str):
+def _analysis_chunks(prompt: str, model_id: str, role_key=None, received_at=None):
     """공통 분석 청크 생성기 — 선택된 모델로 프롬프트를 실행하고 SSE 이벤트 문자열을 yield한다.
 
     Response 객체가 아닌 generator를 반환하므로 외부 generator에서 yield from으로 안전하게 사용할 수 있다.
+    role_key/received_at은 텔레메트리 라벨과 요청 수신 시점(데이터 수집 시간 포함)이다.
     """
+    provider = (AVAILABLE_MODELS.get(model_id) or {}).get("provider", "anthropic")
+    user_id = current_user.id
+    slot = LLMSlot(provider, model_id, user_id)
+    span = StreamSpan("analyze", role_key, received_at)
+    usage = {}
+    output = []
+    error = None
     try:
-        for chunk in generate_ai_response_stream(
+        for position in slot.wait():
+            yield _sse("status", f"요청이 많아 대기 중입니다... ({position}번째)")
+        deltas = generate_ai_response_stream(
             model_id=model_id,
             system_prompt="당신은 교육 데이터 분석 전문가입니다.",
             messages=[{"role": "user", "content": prompt}],
             max_tokens=ANALYSIS_MAX_TOKENS,
             upload_folder="",   # 분석에는 이미지 없음
-        ):
+            usage=usage,
+        )
+        for chunk in coalesce_deltas(deltas, label="analyze"):
             # ai_service는 오류 문자열도 yield하므로 그대로 전달
+            span.first_token()
+            output.append(chunk)
             yield _sse("chunk", chunk)
         yield _sse("done", "")
     except Exception as e:
+        error = e
         yield _sse("error", str(e))
+    finally:
+        slot.release()
+        output_tokens = usage.get("output_tokens") or count_tokens("".join(output))
+        prompt_tokens = usage.get("input_tokens") or count_tokens(prompt)
+        span.finish(provider, model_id, output_tokens=output_tokens, prompt_tokens=prompt_tokens, error=error)
+        if output:
+            record_usage(
+                "analysis", model_id, usage, user_id=user_id, role_key=role_key, provider=provider,
+                estimated_input=prompt_tokens, estimated_output=output_tokens,
+            )
 
 
 @admin_analyze_bp.route("/api/admin/analyze/class", methods=["POST"])
@@ -414,6 +445,7 @@ def analyze_class():
     persona = db.session.get(PersonaDefinition, int(persona_id))
     if not persona:
         return jsonify({"error": "Persona not found"}), 404
+    received_at = time.monotonic()
 
     def generate():
         try:
@@ -447,7 +479,7 @@ def analyze_class():
 {conv_text}
 """
 
-            yield from _analysis_chunks(prompt, model_id)
+            yield from _analysis_chunks(prompt, model_id, persona.role_key, received_at)
 
         except Exception as e:
             yield _sse("error", str(e))
@@ -483,6 +515,7 @@ def analyze_student():
         if not _can_access_persona(int(persona_id)):
             return jsonify({"error": "Denied"}), 403
         persona = db.session.get(PersonaDefinition, int(persona_id))
+    received_at = time.monotonic()
 
     def generate():
         try:
@@ -520,7 +553,9 @@ def analyze_student():
 {conv_text}
 """
 
-            yield from _analysis_chunks(prompt, model_id)
+            yield from _analysis_chunks(
+                prompt, model_id, persona.role_key if persona else None, received_at
+            )
 
         except Exception as e:
             yield _sse("error", str(e))
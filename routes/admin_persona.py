@@ -22,8 +22,12 @@ from models import (
 )
 from services.ai_service import AVAILABLE_MODELS
 from services.rag_service import get_rag_statistics
+from services.local_vector_store import drop_persona, local_store_enabled, remove as remove_local_vectors
+from services.vector_index import DEFAULT_SEARCH_QUALITY, SEARCH_QUALITY, vector_index_status
+from services.persona_cache import invalidate_persona_snapshot
+from services.semantic_cache import purge_semantic_cache
 from prompts import AI_PERSONAS
-from tasks import process_document_async
+from tasks import maintain_vector_index, process_document_async
 import datetime
 import os
 import json
@@ -95,10 +99,22 @@ def _build_allowed_models_config(data):
     return json.dumps(result)
 
 
+def _search_quality(value):
+    """rag_search_quality 입력 검증 (알 수 없는 값은 기본값)"""
+    return value if value in SEARCH_QUALITY else DEFAULT_SEARCH_QUALITY
+
+
 # =============================================================================
 # 권한 체크 헬퍼 함수
 # =============================================================================
 
+def _invalidate_persona_snapshot_by_id(persona_id):
+    """persona_id로 role_key를 찾아 채팅 컨텍스트 스냅샷 캐시를 무효화합니다."""
+    persona = db.session.get(PersonaDefinition, persona_id)
+    if persona:
+        invalidate_persona_snapshot(persona.role_key)
+
+
 def get_manageable_persona_ids(user):
     """
     사용자가 관리할 수 있는 페르소나 ID 리스트 반환
@@ -430,6 +446,7 @@ def get_persona_detail(persona_id):
         "model_google": persona.model_google,
         "model_xai": persona.model_xai,
         "max_tokens": persona.max_tokens,
+        "history_token_budget": persona.history_token_budget,
         "allowed_models_config": json.loads(persona.allowed_models_config)
             if persona.allowed_models_config else None,
         # 권한 설정
@@ -446,6 +463,10 @@ def get_persona_detail(persona_id):
         "rag_max_k": persona.rag_max_k,
         "rag_similarity_threshold": persona.rag_similarity_threshold,
         "rag_gap_threshold": persona.rag_gap_threshold,
+        "rag_search_quality": persona.rag_search_quality,
+        # 시맨틱 답변 캐시
+        "semantic_cache_enabled": persona.semantic_cache_enabled,
+        "semantic_cache_threshold": persona.semantic_cache_threshold,
         # 청크 설정
         "chunk_strategy": chunk_strategy,
         "chunk_size": chunk_size,
@@ -507,6 +528,7 @@ def create_persona():
             model_google=data.get("model_google", "gemini-3-flash-preview"),
             model_xai=data.get("model_xai", "grok-4-1-fast-reasoning"),
             max_tokens=data.get("max_tokens", 4096),
+            history_token_budget=data.get("history_token_budget", 6000),
             # 권한 설정
             allow_user=data.get("allow_user", True),
             allow_teacher=data.get("allow_teacher", True),
@@ -521,6 +543,10 @@ def create_persona():
             rag_max_k=data.get("rag_max_k", 7),
             rag_similarity_threshold=data.get("rag_similarity_threshold", 0.5),
             rag_gap_threshold=data.get("rag_gap_threshold", 0.1),
+            rag_search_quality=_search_quality(data.get("rag_search_quality")),
+            # 시맨틱 답변 캐시
+            semantic_cache_enabled=data.get("semantic_cache_enabled", False),
+            semantic_cache_threshold=data.get("semantic_cache_threshold", 0.95),
             allowed_models_config=_build_allowed_models_config(data)
         )
 
@@ -552,6 +578,8 @@ def create_persona():
             db.session.add(prompt)
             db.session.commit()
 
+        invalidate_persona_snapshot(persona.role_key)
+
         return jsonify({
             "success": True,
             "persona_id": persona.id,
@@ -610,6 +638,8 @@ def update_persona(persona_id):
             persona.model_xai = data["model_xai"]
         if "max_tokens" in data:
             persona.max_tokens = data["max_tokens"]
+        if "history_token_budget" in data:
+            persona.history_token_budget = data["history_token_budget"]
 
         # allowed_models_config 처리 (페르소나별 허용 모델 목록 + 순서)
         if 'allowed_models_config' in data:
@@ -653,6 +683,14 @@ def update_persona(persona_id):
             persona.rag_similarity_threshold = data["rag_similarity_threshold"]
         if "rag_gap_threshold" in data:
             persona.rag_gap_threshold = data["rag_gap_threshold"]
+        if "rag_search_quality" in data:
+            persona.rag_search_quality = _search_quality(data["rag_search_quality"])
+
+        # 시맨틱 답변 캐시
+        if "semantic_cache_enabled" in data:
+            persona.semantic_cache_enabled = data["semantic_cache_enabled"]
+        if "semantic_cache_threshold" in data:
+            persona.semantic_cache_threshold = data["semantic_cache_threshold"]
 
         # 청크 설정 (지식 베이스 업데이트)
         if any(k in data for k in ["chunk_strategy", "chunk_size", "chunk_overlap"]):
@@ -687,6 +725,7 @@ def update_persona(persona_id):
         persona.updated_at = datetime.datetime.utcnow()
         db.session.commit()
         cache.delete('active_personas')
+        invalidate_persona_snapshot(persona.role_key)
 
         return jsonify({"success": True})
 
@@ -717,9 +756,19 @@ def delete_persona(persona_id):
 
     try:
         role_name = persona.role_name
+        role_key = persona.role_key
+        # 청크는 ORM cascade로 한 행씩 지우지 않고 비정규화된 persona_id로 일괄 삭제
+        DocumentChunk.query.filter_by(persona_id=persona_id).delete(synchronize_session=False)
         db.session.delete(persona)
         db.session.commit()
         cache.delete('active_personas')
+        invalidate_persona_snapshot(role_key)
+        purge_semantic_cache(role_key)
+        # 페르소나 전용 부분 ANN 인덱스(SQLite는 로컬 벡터 파일) 정리
+        if local_store_enabled():
+            drop_persona(persona_id)
+        else:
+            maintain_vector_index.delay()
 
         return jsonify({
             "success": True,
@@ -836,6 +885,7 @@ def grant_teacher_permission(persona_id):
 
         db.session.add(permission)
         db.session.commit()
+        invalidate_persona_snapshot(persona.role_key)
 
         return jsonify({"success": True})
 
@@ -868,6 +918,7 @@ def revoke_teacher_permission(persona_id, teacher_id):
     try:
         db.session.delete(permission)
         db.session.commit()
+        _invalidate_persona_snapshot_by_id(persona_id)
 
         return jsonify({"success": True})
 
@@ -970,6 +1021,7 @@ def assign_student_permission(persona_id):
         )
         db.session.add(permission)
         db.session.commit()
+        invalidate_persona_snapshot(persona.role_key)
 
         return jsonify({"success": True})
 
@@ -1005,6 +1057,7 @@ def unassign_student_permission(persona_id, student_id):
     try:
         db.session.delete(permission)
         db.session.commit()
+        _invalidate_persona_snapshot_by_id(persona_id)
 
         return jsonify({"success": True})
 
@@ -1096,6 +1149,8 @@ def update_persona_prompt(persona_id):
             db.session.add(prompt)
 
         db.session.commit()
+        invalidate_persona_snapshot(persona.role_key)
+        purge_semantic_cache(persona.role_key)
         return jsonify({"success": True})
 
     except Exception as e:
@@ -1223,6 +1278,10 @@ def restore_prompt_snapshot(persona_id, slot):
                 ))
 
         db.session.commit()
+        _invalidate_persona_snapshot_by_id(persona_id)
+        persona = db.session.get(PersonaDefinition, persona_id)
+        if persona:
+            purge_semantic_cache(persona.role_key)
 
         return jsonify({
             "success": True,
@@ -1437,6 +1496,7 @@ def delete_knowledge_document(persona_id, doc_id):
             return jsonify({"error": "페르소나가 일치하지 않습니다"}), 403
 
         # 관련 청크 삭제
+        chunk_ids = [row[0] for row in db.session.query(DocumentChunk.id).filter_by(document_id=doc_id)]
         DocumentChunk.query.filter_by(document_id=doc_id).delete()
 
         # 파일 삭제
@@ -1449,6 +1509,10 @@ def delete_knowledge_document(persona_id, doc_id):
         # 문서 삭제
         db.session.delete(doc)
         db.session.commit()
+        if local_store_enabled():
+            remove_local_vectors(persona_id, chunk_ids)
+        # 삭제된 자료에 근거한 캐시 답변이 재생되지 않도록
+        purge_semantic_cache(kb.persona.role_key)
 
         return jsonify({
             "success": True,
@@ -1476,7 +1540,8 @@ def get_knowledge_stats(persona_id):
             "completed_count": 완료된 문서 수,
             "processing_count": 처리 중인 문서 수,
             "failed_count": 실패한 문서 수,
-            "chunk_count": 총 청크 수
+            "chunk_count": 총 청크 수,
+            "vector_index": ANN 인덱스 종류/크기/유효 여부/빌드 상태 (전체 document_chunk 공용)
         }
     """
     # 권한 체크: 관리자 또는 분석 조회 권한이 있는 교사
@@ -1485,6 +1550,7 @@ def get_knowledge_stats(persona_id):
 
     try:
         stats = get_rag_statistics(persona_id)
+        stats["vector_index"] = vector_index_status(persona_id)
         return jsonify(stats)
 
     except Exception as e:
@@ -9,6 +9,8 @@ from models import (User, ChatSession, Message, ChatFile,
                     PersonaDefinition, PersonaSystemPrompt, PersonaTeacherPermission,
                     PersonaStudentPermission, PersonaPromptSnapshot,
                     PersonaKnowledgeBase, KnowledgeDocument)
+from services.persona_cache import invalidate_all_persona_snapshots
+from services.image_service import remove_image_derivatives
 
 admin_users_bp = Blueprint("admin_users", __name__)
 
@@ -124,6 +126,7 @@ def delete_no_history_users():
                         path = os.path.join(current_app.config["UPLOAD_FOLDER"], "files", base)
                     if os.path.exists(path):
                         os.remove(path)
+                        remove_image_derivatives(path)
                 except Exception:
                     pass
                 db.session.delete(f)
@@ -149,6 +152,8 @@ def delete_no_history_users():
             deleted += 1
 
         db.session.commit()
+        # 삭제된 사용자의 학생/교사 배정이 사라졌으므로 페르소나 스냅샷 전체 무효화
+        invalidate_all_persona_snapshots()
         return jsonify({"success": True, "deleted": deleted})
     except Exception as e:
         db.session.rollback()
@@ -1,4 +1,5 @@
 import os
+import time
 import traceback
 import types
 
@@ -13,19 +14,54 @@ from models import (
     PersonaConfig,
     User,
     PersonaDefinition,
-    PersonaSystemPrompt,
     PersonaStudentPermission,
     PersonaTeacherPermission,
 )
 from services.ai_service import (
     generate_ai_response_stream,
+    is_error_response,
     DEFAULT_MODELS,
     DEFAULT_MODEL,
     DEFAULT_MAX_TOKENS,
     AVAILABLE_MODELS,
 )
+from services.persona_cache import get_persona_snapshot
+from services.image_service import remove_image_derivatives
+from services.admission_service import AdmissionTimeout
+from services.circuit_breaker import failover_candidates, stream_with_failover
+from services.write_behind import (
+    enqueue_alert_check,
+    enqueue_file_relink,
+    enqueue_message,
+    enqueue_session_summary,
+)
+from services.stream_service import (
+    format_sse,
+    get_turn_owner,
+    iter_turn_events,
+    start_turn_stream,
+)
+from services.history_service import (
+    DEFAULT_HISTORY_TOKEN_BUDGET,
+    build_history_window,
+    count_tokens,
+    format_summary_context,
+    should_summarize,
+    summary_boundary,
+)
+from services.telemetry import StreamSpan
+from services.usage_ledger import record_usage
+from services.quota_service import QUOTA_OUTPUT_RESERVE, QuotaExceeded, reserve_quota
+from services.rag_service import RetrievalTask, format_rag_context
+from services.semantic_cache import (
+    cache_namespace,
+    is_cacheable_question,
+    iter_answer_chunks,
+    lookup_answer,
+    store_answer,
+)
 from extensions import db, cache
-from tasks import generate_image_async
+from tasks import IMAGE_PROMPT_MAX_TOKENS, MUSIC_PROMPT_MAX_TOKENS, generate_image_async
 
 # ======================================================
 # 캐시 헬퍼 (Redis, TTL 60초)
@@ -59,34 +95,6 @@ def get_active_personas_cached():
 chat_bp = Blueprint("chat", __name__)
 
 
-# ======================================================
-# 헬퍼 함수: DB 기반 페르소나 조회
-# ======================================================
-def get_persona_from_db(role_key):
-    """DB에서 페르소나 조회 (활성화된 것만)"""
-    return PersonaDefinition.query.filter_by(role_key=role_key, is_active=True).first()
-
-
-def get_system_prompt_from_db(persona_id, provider):
-    """DB에서 시스템 프롬프트 조회 (provider별, fallback to default)"""
-    # 먼저 해당 provider 프롬프트 찾기
-    prompt = PersonaSystemPrompt.query.filter_by(
-        persona_id=persona_id,
-        provider=provider
-    ).first()
-
-    if prompt:
-        return prompt.system_prompt
-
-    # 없으면 default 프롬프트 fallback
-    default_prompt = PersonaSystemPrompt.query.filter_by(
-        persona_id=persona_id,
-        provider="default"
-    ).first()
-
-    return default_prompt.system_prompt if default_prompt else ""
-
-
 @chat_bp.route("/")
 @login_required
 def index():
@@ -282,14 +290,30 @@ def get_persona_provider_restrictions():
     return jsonify(data)
 
 
+def _quota_exceeded_response(quota_err):
+    """사용 한도 초과 429 응답 (SSE 오류 이벤트 + Retry-After)"""
+    return Response(
+        format_sse({'error': str(quota_err), 'quota_exceeded': True, 'retry_after': quota_err.retry_after}),
+        status=429,
+        mimetype='text/event-stream',
+        headers={'Retry-After': str(quota_err.retry_after)},
+    )
+
+
+def _elapsed_ms(since):
+    return round((time.monotonic() - since) * 1000, 1)
+
+
 @chat_bp.route("/chat", methods=["POST"])
 @login_required
 def chat():
     """채팅 요청 처리(텍스트/이미지 생성).
 
     - 권한: 로그인 사용자
-    - 기능: 서비스 점검 체크 → 페르소나/권한 검증 → 세션 생성 → 메시지 저장 → AI 응답 생성
+    - 기능: 서비스 점검 체크 → 페르소나/권한 검증 → (RAG 검색 시작) → 세션 생성 → 메시지 저장 → AI 응답 생성
     """
+    received_at = time.monotonic()  # 텔레메트리: 요청 수신 시점 (DB/대기열/공급사 지연 구분용)
+
     # 서비스 점검 모드면 즉시 차단 (30초 캐시)
     _svc_status = cache.get('service_status')
     if _svc_status is None:
@@ -309,22 +333,27 @@ def chat():
 
     # 이미지 생성 페르소나: 별도 플로우로 처리
     if role_key == "ai_illustrator":
+        quota = None
         try:
-            # DB에서 페르소나 조회
-            persona = get_persona_from_db(role_key)
+            # 페르소나 스냅샷 조회 (캐시)
+            persona = get_persona_snapshot(role_key)
             if not persona:
                 return jsonify({"error": "페르소나를 찾을 수 없습니다"}), 404
 
             # 권한 확인
-            if not current_user.is_admin:
-                if provider == "google" and persona.restrict_google:
-                    return jsonify({"error": "권한 없음"}), 403
-                if provider == "anthropic" and persona.restrict_anthropic:
-                    return jsonify({"error": "권한 없음"}), 403
-                if provider == "openai" and persona.restrict_openai:
-                    return jsonify({"error": "권한 없음"}), 403
-                if provider == "xai" and persona.restrict_xai:
-                    return jsonify({"error": "권한 없음"}), 403
+            if not current_user.is_admin and persona.is_provider_restricted(provider):
+                return jsonify({"error": "권한 없음"}), 403
+
+            # 시스템 프롬프트 조회
+            system_prompt = persona.system_prompt(provider)
+
+            # 사용 한도 확인: 세션/메시지 저장과 작업 예약 전에 요청 1건과 프롬프트 생성 예상 토큰을 차감
+            # (Claude는 이미지 생성을 지원하지 않아 호출 자체가 없으므로 제외)
+            if provider != "anthropic":
+                quota = reserve_quota(
+                    current_user, role_key,
+                    count_tokens(system_prompt) + count_tokens(user_message) + IMAGE_PROMPT_MAX_TOKENS,
+                )
 
             session_id = data.get("session_id")
             if not session_id:
@@ -377,9 +406,6 @@ def chat():
                 # xAI 이미지 프롬프트 생성용으로는 일반 grok 모델 사용
                 prompt_model_id = "grok-4-1-fast-reasoning"
 
-            # 시스템 프롬프트 조회
-            system_prompt = get_system_prompt_from_db(persona.id, provider)
-
             if provider == "anthropic":
                 def generate_unsupported():
                     chunk = "Claude(Anthropic)는 아직 이미지 생성을 지원하지 않습니다. Google이나 GPT를 선택해주세요."
@@ -397,6 +423,7 @@ def chat():
                 system_prompt=system_prompt,
                 user_message=user_message,
                 upload_folder=current_app.config["UPLOAD_FOLDER"],
+                quota_reservation=quota.to_payload() if quota is not None else None,
             )
 
             # 즉시 task_id 반환 → 프론트가 폴링해서 완료 확인
@@ -406,29 +433,35 @@ def chat():
 
             return Response(stream_with_context(generate_task_queued()), mimetype="text/event-stream")
 
+        except QuotaExceeded as quota_err:
+            return _quota_exceeded_response(quota_err)
         except Exception as e:
             print(f"Image Gen Error: {e}")
+            if quota is not None:
+                quota.settle(0)
             def generate_error_stream():
                 yield f"data: {json.dumps({'error': f'이미지 생성 실패: {str(e)}'})}\n\n"
             return Response(stream_with_context(generate_error_stream()), mimetype="text/event-stream")
 
     # 음악 생성 페르소나: 별도 플로우로 처리
     if role_key == "ai_composer":
+        quota = None
         try:
-            persona = get_persona_from_db(role_key)
+            persona = get_persona_snapshot(role_key)
             if not persona:
                 return jsonify({"error": "페르소나를 찾을 수 없습니다"}), 404
 
             # 권한 확인
-            if not current_user.is_admin:
-                if provider == "google" and persona.restrict_google:
-                    return jsonify({"error": "권한 없음"}), 403
-                if provider == "anthropic" and persona.restrict_anthropic:
-                    return jsonify({"error": "권한 없음"}), 403
-                if provider == "openai" and persona.restrict_openai:
-                    return jsonify({"error": "권한 없음"}), 403
-                if provider == "xai" and persona.restrict_xai:
-                    return jsonify({"error": "권한 없음"}), 403
+            if not current_user.is_admin and persona.is_provider_restricted(provider):
+                return jsonify({"error": "권한 없음"}), 403
+
+            system_prompt = persona.system_prompt(provider)
+
+            # 사용 한도 확인: 세션/메시지 저장과 작업 예약 전에 요청 1건과 프롬프트 생성 예상 토큰을 차감
+            quota = reserve_quota(
+                current_user, role_key,
+                count_tokens(system_prompt) + count_tokens(user_message) + MUSIC_PROMPT_MAX_TOKENS,
+            )
 
             session_id = data.get("session_id")
             if not session_id:
@@ -463,8 +496,6 @@ def chat():
             if provider == "google":
                 prompt_model_id = "gemini-3-pro-preview"
 
-            system_prompt = get_system_prompt_from_db(persona.id, provider)
-
             from tasks import generate_music_async
             task = generate_music_async.delay(
                 session_id=session_id,
@@ -475,6 +506,7 @@ def chat():
                 system_prompt=system_prompt,
                 user_message=user_message,
                 upload_folder=current_app.config["UPLOAD_FOLDER"],
+                quota_reservation=quota.to_payload() if quota is not None else None,
             )
 
             def generate_task_queued():
@@ -484,87 +516,45 @@ def chat():
 
             return Response(stream_with_context(generate_task_queued()), mimetype="text/event-stream")
 
+        except QuotaExceeded as quota_err:
+            return _quota_exceeded_response(quota_err)
         except Exception as e:
             print(f"Music Gen Error: {e}")
+            if quota is not None:
+                quota.settle(0)
             def generate_error_stream():
                 yield f"data: {json.dumps({'error': f'음악 생성 실패: {str(e)}'})}\n\n"
             return Response(stream_with_context(generate_error_stream()), mimetype="text/event-stream")
 
     image_paths_for_ai = []
+    owned_file_ids = []
 
-    # 업로드된 파일 중 이미지 경로만 AI 입력으로 전달
+    # 업로드된 파일 중 이미지 경로만 AI 입력으로 전달 (세션 연결은 write-behind로 처리)
     if file_ids:
         files = ChatFile.query.filter(ChatFile.id.in_(file_ids)).all()
         for f in files:
             if f and f.user_id == current_user.id:
-                if data.get("session_id"):
-                    f.session_id = data.get("session_id")
+                owned_file_ids.append(f.id)
                 if f.file_type and f.file_type.startswith("image/"):
                     image_paths_for_ai.append(f.storage_path)
 
-    # DB에서 페르소나 조회
-    persona = get_persona_from_db(role_key)
+    # 페르소나 스냅샷 조회 (페르소나/프롬프트/허용 모델/배정 정보를 캐시에서 한 번에)
+    persona = get_persona_snapshot(role_key)
     if not persona:
         return jsonify({"error": "Invalid persona"}), 400
 
-    # 관리자 제외: 페르소나 접근 권한 체크
+    # 관리자 제외: 페르소나 접근 권한 및 공급사 제한 체크
     if not current_user.is_admin:
-        user_role = getattr(current_user, "role", "user") or "user"
-
-        # 사용자 역할별 접근 권한 확인
-        if user_role == "user":
-            # 학생 배정이 있으면 배정된 학생만, 없으면 allow_user 적용
-            has_student_assignments = PersonaStudentPermission.query.filter_by(
-                persona_id=persona.id
-            ).first() is not None
-            if has_student_assignments:
-                is_allowed = PersonaStudentPermission.query.filter_by(
-                    persona_id=persona.id, student_id=current_user.id
-                ).first() is not None
-            else:
-                is_allowed = persona.allow_user
-        else:  # teacher
-            # 관리 교사 배정이 있으면 배정된 교사만, 없으면 allow_teacher 적용
-            has_teacher_assignments = PersonaTeacherPermission.query.filter_by(
-                persona_id=persona.id
-            ).first() is not None
-            if has_teacher_assignments:
-                is_allowed = PersonaTeacherPermission.query.filter_by(
-                    persona_id=persona.id, teacher_id=current_user.id
-                ).first() is not None
-            else:
-                is_allowed = persona.allow_teacher
-
-        if not is_allowed:
-            return jsonify({"error": "권한 없음"}), 403
-
-        # 페르소나별 공급사 제한 체크
-        if provider == "google" and persona.restrict_google:
-            return jsonify({"error": "권한 없음"}), 403
-        if provider == "anthropic" and persona.restrict_anthropic:
-            return jsonify({"error": "권한 없음"}), 403
-        if provider == "openai" and persona.restrict_openai:
+        if not persona.can_access(current_user):
             return jsonify({"error": "권한 없음"}), 403
-        if provider == "xai" and persona.restrict_xai:
+        if persona.is_provider_restricted(provider):
             return jsonify({"error": "권한 없음"}), 403
 
     # 시스템 프롬프트 조회
-    system_prompt = get_system_prompt_from_db(persona.id, provider)
+    system_prompt = persona.system_prompt(provider)
 
-    # 페르소나 설정에 따라 모델 선택 (allowed_models_config 기반 3단계 필터링)
-    _allowed_list = []
-    if persona.allowed_models_config:
-        try:
-            _cfg = json.loads(persona.allowed_models_config)
-            _allowed_list = _cfg.get(provider, [])
-        except (ValueError, TypeError):
-            pass
-
-    if not _allowed_list:
-        # 폴백: 단일 필드 (기존 페르소나 하위호환)
-        _single = getattr(persona, f'model_{provider}', None)
-        if _single:
-            _allowed_list = [_single]
+    # 페르소나 설정에 따라 모델 선택 (allowed_models_config 기반, 없으면 단일 필드 폴백)
+    _allowed_list = persona.allowed_models_for(provider)
 
     # 학생이 요청한 model_id 검증 (허용 목록에 있어야만 사용)
     if requested_model_id and requested_model_id in _allowed_list:
@@ -580,133 +570,260 @@ def chat():
 
     selected_max_tokens = persona.max_tokens
 
+    # 기존 세션 사용 시 소유자 검증 (한도 차감/검색 임베딩 등 비용이 드는 단계보다 먼저)
+    session_id = data.get("session_id")
+    is_new_session = not session_id
+    current_session = None
+    if session_id:
+        current_session = db.session.get(ChatSession, session_id)
+        if not current_session:
+            return jsonify({"error": "Session not found"}), 404
+        if current_session.user_id != current_user.id:
+            return jsonify({"error": "권한 없음"}), 403
+
+    # 사용 한도 확인: 공급사 호출(세션 생성) 전에 요청 1건과 예상 토큰을 차감, 초과 시 즉시 429
+    # 대화 이력/실제 답변 길이는 스트림 종료 후 실제 사용량으로 정산한다.
     try:
-        session_id = data.get("session_id")
-
-        if session_id:
-            # 기존 세션 사용 시 소유자 검증
-            current_session = db.session.get(ChatSession, session_id)
-            if not current_session:
-                return jsonify({"error": "Session not found"}), 404
-            if current_session.user_id != current_user.id:
-                return jsonify({"error": "권한 없음"}), 403
-        else:
+        quota = reserve_quota(
+            current_user, role_key,
+            count_tokens(system_prompt) + count_tokens(user_message)
+            + min(selected_max_tokens or QUOTA_OUTPUT_RESERVE, QUOTA_OUTPUT_RESERVE),
+        )
+    except QuotaExceeded as quota_err:
+        return _quota_exceeded_response(quota_err)
+
+    # RAG 페르소나: 질문 임베딩 + 벡터 검색을 백그라운드에서 시작하고, 세션/대화 이력 조회와 병렬로 진행
+    # 단계별 소요 시간은 첫 SSE 이벤트(timings)로 전달한다.
+    timings = {}
+    rag_task = None
+    if persona.use_rag and user_message:
+        rag_task = RetrievalTask(current_app._get_current_object(), persona, user_message, current_user.id)
+    timings["prepare_ms"] = _elapsed_ms(received_at)
+
+    try:
+        stage_started = time.monotonic()
+        if is_new_session:
             # 새 세션 생성
             title = user_message[:30] if user_message else "새 대화"
             current_session = ChatSession(
                 title=title, user_id=current_user.id, role_key=role_key
             )
             db.session.add(current_session)
-            db.session.flush()
+            # 이후 메시지 INSERT가 별도 트랜잭션(write-behind)에서 참조하므로 세션은 즉시 커밋
+            db.session.commit()
             session_id = current_session.id
-            # 첨부 파일에 세션 ID 연결
-            if file_ids:
-                files = ChatFile.query.filter(ChatFile.id.in_(file_ids)).all()
-                for f in files:
-                    if f.user_id == current_user.id:
-                        f.session_id = session_id
-
-        # 세션 내 기존 메시지 조회(대화 문맥용)
-        db_messages = (
-            Message.query.filter_by(session_id=session_id)
-            .order_by(Message.timestamp.asc())
-            .all()
-        )
 
-        history_for_api = []
-        for msg in db_messages:
-            role = "user" if msg.is_user else "assistant"
-            msg_image_paths = []
-            if msg.image_path:
-                msg_image_paths = msg.image_path.split(",")
-
-            item = {"role": role, "content": msg.content, "image_paths": msg_image_paths}
-
-            # 연속된 동일 역할 메시지는 합쳐서 전송(토큰 절감)
-            if history_for_api and history_for_api[-1]["role"] == role:
-                prev_content = history_for_api[-1]["content"] or ""
-                curr_content = item["content"] or ""
-                history_for_api[-1]["content"] = prev_content + "\n\n" + curr_content
-                history_for_api[-1]["image_paths"].extend(item["image_paths"])
-            else:
-                history_for_api.append(item)
+        # 첨부 파일에 세션 ID 연결
+        enqueue_file_relink(owned_file_ids, session_id, current_user.id)
+        timings["session_ms"] = _elapsed_ms(stage_started)
+        stage_started = time.monotonic()
+
+        # 세션 내 최근 메시지 조회(대화 문맥용, 페르소나별 토큰 예산 내에서 최신순)
+        # 롤링 요약이 있으면 요약 이후 메시지만 사용하고, 요약은 시스템 프롬프트 문맥으로 전달
+        history_budget = persona.history_token_budget
+        session_summary = current_session.summary
+        window_budget = history_budget
+        dynamic_context = None
+        if session_summary:
+            dynamic_context = format_summary_context(session_summary)
+            # 요약이 예산 대부분을 차지하더라도 최근 대화용으로 최소 1/4은 남김
+            window_budget = max(
+                (history_budget or DEFAULT_HISTORY_TOKEN_BUDGET) - (current_session.summary_tokens or 0),
+                (history_budget or DEFAULT_HISTORY_TOKEN_BUDGET) // 4,
+            )
+        if is_new_session:
+            # 새 세션은 이전 대화가 없으므로 조회 생략
+            final_messages, history_stats = [], {"history_tokens": 0, "dropped_messages": 0}
+        else:
+            final_messages, history_stats = build_history_window(
+                session_id,
+                window_budget,
+                after=summary_boundary(current_session) if session_summary else None,
+            )
+        timings["history_ms"] = _elapsed_ms(stage_started)
 
-        final_messages = []
-        for m in history_for_api:
-            final_messages.append(m)
+        # 검색 결과 합류 (실패/시간 초과 시 참고 자료 없이 진행)
+        # 턴마다 바뀌는 참고 자료는 시스템 문맥이 아니라 현재 사용자 메시지 앞에 붙인다.
+        # 시스템 블록에 넣으면 그 뒤의 대화 이력 접두부(프롬프트 캐시 breakpoint)가 매 턴 달라져 캐시가 깨진다.
+        rag_context = None
+        if rag_task is not None:
+            rag_context = format_rag_context(rag_task.result()) or None
+            timings["rag"] = rag_task.timings
 
-        # 현재 사용자 메시지를 마지막에 추가
+        # 현재 사용자 메시지를 마지막에 추가 (DB에는 참고 자료 없이 원문만 저장)
         final_messages.append(
             {
                 "role": "user",
-                "content": user_message,
+                "content": f"{rag_context}\n\n[질문]\n{user_message}" if rag_context else user_message,
                 "image_paths": image_paths_for_ai,
             }
         )
 
         saved_img_path_str = ",".join(image_paths_for_ai) if image_paths_for_ai else None
 
-        # 사용자 메시지를 DB에 저장
-        db.session.add(
-            Message(
-                session_id=session_id,
-                user_id=current_user.id,
-                is_user=True,
-                content=user_message,
-                image_path=saved_img_path_str,
-                provider=provider,
-            )
+        # 사용자 메시지 저장 및 조기 개입 알림 감지는 write-behind 큐에서 배치로 처리
+        enqueue_message(
+            session_id=session_id,
+            user_id=current_user.id,
+            is_user=True,
+            content=user_message,
+            provider=provider,
+            image_path=saved_img_path_str,
+        )
+        enqueue_alert_check(current_user.id, session_id, role_key, user_message)
+
+        # AI 응답 생성은 HTTP 연결과 분리된 백그라운드 워커가 담당하고 턴 스트림에 기록한다.
+        # 클라이언트 연결이 끊겨도 생성과 DB 저장은 끝까지 진행되며, 재연결 시 Last-Event-ID로 이어받는다.
+        upload_folder = current_app.config["UPLOAD_FOLDER"]
+        user_id = current_user.id
+
+        # 장애 시 자동 전환할 후보 (요청 모델 → 같은 공급사의 허용 모델 → 다른 허용 공급사)
+        candidates = failover_candidates(persona, provider, selected_model_id)
+
+        # 프롬프트 크기 추정 (공급사가 usage를 돌려주면 그 값을 우선 사용)
+        estimated_prompt_tokens = (
+            history_stats.get("history_tokens", 0)
+            + count_tokens(system_prompt)
+            + count_tokens(dynamic_context)
+            + count_tokens(rag_context)
+            + count_tokens(user_message)
         )
-        db.session.commit()
 
-        # 조기 개입 알림 감지 (채팅 흐름에 영향 없도록 예외 무시)
-        try:
-            from services.alert_service import check_and_create_alerts
-            check_and_create_alerts(current_user.id, session_id, role_key, user_message)
-        except Exception:
-            pass
+        # 시맨틱 답변 캐시 대상: 캐시를 켠 페르소나의 첫 턴 텍스트 질문
+        semantic_namespace = None
+        if is_cacheable_question(persona, is_new_session, user_message, image_paths_for_ai):
+            semantic_namespace = cache_namespace(persona, provider, selected_model_id, system_prompt)
 
-        # AI 응답을 DB에 저장 (스트리밍 완료 후 저장을 위해, 이 블록은 스트리밍 제너레이터 내에서 처리하거나 프론트/비동기로 위임해야 합니다)
-        # HTTP 스트리밍(SSE) 응답 생성
-        def generate_sse():
-            yield f"data: {json.dumps({'message': '연결됨', 'session_id': session_id, 'provider': provider})}\n\n"
-            
+        def produce(emit):
             full_content = ""
-            try:
-                for chunk in generate_ai_response_stream(
-                    model_id=selected_model_id,
-                    system_prompt=system_prompt,
+            usage = {}
+            used = {}
+            question_vec = None
+
+            if semantic_namespace:
+                # 같은 페르소나/모델/프롬프트에서 유사한 첫 질문이 있었으면 저장된 답변을 즉시 재생
+                cached_answer, question_vec = lookup_answer(
+                    semantic_namespace, role_key, user_message,
+                    threshold=persona.semantic_cache_threshold, user_id=user_id,
+                )
+                if cached_answer is not None:
+                    for chunk in iter_answer_chunks(cached_answer):
+                        emit({'chunk': chunk})
+                    quota.settle(0)
+                    enqueue_message(
+                        session_id=session_id,
+                        user_id=user_id,
+                        is_user=False,
+                        content=cached_answer,
+                        provider=provider,
+                    )
+                    emit({'done': True, 'cached': True, **history_stats})
+                    return
+
+            span = StreamSpan("chat", role_key, received_at)
+
+            def open_stream(cand_provider, cand_model):
+                return generate_ai_response_stream(
+                    model_id=cand_model,
+                    system_prompt=system_prompt if cand_provider == provider else persona.system_prompt(cand_provider),
                     messages=final_messages,
                     max_tokens=selected_max_tokens,
-                    upload_folder=current_app.config["UPLOAD_FOLDER"],
+                    upload_folder=upload_folder,
+                    context=dynamic_context,
+                    usage=usage,
+                    raise_errors=True,
+                )
+
+            # 서킷 브레이커가 열린 공급사는 건너뛰고, 첫 토큰 전에 실패하면 다음 후보로 페일오버한다.
+            # 공급사/모델 동시성 한도를 넘으면 슬롯이 날 때까지 대기하며 순번을 알린다.
+            try:
+                for chunk in stream_with_failover(
+                    candidates, open_stream, user_id, emit, used, label="chat"
                 ):
+                    span.first_token()
                     full_content += chunk
-                    # JSON 포맷으로 이스케이프해서 클라이언트로 전송
-                    yield f"data: {json.dumps({'chunk': chunk})}\n\n"
-                
-                # 전송이 모두 끝나면 마무리 데이터 알림
-                yield f"data: {json.dumps({'done': True})}\n\n"
-                
-                # 완성된 메시지 DB에 비동기적으로 저장 (Flask app context 이용)
-                try:
-                    from app import app
-                    with app.app_context():
-                        db.session.add(
-                            Message(
-                                session_id=session_id,
-                                user_id=current_user.id,
-                                is_user=False,
-                                content=full_content,
-                                provider=provider,
-                            )
-                        )
-                        db.session.commit()
-                except Exception as save_err:
-                    print(f"SSE 완료 후 DB 저장 오류: {save_err}")
-                    
+                    emit({'chunk': chunk})
+            except AdmissionTimeout as wait_err:
+                quota.settle(0)
+                span.finish(provider, selected_model_id, prompt_tokens=estimated_prompt_tokens, error=wait_err)
+                emit({'error': str(wait_err)})
+                return
             except Exception as stream_err:
                 print(f"SSE 스트리밍 오류: {stream_err}")
-                yield f"data: {json.dumps({'error': str(stream_err)})}\n\n"
+                quota.settle(0)
+                span.finish(provider, selected_model_id, prompt_tokens=estimated_prompt_tokens, error=stream_err)
+                emit({'error': str(stream_err)})
+                return
+
+            answered_provider = used.get("provider", provider)
+            answered_model_id = used.get("model_id", selected_model_id)
+            output_tokens = usage.get("output_tokens") or count_tokens(full_content)
+            prompt_tokens = (
+                usage.get("input_tokens", 0)
+                + usage.get("cache_creation_input_tokens", 0)
+                + usage.get("cache_read_input_tokens", 0)
+            ) or estimated_prompt_tokens
+            span.finish(
+                answered_provider,
+                answered_model_id,
+                output_tokens=output_tokens,
+                prompt_tokens=prompt_tokens,
+                error=used.get("error"),
+            )
+            # 사용 한도 정산 (예약한 예상치 → 실제 입력+출력 토큰)
+            quota.settle(prompt_tokens + output_tokens)
+            # 토큰 사용량 원장 (usage 미수신 공급사는 추정치로 기록)
+            record_usage(
+                "chat", answered_model_id, usage, user_id=user_id, role_key=role_key,
+                provider=answered_provider,
+                estimated_input=estimated_prompt_tokens, estimated_output=output_tokens,
+            )
+
+            # 완성된 메시지 저장 예약 (클라이언트 연결 여부와 무관)
+            enqueue_message(
+                session_id=session_id,
+                user_id=user_id,
+                is_user=False,
+                content=full_content,
+                provider=used.get("provider", provider),
+            )
+
+            # 전송이 모두 끝나면 마무리 데이터 알림
+            done_event = {'done': True, **history_stats}
+            if used.get("model_id") != selected_model_id:
+                # 페일오버로 다른 공급사/모델이 답변한 경우
+                done_event['provider'] = used.get("provider")
+                done_event['model_id'] = used.get("model_id")
+            if usage:
+                # 토큰 사용량 (Anthropic은 프롬프트 캐시 읽기/쓰기 토큰 포함)
+                done_event['usage'] = usage
+            emit(done_event)
+
+            # 요청한 모델이 끝까지 정상 답변한 경우에만 시맨틱 캐시에 저장
+            # (페일오버 답변은 네임스페이스가 다르고, 응답 도중 실패/키 누락/안전 차단 문구는 답변이 아님)
+            if (
+                question_vec is not None
+                and used.get("model_id") == selected_model_id
+                and used.get("error") is None
+                and not is_error_response(full_content)
+            ):
+                store_answer(semantic_namespace, role_key, user_message, question_vec, full_content)
+
+            # 이력이 예산에 가까워지면 오래된 대화를 요약으로 접도록 백그라운드 예약 (답변 저장 이후 실행)
+            if should_summarize(history_stats, window_budget):
+                enqueue_session_summary(session_id, history_budget)
+
+        turn_id = start_turn_stream(
+            current_app._get_current_object(), session_id, user_id, produce
+        )
+        timings["total_ms"] = _elapsed_ms(received_at)
+
+        def generate_sse():
+            yield format_sse({
+                'message': '연결됨', 'session_id': session_id, 'provider': provider, 'turn_id': turn_id,
+                'timings': timings,
+            })
+            yield from iter_turn_events(session_id, turn_id)
 
         return Response(stream_with_context(generate_sse()), mimetype='text/event-stream')
 
@@ -715,9 +832,32 @@ def chat():
         print(f"Chat Error ({provider}): {e}")
         traceback.print_exc()
         db.session.rollback()
+        quota.settle(0)
         return jsonify({"error": f"AI 응답 오류 ({provider}): {str(e)}"}), 500
 
 
+@chat_bp.route("/api/chat/stream/<int:session_id>/<turn_id>")
+@login_required
+def resume_chat_stream(session_id, turn_id):
+    """끊긴 채팅 응답 스트림 이어받기.
+
+    - 권한: 턴 소유자
+    - 입력: Last-Event-ID 헤더(또는 last_event_id 쿼리) — 마지막으로 받은 이벤트 ID
+    - 동작: 해당 ID 이후 이벤트를 재전송하고, 생성 중이면 완료될 때까지 계속 전달
+    """
+    owner_id = get_turn_owner(session_id, turn_id)
+    if owner_id is None:
+        return jsonify({"error": "만료되었거나 존재하지 않는 응답 스트림입니다."}), 404
+    if owner_id != current_user.id:
+        return jsonify({"error": "권한 없음"}), 403
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    return Response(
+        stream_with_context(iter_turn_events(session_id, turn_id, last_event_id)),
+        mimetype='text/event-stream',
+    )
+
+
 @chat_bp.route("/api/image_task_status/<task_id>")
 @login_required
 def image_task_status(task_id):
@@ -866,6 +1006,7 @@ def delete_session(session_id):
 
                 if os.path.exists(path):
                     os.remove(path)
+                    remove_image_derivatives(path)
             except Exception as e:
                 print(f"File removal error: {e}")
 
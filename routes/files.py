@@ -9,6 +9,7 @@ from werkzeug.utils import secure_filename
 from extensions import db
 from models import ChatFile, ChatSession
 from services.file_service import extract_text_from_file
+from services.image_service import create_image_derivative
 
 files_bp = Blueprint("files", __name__)
 
@@ -52,6 +53,13 @@ def upload_file_api():
             f.write(content)
         os.chmod(save_path, 0o644)
 
+        # 이미지는 AI 전송용 축소 파생본을 미리 생성 (실패해도 전송 시점에 재시도)
+        if is_image:
+            try:
+                create_image_derivative(save_path)
+            except Exception as e:
+                print(f"⚠️ 이미지 전처리 실패 ({filename}): {e}")
+
         # 이미지가 아닌 경우 텍스트 추출
         text = ""
         if not is_image:
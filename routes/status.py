@@ -1,4 +1,4 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request
 from flask_login import login_required, current_user
 import os
 import json
@@ -81,6 +81,7 @@ def toggle_provider_status():
     if conf:
         conf.value = "restricted" if conf.value == "active" else "active"
         db.session.commit()
+        cache.delete("provider_statuses")
         return jsonify({"success": True, "provider": provider, "status": conf.value})
     return jsonify({"error": "Provider not found"}), 404
 
@@ -105,10 +106,289 @@ def set_provider_status():
     if conf:
         conf.value = status
         db.session.commit()
+        cache.delete("provider_statuses")
         return jsonify({"success": True, "provider": provider, "status": conf.value})
     return jsonify({"error": "Provider not found"}), 404
 
 
+@status_bp.route("/api/admin/provider_concurrency", methods=["GET"])
+@login_required
+def get_provider_concurrency():
+    """공급사/모델 동시 호출 한도와 현재 실행·대기 수 조회(관리자 전용).
+
+    - 권한: 관리자
+    - 응답: limits(provider/model별 한도, 0=무제한), usage(공급사별 in_flight/queued),
+            breakers(공급사별 서킷 브레이커 상태와 최근 60초 호출/실패/지연 수)
+    """
+    if not current_user.is_admin:
+        return jsonify({"error": "Admin only"}), 403
+    from services.admission_service import concurrency_usage, get_concurrency_limits
+    from services.circuit_breaker import breaker_states
+    return jsonify({
+        "limits": get_concurrency_limits(),
+        "usage": concurrency_usage(),
+        "breakers": breaker_states(),
+    })
+
+
+@status_bp.route("/api/admin/set_provider_concurrency", methods=["POST"])
+@login_required
+def set_provider_concurrency():
+    """공급사(또는 모델) 동시 호출 한도 설정(관리자 전용).
+
+    - 권한: 관리자
+    - 입력: provider, limit(0 이상, 0=무제한), model_id(선택 — 지정 시 모델별 한도)
+    - 저장: SystemConfig provider_concurrency_{provider} / model_concurrency_{model_id}
+    """
+    if not current_user.is_admin:
+        return jsonify({"error": "Admin only"}), 403
+    data = request.json or {}
+    provider = data.get("provider")
+    model_id = data.get("model_id")
+    try:
+        limit = int(data.get("limit"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid limit"}), 400
+    if limit < 0:
+        return jsonify({"error": "Invalid limit"}), 400
+
+    if model_id:
+        # 한도는 LLMSlot이 실제 model_id로 조회하므로 등록된 모델만 허용 (오타 키가 조용히 무시되지 않도록)
+        from services.ai_service import AVAILABLE_MODELS
+        if model_id not in AVAILABLE_MODELS:
+            return jsonify({"error": "Model not found"}), 404
+        key = f"model_concurrency_{model_id}"
+    elif provider in ["openai", "anthropic", "google", "xai"]:
+        key = f"provider_concurrency_{provider}"
+    else:
+        return jsonify({"error": "Provider not found"}), 404
+
+    conf = SystemConfig.query.filter_by(key=key).first()
+    if not conf:
+        conf = SystemConfig(key=key, value=str(limit))
+        db.session.add(conf)
+    else:
+        conf.value = str(limit)
+    db.session.commit()
+
+    from services.admission_service import invalidate_concurrency_limits
+    invalidate_concurrency_limits()
+    return jsonify({"success": True, "key": key, "limit": limit})
+
+
+@status_bp.route("/api/admin/quotas", methods=["GET"])
+@login_required
+def get_quotas():
+    """토큰/요청 사용 한도 설정 조회(관리자 전용).
+
+    - 권한: 관리자
+    - 입력: user_id(선택), role_key(선택) — 지정 시 해당 사용자에게 적용되는 한도별 남은 양 포함
+    - 응답: quotas({"user"|"role"|"persona": {키: {tokens_day, tokens_hour, requests_day, requests_hour}}}),
+            fields, status(선택)
+    """
+    if not current_user.is_admin:
+        return jsonify({"error": "Admin only"}), 403
+    from models import User
+    from services.quota_service import LIMIT_FIELDS, get_quota_config, quota_status
+    result = {"quotas": get_quota_config(), "fields": list(LIMIT_FIELDS)}
+    user_id = request.args.get("user_id", type=int)
+    if user_id:
+        user = db.session.get(User, user_id)
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+        result["status"] = quota_status(user, request.args.get("role_key"))
+    return jsonify(result)
+
+
+@status_bp.route("/api/admin/set_quota", methods=["POST"])
+@login_required
+def set_quota():
+    """사용 한도 설정(관리자 전용).
+
+    - 권한: 관리자
+    - 입력: scope(user|role|persona), key(user_id / 역할(user|teacher) / role_key, "*"=범위 기본값),
+            tokens_day, tokens_hour, requests_day, requests_hour (0 이상, 0=무제한, 모두 0이면 설정 삭제)
+    - 저장: SystemConfig usage_quotas (JSON)
+    """
+    if not current_user.is_admin:
+        return jsonify({"error": "Admin only"}), 403
+    from services.quota_service import (
+        SCOPES, get_quota_config, invalidate_quota_config, normalize_limits,
+    )
+    data = request.json or {}
+    scope = data.get("scope")
+    key = str(data.get("key") or "").strip()
+    if scope not in SCOPES or not key or (scope == "role" and key == "*"):
+        return jsonify({"error": "Invalid scope or key"}), 400
+    try:
+        limits = normalize_limits(data)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid limit"}), 400
+
+    invalidate_quota_config()
+    config = get_quota_config()
+    if limits:
+        config[scope][key] = limits
+    else:
+        config[scope].pop(key, None)
+
+    conf = SystemConfig.query.filter_by(key="usage_quotas").first()
+    if not conf:
+        conf = SystemConfig(key="usage_quotas", value=json.dumps(config))
+        db.session.add(conf)
+    else:
+        conf.value = json.dumps(config)
+    db.session.commit()
+    invalidate_quota_config()
+    return jsonify({"success": True, "scope": scope, "key": key, "limits": limits})
+
+
+@status_bp.route("/api/admin/cache_stats", methods=["GET"])
+@login_required
+def get_cache_stats():
+    """프로세스 내부 캐시 통계 조회(관리자 전용).
+
+    - 권한: 관리자
+    - 응답: 이미지 페이로드 캐시 / 페르소나 스냅샷 L1 캐시 / 시맨틱 답변 캐시 / 질의 임베딩 캐시(L1+Redis)의 적중률·크기, 공용 HTTP 전송 계층 설정,
+            스트리밍 엔진(sync/asyncio) 상태
+    - 참고: gunicorn 워커별 값이므로 요청을 처리한 워커 기준
+    """
+    if not current_user.is_admin:
+        return jsonify({"error": "Admin only"}), 403
+    from services.ai_service import STREAM_ENGINE
+    from services.http_transport import transport_stats
+    from services.image_cache import image_cache_stats
+    from services.persona_cache import persona_snapshot_cache_stats
+    from services.embedding_cache import embedding_cache_stats
+    from services.semantic_cache import semantic_cache_stats
+    return jsonify({
+        "pid": os.getpid(),
+        "image_cache": image_cache_stats(),
+        "persona_snapshots": persona_snapshot_cache_stats(),
+        "semantic_answers": semantic_cache_stats(),
+        "embeddings": embedding_cache_stats(),
+        "http_transport": transport_stats(),
+        "stream_engine": _stream_engine_stats(STREAM_ENGINE),
+    })
+
+
+@status_bp.route("/api/admin/vector_index", methods=["GET"])
+@login_required
+def get_vector_index():
+    """document_chunk.embedding ANN 인덱스 상태 조회(관리자 전용).
+
+    - 권한: 관리자
+    - 응답: 현재 인덱스 종류/파라미터/크기/유효 여부, 마지막 생성 기록, 생성 진행률, 재생성 필요 사유
+    """
+    if not current_user.is_admin:
+        return jsonify({"error": "Admin only"}), 403
+    from services.vector_index import vector_index_status
+    return jsonify(vector_index_status())
+
+
+@status_bp.route("/api/admin/vector_index/rebuild", methods=["POST"])
+@login_required
+def rebuild_vector_index():
+    """ANN 인덱스 재생성 요청(관리자 전용, Celery에서 CREATE INDEX CONCURRENTLY 실행).
+
+    - 권한: 관리자
+    - 입력: { "kind": "hnsw" | "ivfflat" | "none" } (생략 시 VECTOR_INDEX_KIND)
+    - 응답: { "success": true, "task_id": "...", "kind": "..." }
+    """
+    if not current_user.is_admin:
+        return jsonify({"error": "Admin only"}), 403
+    from services.vector_index import INDEX_KINDS, VECTOR_INDEX_KIND
+    if db.engine.dialect.name != "postgresql":
+        return jsonify({"error": "ANN 인덱스는 PostgreSQL(pgvector)에서만 지원합니다."}), 400
+    kind = (request.get_json(silent=True) or {}).get("kind") or VECTOR_INDEX_KIND
+    if kind not in INDEX_KINDS:
+        return jsonify({"error": f"kind는 {', '.join(INDEX_KINDS)} 중 하나여야 합니다."}), 400
+    from tasks import rebuild_vector_index_async
+    task = rebuild_vector_index_async.delay(kind, "manual")
+    return jsonify({"success": True, "task_id": task.id, "kind": kind})
+
+
+def _stream_engine_stats(engine):
+    if engine != "asyncio":
+        return {"engine": engine}
+    from services.async_stream import stream_engine_stats
+    return stream_engine_stats()
+
+
+def _is_direct_local_request():
+    """
+    프록시를 거치지 않은 로컬 요청인지 (ProxyFix가 X-Forwarded-For로 바꾸기 전의 원래 접속 주소 기준).
+
+    request.remote_addr는 클라이언트가 보낸 X-Forwarded-For 값이 될 수 있고, 같은 호스트의 Nginx를 거친
+    외부 요청도 원래 주소는 127.0.0.1이므로 전달 헤더가 없는 경우만 로컬로 본다.
+    """
+    orig = request.environ.get("werkzeug.proxy_fix.orig") or {}
+    remote_addr = orig.get("REMOTE_ADDR", request.environ.get("REMOTE_ADDR"))
+    return remote_addr in ("127.0.0.1", "::1") and "X-Forwarded-For" not in request.headers
+
+
+@status_bp.route("/metrics", methods=["GET"])
+def metrics():
+    """LLM 스트리밍 텔레메트리(Prometheus 텍스트 형식).
+
+    - 권한: METRICS_TOKEN 설정 시 Authorization: Bearer 토큰, 미설정 시 프록시를 거치지 않은 로컬 요청 또는 관리자
+    - 응답: TTFT/생성 시간/전체 시간/출력 토큰 속도/프롬프트 크기 히스토그램과 요청·오류 카운터
+            (provider, model_id, role_key, path 라벨, Redis가 있으면 전 워커 합산)
+    """
+    token = os.environ.get("METRICS_TOKEN")
+    if token:
+        if request.headers.get("Authorization") != f"Bearer {token}":
+            return jsonify({"error": "Unauthorized"}), 401
+    elif not _is_direct_local_request() and not (
+        current_user.is_authenticated and current_user.is_admin
+    ):
+        return jsonify({"error": "Unauthorized"}), 401
+    from services.telemetry import render_prometheus
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+@status_bp.route("/api/admin/llm_latency", methods=["GET"])
+@login_required
+def get_llm_latency():
+    """최근 구간의 LLM 지연/처리량 분위수 조회(관리자 전용).
+
+    - 권한: 관리자
+    - 입력: group_by(선택, 쉼표 구분 — path,provider,model_id,role_key 중. 기본 path,provider,model_id)
+    - 응답: window_minutes, series[{라벨..., 지표별 count/p50/p95/p99}]
+    """
+    if not current_user.is_admin:
+        return jsonify({"error": "Admin only"}), 403
+    from services.telemetry import LABEL_NAMES, rolling_summary
+    group_by = tuple(
+        name for name in (request.args.get("group_by") or "path,provider,model_id").split(",")
+        if name in LABEL_NAMES
+    )
+    return jsonify(rolling_summary(group_by or ("path", "provider", "model_id")))
+
+
+@status_bp.route("/api/admin/usage", methods=["GET"])
+@login_required
+def get_usage_report():
+    """토큰 사용량/비용 집계 조회(관리자 전용).
+
+    - 권한: 관리자
+    - 입력: days(선택, 1~365, 기본 30), group_by(선택, 쉼표 구분 — user,persona,model,feature. 기본 model)
+    - 응답: totals, daily[{day, requests, input/output/cache 토큰, cost_usd}], groups[{그룹 컬럼..., 합계}]
+    """
+    if not current_user.is_admin:
+        return jsonify({"error": "Admin only"}), 403
+    from services.usage_ledger import GROUP_COLUMNS, usage_report
+    try:
+        days = min(max(int(request.args.get("days", 30)), 1), 365)
+    except ValueError:
+        return jsonify({"error": "days는 정수여야 합니다."}), 400
+    group_by = tuple(
+        name for name in (request.args.get("group_by") or "model").split(",")
+        if name in GROUP_COLUMNS
+    )
+    return jsonify(usage_report(days, group_by or ("model",)))
+
+
 # ========================================================================
 # 공급사 모델 설정 API
 # ========================================================================
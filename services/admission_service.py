@@ -0,0 +1,401 @@
+"""
+외부 LLM 호출 동시성 제어(admission control)
+
+반 전체가 동시에 질문하면 한 공급사로 수백 개의 스트림이 열려 rate limit에 걸리고
+모두가 한꺼번에 실패합니다. 공급사별(선택적으로 모델별) 동시 호출 수를 제한하고,
+초과분은 대기열에서 기다리게 하며 대기 순번을 SSE로 알려줍니다.
+
+- 한도: SystemConfig provider_concurrency_{provider}, model_concurrency_{model_id} (0 또는 미설정 = 무제한)
+- 세마포어: Redis sorted set(워커 간 공유, Lua로 원자적 획득). Redis가 없으면 프로세스 내부 구현
+- 공정성: 같은 사용자가 이미 대기/실행 중인 요청이 있으면 그만큼 뒤로 밀어 한 사용자가 슬롯을 독점하지 못하게 함
+- 대기열은 공급사 단위 하나지만, 모델 한도가 찬 모델을 기다리는 대기자는 공급사 슬롯 순번에서 빼고 센다.
+  (포화된 모델 하나 때문에 같은 공급사의 다른 모델 요청까지 막히지 않도록)
+- 임대(lease): 슬롯 보유자는 주기적으로 임대를 갱신하며, 워커가 죽으면 LEASE_SECONDS 후 자동 반환
+"""
+
+import os
+import threading
+import time
+import uuid
+
+from extensions import cache
+from models import SystemConfig
+from services.cache_utils import get_redis_client
+
+PROVIDERS = ("openai", "anthropic", "google", "xai")
+
+LEASE_SECONDS = 90          # 보유 슬롯 임대 시간 (갱신 주기는 1/3)
+WAITER_STALE_SECONDS = 15   # 대기자가 이 시간 동안 폴링하지 않으면 대기열에서 제거
+POLL_INTERVAL = 0.5
+FAIRNESS_PENALTY = 30.0     # 사용자당 진행 중인 요청 1건마다 대기 순서를 30초만큼 뒤로
+ADMISSION_TIMEOUT = int(os.getenv("LLM_ADMISSION_TIMEOUT", "120"))
+
+_LIMITS_CACHE_KEY = "llm_concurrency_limits"
+_HOLDERS_KEY = "llm_sem:{scope}"
+_QUEUE_KEY = "llm_queue:{provider}"
+_SEEN_KEY = "llm_queue_seen:{provider}"
+_META_KEY = "llm_queue_meta:{provider}"   # 대기 token -> "모델 한도|모델 범위"
+
+
+class AdmissionTimeout(Exception):
+    """대기 시간 안에 슬롯을 얻지 못한 경우"""
+
+
+# ----------------------------------------------------------------------
+# 한도 설정 (SystemConfig, 30초 캐시)
+# ----------------------------------------------------------------------
+
+def get_concurrency_limits():
+    """{"provider": {...}, "model": {...}} 형태의 동시성 한도 (0 = 무제한)"""
+    limits = cache.get(_LIMITS_CACHE_KEY)
+    if limits is None:
+        limits = {"provider": {}, "model": {}}
+        rows = SystemConfig.query.filter(
+            SystemConfig.key.like("provider_concurrency_%")
+            | SystemConfig.key.like("model_concurrency_%")
+        ).all()
+        for row in rows:
+            try:
+                value = max(int(row.value), 0)
+            except (TypeError, ValueError):
+                continue
+            if row.key.startswith("provider_concurrency_"):
+                limits["provider"][row.key[len("provider_concurrency_"):]] = value
+            else:
+                limits["model"][row.key[len("model_concurrency_"):]] = value
+        cache.set(_LIMITS_CACHE_KEY, limits, timeout=30)
+    return limits
+
+
+def invalidate_concurrency_limits():
+    cache.delete(_LIMITS_CACHE_KEY)
+
+
+# ----------------------------------------------------------------------
+# 세마포어 저장소
+# ----------------------------------------------------------------------
+
+# 순번 계산 (Lua/메모리 구현 공통 규칙)
+#   앞선 대기자를 모델 범위별로 세되, 모델 한도가 있는 범위는 그 모델의 남은 슬롯 수까지만 센다(eligible).
+#   공급사 순번 = eligible - 공급사 남은 슬롯 + 1, 모델 순번 = 같은 모델 대기자 - 모델 남은 슬롯 + 1
+#   둘 다 0 이하이면 획득, 아니면 큰 쪽이 대기 순번
+
+# KEYS: holders_provider, holders_model, queue, seen, meta
+# ARGV: token, now, lease_until, limit_provider, limit_model, stale_before, model_scope, holders_prefix
+# (다른 모델 범위의 보유자 키는 holders_prefix로 조합해 읽으므로 단일 Redis 전제)
+_ACQUIRE_LUA = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[2])
+local stale = redis.call('ZRANGEBYSCORE', KEYS[4], '-inf', ARGV[6])
+for _, t in ipairs(stale) do
+  redis.call('ZREM', KEYS[3], t)
+  redis.call('ZREM', KEYS[4], t)
+  redis.call('HDEL', KEYS[5], t)
+end
+local rank = redis.call('ZRANK', KEYS[3], ARGV[1])
+if not rank then return -1 end
+redis.call('ZADD', KEYS[4], ARGV[2], ARGV[1])
+local lp = tonumber(ARGV[4])
+local lm = tonumber(ARGV[5])
+local eligible = 0
+local same = 0
+if rank > 0 then
+  local ahead = {}
+  local limits = {}
+  local tokens = redis.call('ZRANGE', KEYS[3], 0, rank - 1)
+  local metas = redis.call('HMGET', KEYS[5], unpack(tokens))
+  for _, meta in ipairs(metas) do
+    if meta then
+      local sep = string.find(meta, '|', 1, true)
+      local scope = string.sub(meta, sep + 1)
+      limits[scope] = tonumber(string.sub(meta, 1, sep - 1))
+      ahead[scope] = (ahead[scope] or 0) + 1
+    else
+      eligible = eligible + 1
+    end
+  end
+  for scope, count in pairs(ahead) do
+    if scope == ARGV[7] then same = count end
+    if limits[scope] > 0 then
+      local used = redis.call('ZCOUNT', ARGV[8] .. scope, ARGV[2], '+inf')
+      eligible = eligible + math.max(math.min(count, limits[scope] - used), 0)
+    else
+      eligible = eligible + count
+    end
+  end
+end
+local position = 0
+if lp > 0 then position = math.max(position, eligible - (lp - redis.call('ZCARD', KEYS[1])) + 1) end
+if lm > 0 then position = math.max(position, same - (lm - redis.call('ZCARD', KEYS[2])) + 1) end
+if position <= 0 then
+  redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+  if lm > 0 then redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1]) end
+  redis.call('ZREM', KEYS[3], ARGV[1])
+  redis.call('ZREM', KEYS[4], ARGV[1])
+  redis.call('HDEL', KEYS[5], ARGV[1])
+  return 0
+end
+return position
+"""
+
+# KEYS: holders_provider, queue, seen, meta
+# ARGV: token, user_prefix, now, penalty, meta
+_ENQUEUE_LUA = """
+local count = 0
+for _, key in ipairs({KEYS[1], KEYS[2]}) do
+  for _, t in ipairs(redis.call('ZRANGE', key, 0, -1)) do
+    if string.sub(t, 1, string.len(ARGV[2])) == ARGV[2] then count = count + 1 end
+  end
+end
+redis.call('ZADD', KEYS[2], tonumber(ARGV[3]) + count * tonumber(ARGV[4]), ARGV[1])
+redis.call('ZADD', KEYS[3], ARGV[3], ARGV[1])
+redis.call('HSET', KEYS[4], ARGV[1], ARGV[5])
+return count
+"""
+
+
+class _RedisSemaphoreStore:
+    def __init__(self, client):
+        self._redis = client
+        self._acquire = client.register_script(_ACQUIRE_LUA)
+        self._enqueue = client.register_script(_ENQUEUE_LUA)
+
+    def enqueue(self, provider, model_scope, limit_model, token, user_prefix, now):
+        self._enqueue(
+            keys=[_HOLDERS_KEY.format(scope=provider), _QUEUE_KEY.format(provider=provider),
+                  _SEEN_KEY.format(provider=provider), _META_KEY.format(provider=provider)],
+            args=[token, user_prefix, now, FAIRNESS_PENALTY, f"{limit_model}|{model_scope}"],
+        )
+
+    def try_acquire(self, provider, model_scope, token, now, limit_provider, limit_model):
+        return int(self._acquire(
+            keys=[_HOLDERS_KEY.format(scope=provider), _HOLDERS_KEY.format(scope=model_scope),
+                  _QUEUE_KEY.format(provider=provider), _SEEN_KEY.format(provider=provider),
+                  _META_KEY.format(provider=provider)],
+            args=[token, now, now + LEASE_SECONDS, limit_provider, limit_model, now - WAITER_STALE_SECONDS,
+                  model_scope, _HOLDERS_KEY.format(scope="")],
+        ))
+
+    def refresh(self, provider, model_scope, token, now):
+        pipe = self._redis.pipeline()
+        for scope in (provider, model_scope):
+            pipe.zadd(_HOLDERS_KEY.format(scope=scope), {token: now + LEASE_SECONDS}, xx=True)
+        pipe.execute()
+
+    def release(self, provider, model_scope, token):
+        pipe = self._redis.pipeline()
+        pipe.zrem(_HOLDERS_KEY.format(scope=provider), token)
+        pipe.zrem(_HOLDERS_KEY.format(scope=model_scope), token)
+        pipe.zrem(_QUEUE_KEY.format(provider=provider), token)
+        pipe.zrem(_SEEN_KEY.format(provider=provider), token)
+        pipe.hdel(_META_KEY.format(provider=provider), token)
+        pipe.execute()
+
+    def usage(self, provider):
+        now = time.time()
+        pipe = self._redis.pipeline()
+        pipe.zcount(_HOLDERS_KEY.format(scope=provider), now, "+inf")
+        pipe.zcard(_QUEUE_KEY.format(provider=provider))
+        in_flight, queued = pipe.execute()
+        return {"in_flight": in_flight, "queued": queued}
+
+
+class _MemorySemaphoreStore:
+    """Redis 미설정(로컬 개발)용 프로세스 내부 구현 — Lua 스크립트와 같은 규칙"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._holders = {}   # scope -> {token: lease_until}
+        self._queues = {}    # provider -> {token: score}
+        self._seen = {}      # provider -> {token: last_seen}
+        self._meta = {}      # provider -> {token: (model_scope, limit_model)}
+
+    def enqueue(self, provider, model_scope, limit_model, token, user_prefix, now):
+        with self._lock:
+            holders = self._holders.setdefault(provider, {})
+            queue = self._queues.setdefault(provider, {})
+            count = sum(1 for t in list(holders) + list(queue) if t.startswith(user_prefix))
+            queue[token] = now + count * FAIRNESS_PENALTY
+            self._seen.setdefault(provider, {})[token] = now
+            self._meta.setdefault(provider, {})[token] = (model_scope, limit_model)
+
+    def try_acquire(self, provider, model_scope, token, now, limit_provider, limit_model):
+        with self._lock:
+            holders_p = self._holders.setdefault(provider, {})
+            holders_m = self._holders.setdefault(model_scope, {})
+            for holders in (holders_p, holders_m):
+                for t in [t for t, until in holders.items() if until <= now]:
+                    del holders[t]
+            queue = self._queues.setdefault(provider, {})
+            seen = self._seen.setdefault(provider, {})
+            meta = self._meta.setdefault(provider, {})
+            for t in [t for t, ts in seen.items() if ts <= now - WAITER_STALE_SECONDS]:
+                queue.pop(t, None)
+                seen.pop(t, None)
+                meta.pop(t, None)
+            if token not in queue:
+                return -1
+            seen[token] = now
+            order = sorted(queue, key=lambda t: (queue[t], t))
+            ahead, limits = {}, {}
+            for t in order[:order.index(token)]:
+                scope, limit = meta.get(t, (None, 0))
+                ahead[scope] = ahead.get(scope, 0) + 1
+                limits[scope] = limit
+            eligible = 0
+            for scope, count in ahead.items():
+                if limits[scope] > 0:
+                    used = sum(1 for until in self._holders.get(scope, {}).values() if until > now)
+                    eligible += max(min(count, limits[scope] - used), 0)
+                else:
+                    eligible += count
+            position = 0
+            if limit_provider > 0:
+                position = max(position, eligible - (limit_provider - len(holders_p)) + 1)
+            if limit_model > 0:
+                position = max(position, ahead.get(model_scope, 0) - (limit_model - len(holders_m)) + 1)
+            if position <= 0:
+                holders_p[token] = now + LEASE_SECONDS
+                if limit_model > 0:
+                    holders_m[token] = now + LEASE_SECONDS
+                queue.pop(token, None)
+                seen.pop(token, None)
+                meta.pop(token, None)
+                return 0
+            return position
+
+    def refresh(self, provider, model_scope, token, now):
+        with self._lock:
+            for scope in (provider, model_scope):
+                holders = self._holders.get(scope, {})
+                if token in holders:
+                    holders[token] = now + LEASE_SECONDS
+
+    def release(self, provider, model_scope, token):
+        with self._lock:
+            for scope in (provider, model_scope):
+                self._holders.get(scope, {}).pop(token, None)
+            self._queues.get(provider, {}).pop(token, None)
+            self._seen.get(provider, {}).pop(token, None)
+            self._meta.get(provider, {}).pop(token, None)
+
+    def usage(self, provider):
+        now = time.time()
+        with self._lock:
+            holders = self._holders.get(provider, {})
+            return {
+                "in_flight": sum(1 for until in holders.values() if until > now),
+                "queued": len(self._queues.get(provider, {})),
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                client = get_redis_client()
+                _store = _RedisSemaphoreStore(client) if client is not None else _MemorySemaphoreStore()
+    return _store
+
+
+# ----------------------------------------------------------------------
+# 슬롯
+# ----------------------------------------------------------------------
+
+class LLMSlot:
+    """
+    공급사/모델 동시성 슬롯 하나.
+
+    사용 예:
+        slot = LLMSlot(provider, model_id, user_id)
+        for position in slot.wait():      # 대기 중이면 순번을 yield
+            emit({"queued": True, "position": position})
+        try:
+            ... LLM 호출 ...
+        finally:
+            slot.release()
+    """
+
+    def __init__(self, provider, model_id, user_id, timeout=None):
+        limits = get_concurrency_limits()
+        self.provider = provider
+        self.model_scope = f"{provider}:{model_id}"
+        self.limit_provider = limits["provider"].get(provider, 0)
+        self.limit_model = limits["model"].get(model_id, 0)
+        self.user_prefix = f"{user_id}:"
+        self.token = f"{user_id}:{uuid.uuid4().hex}"
+        self.timeout = ADMISSION_TIMEOUT if timeout is None else timeout
+        self.acquired = False
+        self._stop_refresh = None
+
+    @property
+    def unlimited(self):
+        return self.limit_provider <= 0 and self.limit_model <= 0
+
+    def wait(self):
+        """슬롯을 얻을 때까지 대기하며 순번이 바뀔 때마다 yield. 시간 초과 시 AdmissionTimeout"""
+        if self.unlimited:
+            return
+        store = _get_store()
+        store.enqueue(self.provider, self.model_scope, self.limit_model, self.token, self.user_prefix, time.time())
+        deadline = time.monotonic() + self.timeout
+        last_position = None
+
+        while True:
+            position = store.try_acquire(
+                self.provider, self.model_scope, self.token, time.time(),
+                self.limit_provider, self.limit_model,
+            )
+            if position == 0:
+                self.acquired = True
+                self._start_refresh(store)
+                return
+            if position < 0:
+                # 폴링이 늦어 대기열에서 빠진 경우 다시 줄을 선다
+                store.enqueue(
+                    self.provider, self.model_scope, self.limit_model, self.token, self.user_prefix, time.time()
+                )
+            elif position != last_position:
+                last_position = position
+                yield position
+
+            if time.monotonic() > deadline:
+                store.release(self.provider, self.model_scope, self.token)
+                raise AdmissionTimeout(
+                    f"{self.provider} 요청이 많아 대기 시간이 초과되었습니다. 잠시 후 다시 시도해주세요."
+                )
+            time.sleep(POLL_INTERVAL)
+
+    def _start_refresh(self, store):
+        stop = threading.Event()
+        self._stop_refresh = stop
+
+        def refresh_loop():
+            while not stop.wait(LEASE_SECONDS / 3):
+                try:
+                    store.refresh(self.provider, self.model_scope, self.token, time.time())
+                except Exception as e:
+                    print(f"⚠️ LLM 슬롯 임대 갱신 실패: {e}")
+
+        threading.Thread(target=refresh_loop, name="llm-slot-lease", daemon=True).start()
+
+    def release(self):
+        if self._stop_refresh is not None:
+            self._stop_refresh.set()
+        if self.acquired:
+            self.acquired = False
+            try:
+                _get_store().release(self.provider, self.model_scope, self.token)
+            except Exception as e:
+                print(f"⚠️ LLM 슬롯 반환 실패 (임대 만료 시 자동 반환): {e}")
+
+
+def concurrency_usage():
+    """공급사별 현재 실행/대기 수 (관리자 모니터링용)"""
+    store = _get_store()
+    return {provider: store.usage(provider) for provider in PROVIDERS}
@@ -4,20 +4,23 @@ AI 공급사별 클라이언트 초기화 및 통합 응답 생성 로직.
 """
 
 import os
-import base64
-import mimetypes
 
 import anthropic
 import openai
 import google.generativeai as genai
-import httpx
+from services.http_transport import DEFAULT_TIMEOUT, get_http_client
+from services.image_cache import get_image_payload
 
 _anthropic_client = None
 def get_anthropic_client():
     global _anthropic_client
     if _anthropic_client is None and os.getenv("ANTHROPIC_API_KEY"):
         try:
-            _anthropic_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+            _anthropic_client = anthropic.Anthropic(
+                api_key=os.getenv("ANTHROPIC_API_KEY"),
+                http_client=get_http_client(),
+                timeout=DEFAULT_TIMEOUT,
+            )
         except Exception as e:
             print(f"⚠️ Anthropic Client Init Error: {e}")
     return _anthropic_client
@@ -27,7 +30,11 @@ def get_openai_client():
     global _openai_client
     if _openai_client is None and os.getenv("OPENAI_API_KEY"):
         try:
-            _openai_client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+            _openai_client = openai.OpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                http_client=get_http_client(),
+                timeout=DEFAULT_TIMEOUT,
+            )
         except Exception as e:
             print(f"⚠️ OpenAI Client Init Error: {e}")
     return _openai_client
@@ -39,12 +46,45 @@ def get_xai_client():
         try:
             _xai_client = openai.OpenAI(
                 api_key=os.getenv("XAI_API_KEY"),
-                base_url="https://api.x.ai/v1"
+                base_url="https://api.x.ai/v1",
+                http_client=get_http_client(),
+                timeout=DEFAULT_TIMEOUT,
             )
         except Exception as e:
             print(f"⚠️ xAI Client Init Error: {e}")
     return _xai_client
 
+_gemini_client = None
+def get_gemini_client():
+    """Gemini 스트리밍용 OpenAI 호환 클라이언트 (gRPC SDK 대신 HTTP/SSE 엔드포인트 사용)"""
+    global _gemini_client
+    if _gemini_client is None and os.getenv("GOOGLE_API_KEY"):
+        try:
+            _gemini_client = openai.OpenAI(
+                api_key=os.getenv("GOOGLE_API_KEY"),
+                base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
+                http_client=get_http_client(),
+                timeout=DEFAULT_TIMEOUT,
+            )
+        except Exception as e:
+            print(f"⚠️ Gemini Client Init Error: {e}")
+    return _gemini_client
+
+# 오프라인 부하 테스트용 모의 공급사 (services/mock_provider.py). MOCK_LLM_URL이 있을 때만 등록된다.
+MOCK_LLM_URL = os.getenv("MOCK_LLM_URL")
+
+_mock_client = None
+def get_mock_client():
+    global _mock_client
+    if _mock_client is None and MOCK_LLM_URL:
+        _mock_client = openai.OpenAI(
+            api_key="mock",
+            base_url=MOCK_LLM_URL,
+            http_client=get_http_client(),
+            timeout=DEFAULT_TIMEOUT,
+        )
+    return _mock_client
+
 def init_google_client():
     if os.getenv("GOOGLE_API_KEY"):
         try:
@@ -336,8 +376,100 @@ DEFAULT_MODELS = {
 DEFAULT_MODEL = DEFAULT_MODELS["anthropic"]
 DEFAULT_MAX_TOKENS = 4096
 
+if MOCK_LLM_URL:
+    AVAILABLE_MODELS["mock-llm"] = {
+        "name": "Mock LLM (부하 테스트)",
+        "provider": "mock",
+        "input_price": 0.0,
+        "output_price": 0.0,
+        "description": "로컬 모의 공급사 — 실제 API를 호출하지 않음",
+    }
+    DEFAULT_MODELS["mock"] = "mock-llm"
+
 
-def generate_ai_response(model_id, system_prompt, messages, max_tokens, upload_folder):
+# ---------------------------------------------------------
+# Anthropic 프롬프트 캐싱 헬퍼
+# ---------------------------------------------------------
+# 페르소나 시스템 프롬프트는 같은 페르소나를 쓰는 모든 학생에게 동일하므로 캐시 블록으로 보내고,
+# 세션 요약 등 요청마다 달라지는 문맥은 그 뒤 별도 블록(캐시 안 함)으로 붙인다.
+# 대화 이력은 직전 턴까지가 다음 요청에서도 그대로 반복되는 접두부이므로 마지막 이력 메시지에
+# 두 번째 breakpoint를 둔다. (최소 캐시 길이에 못 미치는 프롬프트는 API가 캐싱 없이 처리)
+_EPHEMERAL_CACHE = {"type": "ephemeral"}
+
+
+def _merge_system_context(system_prompt, context):
+    """캐시 블록을 지원하지 않는 공급사용: 시스템 프롬프트 뒤에 동적 문맥을 이어 붙인다."""
+    if not context:
+        return system_prompt
+    return f"{system_prompt}\n\n{context}" if system_prompt else context
+
+
+def _anthropic_system_blocks(system_prompt, context=None):
+    """Anthropic system 파라미터를 [캐시된 페르소나 프롬프트, 동적 문맥] 블록으로 구성"""
+    blocks = []
+    if system_prompt:
+        blocks.append({"type": "text", "text": system_prompt, "cache_control": _EPHEMERAL_CACHE})
+    if context:
+        blocks.append({"type": "text", "text": context})
+    return blocks or (system_prompt or "")
+
+
+def _mark_anthropic_history_prefix(anthropic_messages):
+    """현재 턴 직전 메시지의 마지막 블록에 cache_control을 달아 대화 이력 접두부를 캐싱"""
+    if len(anthropic_messages) < 2:
+        return
+    prefix_content = anthropic_messages[-2]["content"]
+    if prefix_content:
+        prefix_content[-1] = {**prefix_content[-1], "cache_control": _EPHEMERAL_CACHE}
+
+
+def _record_anthropic_usage(message_usage, usage):
+    """Anthropic 응답 usage(캐시 읽기/쓰기 토큰 포함)를 usage dict에 기록"""
+    if message_usage is None:
+        return
+    data = {
+        "input_tokens": getattr(message_usage, "input_tokens", 0) or 0,
+        "output_tokens": getattr(message_usage, "output_tokens", 0) or 0,
+        "cache_creation_input_tokens": getattr(message_usage, "cache_creation_input_tokens", 0) or 0,
+        "cache_read_input_tokens": getattr(message_usage, "cache_read_input_tokens", 0) or 0,
+    }
+    if data["cache_creation_input_tokens"] or data["cache_read_input_tokens"]:
+        print(
+            f"🗄️ Anthropic 프롬프트 캐시: read={data['cache_read_input_tokens']}, "
+            f"write={data['cache_creation_input_tokens']}, uncached={data['input_tokens']}"
+        )
+    if usage is not None:
+        usage.update(data)
+
+
+def _record_openai_usage(response_usage, usage):
+    """OpenAI 호환 응답 usage를 Anthropic과 같은 키로 기록 (input_tokens는 캐시 미적중분)"""
+    if response_usage is None or usage is None:
+        return
+    details = getattr(response_usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+    usage.update({
+        "input_tokens": (getattr(response_usage, "prompt_tokens", 0) or 0) - cached,
+        "output_tokens": getattr(response_usage, "completion_tokens", 0) or 0,
+        "cache_creation_input_tokens": 0,
+        "cache_read_input_tokens": cached,
+    })
+
+
+def _record_gemini_usage(usage_metadata, usage):
+    """Gemini SDK usage_metadata를 같은 키로 기록"""
+    if usage_metadata is None or usage is None:
+        return
+    cached = getattr(usage_metadata, "cached_content_token_count", 0) or 0
+    usage.update({
+        "input_tokens": (getattr(usage_metadata, "prompt_token_count", 0) or 0) - cached,
+        "output_tokens": getattr(usage_metadata, "candidates_token_count", 0) or 0,
+        "cache_creation_input_tokens": 0,
+        "cache_read_input_tokens": cached,
+    })
+
+
+def generate_ai_response(model_id, system_prompt, messages, max_tokens, upload_folder, usage=None):
     """
     여러 공급사에 대한 통합 응답 생성 함수.
 
@@ -347,6 +479,7 @@ def generate_ai_response(model_id, system_prompt, messages, max_tokens, upload_f
         messages: role/content/image_paths가 포함된 대화 기록.
         max_tokens: 응답 길이 제한.
         upload_folder: 이미지 파일이 저장된 업로드 루트 경로.
+        usage: dict를 넘기면 공급사가 돌려준 토큰 사용량과 실제 사용된 model_id를 채워 넣는다.
     """
     model_info = AVAILABLE_MODELS.get(model_id)
     if not model_info:
@@ -364,6 +497,8 @@ def generate_ai_response(model_id, system_prompt, messages, max_tokens, upload_f
 
     # 모델 소유 공급사를 기준으로 분기한다.
     provider = model_info["provider"]
+    if usage is not None:
+        usage["model_id"] = model_id
 
     if provider == "anthropic":
         # Anthropic 메시지 포맷(텍스트+이미지)을 구성한다.
@@ -378,17 +513,9 @@ def generate_ai_response(model_id, system_prompt, messages, max_tokens, upload_f
                 img_paths = [msg.get("image_path")]
 
             for img_path in img_paths:
-                # 로컬 파일을 base64로 읽어 Anthropic 이미지 형식으로 변환
+                # 로컬 파일을 Anthropic 이미지 블록으로 변환 (인코딩 결과는 LRU 캐시 재사용)
                 try:
-                    relative_path = img_path.replace("uploads/", "", 1)
-                    full_path = os.path.join(upload_folder, relative_path)
-                    with open(full_path, "rb") as f:
-                        img_data = base64.b64encode(f.read()).decode("utf-8")
-                        media_type = mimetypes.guess_type(full_path)[0] or "image/jpeg"
-                        content_list.append({
-                            "type": "image",
-                            "source": {"type": "base64", "media_type": media_type, "data": img_data},
-                        })
+                    content_list.append(get_image_payload(img_path, upload_folder, "anthropic"))
                 except Exception as e:
                     print(f"Anthropic Image Load Warning: {e}")
 
@@ -402,8 +529,10 @@ def generate_ai_response(model_id, system_prompt, messages, max_tokens, upload_f
                 anthropic_messages.append({"role": msg["role"], "content": content_list})
 
         response = anthropic_client.messages.create(
-            model=model_id, max_tokens=max_tokens, system=system_prompt, messages=anthropic_messages
+            model=model_id, max_tokens=max_tokens,
+            system=_anthropic_system_blocks(system_prompt), messages=anthropic_messages
         )
+        _record_anthropic_usage(getattr(response, "usage", None), usage)
         return response.content[0].text
 
     if provider == "openai":
@@ -427,15 +556,10 @@ def generate_ai_response(model_id, system_prompt, messages, max_tokens, upload_f
             for img_path in img_paths:
                 # OpenAI는 data URL 방식으로 이미지를 전달한다.
                 try:
-                    relative_path = img_path.replace("uploads/", "", 1)
-                    full_path = os.path.join(upload_folder, relative_path)
-                    with open(full_path, "rb") as f:
-                        img_b64 = base64.b64encode(f.read()).decode("utf-8")
-                        mime = mimetypes.guess_type(full_path)[0] or "image/jpeg"
-                        content_list.append({
-                            "type": "image_url",
-                            "image_url": {"url": f"data:{mime};base64,{img_b64}"},
-                        })
+                    content_list.append({
+                        "type": "image_url",
+                        "image_url": {"url": get_image_payload(img_path, upload_folder, "data_url")},
+                    })
                 except Exception:
                     pass
 
@@ -445,6 +569,18 @@ def generate_ai_response(model_id, system_prompt, messages, max_tokens, upload_f
         response = openai_client.chat.completions.create(
             model=model_id, messages=openai_messages, max_tokens=max_tokens
         )
+        _record_openai_usage(getattr(response, "usage", None), usage)
+        return response.choices[0].message.content
+
+    if provider == "mock":
+        response = get_mock_client().chat.completions.create(
+            model=model_id, max_tokens=max_tokens,
+            messages=[{"role": "system", "content": system_prompt}] + [
+                {"role": msg["role"], "content": msg["content"]}
+                for msg in messages if isinstance(msg.get("content"), str)
+            ],
+        )
+        _record_openai_usage(getattr(response, "usage", None), usage)
         return response.choices[0].message.content
 
     if provider == "xai":
@@ -469,15 +605,10 @@ def generate_ai_response(model_id, system_prompt, messages, max_tokens, upload_f
             for img_path in img_paths:
                 # xAI 비전 모델은 data URL 방식을 지원할 수 있다. (grok-2-vision 등)
                 try:
-                    relative_path = img_path.replace("uploads/", "", 1)
-                    full_path = os.path.join(upload_folder, relative_path)
-                    with open(full_path, "rb") as f:
-                        img_b64 = base64.b64encode(f.read()).decode("utf-8")
-                        mime = mimetypes.guess_type(full_path)[0] or "image/jpeg"
-                        content_list.append({
-                            "type": "image_url",
-                            "image_url": {"url": f"data:{mime};base64,{img_b64}"},
-                        })
+                    content_list.append({
+                        "type": "image_url",
+                        "image_url": {"url": get_image_payload(img_path, upload_folder, "data_url")},
+                    })
                 except Exception:
                     pass
 
@@ -488,6 +619,7 @@ def generate_ai_response(model_id, system_prompt, messages, max_tokens, upload_f
         response = xai_client.chat.completions.create(
             model=model_id, messages=xai_messages, max_tokens=max_tokens
         )
+        _record_openai_usage(getattr(response, "usage", None), usage)
         return response.choices[0].message.content
 
     if provider == "google":
@@ -522,12 +654,7 @@ def generate_ai_response(model_id, system_prompt, messages, max_tokens, upload_f
 
             for img_path in img_paths:
                 try:
-                    import PIL.Image
-
-                    relative_path = img_path.replace("uploads/", "", 1)
-                    full_path = os.path.join(upload_folder, relative_path)
-                    img = PIL.Image.open(full_path)
-                    parts.append(img)
+                    parts.append(get_image_payload(img_path, upload_folder, "blob"))
                 except Exception as e:
                     print(f"Gemini Image Load Error: {e}")
 
@@ -542,11 +669,13 @@ def generate_ai_response(model_id, system_prompt, messages, max_tokens, upload_f
                 response = chat_session.send_message(
                     last_msg["parts"], generation_config=gen_config, safety_settings=safety_settings
                 )
+                _record_gemini_usage(getattr(response, "usage_metadata", None), usage)
                 return response.text
             chat_session = gemini_model.start_chat(history=chat_history)
             response = chat_session.send_message(
                 "Please continue.", generation_config=gen_config, safety_settings=safety_settings
             )
+            _record_gemini_usage(getattr(response, "usage_metadata", None), usage)
             return response.text
         except ValueError as e:
             print(f"Gemini ValueError: {e}")
@@ -561,11 +690,13 @@ def generate_ai_response(model_id, system_prompt, messages, max_tokens, upload_f
 # ---------------------------------------------------------
 # [4] 비동기 스트리밍 AI 응답 생성 함수 (Server-Sent Events 용)
 # ---------------------------------------------------------
-def generate_ai_response_stream(model_id, system_prompt, messages, max_tokens, upload_folder):
-    """
-    선택된 모델에 따라 스트리밍 형태(Generator)로 텍스트 청크를 반환합니다. (Yield)
-    SSE(Server-Sent Events)를 통해 클라이언트가 실시간으로 텍스트를 받게 됩니다.
-    """
+# 스트리밍 엔진: "sync"(기본, gevent 환경에서 동기 SDK 이터레이터) 또는
+# "asyncio"(services.async_stream — 프로세스당 이벤트 루프 하나에서 Async SDK로 다중 스트림 처리)
+STREAM_ENGINE = os.getenv("LLM_STREAM_ENGINE", "sync").lower()
+
+
+def _resolve_stream_model(model_id):
+    """모델 ID를 검증하고 (model_id, provider)를 반환 (미등록 모델은 공급사 기본 모델로 대체)"""
     model_info = AVAILABLE_MODELS.get(model_id)
     if not model_info:
         if "gpt" in str(model_id): model_id = DEFAULT_MODELS["openai"]
@@ -574,203 +705,225 @@ def generate_ai_response_stream(model_id, system_prompt, messages, max_tokens, u
         elif "grok" in str(model_id): model_id = DEFAULT_MODELS["xai"]
         else: model_id = DEFAULT_MODELS["anthropic"]
         model_info = AVAILABLE_MODELS[model_id]
+    return model_id, model_info["provider"]
 
-    provider = model_info["provider"]
+
+def _stream_anthropic_request(model_id, system_prompt, messages, max_tokens, upload_folder, context=None):
+    """Anthropic messages.stream() 인자 구성 (텍스트+이미지, 프롬프트 캐시 breakpoint 포함)"""
+    anthropic_messages = []
+    for msg in messages:
+        content_list = []
+
+        # 텍스트 처리
+        msg_content = msg.get("content")
+        if isinstance(msg_content, str) and msg_content.strip():
+            content_list.append({"type": "text", "text": msg_content})
+
+        # 이미지 처리 (스트리밍 시에도 동일 규격)
+        img_paths = msg.get("image_paths", [])
+        if not img_paths and msg.get("image_path"):
+            img_paths = [msg.get("image_path")]
+
+        for img_path in img_paths:
+            try:
+                content_list.append(get_image_payload(img_path, upload_folder, "anthropic"))
+            except Exception as e:
+                print(f"Anthropic Image Load Warning: {e}")
+
+        if content_list:
+            anthropic_messages.append({"role": msg["role"], "content": content_list})
+
+    _mark_anthropic_history_prefix(anthropic_messages)
+    return {
+        "max_tokens": max_tokens,
+        "system": _anthropic_system_blocks(system_prompt, context),
+        "messages": anthropic_messages,
+        "model": model_id,
+    }
+
+
+def _stream_openai_compat_request(provider, model_id, system_prompt, messages, max_tokens,
+                                  upload_folder, context=None):
+    """OpenAI 호환(openai/google/xai) chat.completions 스트리밍 인자 구성"""
+    chat_messages = [{"role": "system", "content": _merge_system_context(system_prompt, context)}]
+    for msg in messages:
+        msg_content = msg.get("content")
+        if provider in ("xai", "mock"):
+            # xAI(와 모의 공급사) 스트리밍은 텍스트만 전달
+            if isinstance(msg_content, str) and msg_content:
+                chat_messages.append({"role": msg["role"], "content": msg_content})
+            continue
+
+        content_list = []
+        if isinstance(msg_content, str) and msg_content:
+            content_list.append({"type": "text", "text": msg_content})
+
+        img_paths = msg.get("image_paths", [])
+        if not img_paths and msg.get("image_path"):
+            img_paths = [msg.get("image_path")]
+
+        for img_path in img_paths:
+            try:
+                content_list.append({
+                    "type": "image_url",
+                    "image_url": {"url": get_image_payload(img_path, upload_folder, "data_url")},
+                })
+            except Exception as e:
+                if provider == "google":
+                    print(f"Gemini Image Load Error: {e}")
+
+        if content_list:
+            chat_messages.append({"role": msg["role"], "content": content_list})
+
+    # 마지막 청크로 usage를 받는다 (choices가 빈 청크)
+    kwargs = {
+        "model": model_id, "messages": chat_messages, "stream": True,
+        "stream_options": {"include_usage": True},
+    }
+    m_id_lower = model_id.lower()
+    if provider == "openai" and (
+        "o1" in m_id_lower or "o3" in m_id_lower or "gpt-4.5" in m_id_lower or "gpt-5" in m_id_lower
+    ):
+        kwargs["max_completion_tokens"] = max_tokens
+    else:
+        kwargs["max_tokens"] = max_tokens
+    return kwargs
+
+
+def _retry_with_max_completion_tokens(kwargs, error):
+    """max_tokens 미지원 모델의 BadRequest면 max_completion_tokens로 바꾼 인자를, 아니면 None을 반환"""
+    if "max_completion_tokens" not in str(error) or "max_tokens" not in kwargs:
+        return None
+    retry_kwargs = dict(kwargs)
+    retry_kwargs["max_completion_tokens"] = retry_kwargs.pop("max_tokens")
+    return retry_kwargs
+
+
+def _retry_without_stream_options(kwargs, error):
+    """stream_options를 거부하는 호환 엔드포인트면 해당 인자를 뺀 인자를, 아니면 None을 반환"""
+    if "stream_options" not in str(error) or "stream_options" not in kwargs:
+        return None
+    retry_kwargs = dict(kwargs)
+    retry_kwargs.pop("stream_options")
+    return retry_kwargs
+
+
+def _chunk_text(chunk):
+    if chunk.choices and len(chunk.choices) > 0 and chunk.choices[0].delta.content is not None:
+        return chunk.choices[0].delta.content
+    return None
+
+
+_MISSING_KEY_MESSAGES = {
+    "anthropic": "Anthropic API Key가 없습니다.",
+    "openai": "OpenAI API Key가 없습니다.",
+    "google": "Google API Key가 없습니다.",
+    "xai": "xAI API Key가 없습니다.",
+    "mock": "MOCK_LLM_URL이 설정되지 않았습니다.",
+}
+
+
+def is_error_response(text):
+    """공급사 오류/안전 차단/API 키 누락 안내처럼 답변이 아닌 텍스트인지 (캐시·요약 저장 전 확인용)"""
+    if not text:
+        return False
+    stripped = text.strip()
+    return (
+        stripped.startswith("⚠️")
+        or stripped.startswith("Error")
+        or "[오류 발생:" in stripped
+        or stripped in _MISSING_KEY_MESSAGES.values()
+    )
+
+
+def generate_ai_response_stream(model_id, system_prompt, messages, max_tokens, upload_folder,
+                                context=None, usage=None, raise_errors=False):
+    """
+    선택된 모델에 따라 스트리밍 형태(Generator)로 텍스트 청크를 반환합니다. (Yield)
+    SSE(Server-Sent Events)를 통해 클라이언트가 실시간으로 텍스트를 받게 됩니다.
+
+    Args:
+        context: 요청마다 달라지는 문맥(세션 요약 등). Anthropic은 캐시되지 않는 별도 system 블록,
+                 그 외 공급사는 시스템 프롬프트 뒤에 이어 붙인다.
+        usage: dict를 넘기면 스트림 종료 후 토큰 사용량(캐시 읽기/쓰기 포함)을 채워 넣는다.
+               (Anthropic은 최종 message usage, OpenAI 호환 공급사는 include_usage 마지막 청크)
+        raise_errors: True면 공급사 호출 오류와 API 키 미설정/미지원 공급사를 안내 텍스트 대신 예외로 올린다
+                      (서킷 브레이커/페일오버가 오류를 판별할 수 있도록).
+    """
+    if STREAM_ENGINE == "asyncio":
+        from services.async_stream import generate_ai_response_stream_async
+        yield from generate_ai_response_stream_async(
+            model_id, system_prompt, messages, max_tokens, upload_folder,
+            context=context, usage=usage, raise_errors=raise_errors,
+        )
+        return
+
+    model_id, provider = _resolve_stream_model(model_id)
 
     # --- A. Anthropic (Claude) 스트리밍 ---
     if provider == "anthropic":
         anthropic_client = get_anthropic_client()
         if not anthropic_client:
-            yield "Anthropic API Key가 없습니다."
+            if raise_errors:
+                raise ValueError(_MISSING_KEY_MESSAGES[provider])
+            yield _MISSING_KEY_MESSAGES[provider]
             return
-        
-        anthropic_messages = []
-        for msg in messages:
-            content_list = []
-            
-            # 텍스트 처리 
-            msg_content = msg.get("content")
-            if isinstance(msg_content, str) and msg_content.strip():
-                content_list.append({"type": "text", "text": msg_content})
-                
-            # 이미지 처리 (스트리밍 시에도 동일 규격)
-            img_paths = msg.get("image_paths", [])
-            if not img_paths and msg.get("image_path"):
-                img_paths = [msg.get("image_path")]
 
-            for img_path in img_paths:
-                try:
-                    relative_path = img_path.replace("uploads/", "", 1)
-                    full_path = os.path.join(upload_folder, relative_path)
-                    with open(full_path, "rb") as f:
-                        img_data = base64.b64encode(f.read()).decode("utf-8")
-                        media_type = mimetypes.guess_type(full_path)[0] or "image/jpeg"
-                        content_list.append({
-                            "type": "image", 
-                            "source": {"type": "base64", "media_type": media_type, "data": img_data}
-                        })
-                except Exception as e:
-                    print(f"Anthropic Image Load Warning: {e}")
-            
-            if content_list:
-                anthropic_messages.append({"role": msg["role"], "content": content_list})
-        
+        request_kwargs = _stream_anthropic_request(
+            model_id, system_prompt, messages, max_tokens, upload_folder, context
+        )
         try:
-            with anthropic_client.messages.stream(
-                max_tokens=max_tokens,
-                system=system_prompt,
-                messages=anthropic_messages,
-                model=model_id,
-            ) as stream:
+            with anthropic_client.messages.stream(**request_kwargs) as stream:
                 for text_chunk in stream.text_stream:
                     yield text_chunk
+                _record_anthropic_usage(stream.get_final_message().usage, usage)
         except Exception as e:
+            if raise_errors:
+                raise
             yield f"\n[오류 발생: {str(e)}]"
 
-    # --- B. OpenAI (GPT) 스트리밍 ---
-    elif provider == "openai":
-        openai_client = get_openai_client()
-        if not openai_client:
-            yield "OpenAI API Key가 없습니다."
+    # --- B/C/D. OpenAI (GPT), Google (Gemini), xAI 스트리밍 ---
+    # Gemini는 Google Generative AI SDK (gRPC) 대신 HTTP/SSE가 안정적인 OpenAI 호환 엔드포인트를 사용합니다.
+    elif provider in ("openai", "google", "xai", "mock"):
+        client = {
+            "openai": get_openai_client,
+            "google": get_gemini_client,
+            "xai": get_xai_client,
+            "mock": get_mock_client,
+        }[provider]()
+        if not client:
+            if raise_errors:
+                raise ValueError(_MISSING_KEY_MESSAGES[provider])
+            yield _MISSING_KEY_MESSAGES[provider]
             return
-        
-        openai_messages = [{"role": "system", "content": system_prompt}]
-        for msg in messages:
-            content_list = []
-            
-            msg_content = msg.get("content")
-            if isinstance(msg_content, str) and msg_content:
-                content_list.append({"type": "text", "text": msg_content})
 
-            img_paths = msg.get("image_paths", [])
-            if not img_paths and msg.get("image_path"):
-                img_paths = [msg.get("image_path")]
-
-            for img_path in img_paths:
-                try:
-                    relative_path = img_path.replace("uploads/", "", 1)
-                    full_path = os.path.join(upload_folder, relative_path)
-                    with open(full_path, "rb") as f:
-                        img_b64 = base64.b64encode(f.read()).decode("utf-8")
-                        mime = mimetypes.guess_type(full_path)[0] or "image/jpeg"
-                        content_list.append({
-                            "type": "image_url", 
-                            "image_url": {"url": f"data:{mime};base64,{img_b64}"}
-                        })
-                except: pass
-            
-            if content_list:
-                openai_messages.append({"role": msg["role"], "content": content_list})
-            
+        kwargs = _stream_openai_compat_request(
+            provider, model_id, system_prompt, messages, max_tokens, upload_folder, context
+        )
         try:
-            kwargs = {
-                "model": model_id,
-                "messages": openai_messages,
-                "stream": True,
-            }
-            m_id_lower = model_id.lower()
-            if "o1" in m_id_lower or "o3" in m_id_lower or "gpt-4.5" in m_id_lower or "gpt-5" in m_id_lower:
-                kwargs["max_completion_tokens"] = max_tokens
-            else:
-                kwargs["max_tokens"] = max_tokens
-                
             try:
-                stream = openai_client.chat.completions.create(**kwargs)
+                stream = client.chat.completions.create(**kwargs)
             except openai.BadRequestError as e:
                 # max_tokens 에러 발생 시 최신 파라미터로 재시도
-                if "max_completion_tokens" in str(e):
-                    kwargs.pop("max_tokens", None)
-                    kwargs["max_completion_tokens"] = max_tokens
-                    stream = openai_client.chat.completions.create(**kwargs)
-                else:
+                retry_kwargs = (
+                    _retry_with_max_completion_tokens(kwargs, e) or _retry_without_stream_options(kwargs, e)
+                )
+                if retry_kwargs is None:
                     raise e
-                    
-            for chunk in stream:
-                if chunk.choices and len(chunk.choices) > 0 and chunk.choices[0].delta.content is not None:
-                    yield chunk.choices[0].delta.content
-        except Exception as e:
-            yield f"\n[오류 발생: {str(e)}]"
+                stream = client.chat.completions.create(**retry_kwargs)
 
-    # --- C. Google (Gemini) 스트리밍 ---
-    elif provider == "google":
-        if not os.getenv("GOOGLE_API_KEY"):
-            yield "Google API Key가 없습니다."
-            return
-            
-        # Google Generative AI SDK (gRPC) 대신 HTTP/SSE가 안정적인 OpenAI 호환 엔드포인트를 사용합니다.
-        gemini_client = openai.OpenAI(
-            api_key=os.getenv("GOOGLE_API_KEY"),
-            base_url="https://generativelanguage.googleapis.com/v1beta/openai/"
-        )
-        
-        # OpenAI 규격과 동일하므로 메시지를 그대로 파싱합니다.
-        gemini_messages = [{"role": "system", "content": system_prompt}]
-        for msg in messages:
-            content_list = []
-            
-            msg_content = msg.get("content")
-            if isinstance(msg_content, str) and msg_content:
-                content_list.append({"type": "text", "text": msg_content})
-
-            img_paths = msg.get("image_paths", [])
-            if not img_paths and msg.get("image_path"):
-                img_paths = [msg.get("image_path")]
-
-            for img_path in img_paths:
-                try:
-                    relative_path = img_path.replace("uploads/", "", 1)
-                    full_path = os.path.join(upload_folder, relative_path)
-                    with open(full_path, "rb") as f:
-                        img_b64 = base64.b64encode(f.read()).decode("utf-8")
-                        mime = mimetypes.guess_type(full_path)[0] or "image/jpeg"
-                        content_list.append({
-                            "type": "image_url", 
-                            "image_url": {"url": f"data:{mime};base64,{img_b64}"}
-                        })
-                except Exception as e: 
-                    print(f"Gemini Image Load Error: {e}")
-            
-            if content_list:
-                gemini_messages.append({"role": msg["role"], "content": content_list})
-        
-        try:
-            stream = gemini_client.chat.completions.create(
-                model=model_id,
-                messages=gemini_messages,
-                max_tokens=max_tokens,
-                stream=True,
-            )
-            for chunk in stream:
-                if chunk.choices and len(chunk.choices) > 0 and chunk.choices[0].delta.content is not None:
-                    yield chunk.choices[0].delta.content
-        except Exception as e:
-            yield f"\n[오류 발생: {str(e)}]"
-
-    # --- D. xAI 스트리밍 ---
-    elif provider == "xai":
-        xai_client = get_xai_client()
-        if not xai_client:
-            yield "xAI API Key가 없습니다."
-            return
-            
-        xai_messages = [{"role": "system", "content": system_prompt}]
-        for msg in messages:
-            msg_content = msg.get("content")
-            if isinstance(msg_content, str) and msg_content:
-                xai_messages.append({"role": msg["role"], "content": msg_content})
-                
-        try:
-            stream = xai_client.chat.completions.create(
-                model=model_id,
-                messages=xai_messages,
-                max_tokens=max_tokens,
-                stream=True,
-            )
             for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    yield chunk.choices[0].delta.content
+                if getattr(chunk, "usage", None):
+                    _record_openai_usage(chunk.usage, usage)
+                text = _chunk_text(chunk)
+                if text is not None:
+                    yield text
         except Exception as e:
+            if raise_errors:
+                raise
             yield f"\n[오류 발생: {str(e)}]"
 
     else:
+        if raise_errors:
+            raise ValueError("스트리밍을 지원하지 않는 공급사입니다.")
         yield "Error: 스트리밍을 지원하지 않는 공급사입니다."
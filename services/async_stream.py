@@ -0,0 +1,274 @@
+"""
+asyncio 기반 공급사 스트리밍 엔진
+
+동기 SDK 이터레이터는 스트림 하나마다 그린렛(또는 스레드) 하나를 붙잡고, SDK 클라이언트의
+스레드 안전성 가정 위에서 동작합니다. 이 엔진은 프로세스당 이벤트 루프 하나에서
+AsyncAnthropic / AsyncOpenAI로 여러 생성을 동시에 다중화(multiplex)합니다.
+
+- 활성화: LLM_STREAM_ENGINE=asyncio (ai_service.generate_ai_response_stream이 이 모듈로 위임)
+- 브리지: generate_ai_response_stream_async()는 동기 generator이므로 /chat, 관리자 분석 SSE 라우트가
+  그대로 소비합니다. 요청 구성(이미지 인코딩 등 파일 I/O)은 호출한 쪽에서 끝내고, 네트워크 I/O만 루프에서 실행
+- 루프 스레드: threading.Thread로 띄우므로 gevent monkey patch 환경에서는 같은 허브 위의 그린렛으로,
+  그 외에는 네이티브 스레드로 동작 (gevent에서는 GeventSelector를 사용해 허브를 막지 않음)
+- 취소: 소비자가 generator를 닫으면(클라이언트 연결 종료 등) 루프 쪽 태스크도 취소되어 업스트림 연결을 정리
+- fork 안전: 프로세스(PID)가 바뀌면 루프와 비동기 클라이언트를 새로 만든다
+"""
+
+import asyncio
+import collections
+import os
+import threading
+
+import anthropic
+import openai
+
+from services.ai_service import (
+    MOCK_LLM_URL,
+    _MISSING_KEY_MESSAGES,
+    _chunk_text,
+    _record_anthropic_usage,
+    _record_openai_usage,
+    _resolve_stream_model,
+    _retry_with_max_completion_tokens,
+    _retry_without_stream_options,
+    _stream_anthropic_request,
+    _stream_openai_compat_request,
+)
+from services.http_transport import DEFAULT_TIMEOUT, READ_TIMEOUT, build_async_http_client
+
+_ITEM, _DONE, _ERROR = "item", "done", "error"
+
+
+def _new_event_loop():
+    try:
+        import gevent.monkey
+        if gevent.monkey.is_module_patched("select"):
+            import gevent.selectors
+            return asyncio.SelectorEventLoop(gevent.selectors.GeventSelector())
+    except ImportError:
+        pass
+    return asyncio.new_event_loop()
+
+
+class _StreamEngine:
+    """프로세스당 하나의 이벤트 루프와 그 루프에 묶인 비동기 SDK 클라이언트"""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.loop = _new_event_loop()
+        self._clients = {}
+        self.active_streams = 0     # 루프 스레드에서만 증감
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="llm-asyncio-engine", daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(self._started.set)
+        self.loop.run_forever()
+
+    def client(self, provider):
+        """공급사별 비동기 SDK 클라이언트 (루프 안에서만 사용, API 키가 없으면 None)"""
+        if provider in self._clients:
+            return self._clients[provider]
+        client = None
+        if provider == "anthropic" and os.getenv("ANTHROPIC_API_KEY"):
+            client = anthropic.AsyncAnthropic(
+                api_key=os.getenv("ANTHROPIC_API_KEY"),
+                http_client=self._http_client(),
+                timeout=DEFAULT_TIMEOUT,
+            )
+        elif provider == "openai" and os.getenv("OPENAI_API_KEY"):
+            client = openai.AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                http_client=self._http_client(),
+                timeout=DEFAULT_TIMEOUT,
+            )
+        elif provider == "xai" and os.getenv("XAI_API_KEY"):
+            client = openai.AsyncOpenAI(
+                api_key=os.getenv("XAI_API_KEY"),
+                base_url="https://api.x.ai/v1",
+                http_client=self._http_client(),
+                timeout=DEFAULT_TIMEOUT,
+            )
+        elif provider == "google" and os.getenv("GOOGLE_API_KEY"):
+            client = openai.AsyncOpenAI(
+                api_key=os.getenv("GOOGLE_API_KEY"),
+                base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
+                http_client=self._http_client(),
+                timeout=DEFAULT_TIMEOUT,
+            )
+        elif provider == "mock" and MOCK_LLM_URL:
+            client = openai.AsyncOpenAI(
+                api_key="mock",
+                base_url=MOCK_LLM_URL,
+                http_client=self._http_client(),
+                timeout=DEFAULT_TIMEOUT,
+            )
+        self._clients[provider] = client
+        return client
+
+    def _http_client(self):
+        if "_http" not in self._clients:
+            self._clients["_http"] = build_async_http_client()
+        return self._clients["_http"]
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_stream_engine():
+    global _engine
+    pid = os.getpid()
+    if _engine is not None and _engine.pid == pid:
+        return _engine
+    with _engine_lock:
+        if _engine is None or _engine.pid != pid:
+            _engine = _StreamEngine()
+    return _engine
+
+
+class _Channel:
+    """루프 → 소비자 방향의 단방향 큐 (put은 루프에서, get은 소비자 그린렛/스레드에서)"""
+
+    def __init__(self):
+        self._items = collections.deque()
+        self._ready = threading.Event()
+
+    def put(self, kind, value=None):
+        self._items.append((kind, value))
+        self._ready.set()
+
+    def get(self, timeout):
+        while not self._items:
+            if not self._ready.wait(timeout):
+                raise TimeoutError("스트리밍 엔진 응답 대기 시간 초과")
+            self._ready.clear()
+        return self._items.popleft()
+
+
+async def _pump(agen, channel):
+    try:
+        async for item in agen:
+            channel.put(_ITEM, item)
+        channel.put(_DONE)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        channel.put(_ERROR, e)
+    finally:
+        await agen.aclose()
+
+
+def iter_async_stream(agen_factory, timeout=None):
+    """
+    비동기 generator를 엔진 루프에서 실행하고 결과를 동기 generator로 yield 합니다.
+
+    Args:
+        agen_factory: 엔진을 받아 async generator를 반환하는 함수 (루프 스레드에서 호출)
+        timeout: 다음 항목을 기다릴 최대 시간(초). None이면 HTTP 읽기 타임아웃보다 조금 길게
+    """
+    engine = get_stream_engine()
+    channel = _Channel()
+    wait_timeout = timeout if timeout is not None else READ_TIMEOUT + 30
+
+    async def runner():
+        engine.active_streams += 1
+        try:
+            await _pump(agen_factory(engine), channel)
+        finally:
+            engine.active_streams -= 1
+
+    future = asyncio.run_coroutine_threadsafe(runner(), engine.loop)
+    try:
+        while True:
+            kind, value = channel.get(wait_timeout)
+            if kind == _ITEM:
+                yield value
+            elif kind == _ERROR:
+                raise value
+            else:
+                return
+    finally:
+        if not future.done():
+            future.cancel()
+
+
+async def _astream_anthropic(client, request_kwargs, usage):
+    async with client.messages.stream(**request_kwargs) as stream:
+        async for text_chunk in stream.text_stream:
+            yield text_chunk
+        _record_anthropic_usage((await stream.get_final_message()).usage, usage)
+
+
+async def _astream_openai_compat(client, kwargs, usage):
+    try:
+        stream = await client.chat.completions.create(**kwargs)
+    except openai.BadRequestError as e:
+        retry_kwargs = _retry_with_max_completion_tokens(kwargs, e) or _retry_without_stream_options(kwargs, e)
+        if retry_kwargs is None:
+            raise
+        stream = await client.chat.completions.create(**retry_kwargs)
+    async for chunk in stream:
+        if getattr(chunk, "usage", None):
+            _record_openai_usage(chunk.usage, usage)
+        text = _chunk_text(chunk)
+        if text is not None:
+            yield text
+
+
+def generate_ai_response_stream_async(model_id, system_prompt, messages, max_tokens, upload_folder,
+                                      context=None, usage=None, raise_errors=False):
+    """ai_service.generate_ai_response_stream과 같은 인자·출력 규약의 asyncio 엔진 구현"""
+    model_id, provider = _resolve_stream_model(model_id)
+    if provider not in _MISSING_KEY_MESSAGES:
+        if raise_errors:
+            raise ValueError("스트리밍을 지원하지 않는 공급사입니다.")
+        yield "Error: 스트리밍을 지원하지 않는 공급사입니다."
+        return
+    if not os.getenv({
+        "anthropic": "ANTHROPIC_API_KEY",
+        "openai": "OPENAI_API_KEY",
+        "google": "GOOGLE_API_KEY",
+        "xai": "XAI_API_KEY",
+        "mock": "MOCK_LLM_URL",
+    }[provider]):
+        if raise_errors:
+            raise ValueError(_MISSING_KEY_MESSAGES[provider])
+        yield _MISSING_KEY_MESSAGES[provider]
+        return
+
+    # 요청 구성(이미지 로드/인코딩)은 루프를 막지 않도록 호출한 쪽에서 처리
+    if provider == "anthropic":
+        request_kwargs = _stream_anthropic_request(
+            model_id, system_prompt, messages, max_tokens, upload_folder, context
+        )
+
+        def factory(engine):
+            return _astream_anthropic(engine.client(provider), request_kwargs, usage)
+    else:
+        request_kwargs = _stream_openai_compat_request(
+            provider, model_id, system_prompt, messages, max_tokens, upload_folder, context
+        )
+
+        def factory(engine):
+            return _astream_openai_compat(engine.client(provider), request_kwargs, usage)
+
+    try:
+        yield from iter_async_stream(factory)
+    except Exception as e:
+        if raise_errors:
+            raise
+        yield f"\n[오류 발생: {str(e)}]"
+
+
+def stream_engine_stats():
+    """현재 프로세스의 엔진 상태 (관리자 모니터링용)"""
+    engine = _engine if _engine is not None and _engine.pid == os.getpid() else None
+    return {
+        "engine": "asyncio",
+        "running": engine is not None,
+        "active_streams": engine.active_streams if engine else 0,
+    }
@@ -0,0 +1,124 @@
+"""
+프로세스 내부(in-process) 캐시 유틸리티.
+
+Flask-Caching(Redis) 앞단에 두는 L1 캐시 용도로 사용한다.
+gunicorn gevent 워커에서는 threading.Lock 이 그린렛 락으로 패치되므로 그대로 안전하다.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    항목 수(선택적으로 바이트 크기) 기준 LRU 캐시 (선택적으로 TTL 적용).
+
+    Args:
+        maxsize: 최대 보관 항목 수
+        ttl: 항목 유효 시간(초). None 이면 만료 없음
+        max_bytes: 보관 항목 크기 합계 상한. 지정 시 sizeof 필요
+        sizeof: 값의 크기(바이트)를 반환하는 함수
+    """
+
+    def __init__(self, maxsize=128, ttl=None, max_bytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _size(self, value):
+        return self.sizeof(value) if self.sizeof else 0
+
+    def _pop(self, key):
+        value, _ = self._data.pop(key)
+        self.current_bytes -= self._size(value)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.monotonic():
+                self._pop(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        size = self._size(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return  # 단일 항목이 상한보다 크면 캐싱하지 않음
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (value, expires_at)
+            self.current_bytes += size
+            while len(self._data) > self.maxsize or (
+                self.max_bytes is not None and self.current_bytes > self.max_bytes
+            ):
+                self._pop(next(iter(self._data)))
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.current_bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """적중/미스 통계 (관리자 모니터링용)"""
+        total = self.hits + self.misses
+        stats = {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+        if self.max_bytes is not None:
+            stats["bytes"] = self.current_bytes
+            stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+_redis_clients = {}
+_redis_lock = threading.Lock()
+
+
+def get_redis_client(db_index=1):
+    """
+    캐시와 같은 Redis 인스턴스의 raw 클라이언트 (스트림/리스트 등 캐시 API 밖의 자료구조용).
+
+    CELERY_BROKER_URL이 없으면(로컬 개발) None을 반환하므로 호출자가 메모리 폴백을 사용한다.
+    """
+    broker = os.getenv("CELERY_BROKER_URL")
+    if not broker:
+        return None
+    with _redis_lock:
+        client = _redis_clients.get(db_index)
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(f"{broker.rsplit('/', 1)[0]}/{db_index}")
+            _redis_clients[db_index] = client
+    return client
@@ -0,0 +1,354 @@
+"""
+공급사/모델 서킷 브레이커와 자동 페일오버
+
+공급사 장애 시 학생들이 죽은 엔드포인트의 타임아웃을 기다리지 않도록,
+공급사·모델 단위로 최근 호출의 오류율과 첫 토큰 지연을 슬라이딩 윈도우로 추적합니다.
+
+- 윈도우(BREAKER_WINDOW초) 안에 호출이 BREAKER_MIN_CALLS 이상이고
+  오류율이 BREAKER_ERROR_RATE 이상이거나 느린 호출 비율이 BREAKER_SLOW_RATE 이상이면 open
+- open 상태에서는 호출하지 않고 페르소나의 다음 허용 공급사/모델로 페일오버
+- BREAKER_COOLDOWN초 후 half-open: 워커 전체에서 1건만 시험 호출, 성공하면 close
+- 공급사 단위 브레이커가 열리면 provider_status_{provider}를 degraded로, 닫히면 active로 자동 변경
+  (관리자가 수동으로 설정한 restricted는 건드리지 않음)
+
+윈도우 집계는 Redis 해시 버킷(워커 간 공유), Redis가 없으면 프로세스 내부 메모리를 사용합니다.
+"""
+
+import threading
+import time
+
+from extensions import cache, db
+from models import SystemConfig
+from services.ai_service import AVAILABLE_MODELS
+from services.admission_service import AdmissionTimeout, LLMSlot
+from services.cache_utils import get_redis_client
+from services.sse_service import coalesce_deltas
+
+PROVIDERS = ("openai", "anthropic", "google", "xai")
+
+BREAKER_WINDOW = 60          # 슬라이딩 윈도우(초)
+BREAKER_BUCKET = 10          # 버킷 크기(초)
+BREAKER_MIN_CALLS = 5
+BREAKER_ERROR_RATE = 0.5
+BREAKER_SLOW_SECONDS = 20.0  # 첫 토큰까지 이보다 오래 걸리면 느린 호출
+BREAKER_SLOW_RATE = 0.8
+BREAKER_COOLDOWN = 30
+
+_OPEN_KEY = "breaker_open:{scope}"
+_PROBE_KEY = "breaker_probe:{scope}"
+_BUCKET_KEY = "breaker:{scope}:{bucket}"
+_STATUS_CACHE_KEY = "provider_statuses"
+
+# 텍스트 채팅 스트림으로 대신 응답할 수 없는 모델(이미지/영상/음성/음악 생성)은 페일오버 대상에서 제외
+_NON_CHAT_MODELS = frozenset({
+    "gpt-image-1.5", "dall-e-3",
+    "gemini-2.5-flash-preview-tts", "gemini-2.5-pro-preview-tts",
+    "gemini-2.5-flash-image", "gemini-3-pro-image-preview", "imagen-4.0-generate-001",
+    "grok-imagine-image", "grok-imagine-video",
+    "lyria-3-pro-preview", "mureka-v1",
+})
+
+
+class ProvidersUnavailable(RuntimeError):
+    """모든 후보의 서킷이 열려 있어 어떤 공급사도 시도하지 못한 경우"""
+
+
+# ----------------------------------------------------------------------
+# 슬라이딩 윈도우 집계
+# ----------------------------------------------------------------------
+
+class _RedisWindow:
+    def __init__(self, client):
+        self._redis = client
+
+    def add(self, scope, failed, slow):
+        bucket = int(time.time()) // BREAKER_BUCKET
+        key = _BUCKET_KEY.format(scope=scope, bucket=bucket)
+        pipe = self._redis.pipeline()
+        pipe.hincrby(key, "calls", 1)
+        if failed:
+            pipe.hincrby(key, "failures", 1)
+        if slow:
+            pipe.hincrby(key, "slow", 1)
+        pipe.expire(key, BREAKER_WINDOW + BREAKER_BUCKET)
+        pipe.execute()
+
+    def totals(self, scope):
+        current = int(time.time()) // BREAKER_BUCKET
+        pipe = self._redis.pipeline()
+        for bucket in range(current - BREAKER_WINDOW // BREAKER_BUCKET + 1, current + 1):
+            pipe.hgetall(_BUCKET_KEY.format(scope=scope, bucket=bucket))
+        calls = failures = slow = 0
+        for data in pipe.execute():
+            calls += int(data.get(b"calls", 0))
+            failures += int(data.get(b"failures", 0))
+            slow += int(data.get(b"slow", 0))
+        return calls, failures, slow
+
+    def reset(self, scope):
+        current = int(time.time()) // BREAKER_BUCKET
+        keys = [
+            _BUCKET_KEY.format(scope=scope, bucket=bucket)
+            for bucket in range(current - BREAKER_WINDOW // BREAKER_BUCKET + 1, current + 1)
+        ]
+        self._redis.delete(*keys)
+
+
+class _MemoryWindow:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # scope -> {bucket: [calls, failures, slow]}
+
+    def _live(self, scope):
+        current = int(time.time()) // BREAKER_BUCKET
+        oldest = current - BREAKER_WINDOW // BREAKER_BUCKET + 1
+        buckets = self._buckets.setdefault(scope, {})
+        for bucket in [b for b in buckets if b < oldest]:
+            del buckets[bucket]
+        return buckets, current
+
+    def add(self, scope, failed, slow):
+        with self._lock:
+            buckets, current = self._live(scope)
+            counts = buckets.setdefault(current, [0, 0, 0])
+            counts[0] += 1
+            counts[1] += int(failed)
+            counts[2] += int(slow)
+
+    def totals(self, scope):
+        with self._lock:
+            buckets, _ = self._live(scope)
+            return tuple(sum(c[i] for c in buckets.values()) for i in range(3))
+
+    def reset(self, scope):
+        with self._lock:
+            self._buckets.pop(scope, None)
+
+
+_window = None
+_window_lock = threading.Lock()
+
+
+def _get_window():
+    global _window
+    if _window is None:
+        with _window_lock:
+            if _window is None:
+                client = get_redis_client()
+                _window = _RedisWindow(client) if client is not None else _MemoryWindow()
+    return _window
+
+
+# ----------------------------------------------------------------------
+# 브레이커 상태
+# ----------------------------------------------------------------------
+
+def _scopes(provider, model_id):
+    return (provider, f"{provider}:{model_id}")
+
+
+def allow_request(provider, model_id):
+    """
+    공급사/모델 호출 가능 여부.
+
+    open 상태면 False. 쿨다운이 지나면(half-open) 워커 전체에서 한 요청만 시험 호출로 통과시킨다.
+    """
+    for scope in _scopes(provider, model_id):
+        open_until = cache.get(_OPEN_KEY.format(scope=scope))
+        if open_until is None:
+            continue
+        if time.time() < open_until:
+            return False
+        if not cache.add(_PROBE_KEY.format(scope=scope), 1, timeout=BREAKER_COOLDOWN):
+            return False
+    return True
+
+
+def record_result(provider, model_id, ok, first_token_seconds=None):
+    """호출 결과 기록 및 브레이커 상태 전이"""
+    slow = first_token_seconds is not None and first_token_seconds > BREAKER_SLOW_SECONDS
+    window = _get_window()
+    for scope in _scopes(provider, model_id):
+        try:
+            window.add(scope, failed=not ok, slow=slow)
+            is_open = cache.get(_OPEN_KEY.format(scope=scope)) is not None
+            if is_open:
+                # half-open 시험 호출 결과
+                if ok and not slow:
+                    _close(scope, provider)
+                else:
+                    _open(scope, provider)
+            elif not ok or slow:
+                calls, failures, slow_calls = window.totals(scope)
+                if calls >= BREAKER_MIN_CALLS and (
+                    failures / calls >= BREAKER_ERROR_RATE or slow_calls / calls >= BREAKER_SLOW_RATE
+                ):
+                    _open(scope, provider)
+        except Exception as e:
+            print(f"⚠️ 서킷 브레이커 기록 실패 ({scope}): {e}")
+
+
+def _open(scope, provider):
+    was_open = cache.get(_OPEN_KEY.format(scope=scope)) is not None
+    cache.set(_OPEN_KEY.format(scope=scope), time.time() + BREAKER_COOLDOWN, timeout=0)
+    cache.delete(_PROBE_KEY.format(scope=scope))
+    if not was_open:
+        print(f"🔴 서킷 브레이커 open: {scope} ({BREAKER_COOLDOWN}초 후 재시도)")
+        if scope == provider:
+            _set_provider_status(provider, "degraded", only_if="active")
+
+
+def _close(scope, provider):
+    cache.delete(_OPEN_KEY.format(scope=scope))
+    cache.delete(_PROBE_KEY.format(scope=scope))
+    _get_window().reset(scope)
+    print(f"🟢 서킷 브레이커 close: {scope}")
+    if scope == provider:
+        _set_provider_status(provider, "active", only_if="degraded")
+
+
+def _set_provider_status(provider, status, only_if):
+    """provider_status_* 자동 갱신 (수동 restricted 설정은 유지)"""
+    try:
+        conf = SystemConfig.query.filter_by(key=f"provider_status_{provider}").first()
+        if conf and conf.value == only_if:
+            conf.value = status
+            db.session.commit()
+            cache.delete(_STATUS_CACHE_KEY)
+            print(f"🔁 provider_status_{provider}: {only_if} → {status}")
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️ provider_status 자동 갱신 실패 ({provider}): {e}")
+
+
+def breaker_states():
+    """공급사별 브레이커 상태 (관리자 모니터링용)"""
+    now = time.time()
+    states = {}
+    for provider in PROVIDERS:
+        open_until = cache.get(_OPEN_KEY.format(scope=provider))
+        calls, failures, slow = _get_window().totals(provider)
+        states[provider] = {
+            "state": "closed" if open_until is None else ("open" if now < open_until else "half_open"),
+            "calls": calls,
+            "failures": failures,
+            "slow": slow,
+        }
+    return states
+
+
+# ----------------------------------------------------------------------
+# 페일오버
+# ----------------------------------------------------------------------
+
+def get_provider_statuses():
+    """provider_status_* 값 (30초 캐시)"""
+    statuses = cache.get(_STATUS_CACHE_KEY)
+    if statuses is None:
+        rows = SystemConfig.query.filter(SystemConfig.key.like("provider_status_%")).all()
+        statuses = {row.key[len("provider_status_"):]: row.value for row in rows}
+        cache.set(_STATUS_CACHE_KEY, statuses, timeout=30)
+    return statuses
+
+
+def invalidate_provider_statuses():
+    cache.delete(_STATUS_CACHE_KEY)
+
+
+def failover_candidates(persona, provider, model_id):
+    """
+    요청한 공급사/모델을 첫 번째로, 이어서 페르소나의 허용 모델(allowed_models_config) 순서대로 후보 목록 구성.
+
+    페르소나에서 제한된 공급사와 관리자가 restricted로 설정한 공급사는 제외합니다.
+    모의 공급사(mock, 부하 테스트용)는 실제 공급사로 넘어가지 않고, 페일오버 대상으로도 쓰지 않습니다.
+    """
+    if provider == "mock":
+        return [(provider, model_id)]
+    candidates = [(provider, model_id)]
+    statuses = None
+    for cand_provider in (provider,) + tuple(p for p in PROVIDERS if p != provider):
+        if cand_provider != provider:
+            if persona.is_provider_restricted(cand_provider):
+                continue
+            if statuses is None:
+                statuses = get_provider_statuses()
+            if statuses.get(cand_provider) == "restricted":
+                continue
+        for cand_model in persona.allowed_models_for(cand_provider):
+            if cand_model in _NON_CHAT_MODELS:
+                continue
+            if AVAILABLE_MODELS.get(cand_model, {}).get("provider") != cand_provider:
+                continue
+            if (cand_provider, cand_model) not in candidates:
+                candidates.append((cand_provider, cand_model))
+    return candidates
+
+
+def stream_with_failover(candidates, open_stream, user_id, notify, result, label="chat"):
+    """
+    후보 공급사/모델을 순서대로 시도하며 응답 텍스트 청크를 yield 합니다.
+
+    - 브레이커가 열린 후보는 건너뜀
+    - 첫 청크 이전에 실패하면 다음 후보로 페일오버 (notify로 failover 이벤트 전달)
+    - 응답 도중 실패하면 이미 보낸 내용과 섞이지 않도록 페일오버하지 않고 오류 표시로 마무리
+    - 후보마다 동시성 슬롯(LLMSlot)을 획득하며, 대기 순번은 notify로 전달
+
+    Args:
+        candidates: [(provider, model_id), ...]
+        open_stream: (provider, model_id) -> 텍스트 delta iterator (오류는 예외로 올려야 함)
+        user_id: 요청 사용자 (동시성 슬롯 공정성 기준)
+        notify: 이벤트 dict를 받는 콜백 ({"queued": ...}, {"failover": ...})
+        result: 성공한 provider/model_id를 기록할 dict (응답 도중 실패했다면 error도 기록)
+    Raises:
+        ProvidersUnavailable: 모든 후보의 서킷이 열려 시도한 후보가 없음
+        첫 청크 전에 모든 후보가 실패하면 마지막 오류(AdmissionTimeout 포함)
+    """
+    last_error = None
+    attempted = False
+    for index, (cand_provider, cand_model) in enumerate(candidates):
+        if not allow_request(cand_provider, cand_model):
+            continue
+        attempted = True
+        if index > 0:
+            print(f"↪️ 페일오버: {cand_provider}/{cand_model} (직전 오류: {last_error or '서킷 open'})")
+            notify({"failover": True, "provider": cand_provider, "model_id": cand_model})
+
+        slot = LLMSlot(cand_provider, cand_model, user_id)
+        try:
+            for position in slot.wait():
+                notify({"queued": True, "position": position})
+        except AdmissionTimeout as e:
+            last_error = e
+            continue
+
+        started = time.monotonic()
+        first_token_seconds = None
+        try:
+            deltas = open_stream(cand_provider, cand_model)
+            for chunk in coalesce_deltas(deltas, label=f"{label}:{cand_provider}"):
+                if first_token_seconds is None:
+                    first_token_seconds = time.monotonic() - started
+                yield chunk
+        except Exception as e:
+            record_result(cand_provider, cand_model, ok=False)
+            if first_token_seconds is None:
+                last_error = e
+                continue
+            # 이미 일부를 보냈으면 다른 모델 답변과 섞지 않고 기존처럼 오류 표시로 마무리
+            yield f"\n[오류 발생: {str(e)}]"
+            result["provider"] = cand_provider
+            result["model_id"] = cand_model
+            result["error"] = e
+            return
+        finally:
+            slot.release()
+
+        record_result(cand_provider, cand_model, ok=True, first_token_seconds=first_token_seconds)
+        result["provider"] = cand_provider
+        result["model_id"] = cand_model
+        return
+
+    if not attempted or last_error is None:
+        # 후보를 하나도 시도하지 못했으면 호출자가 빈 답변을 정상 완료로 처리하지 않도록 반드시 예외로 알린다
+        raise ProvidersUnavailable("현재 사용 가능한 AI 공급사가 없습니다. 잠시 후 다시 시도해주세요.")
+    raise last_error
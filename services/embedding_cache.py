@@ -0,0 +1,116 @@
+"""
+질의 임베딩 2단계 캐시
+
+같은 질문(또는 공백/유니코드 표기만 다른 질문)을 다시 임베딩하지 않도록
+generate_embedding / generate_embeddings_batch 앞단에서 벡터를 재사용합니다.
+
+캐시 계층:
+  1. 프로세스 내부 LRU (L1, float32 바이트로 보관 — 벡터당 약 6KB)
+  2. Redis (워커/서버 간 공유, EMBEDDING_CACHE_TTL 만료). CELERY_BROKER_URL이 없으면 L1만 사용
+
+키는 임베딩 모델명 + 정규화 텍스트(NFKC, 연속 공백 축약, 앞뒤 공백 제거)의 SHA-256입니다.
+"""
+
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+
+import numpy as np
+
+from services.cache_utils import LRUCache, get_redis_client
+
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", str(7 * 24 * 3600)))
+_KEY = "emb:{model}:{digest}"
+_WHITESPACE = re.compile(r"\s+")
+
+_local = LRUCache(maxsize=int(os.getenv("EMBEDDING_CACHE_MAX_ITEMS", "2048")))
+_stats = {"redis_hits": 0, "api_texts": 0, "redis_errors": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name, n=1):
+    if n:
+        with _stats_lock:
+            _stats[name] += n
+
+
+def normalize_text(text):
+    """캐시 키용 정규화 (NFKC + 공백 정리)"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text or "")).strip()
+
+
+def cache_key(text, model):
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()[:32]
+    return _KEY.format(model=model, digest=digest)
+
+
+def _encode(vector):
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def _decode(raw):
+    return np.frombuffer(raw, dtype=np.float32).tolist()
+
+
+def get_cached_embeddings(keys):
+    """
+    키 목록의 캐시된 벡터 (없으면 None). L1 미스는 Redis MGET 한 번으로 조회하고 L1에 채웁니다.
+
+    Returns:
+        keys와 같은 순서의 [List[float] 또는 None]
+    """
+    found = [_local.get(key) for key in keys]
+    missing = [i for i, raw in enumerate(found) if raw is None]
+    client = get_redis_client() if missing else None
+    if client is not None:
+        try:
+            values = client.mget([keys[i] for i in missing])
+        except Exception as e:
+            _count("redis_errors")
+            print(f"⚠️ 임베딩 캐시 조회 실패: {e}")
+            values = [None] * len(missing)
+        for i, raw in zip(missing, values):
+            if raw is not None:
+                found[i] = raw
+                _local.set(keys[i], raw)
+                _count("redis_hits")
+    return [_decode(raw) if raw is not None else None for raw in found]
+
+
+def store_embeddings(keys, vectors):
+    """API로 새로 만든 벡터를 L1과 Redis에 저장"""
+    _count("api_texts", len(keys))
+    encoded = [_encode(v) for v in vectors]
+    for key, raw in zip(keys, encoded):
+        _local.set(key, raw)
+    client = get_redis_client()
+    if client is None or not keys:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        for key, raw in zip(keys, encoded):
+            pipe.set(key, raw, ex=EMBEDDING_CACHE_TTL)
+        pipe.execute()
+    except Exception as e:
+        _count("redis_errors")
+        print(f"⚠️ 임베딩 캐시 저장 실패: {e}")
+
+
+def embedding_cache_stats():
+    """L1/Redis 적중률 (관리자 모니터링용, 워커별)"""
+    local = _local.stats()
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = local["hits"] + local["misses"]
+    hits = local["hits"] + stats["redis_hits"]
+    stats.update({
+        "local": local,
+        "lookups": lookups,
+        "hits": hits,
+        "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        "redis": get_redis_client() is not None,
+        "ttl": EMBEDDING_CACHE_TTL,
+    })
+    return stats
@@ -3,19 +3,37 @@
 
 OpenAI text-embedding-3-small 모델을 사용하여 텍스트를 1536차원 벡터로 변환합니다.
 RAG 시스템에서 문서 검색을 위해 사용됩니다.
+같은 텍스트는 services/embedding_cache.py(L1 LRU + Redis)에서 재사용하고, 미스만 API로 보냅니다.
 """
 
 import os
 from typing import List
 from services.ai_service import get_openai_client
+from services.embedding_cache import cache_key, get_cached_embeddings, store_embeddings
 
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_PRICE_PER_1M = 0.02  # USD / 1M tokens
 
-def generate_embedding(text: str) -> List[float]:
+
+def _record_embedding_usage(response, user_id=None, role_key=None):
+    """임베딩 응답 usage를 사용량 원장에 기록"""
+    from services.usage_ledger import record_usage
+
+    tokens = getattr(getattr(response, "usage", None), "prompt_tokens", 0) or 0
+    try:
+        record_usage("embedding", EMBEDDING_MODEL, {"input_tokens": tokens},
+                     user_id=user_id, role_key=role_key, provider="openai")
+    except Exception as e:
+        print(f"⚠️ 임베딩 사용량 기록 실패: {e}")
+
+
+def generate_embedding(text: str, user_id: int = None, role_key: str = None) -> List[float]:
     """
     단일 텍스트의 임베딩 생성
 
     Args:
         text: 임베딩할 텍스트
+        user_id, role_key: 사용량 원장에 기록할 요청자/페르소나 (선택)
 
     Returns:
         1536차원 벡터 (List[float])
@@ -24,27 +42,38 @@ def generate_embedding(text: str) -> List[float]:
         ValueError: OpenAI 클라이언트가 초기화되지 않은 경우
         Exception: API 호출 실패 시
     """
+    key = cache_key(text, EMBEDDING_MODEL)
+    cached = get_cached_embeddings([key])[0]
+    if cached is not None:
+        return cached
+
     openai_client = get_openai_client()
     if not openai_client:
         raise ValueError("OpenAI 클라이언트가 초기화되지 않았습니다. OPENAI_API_KEY를 확인하세요.")
 
     try:
         response = openai_client.embeddings.create(
-            model="text-embedding-3-small",
+            model=EMBEDDING_MODEL,
             input=text
         )
-        return response.data[0].embedding
+        _record_embedding_usage(response, user_id, role_key)
+        embedding = response.data[0].embedding
+        store_embeddings([key], [embedding])
+        return embedding
     except Exception as e:
         print(f"⚠️ 임베딩 생성 실패: {e}")
         raise
 
 
-def generate_embeddings_batch(texts: List[str]) -> List[List[float]]:
+def generate_embeddings_batch(texts: List[str], role_key: str = None) -> List[List[float]]:
     """
     여러 텍스트의 임베딩을 배치로 생성 (효율성 향상)
 
+    캐시에 없는 텍스트(배치 내 중복은 1회)만 API로 보내고, 결과를 입력 순서대로 합칩니다.
+
     Args:
         texts: 임베딩할 텍스트 목록 (최대 2048개)
+        role_key: 사용량 원장에 기록할 페르소나 (선택)
 
     Returns:
         1536차원 벡터 리스트
@@ -53,19 +82,31 @@ def generate_embeddings_batch(texts: List[str]) -> List[List[float]]:
         ValueError: OpenAI 클라이언트가 초기화되지 않은 경우
         Exception: API 호출 실패 시
     """
+    if not texts:
+        return []
+
+    keys = [cache_key(text, EMBEDDING_MODEL) for text in texts]
+    embeddings = get_cached_embeddings(keys)
+    miss_index = {}   # 캐시 키 → 미스 텍스트의 첫 위치
+    for i, (key, embedding) in enumerate(zip(keys, embeddings)):
+        if embedding is None:
+            miss_index.setdefault(key, i)
+    if not miss_index:
+        return embeddings
+
     openai_client = get_openai_client()
     if not openai_client:
         raise ValueError("OpenAI 클라이언트가 초기화되지 않았습니다. OPENAI_API_KEY를 확인하세요.")
 
-    if not texts:
-        return []
-
     try:
         response = openai_client.embeddings.create(
-            model="text-embedding-3-small",
-            input=texts
+            model=EMBEDDING_MODEL,
+            input=[texts[i] for i in miss_index.values()]
         )
-        return [item.embedding for item in response.data]
+        _record_embedding_usage(response, role_key=role_key)
+        fresh = dict(zip(miss_index, (item.embedding for item in response.data)))
+        store_embeddings(list(fresh), list(fresh.values()))
+        return [embedding if embedding is not None else fresh[key] for key, embedding in zip(keys, embeddings)]
     except Exception as e:
         print(f"⚠️ 배치 임베딩 생성 실패: {e}")
         raise
@@ -89,8 +130,8 @@ def estimate_embedding_cost(texts: List[str]) -> dict:
     # 대략적인 토큰 계산 (한글: 2자당 1토큰, 영어: 4자당 1토큰)
     estimated_tokens = total_chars // 3  # 평균값 사용
 
-    # text-embedding-3-small 가격: $0.02 / 1M tokens
-    estimated_cost = (estimated_tokens / 1_000_000) * 0.02
+    # text-embedding-3-small 가격: $0.02 / 1M tokens (실제 사용량은 usage_event 원장 참조)
+    estimated_cost = (estimated_tokens / 1_000_000) * EMBEDDING_PRICE_PER_1M
 
     return {
         "total_chars": total_chars,
@@ -0,0 +1,219 @@
+"""
+대화 이력(history) 윈도우 빌더
+
+세션의 전체 메시지를 매번 불러오는 대신, 최신 메시지부터 역순으로 읽어
+페르소나별 토큰 예산(history_token_budget)에 들어가는 만큼만 AI 입력으로 사용합니다.
+
+- 토큰 계산: tiktoken (로딩 실패 시 UTF-8 바이트 기반 추정치로 폴백)
+- 조회: (session_id, timestamp DESC, id DESC) keyset 페이지네이션 + LIMIT
+- 롤링 요약: 이력이 예산에 가까워지면 Celery 태스크(summarize_session_async)가
+  오래된 대화를 ChatSession.summary로 접고, 이후에는 요약 + 최근 대화만 전송
+"""
+
+import threading
+
+from sqlalchemy import and_, or_
+
+from extensions import cache, db
+from models import Message
+
+DEFAULT_HISTORY_TOKEN_BUDGET = 6000
+PAGE_SIZE = 20                 # 한 번에 읽어올 메시지 수
+MESSAGE_OVERHEAD_TOKENS = 4    # 메시지당 role/구분자 오버헤드
+IMAGE_TOKEN_ESTIMATE = 1600    # 이미지 1장당 추정 토큰 (긴 변 1568px 기준)
+
+SUMMARY_TRIGGER_RATIO = 0.8    # 이력이 예산의 80%를 넘거나 잘리기 시작하면 요약 예약
+SUMMARY_TAIL_RATIO = 0.4       # 요약 후에도 원문으로 남길 최근 대화 비율
+SUMMARY_LOCK_KEY = "session_summary_lock:{session_id}"
+SUMMARY_LOCK_TIMEOUT = 300
+
+_encoder = None
+_encoder_failed = False
+_encoder_lock = threading.Lock()
+
+
+def _get_encoder():
+    """tiktoken 인코더를 1회만 로딩 (실패 시 이후 호출은 바로 None)"""
+    global _encoder, _encoder_failed
+    if _encoder is not None or _encoder_failed:
+        return _encoder
+    with _encoder_lock:
+        if _encoder is None and not _encoder_failed:
+            try:
+                import tiktoken
+                _encoder = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                print(f"⚠️ tiktoken 로딩 실패, 추정치로 토큰 계산: {e}")
+                _encoder_failed = True
+    return _encoder
+
+
+def count_tokens(text):
+    """텍스트 토큰 수 계산"""
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    # 폴백: 한글 1글자(3바이트) ≈ 1토큰, 영문 약 3글자 ≈ 1토큰
+    return len(text.encode("utf-8")) // 3 + 1
+
+
+def count_message_tokens(content, image_count=0):
+    """메시지 1개의 토큰 수 (본문 + 이미지 추정치 + 오버헤드)"""
+    return count_tokens(content) + image_count * IMAGE_TOKEN_ESTIMATE + MESSAGE_OVERHEAD_TOKENS
+
+
+def _split_image_paths(image_path):
+    return [p for p in image_path.split(",") if p] if image_path else []
+
+
+def summary_boundary(chat_session):
+    """
+    요약에 포함된 마지막 메시지의 (timestamp, id). 요약이 없으면 None.
+
+    메시지 id는 write-behind 반영 순서라 재시도/오버플로된 작업은 늦게 INSERT 되므로,
+    시간순 경계는 id만이 아니라 (timestamp, id)로 비교해야 한다.
+    """
+    if not chat_session.summary_upto_message_id:
+        return None
+    ts = chat_session.summary_upto_timestamp
+    if ts is None:
+        # 경계 시각을 저장하기 전의 요약: 경계 메시지의 시각으로 보완 (없으면 id 비교)
+        msg = db.session.get(Message, chat_session.summary_upto_message_id)
+        ts = msg.timestamp if msg else None
+    return ts, chat_session.summary_upto_message_id
+
+
+def after_boundary(query, boundary):
+    """(timestamp, id) 경계 이후의 메시지만 남기는 조건 (keyset 페이지네이션과 같은 정렬 기준)"""
+    ts, mid = boundary
+    if ts is None:
+        return query.filter(Message.id > mid)
+    return query.filter(or_(
+        Message.timestamp > ts,
+        and_(Message.timestamp == ts, Message.id > mid),
+    ))
+
+
+def build_history_window(session_id, token_budget=None, after=None):
+    """
+    토큰 예산 안에 들어가는 최신 대화 이력을 구성합니다.
+
+    Args:
+        session_id: 채팅 세션 ID
+        token_budget: 이력에 사용할 최대 토큰 수 (None이면 기본값)
+        after: 이 (timestamp, id) 경계 이후 메시지만 사용 (요약에 포함된 메시지 제외, summary_boundary())
+
+    Returns:
+        (history, stats)
+        - history: [{"role", "content", "image_paths"}, ...] 시간순, 연속된 동일 역할은 병합
+        - stats: {"history_tokens": int, "dropped_messages": int}
+    """
+    if token_budget is None or token_budget <= 0:
+        token_budget = DEFAULT_HISTORY_TOKEN_BUDGET
+
+    selected = []
+    used_tokens = 0
+    truncated = False
+    cursor = None  # (timestamp, id) — 직전 페이지의 마지막(가장 오래된) 메시지
+
+    base_query = Message.query.filter(Message.session_id == session_id)
+    if after:
+        base_query = after_boundary(base_query, after)
+
+    while not truncated:
+        query = base_query
+        if cursor is not None:
+            ts, mid = cursor
+            query = query.filter(or_(
+                Message.timestamp < ts,
+                and_(Message.timestamp == ts, Message.id < mid),
+            ))
+        page = (
+            query.order_by(Message.timestamp.desc(), Message.id.desc())
+            .limit(PAGE_SIZE)
+            .all()
+        )
+        if not page:
+            break
+
+        for msg in page:
+            image_paths = _split_image_paths(msg.image_path)
+            tokens = count_message_tokens(msg.content, len(image_paths))
+            if used_tokens + tokens > token_budget:
+                truncated = True
+                break
+            used_tokens += tokens
+            selected.append((msg, image_paths))
+
+        if len(page) < PAGE_SIZE:
+            break
+        cursor = (page[-1].timestamp, page[-1].id)
+
+    selected.reverse()
+
+    # 윈도우가 잘렸거나 요약 이후부터 시작하는 경우 assistant 메시지로 시작하지 않도록 앞부분 정리
+    while (truncated or after) and selected and not selected[0][0].is_user:
+        msg, image_paths = selected.pop(0)
+        used_tokens -= count_message_tokens(msg.content, len(image_paths))
+
+    dropped = 0
+    if truncated:
+        total = base_query.count()
+        dropped = total - len(selected)
+
+    history = []
+    for msg, image_paths in selected:
+        role = "user" if msg.is_user else "assistant"
+        item = {"role": role, "content": msg.content, "image_paths": list(image_paths)}
+
+        # 연속된 동일 역할 메시지는 합쳐서 전송(토큰 절감)
+        if history and history[-1]["role"] == role:
+            prev_content = history[-1]["content"] or ""
+            curr_content = item["content"] or ""
+            history[-1]["content"] = prev_content + "\n\n" + curr_content
+            history[-1]["image_paths"].extend(item["image_paths"])
+        else:
+            history.append(item)
+
+    return history, {"history_tokens": used_tokens, "dropped_messages": dropped}
+
+
+def format_summary_context(summary):
+    """세션 요약을 시스템 프롬프트 뒤에 붙일 동적 문맥 블록으로 변환"""
+    return (
+        "[이전 대화 요약]\n"
+        "아래는 이 세션의 앞선 대화를 요약한 것입니다. 이어지는 대화의 맥락으로만 참고하세요.\n"
+        f"{summary}"
+    )
+
+
+def should_summarize(stats, token_budget):
+    """이력 윈도우 통계로 롤링 요약이 필요한지 판단"""
+    if token_budget is None or token_budget <= 0:
+        token_budget = DEFAULT_HISTORY_TOKEN_BUDGET
+    return (
+        stats.get("dropped_messages", 0) > 0
+        or stats.get("history_tokens", 0) >= token_budget * SUMMARY_TRIGGER_RATIO
+    )
+
+
+def request_session_summary(session_id, token_budget):
+    """
+    세션 요약 태스크를 예약합니다 (세션당 동시에 하나만).
+
+    캐시 락(add)이 이미 있으면 진행 중인 요약이 있으므로 건너뜁니다.
+    락은 태스크가 끝날 때 해제되며, 워커가 죽어도 SUMMARY_LOCK_TIMEOUT 후 만료됩니다.
+    """
+    lock_key = SUMMARY_LOCK_KEY.format(session_id=session_id)
+    if not cache.add(lock_key, 1, timeout=SUMMARY_LOCK_TIMEOUT):
+        return False
+    try:
+        from tasks import summarize_session_async
+        summarize_session_async.delay(session_id=session_id, token_budget=token_budget)
+        return True
+    except Exception as e:
+        cache.delete(lock_key)
+        print(f"⚠️ 세션 요약 예약 실패 (session_id={session_id}): {e}")
+        return False
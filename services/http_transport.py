@@ -0,0 +1,101 @@
+"""
+외부 API 호출용 공용 HTTP 전송 계층(httpx)
+
+공급사 SDK 클라이언트(Anthropic/OpenAI/xAI/Gemini)와 Celery 작업(Imagen, Lyria, DALL·E 다운로드, Mureka)이
+하나의 커넥션 풀을 공유하도록 합니다. 요청마다 새 TCP/TLS 연결을 맺지 않으므로
+TLS 핸드셰이크가 첫 토큰 지연(time-to-first-token)에 섞여 들어가지 않습니다.
+
+- keep-alive 풀: HTTP_MAX_CONNECTIONS / HTTP_MAX_KEEPALIVE / HTTP_KEEPALIVE_EXPIRY
+- HTTP/2: h2 패키지가 설치되어 있고 HTTP2_ENABLED가 꺼져 있지 않으면 사용 (미지원 서버는 ALPN으로 HTTP/1.1)
+- 타임아웃: 연결은 짧게, 읽기는 스트림 청크 간격 기준으로 넉넉하게
+- gevent: 소켓이 monkey patch 되어 있으므로 풀 한도가 곧 워커(그린렛)당 동시 연결 상한이 됨
+- fork 안전: 프로세스(PID)가 바뀌면 클라이언트를 새로 만든다 (gunicorn preload / Celery prefork)
+"""
+
+import os
+import threading
+
+import httpx
+
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "120"))     # 스트림 청크 사이 최대 대기
+WRITE_TIMEOUT = float(os.getenv("HTTP_WRITE_TIMEOUT", "30"))
+POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "30"))      # 풀에서 연결을 기다리는 시간
+
+MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "200"))
+MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "50"))
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+
+DEFAULT_TIMEOUT = httpx.Timeout(
+    connect=CONNECT_TIMEOUT, read=READ_TIMEOUT, write=WRITE_TIMEOUT, pool=POOL_TIMEOUT,
+)
+# 이미지/음악 생성처럼 응답 자체가 오래 걸리는 REST 호출용
+LONG_TIMEOUT = httpx.Timeout(
+    connect=CONNECT_TIMEOUT, read=float(os.getenv("HTTP_LONG_READ_TIMEOUT", "300")),
+    write=WRITE_TIMEOUT, pool=POOL_TIMEOUT,
+)
+
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+
+
+def _http2_available():
+    if os.getenv("HTTP2_ENABLED", "1").lower() in ("0", "false", "no"):
+        return False
+    try:
+        import h2  # noqa: F401  (httpx[http2] 선택 의존성)
+    except ImportError:
+        return False
+    return True
+
+
+def _client_options():
+    return {
+        "http2": _http2_available(),
+        "timeout": DEFAULT_TIMEOUT,
+        "limits": httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        "follow_redirects": True,
+    }
+
+
+def _build_client():
+    return httpx.Client(**_client_options())
+
+
+def build_async_http_client():
+    """같은 풀/타임아웃 설정의 httpx.AsyncClient (이벤트 루프 하나에 묶이므로 루프 소유자가 보관)"""
+    return httpx.AsyncClient(**_client_options())
+
+
+def get_http_client():
+    """프로세스 공용 httpx.Client (SDK 클라이언트 주입 및 직접 REST 호출용)"""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+    with _lock:
+        if _client is None or _client_pid != pid:
+            # fork 이전 부모의 소켓은 공유하면 안 되므로 닫지 않고 버린다
+            _client = _build_client()
+            _client_pid = pid
+    return _client
+
+
+def transport_stats():
+    """현재 프로세스의 전송 계층 설정 (관리자 모니터링용)"""
+    return {
+        "http2": _http2_available(),
+        "max_connections": MAX_CONNECTIONS,
+        "max_keepalive": MAX_KEEPALIVE,
+        "keepalive_expiry": KEEPALIVE_EXPIRY,
+        "timeout": {
+            "connect": CONNECT_TIMEOUT, "read": READ_TIMEOUT,
+            "write": WRITE_TIMEOUT, "pool": POOL_TIMEOUT,
+        },
+        "initialized": _client is not None and _client_pid == os.getpid(),
+    }
@@ -0,0 +1,96 @@
+"""
+인코딩된 이미지 페이로드 LRU 캐시
+
+이미지가 포함된 세션은 매 턴마다 과거 이미지 파일을 다시 열고 base64로 인코딩해 왔습니다.
+(path, mtime, 공급사 포맷) 단위로 전송 직전 형태의 페이로드를 바이트 크기 상한이 있는
+LRU에 보관하여, 모든 공급사 분기(generate_ai_response / generate_ai_response_stream)가 공유합니다.
+인코딩 대상은 원본이 아니라 image_service가 만든 축소·재인코딩 파생본입니다.
+
+포맷:
+  - "anthropic": Anthropic image content block (dict)
+  - "data_url":  OpenAI 호환(OpenAI/xAI/Gemini OpenAI 엔드포인트) data URL (str)
+  - "blob":      google.generativeai 인라인 blob {"mime_type", "data"} (dict)
+"""
+
+import base64
+import mimetypes
+import os
+
+from services.cache_utils import LRUCache
+from services.image_service import resolve_ai_image_path
+
+IMAGE_FORMATS = ("anthropic", "data_url", "blob")
+
+
+def _payload_size(payload):
+    """캐시 항목 크기(바이트) 추정"""
+    if isinstance(payload, str):
+        return len(payload)
+    if isinstance(payload, dict):
+        if "source" in payload:
+            return len(payload["source"]["data"])
+        if "data" in payload:
+            return len(payload["data"])
+    return 0
+
+
+_image_cache = LRUCache(
+    maxsize=int(os.getenv("IMAGE_CACHE_MAX_ITEMS", "512")),
+    max_bytes=int(os.getenv("IMAGE_CACHE_MAX_MB", "64")) * 1024 * 1024,
+    sizeof=_payload_size,
+)
+
+
+def resolve_upload_path(img_path, upload_folder):
+    """DB에 저장된 이미지 경로(uploads/...)를 실제 파일 경로로 변환"""
+    relative_path = img_path.replace("uploads/", "", 1)
+    return os.path.join(upload_folder, relative_path)
+
+
+def _encode(full_path, fmt):
+    with open(full_path, "rb") as f:
+        raw = f.read()
+    mime = mimetypes.guess_type(full_path)[0] or "image/jpeg"
+
+    if fmt == "blob":
+        return {"mime_type": mime, "data": raw}
+
+    b64 = base64.b64encode(raw).decode("utf-8")
+    if fmt == "anthropic":
+        return {
+            "type": "image",
+            "source": {"type": "base64", "media_type": mime, "data": b64},
+        }
+    return f"data:{mime};base64,{b64}"
+
+
+def get_image_payload(img_path, upload_folder, fmt):
+    """
+    공급사 포맷에 맞는 이미지 페이로드 반환 (캐시 적중 시 파일 I/O·인코딩 생략).
+
+    Args:
+        img_path: 메시지에 저장된 이미지 경로 (예: "uploads/20250101_a.png")
+        upload_folder: 업로드 루트 경로
+        fmt: "anthropic" | "data_url" | "blob"
+
+    Raises:
+        OSError: 파일이 없거나 읽을 수 없는 경우
+        ValueError: 지원하지 않는 포맷
+    """
+    if fmt not in IMAGE_FORMATS:
+        raise ValueError(f"지원하지 않는 이미지 포맷: {fmt}")
+
+    full_path = resolve_upload_path(img_path, upload_folder)
+    # 같은 경로에 파일이 교체되면 mtime이 바뀌어 자연스럽게 새 키가 된다
+    key = (full_path, os.stat(full_path).st_mtime_ns, fmt)
+
+    payload = _image_cache.get(key)
+    if payload is None:
+        payload = _encode(resolve_ai_image_path(full_path), fmt)
+        _image_cache.set(key, payload)
+    return payload
+
+
+def image_cache_stats():
+    """이미지 캐시 적중/미스 통계"""
+    return _image_cache.stats()
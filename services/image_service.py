@@ -0,0 +1,149 @@
+"""
+AI 전송용 이미지 전처리 (Pillow)
+
+휴대폰으로 찍은 학습지 사진(4~12MB)을 원본 해상도 그대로 base64로 보내면
+요청 크기·업로드 시간·이미지 토큰 비용이 모두 커집니다.
+원본은 그대로 두고, 옆에 AI 전송용 파생본(derivative)을 한 번만 만들어 재사용합니다.
+
+- EXIF 회전 적용 → 긴 변 IMAGE_MAX_LONG_EDGE 이하로 축소 → JPEG/WebP 재인코딩
+- 파생본 경로: 원본 경로 + ".ai.jpg" (또는 ".ai.webp")
+- 업로드 시점(upload_file_api)에 생성하고, 과거 업로드분은 전송 시점에 지연 생성
+- 이미 충분히 작고 회전 정보가 없는 이미지는 원본을 그대로 사용
+"""
+
+import mimetypes
+import os
+import uuid
+
+IMAGE_MAX_LONG_EDGE = int(os.getenv("IMAGE_MAX_LONG_EDGE", "1568"))  # Anthropic 권장 최대 해상도
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+IMAGE_DERIVATIVE_FORMAT = os.getenv("IMAGE_DERIVATIVE_FORMAT", "JPEG").upper()  # JPEG | WEBP
+IMAGE_PASSTHROUGH_BYTES = 1024 * 1024  # 이보다 작고 규격 안이면 원본 사용
+
+_DERIVATIVE_SUFFIXES = {"JPEG": ".ai.jpg", "WEBP": ".ai.webp"}
+_PASSTHROUGH_FORMATS = {"JPEG", "PNG", "WEBP"}  # 모든 공급사가 그대로 받는 포맷
+_EXIF_ORIENTATION = 0x0112
+
+mimetypes.add_type("image/webp", ".webp")
+
+
+def derivative_path(original_path):
+    """원본 경로에 대응하는 파생본 경로"""
+    suffix = _DERIVATIVE_SUFFIXES.get(IMAGE_DERIVATIVE_FORMAT, ".ai.jpg")
+    return original_path + suffix
+
+
+def derivative_source_name(filename):
+    """파생본 파일명이면 원본 파일명을, 아니면 그대로 반환 (고아 파일 정리에서 파생본을 원본 기준으로 판단)"""
+    for suffix in _DERIVATIVE_SUFFIXES.values():
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)]
+    return filename
+
+
+def _needs_derivative(img, file_size):
+    if max(img.size) > IMAGE_MAX_LONG_EDGE:
+        return True
+    if file_size > IMAGE_PASSTHROUGH_BYTES:
+        return True
+    if img.format not in _PASSTHROUGH_FORMATS:
+        return True
+    try:
+        orientation = img.getexif().get(_EXIF_ORIENTATION, 1)
+    except Exception:
+        orientation = 1
+    return orientation not in (None, 1)
+
+
+def _flatten(img, target_format):
+    """JPEG는 알파 채널을 지원하지 않으므로 흰 배경으로 합성"""
+    from PIL import Image
+
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        if target_format == "WEBP":
+            return img
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    if img.mode != "RGB":
+        return img.convert("RGB")
+    return img
+
+
+def create_image_derivative(original_path):
+    """
+    AI 전송용 파생본을 생성합니다.
+
+    Returns:
+        파생본 경로. 원본을 그대로 써도 되는 경우 원본 경로.
+
+    Raises:
+        OSError: 원본을 열 수 없거나 이미지가 아닌 경우
+    """
+    from PIL import Image, ImageOps
+
+    file_size = os.path.getsize(original_path)
+    with Image.open(original_path) as img:
+        if not _needs_derivative(img, file_size):
+            return original_path
+
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((IMAGE_MAX_LONG_EDGE, IMAGE_MAX_LONG_EDGE), Image.LANCZOS)
+        img = _flatten(img, IMAGE_DERIVATIVE_FORMAT)
+
+        target = derivative_path(original_path)
+        # 같은 워커의 그린렛끼리도 겹치지 않도록 쓰기마다 고유한 임시 파일
+        tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+        save_kwargs = {"quality": IMAGE_QUALITY}
+        if IMAGE_DERIVATIVE_FORMAT == "JPEG":
+            save_kwargs.update(optimize=True, progressive=True)
+        else:
+            save_kwargs.update(method=4)
+        try:
+            img.save(tmp_path, format=IMAGE_DERIVATIVE_FORMAT, **save_kwargs)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    # 다른 워커가 동시에 만들어도 마지막 rename만 남도록 원자적으로 교체
+    os.replace(tmp_path, target)
+    os.chmod(target, 0o644)
+    derived_size = os.path.getsize(target)
+    print(
+        f"🖼️ 이미지 파생본 생성: {os.path.basename(original_path)} "
+        f"{file_size // 1024}KB → {derived_size // 1024}KB"
+    )
+    return target
+
+
+def resolve_ai_image_path(original_path):
+    """
+    AI 공급사에 보낼 이미지 파일 경로 (파생본이 최신이면 파생본, 없으면 지연 생성).
+
+    전처리에 실패하면 원본 경로를 반환합니다.
+    """
+    target = derivative_path(original_path)
+    try:
+        if os.path.getmtime(target) >= os.path.getmtime(original_path):
+            return target
+    except OSError:
+        pass
+
+    try:
+        return create_image_derivative(original_path)
+    except Exception as e:
+        print(f"⚠️ 이미지 전처리 실패, 원본 사용 ({os.path.basename(original_path)}): {e}")
+        return original_path
+
+
+def remove_image_derivatives(original_path):
+    """원본 삭제 시 파생본도 함께 정리"""
+    for suffix in _DERIVATIVE_SUFFIXES.values():
+        path = original_path + suffix
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"⚠️ 이미지 파생본 삭제 실패 ({path}): {e}")
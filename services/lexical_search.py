@@ -0,0 +1,186 @@
+"""
+청크 본문 키워드 검색 (하이브리드 검색의 어휘 단계)
+
+청크 임베딩은 process_document_async가 만든 문맥 요약으로 계산되므로, 단원명·공식 이름·코드 식별자처럼
+질문과 본문이 글자 그대로 일치해야 하는 경우를 벡터 검색만으로는 놓치기 쉽습니다.
+이 모듈은 DocumentChunk.content 원문을 키워드로 검색해 순위 목록을 돌려주고,
+rag_service의 'hybrid' 전략이 벡터 검색 결과와 RRF로 합칩니다.
+
+  - PostgreSQL: to_tsvector('simple', content) 접두어 매칭 + ILIKE 부분 문자열 매칭
+                (migrations/011_lexical_search.sql의 GIN tsvector / pg_trgm 인덱스 사용)
+  - SQLite:     FTS5 외부 콘텐츠 테이블 document_chunk_fts (트리거로 document_chunk와 동기화, bm25 순위)
+
+질문은 query_terms()로 검색어를 뽑습니다. 한국어 조사(은/는/이/가/에서 …)와
+"뭐야", "알려줘" 같은 질문 표현을 떼어 내고, 본문 쪽은 접두어/부분 문자열로 맞춰 활용형 차이를 흡수합니다.
+"""
+
+import re
+from typing import Dict, List
+
+from sqlalchemy import text
+
+from extensions import db
+
+LEXICAL_MAX_TERMS = 8
+FTS_TABLE = "document_chunk_fts"
+
+# 식별자(np.linalg.norm, c++, c#)는 한 단어로 유지
+_TOKEN = re.compile(r"[0-9A-Za-z_가-힣][0-9A-Za-z_가-힣.+#]*")
+_WORD_PIECE = re.compile(r"[0-9A-Za-z_가-힣]+")
+_PARTICLES = sorted(
+    ["은", "는", "이", "가", "을", "를", "의", "에", "와", "과", "도", "만", "로", "란", "야", "요",
+     "으로", "에서", "에게", "까지", "부터", "보다", "처럼", "하고", "이란", "이라", "라는", "이라는",
+     "에서는", "으로는", "이에요", "예요", "인가요", "이야"],
+    key=len, reverse=True,
+)
+_STOPWORDS = {
+    "무엇", "뭐", "뭐야", "뭐예요", "뭔가요", "뭔지", "무슨", "어떤", "어떻게", "왜", "언제", "어디",
+    "알려줘", "알려주세요", "설명", "설명해줘", "설명해주세요", "해줘", "해주세요", "있어", "있나요",
+    "하는", "하면", "해요", "하나요", "되나요", "인가", "써요", "쓰나요", "그리고", "그런데",
+    "what", "how", "why", "is", "the", "a", "an",
+}
+
+
+def _strip_particle(token):
+    if not re.search(r"[가-힣]$", token):
+        return token
+    for particle in _PARTICLES:
+        if token.endswith(particle) and len(token) - len(particle) >= 2:
+            return token[:-len(particle)]
+    return token
+
+
+def query_terms(query: str) -> List[str]:
+    """질문에서 검색어 추출 (조사/질문 표현 제거, 중복 제거, 최대 LEXICAL_MAX_TERMS개)"""
+    terms = []
+    for token in _TOKEN.findall(query or ""):
+        token = token.rstrip(".")
+        term = _strip_particle(token)
+        if len(term) < 2 or term.lower() in _STOPWORDS or token.lower() in _STOPWORDS:
+            continue
+        if term.lower() not in (t.lower() for t in terms):
+            terms.append(term)
+        if len(terms) >= LEXICAL_MAX_TERMS:
+            break
+    return terms
+
+
+def search_chunks(persona_id: int, query: str, limit: int = 20) -> List[Dict]:
+    """
+    페르소나의 검색 가능한 청크를 키워드로 검색.
+
+    Returns:
+        점수 내림차순 [{"chunk_id", "content", "filename", "metadata", "lexical_score"}, ...]
+        (검색어가 없으면 빈 목록)
+    """
+    terms = query_terms(query)
+    if not terms:
+        return []
+    if db.engine.dialect.name == "postgresql":
+        rows = _search_postgres(persona_id, terms, limit)
+    else:
+        rows = _search_sqlite(persona_id, terms, limit)
+    return [
+        {
+            "chunk_id": row[0],
+            "content": row[1],
+            "filename": row[2],
+            "metadata": row[3],
+            "lexical_score": float(row[4]),
+        }
+        for row in rows
+    ]
+
+
+# ----------------------------------------------------------------------
+# PostgreSQL
+# ----------------------------------------------------------------------
+
+def _like_pattern(term):
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def _search_postgres(persona_id, terms, limit):
+    # tsquery에는 특수문자를 뺀 단어 조각만 접두어(:*)로 넣고, 식별자 원형은 ILIKE로 맞춘다
+    pieces = []
+    for term in terms:
+        for piece in _WORD_PIECE.findall(term):
+            if piece not in pieces:
+                pieces.append(piece)
+    params = {"persona_id": persona_id, "limit": limit, "tsquery": " | ".join(f"{p}:*" for p in pieces)}
+    likes = []
+    for i, term in enumerate(terms):
+        params[f"p{i}"] = _like_pattern(term)
+        likes.append(f"content ILIKE :p{i}")
+    matched = " + ".join(f"(CASE WHEN {like} THEN 1 ELSE 0 END)" for like in likes)
+    sql = f"""
+        SELECT c.id, c.content, kd.filename, c.chunk_metadata, c.score
+        FROM (
+            SELECT
+                id, document_id, content, chunk_metadata,
+                ({matched}) + ts_rank_cd(to_tsvector('simple', content), q.query) AS score
+            FROM document_chunk, to_tsquery('simple', :tsquery) AS q(query)
+            WHERE persona_id = :persona_id
+              AND is_searchable
+              AND (to_tsvector('simple', content) @@ q.query OR {" OR ".join(likes)})
+            ORDER BY score DESC
+            LIMIT :limit
+        ) c
+        JOIN knowledge_document kd ON c.document_id = kd.id
+        ORDER BY c.score DESC
+    """
+    return db.session.execute(text(sql), params).all()
+
+
+# ----------------------------------------------------------------------
+# SQLite (FTS5)
+# ----------------------------------------------------------------------
+
+def _search_sqlite(persona_id, terms, limit):
+    # 각 검색어를 구(phrase) 접두어 질의로: "변수"* OR "np.linalg"*
+    match = " OR ".join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+    sql = f"""
+        SELECT dc.id, dc.content, kd.filename, dc.chunk_metadata, -bm25({FTS_TABLE}) AS score
+        FROM {FTS_TABLE}
+        JOIN document_chunk dc ON dc.id = {FTS_TABLE}.rowid
+        JOIN knowledge_document kd ON dc.document_id = kd.id
+        WHERE {FTS_TABLE} MATCH :match
+          AND dc.persona_id = :persona_id
+          AND dc.is_searchable
+        ORDER BY bm25({FTS_TABLE})
+        LIMIT :limit
+    """
+    return db.session.execute(text(sql), {"match": match, "persona_id": persona_id, "limit": limit}).all()
+
+
+def ensure_sqlite_fts(conn):
+    """
+    SQLite용 FTS5 외부 콘텐츠 테이블과 동기화 트리거 생성 (앱 시작 시, 이미 있으면 유지).
+    처음 만들 때는 기존 청크로 색인을 채웁니다.
+    """
+    exists = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+    ).first()
+    if not exists:
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"content, content='document_chunk', content_rowid='id', tokenize='unicode61')"
+        ))
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS document_chunk_fts_ai AFTER INSERT ON document_chunk BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+        END
+    """))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS document_chunk_fts_ad AFTER DELETE ON document_chunk BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+    """))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS document_chunk_fts_au AFTER UPDATE OF content ON document_chunk BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content);
+        END
+    """))
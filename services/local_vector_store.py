@@ -0,0 +1,291 @@
+"""
+SQLite 모드용 로컬 벡터 저장소 (페르소나별 메모리 매핑 NumPy 행렬)
+
+PostgreSQL 접속 정보가 없으면 app.py는 sqlite:///chatbot.db로 동작하는데, 이때는 pgvector의 <=> 연산을
+쓸 수 없습니다. 이 모듈은 페르소나 청크 임베딩을 L2 정규화해 파일로 보관하고,
+rag_service._vector_candidates()가 같은 결과 형식으로 상위 k개를 돌려주도록 합니다.
+
+페르소나별 파일 (LOCAL_VECTOR_STORE_DIR):
+  persona_<id>.vec   정규화 벡터 행렬 (LOCAL_VECTOR_DTYPE float32|float16, 행 우선)
+  persona_<id>.ids   행 순서의 청크 ID (int64)
+  persona_<id>.json  {"dim", "dtype", "count"} — count 행까지만 유효 (추가 쓰기 중 중단돼도 메타 기준으로 복구)
+
+  - append():  문서 처리 완료 시 새 청크를 파일 끝에 추가 (메타는 데이터 기록 후 원자적 교체)
+  - remove():  삭제/재처리된 청크를 빼고 새 파일로 압축 후 교체
+  - search_local(): 행렬을 np.memmap으로 열어 질문 벡터와 내적(=코사인 유사도) → argpartition으로 상위 후보,
+                   DB에서 검색 가능 여부(is_searchable)와 본문을 확인. DB에 없는 ID는 압축으로 정리
+  - 메타 파일이 없으면(기존 DB) 첫 검색 때 document_chunk의 임베딩으로 다시 만듭니다.
+
+다른 프로세스(Celery 워커)가 파일을 바꾸면 메타 파일의 수정 시각/크기로 감지해 다시 엽니다.
+"""
+
+import json
+import os
+import threading
+from typing import Dict, List
+
+import numpy as np
+from sqlalchemy import text
+
+from extensions import db
+
+try:
+    import fcntl
+except ImportError:      # Windows: 프로세스 간 잠금 없이 프로세스 내부 잠금만 사용
+    fcntl = None
+
+LOCAL_VECTOR_STORE_DIR = os.getenv(
+    "LOCAL_VECTOR_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "instance", "vector_store"),
+)
+LOCAL_VECTOR_DTYPE = os.getenv("LOCAL_VECTOR_DTYPE", "float32")      # 'float32' | 'float16'(용량 절반)
+
+_lock = threading.Lock()
+_matrices = {}   # persona_id -> (메타 파일 시그니처, ids, memmap 행렬)
+
+
+def local_store_enabled():
+    """pgvector를 쓸 수 없는 배포(SQLite)에서만 사용"""
+    return db.engine.dialect.name != "postgresql"
+
+
+def _path(persona_id, ext):
+    return os.path.join(LOCAL_VECTOR_STORE_DIR, f"persona_{int(persona_id)}.{ext}")
+
+
+def _normalize(vectors):
+    arr = np.asarray(vectors, dtype=np.float32)
+    if arr.ndim == 1:
+        arr = arr.reshape(1, -1)
+    norms = np.linalg.norm(arr, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return arr / norms
+
+
+class _FileLock:
+    """페르소나 파일 쓰기 잠금 (같은 프로세스 스레드 + fcntl 사용 가능 시 프로세스 간)"""
+
+    def __init__(self, persona_id):
+        self._path = _path(persona_id, "lock")
+
+    def __enter__(self):
+        _lock.acquire()
+        os.makedirs(LOCAL_VECTOR_STORE_DIR, exist_ok=True)
+        self._fh = open(self._path, "a")
+        if fcntl is not None:
+            fcntl.flock(self._fh, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._fh, fcntl.LOCK_UN)
+        self._fh.close()
+        _lock.release()
+
+
+def _read_meta(persona_id):
+    try:
+        with open(_path(persona_id, "json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(persona_id, meta):
+    tmp = _path(persona_id, "json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, _path(persona_id, "json"))
+
+
+def _write_files(persona_id, ids, matrix, dtype):
+    """전체 파일을 새로 써서 교체 (압축/재생성)"""
+    # 열려 있는 memmap을 먼저 놓아야 Windows에서도 교체 가능
+    _matrices.pop(persona_id, None)
+    for ext, data in (("vec", matrix.astype(dtype)), ("ids", np.asarray(ids, dtype=np.int64))):
+        tmp = _path(persona_id, f"{ext}.tmp")
+        data.tofile(tmp)
+        os.replace(tmp, _path(persona_id, ext))
+    dim = int(matrix.shape[1]) if matrix.ndim == 2 and matrix.shape[0] else None
+    _write_meta(persona_id, {"dim": dim, "dtype": dtype, "count": int(len(ids))})
+
+
+def _load_all(persona_id, meta):
+    """유효 구간(count 행)의 ids와 float32 행렬"""
+    count, dim = meta["count"], meta["dim"]
+    if not count:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, dim or 0), dtype=np.float32)
+    ids = np.fromfile(_path(persona_id, "ids"), dtype=np.int64, count=count)
+    matrix = np.fromfile(_path(persona_id, "vec"), dtype=meta["dtype"], count=count * dim).reshape(count, dim)
+    return ids, matrix.astype(np.float32)
+
+
+# ----------------------------------------------------------------------
+# 쓰기
+# ----------------------------------------------------------------------
+
+def append(persona_id, chunk_ids, vectors):
+    """새 청크 벡터를 파일 끝에 추가 (메타가 없으면 DB 기준 재생성으로 대신함)"""
+    if not chunk_ids:
+        return
+    matrix = _normalize(vectors)
+    with _FileLock(persona_id):
+        meta = _read_meta(persona_id)
+        if meta is None:
+            _rebuild_locked(persona_id)
+            return
+        if meta["dim"] is None:
+            meta["dim"] = int(matrix.shape[1])
+        if matrix.shape[1] != meta["dim"]:
+            raise ValueError(f"임베딩 차원 불일치: {matrix.shape[1]} != {meta['dim']}")
+        itemsize = np.dtype(meta["dtype"]).itemsize
+        # 중단된 이전 쓰기가 남긴 꼬리를 잘라 낸 뒤 이어 쓰기
+        for ext, size, data in (
+            ("vec", meta["count"] * meta["dim"] * itemsize, matrix.astype(meta["dtype"])),
+            ("ids", meta["count"] * 8, np.asarray(chunk_ids, dtype=np.int64)),
+        ):
+            with open(_path(persona_id, ext), "ab") as f:
+                f.truncate(size)
+                f.write(data.tobytes())
+        meta["count"] += len(chunk_ids)
+        _write_meta(persona_id, meta)
+
+
+def remove(persona_id, chunk_ids):
+    """청크 삭제 후 압축 (남은 행만 새 파일로 교체)"""
+    if not chunk_ids:
+        return
+    with _FileLock(persona_id):
+        meta = _read_meta(persona_id)
+        if meta is None or not meta["count"]:
+            return
+        ids, matrix = _load_all(persona_id, meta)
+        keep = ~np.isin(ids, np.asarray(list(chunk_ids), dtype=np.int64))
+        if keep.all():
+            return
+        _write_files(persona_id, ids[keep], matrix[keep], meta["dtype"])
+
+
+def drop_persona(persona_id):
+    """페르소나 삭제 시 파일 제거"""
+    with _FileLock(persona_id):
+        for ext in ("vec", "ids", "json"):
+            try:
+                os.remove(_path(persona_id, ext))
+            except FileNotFoundError:
+                pass
+    _matrices.pop(persona_id, None)
+
+
+def rebuild(persona_id):
+    """document_chunk의 임베딩으로 페르소나 파일 재생성"""
+    with _FileLock(persona_id):
+        return _rebuild_locked(persona_id)
+
+
+def _rebuild_locked(persona_id):
+    from models import DocumentChunk
+
+    rows = (
+        db.session.query(DocumentChunk.id, DocumentChunk.embedding)
+        .filter(DocumentChunk.persona_id == persona_id, DocumentChunk.embedding.isnot(None))
+        .order_by(DocumentChunk.id)
+        .all()
+    )
+    ids = [row[0] for row in rows]
+    matrix = _normalize([row[1] for row in rows]) if rows else np.zeros((0, 0), dtype=np.float32)
+    _write_files(persona_id, ids, matrix, LOCAL_VECTOR_DTYPE)
+    return len(ids)
+
+
+# ----------------------------------------------------------------------
+# 검색
+# ----------------------------------------------------------------------
+
+def _open(persona_id):
+    """읽기용 (ids, memmap 행렬). 메타 파일이 바뀌었으면 다시 연다."""
+    meta_path = _path(persona_id, "json")
+    try:
+        stat = os.stat(meta_path)
+    except FileNotFoundError:
+        rebuild(persona_id)
+        stat = os.stat(meta_path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _matrices.get(persona_id)
+    if cached and cached[0] == signature:
+        return cached[1], cached[2]
+    meta = _read_meta(persona_id)
+    count, dim = meta["count"], meta["dim"]
+    if not count:
+        ids, matrix = np.zeros(0, dtype=np.int64), None
+    else:
+        ids = np.fromfile(_path(persona_id, "ids"), dtype=np.int64, count=count)
+        matrix = np.memmap(_path(persona_id, "vec"), dtype=meta["dtype"], mode="r", shape=(count, dim))
+    _matrices[persona_id] = (signature, ids, matrix)
+    return ids, matrix
+
+
+def search_local(persona_id: int, query_embedding: List[float], limit: int) -> List[Dict]:
+    """
+    코사인 유사도 상위 limit개 청크 (rag_service._vector_candidates와 같은 형식).
+
+    비활성/재처리 중인 청크를 걸러도 limit개가 남도록 후보를 넉넉히 뽑아 DB에서 확인합니다.
+    """
+    ids, matrix = _open(persona_id)
+    if matrix is None or not len(ids):
+        return []
+    query = _normalize(query_embedding)[0].astype(matrix.dtype)
+    scores = np.asarray(matrix @ query, dtype=np.float32)
+    n = min(len(ids), limit * 2 + 10)
+    top = np.argpartition(-scores, n - 1)[:n] if n < len(ids) else np.arange(len(ids))
+    top = top[np.argsort(-scores[top])]
+    candidate_ids = [int(i) for i in ids[top]]
+
+    rows = db.session.execute(
+        text(f"""
+            SELECT dc.id, dc.content, kd.filename, dc.chunk_metadata, dc.is_searchable
+            FROM document_chunk dc
+            JOIN knowledge_document kd ON dc.document_id = kd.id
+            WHERE dc.id IN ({", ".join(str(i) for i in candidate_ids)})
+              AND dc.persona_id = :persona_id
+        """),
+        {"persona_id": persona_id},
+    ).all()
+    found = {row[0]: row for row in rows}
+    # DB에 없거나 이 페르소나 소속이 아닌 ID는 파일에서 정리
+    missing = [i for i in candidate_ids if i not in found]
+    if missing:
+        remove(persona_id, missing)
+
+    docs = []
+    for position, chunk_id in zip(top, candidate_ids):
+        row = found.get(chunk_id)
+        if row is None or not row[4]:
+            continue
+        metadata = row[3]
+        if isinstance(metadata, str):
+            metadata = json.loads(metadata)
+        docs.append({
+            "content": row[1],
+            "filename": row[2],
+            "metadata": metadata,
+            "similarity": float(scores[position]),
+            "chunk_id": chunk_id,
+        })
+        if len(docs) >= limit:
+            break
+    return docs
+
+
+def local_store_status(persona_id=None):
+    """지식 베이스 통계용 (페르소나 지정 시 행 수/차원/파일 크기)"""
+    status = {"backend": "local", "dir": LOCAL_VECTOR_STORE_DIR, "dtype": LOCAL_VECTOR_DTYPE}
+    if persona_id is not None:
+        meta = _read_meta(persona_id) or {}
+        try:
+            size = os.path.getsize(_path(persona_id, "vec"))
+        except OSError:
+            size = 0
+        status.update({"rows": meta.get("count", 0), "dim": meta.get("dim"), "size_bytes": size,
+                       "dtype": meta.get("dtype", LOCAL_VECTOR_DTYPE)})
+    return status
@@ -0,0 +1,204 @@
+"""
+오프라인 모의(mock) LLM 공급사
+
+실제 API 비용 없이 /chat 파이프라인을 부하 테스트하기 위한 로컬 OpenAI 호환 서버입니다.
+MOCK_LLM_URL이 설정되면 ai_service가 "mock" 공급사와 "mock-llm" 모델을 등록하고
+OpenAI SDK(base_url=MOCK_LLM_URL)로 이 서버를 호출합니다.
+
+시뮬레이션 항목 (CLI 옵션 / 환경변수):
+  - 첫 토큰 지연(TTFT):      --ttft-ms (MOCK_TTFT_MS), --ttft-jitter-ms
+  - 생성 속도:               --tokens-per-sec (MOCK_TOKENS_PER_SEC)
+  - 응답 길이(토큰 수):      --tokens (MOCK_TOKENS)
+  - 서버 오류 비율(500):     --error-rate (MOCK_ERROR_RATE)
+  - rate limit 비율(429):    --rate-limit-rate (MOCK_RATE_LIMIT_RATE), Retry-After 헤더 포함
+  - 스트림 도중 끊김 비율:   --drop-rate (MOCK_DROP_RATE)
+
+지원 엔드포인트: POST /v1/chat/completions (stream true/false), GET /v1/models
+
+실행:
+    python -m services.mock_provider --port 8090 --ttft-ms 400 --tokens-per-sec 60
+    MOCK_LLM_URL=http://127.0.0.1:8090/v1 gunicorn ... app:app
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from dataclasses import dataclass
+
+MOCK_MODEL_ID = "mock-llm"
+
+_WORDS = (
+    "학생", "질문", "개념", "예시", "정리", "단계", "이해", "풀이", "확인", "연습",
+    "the", "model", "answer", "step", "because", "therefore", "example", "note",
+)
+
+
+@dataclass
+class MockConfig:
+    ttft_ms: float = float(os.getenv("MOCK_TTFT_MS", "300"))
+    ttft_jitter_ms: float = float(os.getenv("MOCK_TTFT_JITTER_MS", "100"))
+    tokens_per_sec: float = float(os.getenv("MOCK_TOKENS_PER_SEC", "50"))
+    tokens: int = int(os.getenv("MOCK_TOKENS", "200"))
+    error_rate: float = float(os.getenv("MOCK_ERROR_RATE", "0"))
+    rate_limit_rate: float = float(os.getenv("MOCK_RATE_LIMIT_RATE", "0"))
+    drop_rate: float = float(os.getenv("MOCK_DROP_RATE", "0"))
+    seed: int = None
+
+
+def _json_response(status, reason, body, extra_headers=b""):
+    payload = json.dumps(body).encode()
+    return (
+        f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(payload)}\r\nConnection: keep-alive\r\n".encode()
+        + extra_headers + b"\r\n" + payload
+    )
+
+
+def _chunk_event(index, text, finish=False, usage=None):
+    event = {
+        "id": "mock", "object": "chat.completion.chunk", "created": int(time.time()),
+        "model": MOCK_MODEL_ID,
+        "choices": [{"index": 0, "delta": {} if finish else {"content": text},
+                     "finish_reason": "stop" if finish else None}],
+    }
+    if usage is not None:
+        event["usage"] = usage
+    data = f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode()
+    return f"{len(data):x}\r\n".encode() + data + b"\r\n"
+
+
+class MockProviderServer:
+    """asyncio 기반 모의 공급사 HTTP 서버 (HTTP/1.1 keep-alive, chunked SSE)"""
+
+    def __init__(self, config=None):
+        self.config = config or MockConfig()
+        self.random = random.Random(self.config.seed)
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0, "dropped": 0}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                header = await reader.readuntil(b"\r\n\r\n")
+                request_line, *header_lines = header.decode("latin-1").split("\r\n")
+                method, path, _ = request_line.split(" ", 2)
+                length = 0
+                for line in header_lines:
+                    if line.lower().startswith("content-length:"):
+                        length = int(line.split(":", 1)[1])
+                body = json.loads(await reader.readexactly(length)) if length else {}
+                if not await self._dispatch(method, path, body, writer):
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, path, body, writer):
+        """요청 하나를 처리하고 연결을 유지할지 반환"""
+        if method == "GET" and path.rstrip("/").endswith("/models"):
+            writer.write(_json_response(200, "OK", {
+                "object": "list", "data": [{"id": MOCK_MODEL_ID, "object": "model", "created": 0}],
+            }))
+            await writer.drain()
+            return True
+        if not (method == "POST" and path.rstrip("/").endswith("/chat/completions")):
+            writer.write(_json_response(404, "Not Found", {"error": {"message": "not found"}}))
+            await writer.drain()
+            return True
+
+        self.stats["requests"] += 1
+        cfg = self.config
+        roll = self.random.random()
+        if roll < cfg.rate_limit_rate:
+            self.stats["rate_limited"] += 1
+            writer.write(_json_response(429, "Too Many Requests", {
+                "error": {"message": "mock rate limit", "type": "rate_limit_error"},
+            }, b"Retry-After: 1\r\n"))
+            await writer.drain()
+            return True
+        if roll < cfg.rate_limit_rate + cfg.error_rate:
+            self.stats["errors"] += 1
+            writer.write(_json_response(500, "Internal Server Error", {
+                "error": {"message": "mock server error", "type": "server_error"},
+            }))
+            await writer.drain()
+            return True
+
+        max_tokens = body.get("max_completion_tokens") or body.get("max_tokens") or cfg.tokens
+        n_tokens = max(1, min(cfg.tokens, int(max_tokens)))
+        words = [self.random.choice(_WORDS) for _ in range(n_tokens)]
+        ttft = max(0.0, cfg.ttft_ms + self.random.uniform(-cfg.ttft_jitter_ms, cfg.ttft_jitter_ms)) / 1000.0
+        interval = 1.0 / cfg.tokens_per_sec if cfg.tokens_per_sec > 0 else 0.0
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": n_tokens,
+                 "total_tokens": prompt_tokens + n_tokens}
+
+        await asyncio.sleep(ttft)
+        if not body.get("stream"):
+            writer.write(_json_response(200, "OK", {
+                "id": "mock", "object": "chat.completion", "created": int(time.time()),
+                "model": MOCK_MODEL_ID,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": " ".join(words)}}],
+                "usage": usage,
+            }))
+            await writer.drain()
+            return True
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\nConnection: keep-alive\r\n\r\n"
+        )
+        drop_at = n_tokens // 2 if self.random.random() < cfg.drop_rate else None
+        for i, word in enumerate(words):
+            if i == drop_at:
+                self.stats["dropped"] += 1
+                return False  # 청크 종료 없이 연결을 끊어 스트림 도중 장애를 재현
+            writer.write(_chunk_event(i, word + " "))
+            await writer.drain()
+            if interval:
+                await asyncio.sleep(interval)
+        writer.write(_chunk_event(n_tokens, "", finish=True, usage=usage))
+        done = b"data: [DONE]\n\n"
+        writer.write(f"{len(done):x}\r\n".encode() + done + b"\r\n0\r\n\r\n")
+        await writer.drain()
+        return True
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port, backlog=4096)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="오프라인 모의 LLM 공급사 (OpenAI 호환)")
+    defaults = MockConfig()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--ttft-ms", type=float, default=defaults.ttft_ms)
+    parser.add_argument("--ttft-jitter-ms", type=float, default=defaults.ttft_jitter_ms)
+    parser.add_argument("--tokens-per-sec", type=float, default=defaults.tokens_per_sec)
+    parser.add_argument("--tokens", type=int, default=defaults.tokens)
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--rate-limit-rate", type=float, default=defaults.rate_limit_rate)
+    parser.add_argument("--drop-rate", type=float, default=defaults.drop_rate)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        ttft_ms=args.ttft_ms, ttft_jitter_ms=args.ttft_jitter_ms, tokens_per_sec=args.tokens_per_sec,
+        tokens=args.tokens, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+        drop_rate=args.drop_rate, seed=args.seed,
+    )
+    print(f"🧪 Mock LLM provider: http://{args.host}:{args.port}/v1 ({config})")
+    try:
+        asyncio.run(MockProviderServer(config).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
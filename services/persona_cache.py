@@ -0,0 +1,219 @@
+"""
+페르소나 채팅 컨텍스트 스냅샷 캐시
+
+/chat 요청마다 반복되던 조회(페르소나 행, 공급사별 시스템 프롬프트, 학생/교사 배정,
+allowed_models_config 파싱)를 role_key 단위의 불변 스냅샷 하나로 묶어 캐싱합니다.
+
+캐시 계층:
+  1. 프로세스 내부 LRU (L1)
+  2. Flask-Caching 저장소 (Redis, 워커 간 공유)
+
+무효화는 버전 키 방식입니다. 관리자 화면에서 페르소나/프롬프트/배정이 바뀌면
+invalidate_persona_snapshot()이 버전 토큰을 교체하고, 이전 버전 데이터는 더 이상 조회되지 않습니다.
+캐시가 따뜻하면 채팅 경로에서 SQL 없이 캐시 조회 1회(MGET)로 모든 정보를 얻습니다.
+"""
+
+import hashlib
+import json
+import types
+import uuid
+from dataclasses import dataclass
+
+from extensions import cache
+from models import (
+    PersonaDefinition,
+    PersonaSystemPrompt,
+    PersonaStudentPermission,
+    PersonaTeacherPermission,
+)
+from services.cache_utils import LRUCache
+
+PROVIDERS = ("openai", "anthropic", "google", "xai")
+
+_EPOCH_KEY = "persona_snapshot_epoch"
+_VERSION_KEY = "persona_snapshot_version:{role_key}"
+_DATA_KEY = "persona_snapshot:{schema}:{role_key}:{epoch}:{version}"
+_DATA_TIMEOUT = 3600  # 버전 키가 유실돼도 1시간 뒤에는 재구성되도록 안전장치
+
+_local_snapshots = LRUCache(maxsize=256)
+
+# 컬럼 구성이 바뀌면(배포로 새 컬럼 추가) 공유 캐시에 남은 이전 형식 데이터를 쓰지 않도록 키에 포함
+_SCHEMA_TAG = hashlib.md5(
+    ",".join(c.name for c in PersonaDefinition.__table__.columns).encode()
+).hexdigest()[:8]
+
+
+@dataclass(frozen=True)
+class PersonaSnapshot:
+    """
+    role_key 하나에 대한 채팅 컨텍스트 불변 스냅샷.
+
+    PersonaDefinition 컬럼은 속성으로 그대로 접근할 수 있습니다 (예: snapshot.max_tokens).
+    """
+    role_key: str
+    fields: types.MappingProxyType
+    prompts: types.MappingProxyType
+    allowed_models: types.MappingProxyType
+    student_ids: frozenset
+    teacher_ids: frozenset
+
+    def __getattr__(self, name):
+        # dataclass 필드가 아닌 속성은 PersonaDefinition 컬럼 값으로 위임
+        if name == "fields":
+            raise AttributeError(name)
+        try:
+            return self.fields[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def system_prompt(self, provider):
+        """공급사별 시스템 프롬프트 (없으면 default 프롬프트로 폴백)"""
+        if provider in self.prompts:
+            return self.prompts[provider]
+        return self.prompts.get("default", "")
+
+    def allowed_models_for(self, provider):
+        """공급사별 허용 모델 목록 (노출 순서 유지, 튜플)"""
+        return self.allowed_models.get(provider, ())
+
+    def is_provider_restricted(self, provider):
+        return bool(self.fields.get(f"restrict_{provider}", False))
+
+    def can_access(self, user):
+        """
+        사용자 접근 가능 여부.
+
+        배정 행이 하나라도 있으면 배정된 사용자만, 없으면 allow_user/allow_teacher 플래그를 적용합니다.
+        """
+        if user.is_admin:
+            return True
+        user_role = getattr(user, "role", "user") or "user"
+        if user_role == "user":
+            if self.student_ids:
+                return user.id in self.student_ids
+            return bool(self.fields.get("allow_user"))
+        if self.teacher_ids:
+            return user.id in self.teacher_ids
+        return bool(self.fields.get("allow_teacher"))
+
+
+def _parse_allowed_models(fields):
+    """allowed_models_config(JSON)를 파싱하고, 비어 있으면 model_* 단일 필드로 폴백"""
+    cfg = {}
+    if fields.get("allowed_models_config"):
+        try:
+            cfg = json.loads(fields["allowed_models_config"]) or {}
+        except (ValueError, TypeError):
+            cfg = {}
+
+    allowed = {}
+    for provider in PROVIDERS:
+        lst = cfg.get(provider, []) if isinstance(cfg, dict) else []
+        if not lst:
+            single = fields.get(f"model_{provider}")
+            lst = [single] if single else []
+        allowed[provider] = tuple(lst)
+    return allowed
+
+
+def _load_snapshot_data(role_key):
+    """DB에서 스냅샷 원본 데이터(직렬화 가능한 dict)를 구성. 활성 페르소나가 없으면 None"""
+    persona = PersonaDefinition.query.filter_by(role_key=role_key, is_active=True).first()
+    if not persona:
+        return None
+
+    fields = {c.name: getattr(persona, c.name) for c in PersonaDefinition.__table__.columns}
+    prompts = {
+        p.provider: p.system_prompt
+        for p in PersonaSystemPrompt.query.filter_by(persona_id=persona.id).all()
+    }
+    student_ids = [
+        r[0] for r in PersonaStudentPermission.query
+        .with_entities(PersonaStudentPermission.student_id)
+        .filter_by(persona_id=persona.id).all()
+    ]
+    teacher_ids = [
+        r[0] for r in PersonaTeacherPermission.query
+        .with_entities(PersonaTeacherPermission.teacher_id)
+        .filter_by(persona_id=persona.id).all()
+    ]
+    return {
+        "fields": fields,
+        "prompts": prompts,
+        "allowed_models": _parse_allowed_models(fields),
+        "student_ids": student_ids,
+        "teacher_ids": teacher_ids,
+    }
+
+
+def _snapshot_from_data(role_key, data):
+    return PersonaSnapshot(
+        role_key=role_key,
+        fields=types.MappingProxyType(dict(data["fields"])),
+        prompts=types.MappingProxyType(dict(data["prompts"])),
+        allowed_models=types.MappingProxyType(
+            {k: tuple(v) for k, v in data["allowed_models"].items()}
+        ),
+        student_ids=frozenset(data["student_ids"]),
+        teacher_ids=frozenset(data["teacher_ids"]),
+    )
+
+
+def _current_versions(role_key):
+    """(전역 epoch, role_key 버전) 토큰 조회. 없으면 새 토큰을 원자적으로 등록"""
+    version_key = _VERSION_KEY.format(role_key=role_key)
+    epoch, version = cache.get_many(_EPOCH_KEY, version_key)
+    if epoch is None:
+        cache.add(_EPOCH_KEY, uuid.uuid4().hex, timeout=0)
+        epoch = cache.get(_EPOCH_KEY)
+    if version is None:
+        cache.add(version_key, uuid.uuid4().hex, timeout=0)
+        version = cache.get(version_key)
+    return epoch, version
+
+
+def get_persona_snapshot(role_key):
+    """
+    role_key의 채팅 컨텍스트 스냅샷 조회 (L1 LRU → 공유 캐시 → DB 순).
+
+    Returns:
+        PersonaSnapshot 또는 None (존재하지 않거나 비활성 페르소나)
+    """
+    if not role_key:
+        return None
+
+    epoch, version = _current_versions(role_key)
+    local_key = (role_key, epoch, version)
+    snapshot = _local_snapshots.get(local_key)
+    if snapshot is not None:
+        return snapshot
+
+    data_key = _DATA_KEY.format(
+        schema=_SCHEMA_TAG, role_key=role_key, epoch=epoch, version=version
+    )
+    data = cache.get(data_key)
+    if data is None:
+        data = _load_snapshot_data(role_key)
+        if data is None:
+            return None
+        cache.set(data_key, data, timeout=_DATA_TIMEOUT)
+
+    snapshot = _snapshot_from_data(role_key, data)
+    _local_snapshots.set(local_key, snapshot)
+    return snapshot
+
+
+def invalidate_persona_snapshot(role_key):
+    """특정 페르소나 스냅샷 무효화 (버전 토큰 교체)"""
+    if role_key:
+        cache.set(_VERSION_KEY.format(role_key=role_key), uuid.uuid4().hex, timeout=0)
+
+
+def invalidate_all_persona_snapshots():
+    """전체 페르소나 스냅샷 무효화 (사용자 일괄 삭제 등 여러 페르소나에 걸친 변경 시)"""
+    cache.set(_EPOCH_KEY, uuid.uuid4().hex, timeout=0)
+
+
+def persona_snapshot_cache_stats():
+    """프로세스 내부(L1) 스냅샷 캐시 통계"""
+    return _local_snapshots.stats()
@@ -0,0 +1,41 @@
+"""
+요청별 DB 쿼리 수 계측 (부하 테스트용)
+
+DB_QUERY_STATS=1일 때만 활성화합니다. SQLAlchemy before_cursor_execute 이벤트로 쿼리를 세고,
+요청 처리 중 실행된 쿼리 수를 X-DB-Query-Count 응답 헤더로 돌려줍니다.
+스트리밍 응답(SSE)은 헤더가 먼저 나가므로 본문 생성 중 쿼리는 포함되지 않으며,
+요청 밖(턴 생성 워커, write-behind 등)에서 실행된 쿼리는 프로세스 누적값으로만 집계합니다.
+"""
+
+import threading
+
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+QUERY_COUNT_HEADER = "X-DB-Query-Count"
+
+_background = {"queries": 0}
+_lock = threading.Lock()
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g._db_query_count = g.get("_db_query_count", 0) + 1
+    else:
+        with _lock:
+            _background["queries"] += 1
+
+
+def background_query_count():
+    """요청 밖에서 실행된 쿼리 누적 수 (현재 프로세스)"""
+    return _background["queries"]
+
+
+def init_query_stats(app):
+    event.listen(Engine, "before_cursor_execute", _count_query)
+
+    @app.after_request
+    def add_query_count_header(response):
+        response.headers[QUERY_COUNT_HEADER] = str(g.get("_db_query_count", 0))
+        return response
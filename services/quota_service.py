@@ -0,0 +1,417 @@
+"""
+학생/역할/페르소나별 토큰·요청 사용 한도(quota)
+
+한 학생이 큰 파일을 붙여 넣거나 같은 질문을 반복해 학교 예산을 소진하고 다른 학생의 몫까지 빼앗지 않도록,
+공급사를 호출하기 전에 한도를 확인하고 스트림이 끝나면 실제 사용량으로 정산합니다.
+
+- 범위(scope):
+    user    — 사용자 개인 (user_id별 설정, 없으면 "*" 기본값이 모든 사용자에게 각각 적용)
+    role    — 계정 역할(user|teacher) 전체 합계
+    persona — 페르소나(role_key) 전체 합계 (role_key별 설정, 없으면 "*" 기본값이 페르소나마다 적용)
+- 한도: tokens_day, tokens_hour, requests_day, requests_hour (0 또는 미설정 = 무제한)
+    시간 한도는 토큰 버킷(1시간에 한도만큼 균등 충전 → 최근 1시간 사용량 근사),
+    일 한도는 서버 로컬 날짜 기준 카운터(자정 초기화)
+- 저장소: Redis(워커 간 공유, Lua로 모든 버킷을 원자적으로 확인·차감). Redis가 없으면 프로세스 내부 구현
+- 설정: SystemConfig usage_quotas(JSON), 관리자 API로 변경 (30초 캐시)
+- 관리자 계정은 한도를 적용하지 않는다
+"""
+
+import datetime
+import json
+import math
+import os
+import threading
+import time
+
+from extensions import cache
+from models import SystemConfig
+from services.cache_utils import get_redis_client
+
+LIMIT_FIELDS = ("tokens_day", "tokens_hour", "requests_day", "requests_hour")
+SCOPES = ("user", "role", "persona")
+
+# 답변 길이는 호출 전에 알 수 없으므로 이만큼(최대 max_tokens)을 미리 잡고 종료 후 정산
+QUOTA_OUTPUT_RESERVE = int(os.getenv("QUOTA_OUTPUT_RESERVE_TOKENS", "1000"))
+
+_CONFIG_KEY = "usage_quotas"
+_QUOTAS_CACHE_KEY = "usage_quotas"
+_BUCKET_KEY = "quota:{scope}:{id}:{metric}:hour"
+_COUNTER_KEY = "quota:{scope}:{id}:{metric}:day:{day}"
+_HOUR = 3600
+
+_SCOPE_LABELS = {"user": "개인", "role": "역할 전체", "persona": "페르소나 전체"}
+_FIELD_LABELS = {
+    "tokens_day": "오늘 사용할 수 있는 토큰",
+    "tokens_hour": "최근 1시간 동안 사용할 수 있는 토큰",
+    "requests_day": "오늘 보낼 수 있는 질문 수",
+    "requests_hour": "최근 1시간 동안 보낼 수 있는 질문 수",
+}
+
+
+class QuotaExceeded(Exception):
+    """사용 한도를 넘은 요청 (retry_after: 다시 시도할 수 있을 때까지의 초)"""
+
+    def __init__(self, message, retry_after, scope, field):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.scope = scope
+        self.field = field
+
+
+# ----------------------------------------------------------------------
+# 한도 설정 (SystemConfig usage_quotas, 30초 캐시)
+# ----------------------------------------------------------------------
+
+def get_quota_config():
+    """{"user": {"*": {...}, "<user_id>": {...}}, "role": {...}, "persona": {...}}"""
+    config = cache.get(_QUOTAS_CACHE_KEY)
+    if config is None:
+        config = {scope: {} for scope in SCOPES}
+        row = SystemConfig.query.filter_by(key=_CONFIG_KEY).first()
+        if row:
+            try:
+                stored = json.loads(row.value)
+                for scope in SCOPES:
+                    config[scope].update(stored.get(scope) or {})
+            except (TypeError, ValueError):
+                print("⚠️ usage_quotas 설정을 읽을 수 없습니다 (무제한으로 동작)")
+        cache.set(_QUOTAS_CACHE_KEY, config, timeout=30)
+    return config
+
+
+def invalidate_quota_config():
+    cache.delete(_QUOTAS_CACHE_KEY)
+
+
+def normalize_limits(data):
+    """입력값을 LIMIT_FIELDS 정수 dict로 정리 (음수/잘못된 값은 ValueError)"""
+    limits = {}
+    for field in LIMIT_FIELDS:
+        value = int(data.get(field) or 0)
+        if value < 0:
+            raise ValueError(field)
+        if value:
+            limits[field] = value
+    return limits
+
+
+def _resolve(config, scope, key, fallback=True):
+    limits = config[scope].get(str(key))
+    if limits is None and fallback:
+        limits = config[scope].get("*")
+    return limits or {}
+
+
+def _scopes_for(user, role_key):
+    config = get_quota_config()
+    scopes = [
+        ("user", user.id, _resolve(config, "user", user.id)),
+        ("role", user.role, _resolve(config, "role", user.role, fallback=False)),
+    ]
+    if role_key:
+        scopes.append(("persona", role_key, _resolve(config, "persona", role_key)))
+    return scopes
+
+
+def _day_bounds():
+    """(오늘 날짜 문자열, 다음 자정 epoch) — 서버 로컬 시간 기준"""
+    today = datetime.date.today()
+    midnight = datetime.datetime.combine(today + datetime.timedelta(days=1), datetime.time())
+    return today.strftime("%Y%m%d"), midnight.timestamp()
+
+
+def _build_checks(user, role_key, tokens, requests):
+    """
+    적용되는 한도별 (key, kind, limit, amount, reset_at, scope, field) 목록.
+
+    차감량은 한도를 넘지 않게 자른다. 버킷은 한도까지만 차오르므로 한도보다 큰 요청은 아무리 기다려도
+    통과할 수 없기 때문이다. 이런 요청은 한도가 가득 찼을 때 통과시키고 초과분은 정산에서 반영한다.
+    """
+    day, reset_at = _day_bounds()
+    checks = []
+    for scope, scope_id, limits in _scopes_for(user, role_key):
+        for field in LIMIT_FIELDS:
+            limit = int(limits.get(field) or 0)
+            if limit <= 0:
+                continue
+            metric, window = field.split("_")
+            amount = min(tokens if metric == "tokens" else requests, limit)
+            if window == "hour":
+                key = _BUCKET_KEY.format(scope=scope, id=scope_id, metric=metric)
+                checks.append((key, "b", limit, amount, 0, scope, field))
+            else:
+                key = _COUNTER_KEY.format(scope=scope, id=scope_id, metric=metric, day=day)
+                checks.append((key, "c", limit, amount, reset_at, scope, field))
+    return checks
+
+
+# ----------------------------------------------------------------------
+# 저장소
+# ----------------------------------------------------------------------
+
+# KEYS: 버킷/카운터 키 목록
+# ARGV: now, 이후 키마다 (kind, limit, amount, reset_at)
+# 반환: {0, 0} 성공 / {실패한 키 번호(1부터), 다시 시도까지 초}
+_CONSUME_LUA = """
+local now = tonumber(ARGV[1])
+local levels = {}
+for i, key in ipairs(KEYS) do
+  local base = 1 + (i - 1) * 4
+  local kind = ARGV[base + 1]
+  local limit = tonumber(ARGV[base + 2])
+  local amount = tonumber(ARGV[base + 3])
+  if kind == 'b' then
+    local state = redis.call('HMGET', key, 'level', 'ts')
+    local level = tonumber(state[1]) or limit
+    local ts = tonumber(state[2]) or now
+    level = math.min(limit, level + (now - ts) * limit / 3600)
+    if level < amount then
+      return {i, math.ceil((amount - level) * 3600 / limit)}
+    end
+    levels[i] = level
+  else
+    local used = tonumber(redis.call('GET', key)) or 0
+    if used + amount > limit then
+      return {i, math.ceil(tonumber(ARGV[base + 4]) - now)}
+    end
+  end
+end
+for i, key in ipairs(KEYS) do
+  local base = 1 + (i - 1) * 4
+  local amount = tonumber(ARGV[base + 3])
+  if ARGV[base + 1] == 'b' then
+    redis.call('HSET', key, 'level', levels[i] - amount, 'ts', now)
+    redis.call('EXPIRE', key, 7200)
+  else
+    redis.call('INCRBY', key, amount)
+    redis.call('EXPIREAT', key, math.ceil(tonumber(ARGV[base + 4])) + 3600)
+  end
+end
+return {0, 0}
+"""
+
+# 정산: 차감 없이 delta만큼 더 쓰거나(양수) 돌려준다(음수). 버킷은 음수(초과 사용분)까지 허용
+_ADJUST_LUA = """
+local now = tonumber(ARGV[1])
+for i, key in ipairs(KEYS) do
+  local base = 1 + (i - 1) * 4
+  local limit = tonumber(ARGV[base + 2])
+  local delta = tonumber(ARGV[base + 3])
+  if ARGV[base + 1] == 'b' then
+    local state = redis.call('HMGET', key, 'level', 'ts')
+    local level = tonumber(state[1]) or limit
+    local ts = tonumber(state[2]) or now
+    level = math.min(limit, level + (now - ts) * limit / 3600)
+    redis.call('HSET', key, 'level', math.min(limit, level - delta), 'ts', now)
+    redis.call('EXPIRE', key, 7200)
+  else
+    local used = redis.call('INCRBY', key, delta)
+    if used < 0 then redis.call('SET', key, 0) end
+    redis.call('EXPIREAT', key, math.ceil(tonumber(ARGV[base + 4])) + 3600)
+  end
+end
+return 1
+"""
+
+
+def _script_args(checks, now):
+    args = [now]
+    for check in checks:
+        args.extend([check[1], check[2], check[3], check[4]])
+    return args
+
+
+class _RedisQuotaStore:
+    def __init__(self, client):
+        self._redis = client
+        self._consume = client.register_script(_CONSUME_LUA)
+        self._adjust = client.register_script(_ADJUST_LUA)
+
+    def consume(self, checks, now):
+        failed, retry_after = self._consume(keys=[c[0] for c in checks], args=_script_args(checks, now))
+        return int(failed), int(retry_after)
+
+    def adjust(self, checks, now):
+        self._adjust(keys=[c[0] for c in checks], args=_script_args(checks, now))
+
+    def remaining(self, checks, now):
+        pipe = self._redis.pipeline()
+        for check in checks:
+            if check[1] == "b":
+                pipe.hmget(check[0], "level", "ts")
+            else:
+                pipe.get(check[0])
+        values = pipe.execute()
+        result = []
+        for check, value in zip(checks, values):
+            if check[1] == "b":
+                level = float(value[0]) if value[0] is not None else check[2]
+                ts = float(value[1]) if value[1] is not None else now
+                result.append(min(check[2], level + (now - ts) * check[2] / _HOUR))
+            else:
+                result.append(check[2] - int(value or 0))
+        return result
+
+
+class _MemoryQuotaStore:
+    """Redis 미설정(로컬 개발)용 프로세스 내부 구현 — Lua 스크립트와 같은 규칙"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}    # key -> (level, ts)
+        self._counters = {}   # key -> (used, reset_at)
+
+    def _level(self, key, limit, now):
+        level, ts = self._buckets.get(key, (limit, now))
+        return min(limit, level + (now - ts) * limit / _HOUR)
+
+    def _used(self, key, now):
+        used, reset_at = self._counters.get(key, (0, 0))
+        return used if reset_at > now else 0
+
+    def consume(self, checks, now):
+        with self._lock:
+            levels = {}
+            for i, (key, kind, limit, amount, reset_at, _, _) in enumerate(checks, start=1):
+                if kind == "b":
+                    levels[key] = self._level(key, limit, now)
+                    if levels[key] < amount:
+                        return i, math.ceil((amount - levels[key]) * _HOUR / limit)
+                elif self._used(key, now) + amount > limit:
+                    return i, math.ceil(reset_at - now)
+            for key, kind, limit, amount, reset_at, _, _ in checks:
+                if kind == "b":
+                    self._buckets[key] = (levels[key] - amount, now)
+                else:
+                    self._counters[key] = (self._used(key, now) + amount, reset_at)
+            return 0, 0
+
+    def adjust(self, checks, now):
+        with self._lock:
+            for key, kind, limit, delta, reset_at, _, _ in checks:
+                if kind == "b":
+                    self._buckets[key] = (min(limit, self._level(key, limit, now) - delta), now)
+                else:
+                    self._counters[key] = (max(self._used(key, now) + delta, 0), reset_at)
+
+    def remaining(self, checks, now):
+        with self._lock:
+            return [
+                self._level(key, limit, now) if kind == "b" else limit - self._used(key, now)
+                for key, kind, limit, _, _, _, _ in checks
+            ]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                client = get_redis_client()
+                _store = _RedisQuotaStore(client) if client is not None else _MemoryQuotaStore()
+    return _store
+
+
+# ----------------------------------------------------------------------
+# 확인 / 정산
+# ----------------------------------------------------------------------
+
+class QuotaReservation:
+    """
+    호출 전에 잡아 둔 토큰(예상치). 스트림이 끝나면 settle(실제 토큰)로 차액을 정산한다.
+
+    사용 예:
+        reservation = reserve_quota(current_user, role_key, estimated_tokens)   # 초과 시 QuotaExceeded
+        ... LLM 호출 ...
+        reservation.settle(actual_tokens)   # 실패로 토큰을 쓰지 않았으면 settle(0)
+
+    Celery 작업에서 정산할 때는 to_payload()로 넘기고 작업 쪽에서 from_payload()로 되살린다.
+    """
+
+    def __init__(self, checks, reserved_tokens):
+        self._checks = [c for c in checks if c[6].startswith("tokens_")]
+        self.reserved_tokens = reserved_tokens
+        self._settled = False
+
+    def to_payload(self):
+        """
+        작업 인자로 넘길 수 있는 형태 (정산할 것이 없으면 None).
+        이미 정산했다면 예약분이 0인 형태가 되어, 되살려 settle하면 실제 사용량을 그대로 더한다.
+        """
+        if not self._checks:
+            return None
+        checks = [list(c) for c in self._checks]
+        if self._settled:
+            for check in checks:
+                check[3] = 0
+        return {"checks": checks, "reserved_tokens": 0 if self._settled else self.reserved_tokens}
+
+    @classmethod
+    def from_payload(cls, payload):
+        """to_payload() 결과로 예약을 되살린다 (None이면 정산할 것이 없는 빈 예약)"""
+        if not payload:
+            return cls([], 0)
+        return cls([tuple(c) for c in payload["checks"]], payload["reserved_tokens"])
+
+    def settle(self, actual_tokens):
+        if self._settled or not self._checks:
+            return
+        self._settled = True
+        # 한도별로 실제 차감한 양(한도로 잘렸을 수 있음)과의 차액
+        checks = [(key, kind, limit, int(actual_tokens) - reserved, reset_at, scope, field)
+                  for key, kind, limit, reserved, reset_at, scope, field in self._checks
+                  if int(actual_tokens) != reserved]
+        if not checks:
+            return
+        try:
+            _get_store().adjust(checks, time.time())
+        except Exception as e:
+            print(f"⚠️ 사용 한도 정산 실패: {e}")
+
+
+def reserve_quota(user, role_key, estimated_tokens):
+    """
+    한도를 확인하고 요청 1건과 예상 토큰을 차감한다.
+
+    Returns:
+        QuotaReservation (한도 미설정/관리자는 정산할 것이 없는 빈 예약)
+    Raises:
+        QuotaExceeded: 어느 한 범위라도 한도를 넘는 경우 (아무것도 차감하지 않음)
+    """
+    if user.is_admin:
+        return QuotaReservation([], 0)
+    estimated_tokens = max(int(estimated_tokens), 0)
+    checks = _build_checks(user, role_key, estimated_tokens, 1)
+    if not checks:
+        return QuotaReservation([], 0)
+
+    try:
+        failed, retry_after = _get_store().consume(checks, time.time())
+    except Exception as e:
+        # 한도 저장소 장애로 수업 전체가 막히지 않도록 통과시킨다
+        print(f"⚠️ 사용 한도 확인 실패 (통과 처리): {e}")
+        return QuotaReservation([], 0)
+
+    if failed:
+        _, _, _, _, _, scope, field = checks[failed - 1]
+        retry_after = max(retry_after, 1)
+        wait = f"{math.ceil(retry_after / 60)}분" if retry_after < _HOUR else f"{math.ceil(retry_after / _HOUR)}시간"
+        raise QuotaExceeded(
+            f"{_SCOPE_LABELS[scope]} 사용 한도({_FIELD_LABELS[field]})를 초과했습니다. 약 {wait} 후 다시 시도해주세요.",
+            retry_after, scope, field,
+        )
+    return QuotaReservation(checks, estimated_tokens)
+
+
+def quota_status(user, role_key=None):
+    """사용자(와 페르소나)에게 적용되는 한도별 남은 양 (관리자 조회용)"""
+    checks = _build_checks(user, role_key, 0, 0)
+    remaining = _get_store().remaining(checks, time.time()) if checks else []
+    return [
+        {"scope": scope, "field": field, "limit": limit, "remaining": max(int(left), 0)}
+        for (_, _, limit, _, _, scope, field), left in zip(checks, remaining)
+    ]
@@ -2,15 +2,36 @@
 RAG (Retrieval-Augmented Generation) 검색 서비스
 
 페르소나별 지식 베이스에서 관련 문서를 검색하고 컨텍스트를 구성합니다.
-두 가지 검색 전략을 지원합니다:
+세 가지 검색 전략을 지원합니다:
 - Soft Top-K: 예측 가능, 비용 통제 용이 (기본 추천)
 - Gap-based: 적응적, 자동 최적화 (고급 옵션)
+- Hybrid: 벡터 검색 + 본문 키워드 검색(services/lexical_search.py)을 동시에 실행하고
+          RRF(Reciprocal Rank Fusion)로 순위를 합침 (단원명·공식 이름·코드 식별자 질문에 유리)
+
+채팅 경로에서는 RetrievalTask로 질문 임베딩 + 벡터 검색을 백그라운드에서 시작하고,
+요청 스레드가 세션/대화 이력을 읽는 동안 병렬로 진행한 뒤 결과를 합류시킵니다.
 """
 
+import os
+import threading
+import time
 from typing import List, Dict
+
+from flask import current_app
+from sqlalchemy import text
+
 from services.embedding_service import generate_embedding
+from services.lexical_search import search_chunks
+from services.local_vector_store import local_store_enabled, search_local
+from services.vector_index import DEFAULT_SEARCH_QUALITY, apply_search_params
 from extensions import db
 
+# 채팅 요청이 검색 결과를 기다리는 최대 시간(초). 넘으면 참고 자료 없이 답변을 생성한다.
+RAG_RETRIEVAL_TIMEOUT = float(os.environ.get("RAG_RETRIEVAL_TIMEOUT", "5"))
+# 하이브리드 검색: 단계별 후보 수와 RRF 상수 (score = Σ 1 / (k + 순위))
+RAG_HYBRID_CANDIDATES = int(os.environ.get("RAG_HYBRID_CANDIDATES", "20"))
+RAG_RRF_K = int(os.environ.get("RAG_RRF_K", "60"))
+
 
 def search_knowledge_base(
     persona_id: int,
@@ -19,7 +40,11 @@ def search_knowledge_base(
     top_k: int = 3,
     max_k: int = 7,
     threshold: float = 0.5,
-    gap_threshold: float = 0.1
+    gap_threshold: float = 0.1,
+    user_id: int = None,
+    role_key: str = None,
+    timings: dict = None,
+    search_quality: str = DEFAULT_SEARCH_QUALITY
 ) -> List[Dict]:
     """
     RAG 검색 실행 (두 전략 지원)
@@ -27,11 +52,14 @@ def search_knowledge_base(
     Args:
         persona_id: 페르소나 ID
         query: 검색 질문
-        strategy: 'soft_topk' | 'gap_based'
-        top_k: Soft Top-K의 최소값 또는 고정 Top-K
-        max_k: Soft Top-K의 최대값
+        strategy: 'soft_topk' | 'gap_based' | 'hybrid'
+        top_k: Soft Top-K/Hybrid의 최소값 또는 고정 Top-K
+        max_k: Soft Top-K/Hybrid의 최대값
         threshold: 유사도 임계값 (0.0 ~ 1.0)
         gap_threshold: Gap-based 전략에서 사용할 gap 임계값
+        user_id, role_key: 임베딩 사용량을 원장에 기록할 요청자/페르소나 (선택)
+        timings: 전달하면 단계별 소요 시간(embed_ms, search_ms, hybrid면 vector_ms/lexical_ms/fuse_ms)을 기록
+        search_quality: ANN 인덱스 탐색 폭 'fast' | 'balanced' | 'accurate' (페르소나 rag_search_quality)
 
     Returns:
         검색 결과 리스트 [
@@ -39,7 +67,7 @@ def search_knowledge_base(
                 "content": "청크 내용",
                 "filename": "파일명",
                 "metadata": {...},
-                "similarity": 0.85
+                "similarity": 0.85      # hybrid에서 키워드로만 찾은 청크는 None
             },
             ...
         ]
@@ -49,35 +77,67 @@ def search_knowledge_base(
         Exception: DB 쿼리 실패 시
     """
     try:
+        if strategy == 'hybrid':
+            return _search_hybrid(
+                persona_id, query, top_k, max_k, threshold, user_id, role_key, timings, search_quality
+            )
+
         # 1. 질문 임베딩 생성
-        query_embedding = generate_embedding(query)
+        started = time.monotonic()
+        query_embedding = generate_embedding(query, user_id=user_id, role_key=role_key)
+        embedded = time.monotonic()
 
         # 2. 전략에 따라 검색 실행
-        if strategy == 'soft_topk':
-            return _search_soft_topk(
-                persona_id, query_embedding, top_k, max_k, threshold
-            )
-        elif strategy == 'gap_based':
-            return _search_gap_based(
-                persona_id, query_embedding, threshold, gap_threshold
+        if strategy == 'gap_based':
+            docs = _search_gap_based(
+                persona_id, query_embedding, threshold, gap_threshold, search_quality
             )
         else:
             # 기본값: Soft Top-K
-            return _search_soft_topk(
-                persona_id, query_embedding, top_k, max_k, threshold
+            docs = _search_soft_topk(
+                persona_id, query_embedding, top_k, max_k, threshold, search_quality
             )
 
+        if timings is not None:
+            timings["embed_ms"] = round((embedded - started) * 1000, 1)
+            timings["search_ms"] = round((time.monotonic() - embedded) * 1000, 1)
+        return docs
+
     except Exception as e:
         print(f"⚠️ RAG 검색 실패: {e}")
         raise
 
 
+# 거리(<=>)는 행마다 한 번만 계산하고 그 값으로 정렬.
+# 필터는 document_chunk의 비정규화 컬럼만 사용하므로 페르소나 부분 ANN 인덱스(없으면 전체 인덱스)
+# 단일 테이블 스캔으로 후보를 고르고, 파일명은 LIMIT 이후의 소수 행에만 조인합니다.
+_SOFT_TOPK_SQL = """
+    SELECT c.content, kd.filename, c.chunk_metadata, c.distance, c.id
+    FROM (
+        SELECT
+            id,
+            document_id,
+            content,
+            chunk_metadata,
+            embedding <=> CAST(:query_embedding AS vector) AS distance
+        FROM document_chunk
+        WHERE persona_id = :persona_id
+          AND is_searchable
+        ORDER BY distance
+        LIMIT :limit
+    ) c
+    JOIN knowledge_document kd ON c.document_id = kd.id
+    ORDER BY c.distance
+"""
+
+
 def _search_soft_topk(
     persona_id: int,
     query_embedding: List[float],
     min_k: int,
     max_k: int,
-    threshold: float
+    threshold: float,
+    search_quality: str = DEFAULT_SEARCH_QUALITY
 ) -> List[Dict]:
     """
     Soft Top-K 전략 (추천)
@@ -88,8 +148,9 @@ def _search_soft_topk(
     - 유사도 threshold 이상인 것만 포함 (품질 보장)
 
     동작:
-    1. threshold 이상 & max_k개 이하 검색
-    2. 결과가 min_k 미만이면 threshold 무시하고 min_k개 강제 검색
+    1. 유사도 순 상위 max(min_k, max_k)개를 한 번의 쿼리로 조회
+    2. threshold 이상 & max_k개 이하를 선택
+    3. 결과가 min_k 미만이면 threshold 무시하고 상위 min_k개 사용
 
     Args:
         persona_id: 페르소나 ID
@@ -97,74 +158,41 @@ def _search_soft_topk(
         min_k: 최소 검색 개수
         max_k: 최대 검색 개수
         threshold: 유사도 임계값
+        search_quality: ANN 인덱스 탐색 폭
 
     Returns:
         검색 결과 리스트
     """
-    # Step 1: threshold 이상 & max_k개 이하 검색
-    sql = """
-        SELECT
-            dc.content,
-            kd.filename,
-            dc.chunk_metadata,
-            1 - (dc.embedding <=> %s::vector) AS similarity
-        FROM document_chunk dc
-        JOIN knowledge_document kd ON dc.document_id = kd.id
-        JOIN persona_knowledge_base pkb ON kd.knowledge_base_id = pkb.id
-        WHERE pkb.persona_id = %s
-          AND pkb.is_active = TRUE
-          AND kd.processing_status = 'completed'
-          AND 1 - (dc.embedding <=> %s::vector) >= %s
-        ORDER BY dc.embedding <=> %s::vector
-        LIMIT %s
-    """
+    ranked = _vector_candidates(persona_id, query_embedding, max(min_k, max_k), search_quality)
+    return select_soft_topk(ranked, min_k, max_k, threshold)
 
+
+def _vector_candidates(persona_id, query_embedding, limit, search_quality) -> List[Dict]:
+    """유사도 내림차순 상위 limit개 청크 (threshold 미적용, SQLite 배포는 로컬 벡터 저장소)"""
+    if local_store_enabled():
+        return search_local(persona_id, query_embedding, limit)
+    apply_search_params(search_quality, limit, persona_id=persona_id)
     result = db.session.execute(
-        sql,
-        (query_embedding, persona_id, query_embedding, threshold, query_embedding, max_k)
+        text(_SOFT_TOPK_SQL),
+        {"query_embedding": query_embedding, "persona_id": persona_id, "limit": limit}
     )
-
-    docs = [
+    return [
         {
             "content": row[0],
             "filename": row[1],
             "metadata": row[2],
-            "similarity": float(row[3])
+            "similarity": 1 - float(row[3]),
+            "chunk_id": row[4]
         }
         for row in result
     ]
 
-    # Step 2: 최소 min_k개 보장 (threshold 무시)
-    if len(docs) < min_k:
-        sql_fallback = """
-            SELECT
-                dc.content,
-                kd.filename,
-                dc.chunk_metadata,
-                1 - (dc.embedding <=> %s::vector) AS similarity
-            FROM document_chunk dc
-            JOIN knowledge_document kd ON dc.document_id = kd.id
-            JOIN persona_knowledge_base pkb ON kd.knowledge_base_id = pkb.id
-            WHERE pkb.persona_id = %s
-              AND pkb.is_active = TRUE
-              AND kd.processing_status = 'completed'
-            ORDER BY dc.embedding <=> %s::vector
-            LIMIT %s
-        """
-        result_fallback = db.session.execute(
-            sql_fallback,
-            (query_embedding, persona_id, query_embedding, min_k)
-        )
-        docs = [
-            {
-                "content": row[0],
-                "filename": row[1],
-                "metadata": row[2],
-                "similarity": float(row[3])
-            }
-            for row in result_fallback
-        ]
 
+def select_soft_topk(ranked: List[Dict], min_k: int, max_k: int, threshold: float) -> List[Dict]:
+    """유사도 내림차순 후보에서 Soft Top-K 규칙 적용 (threshold 이상 max_k개, 부족하면 상위 min_k개)"""
+    docs = [doc for doc in ranked[:max_k] if doc["similarity"] >= threshold]
+    if len(docs) < min_k:
+        docs = ranked[:min_k]
     return docs
 
 
@@ -172,7 +200,8 @@ def _search_gap_based(
     persona_id: int,
     query_embedding: List[float],
     threshold: float,
-    gap_threshold: float
+    gap_threshold: float,
+    search_quality: str = DEFAULT_SEARCH_QUALITY
 ) -> List[Dict]:
     """
     Gap-based 전략 (고급)
@@ -191,6 +220,7 @@ def _search_gap_based(
         query_embedding: 질문 임베딩 벡터
         threshold: 최소 유사도 임계값
         gap_threshold: Gap 임계값 (예: 0.1 = 10% 차이)
+        search_quality: ANN 인덱스 탐색 폭
 
     Returns:
         검색 결과 리스트
@@ -201,37 +231,10 @@ def _search_gap_based(
                                     Gap = 0.36 → 여기서 중단!
         결과: 처음 3개만 반환
     """
-    # Step 1: 충분히 많은 문서 가져오기 (최대 50개)
-    sql = """
-        SELECT
-            dc.content,
-            kd.filename,
-            dc.chunk_metadata,
-            1 - (dc.embedding <=> %s::vector) AS similarity
-        FROM document_chunk dc
-        JOIN knowledge_document kd ON dc.document_id = kd.id
-        JOIN persona_knowledge_base pkb ON kd.knowledge_base_id = pkb.id
-        WHERE pkb.persona_id = %s
-          AND pkb.is_active = TRUE
-          AND kd.processing_status = 'completed'
-          AND 1 - (dc.embedding <=> %s::vector) >= %s
-        ORDER BY dc.embedding <=> %s::vector
-        LIMIT 50
-    """
-
-    result = db.session.execute(
-        sql,
-        (query_embedding, persona_id, query_embedding, threshold, query_embedding)
-    )
-
+    # Step 1: 충분히 많은 문서 가져오기 (최대 50개, 유사도 내림차순이므로 임계값은 잘라서 적용)
     all_docs = [
-        {
-            "content": row[0],
-            "filename": row[1],
-            "metadata": row[2],
-            "similarity": float(row[3])
-        }
-        for row in result
+        doc for doc in _vector_candidates(persona_id, query_embedding, 50, search_quality)
+        if doc["similarity"] >= threshold
     ]
 
     if not all_docs:
@@ -257,6 +260,149 @@ def _search_gap_based(
     return selected_docs
 
 
+def _search_hybrid(persona_id, query, min_k, max_k, threshold, user_id, role_key, timings, search_quality):
+    """
+    Hybrid 전략: 키워드 검색을 별도 스레드에서 시작하고, 그동안 임베딩 + 벡터 검색을 실행한 뒤 RRF로 합칩니다.
+
+    벡터 후보 중 threshold 미만은 키워드 검색에도 걸린 경우에만 남기며, 결과는 최대 max_k개,
+    부족하면 융합 순위 상위 min_k개입니다. 한쪽 단계가 실패해도 다른 쪽 결과로 답합니다.
+    """
+    timings = timings if timings is not None else {}
+    started = time.monotonic()
+    lexical = {}
+
+    def run_lexical(app):
+        lexical_started = time.monotonic()
+        with app.app_context():
+            try:
+                lexical["docs"] = search_chunks(persona_id, query, RAG_HYBRID_CANDIDATES)
+            except Exception as e:
+                lexical["error"] = e
+            finally:
+                lexical["ms"] = round((time.monotonic() - lexical_started) * 1000, 1)
+
+    worker = threading.Thread(
+        target=run_lexical, args=(current_app._get_current_object(),), name="rag-lexical", daemon=True
+    )
+    worker.start()
+
+    vector_docs, vector_error = [], None
+    try:
+        query_embedding = generate_embedding(query, user_id=user_id, role_key=role_key)
+        embedded = time.monotonic()
+        timings["embed_ms"] = round((embedded - started) * 1000, 1)
+        vector_docs = _vector_candidates(persona_id, query_embedding, RAG_HYBRID_CANDIDATES, search_quality)
+        timings["vector_ms"] = round((time.monotonic() - embedded) * 1000, 1)
+    except Exception as e:
+        db.session.rollback()
+        vector_error = e
+        timings["vector_error"] = str(e)[:200]
+
+    waited_from = time.monotonic()
+    worker.join(RAG_RETRIEVAL_TIMEOUT)
+    timings["lexical_wait_ms"] = round((time.monotonic() - waited_from) * 1000, 1)
+    if "ms" in lexical:
+        timings["lexical_ms"] = lexical["ms"]
+    if "error" in lexical or worker.is_alive():
+        timings["lexical_error"] = str(lexical.get("error", "timeout"))[:200]
+        if vector_error is not None:
+            raise vector_error
+    lexical_docs = lexical.get("docs", [])
+
+    fuse_started = time.monotonic()
+    fused = reciprocal_rank_fusion([vector_docs, lexical_docs])
+    docs = [
+        doc for doc in fused
+        if "lexical" in doc["sources"] or doc["similarity"] >= threshold
+    ][:max_k]
+    if len(docs) < min_k:
+        docs = fused[:min_k]
+    timings["fuse_ms"] = round((time.monotonic() - fuse_started) * 1000, 1)
+    timings["vector_docs"] = len(vector_docs)
+    timings["lexical_docs"] = len(lexical_docs)
+    # 임베딩 이후 결과 확정까지 (키워드 검색은 임베딩과 겹쳐 실행되므로 그만큼 숨겨짐)
+    timings["search_ms"] = round((time.monotonic() - started) * 1000 - timings.get("embed_ms", 0), 1)
+    return docs
+
+
+def reciprocal_rank_fusion(ranked_lists: List[List[Dict]], k: int = RAG_RRF_K) -> List[Dict]:
+    """
+    여러 순위 목록을 chunk_id 기준으로 합침 (score = Σ 1 / (k + 순위), 순위는 1부터).
+
+    Returns:
+        rrf_score 내림차순 결과. 각 항목에 "rrf_score", "sources"(['vector', 'lexical'] 중 포함된 목록)를 추가하고,
+        벡터 결과에 없던 청크의 similarity는 None입니다.
+    """
+    fused = {}
+    for source, ranked in zip(("vector", "lexical"), ranked_lists):
+        for rank, doc in enumerate(ranked, start=1):
+            entry = fused.get(doc["chunk_id"])
+            if entry is None:
+                entry = fused[doc["chunk_id"]] = {
+                    "content": doc["content"],
+                    "filename": doc["filename"],
+                    "metadata": doc["metadata"],
+                    "similarity": doc.get("similarity"),
+                    "chunk_id": doc["chunk_id"],
+                    "rrf_score": 0.0,
+                    "sources": [],
+                }
+            entry["rrf_score"] += 1.0 / (k + rank)
+            entry["sources"].append(source)
+    return sorted(fused.values(), key=lambda d: d["rrf_score"], reverse=True)
+
+
+class RetrievalTask:
+    """
+    채팅 요청용 백그라운드 RAG 검색.
+
+        task = RetrievalTask(app, persona, user_message, user_id)   # 즉시 반환, 검색은 별도 스레드
+        ... 세션/대화 이력 조회 ...
+        docs = task.result()   # 검색 완료까지 대기 (RAG_RETRIEVAL_TIMEOUT 초과/실패 시 빈 목록)
+        task.timings           # {"embed_ms", "search_ms", "total_ms", "wait_ms", "docs", ("error")}
+    """
+
+    def __init__(self, app, persona, query, user_id=None):
+        self.timings = {}
+        self._docs = []
+        self._done = threading.Event()
+        self._started = time.monotonic()
+        args = dict(
+            persona_id=persona.id,
+            query=query,
+            strategy=persona.retrieval_strategy or 'soft_topk',
+            top_k=persona.rag_top_k or 3,
+            max_k=persona.rag_max_k or 7,
+            threshold=persona.rag_similarity_threshold if persona.rag_similarity_threshold is not None else 0.5,
+            gap_threshold=persona.rag_gap_threshold if persona.rag_gap_threshold is not None else 0.1,
+            user_id=user_id,
+            role_key=persona.role_key,
+            search_quality=persona.rag_search_quality or DEFAULT_SEARCH_QUALITY,
+        )
+        threading.Thread(target=self._run, args=(app, args), name="rag-retrieval", daemon=True).start()
+
+    def _run(self, app, args):
+        with app.app_context():
+            try:
+                self._docs = search_knowledge_base(timings=self.timings, **args)
+            except Exception as e:
+                self.timings["error"] = str(e)[:200]
+            finally:
+                self.timings["total_ms"] = round((time.monotonic() - self._started) * 1000, 1)
+                self._done.set()
+
+    def result(self, timeout=RAG_RETRIEVAL_TIMEOUT):
+        """검색 결과 (시간 초과나 실패 시 빈 목록 — 채팅은 참고 자료 없이 진행)"""
+        waited_from = time.monotonic()
+        finished = self._done.wait(timeout)
+        self.timings["wait_ms"] = round((time.monotonic() - waited_from) * 1000, 1)
+        if not finished:
+            self.timings["error"] = "timeout"
+            return []
+        self.timings["docs"] = len(self._docs)
+        return self._docs
+
+
 def format_rag_context(retrieved_docs: List[dict]) -> str:
     """
     검색된 문서를 AI 프롬프트용 컨텍스트 형식으로 포맷팅
@@ -289,7 +435,10 @@ def format_rag_context(retrieved_docs: List[dict]) -> str:
 
     for i, doc in enumerate(retrieved_docs):
         context += f"[자료 {i+1}] 파일명: {doc['filename']}\n"
-        context += f"유사도: {doc['similarity']:.2f}\n"
+        if doc.get('similarity') is not None:
+            context += f"유사도: {doc['similarity']:.2f}\n"
+        else:
+            context += "검색 근거: 키워드 일치\n"
 
         # 메타데이터에 문서 내 요약본(Contextual Summary)나 페이지 정보가 있으면 표시
         if doc.get('metadata'):
@@ -324,9 +473,9 @@ def get_rag_statistics(persona_id: int) -> Dict:
     kb_count_sql = """
         SELECT COUNT(*)
         FROM persona_knowledge_base
-        WHERE persona_id = %s AND is_active = TRUE
+        WHERE persona_id = :persona_id AND is_active = TRUE
     """
-    kb_count = db.session.execute(kb_count_sql, (persona_id,)).scalar() or 0
+    kb_count = db.session.execute(text(kb_count_sql), {"persona_id": persona_id}).scalar() or 0
 
     # 문서 개수 및 상태별 통계
     doc_stats_sql = """
@@ -338,9 +487,9 @@ def get_rag_statistics(persona_id: int) -> Dict:
             SUM(chunk_count) as total_chunks
         FROM knowledge_document kd
         JOIN persona_knowledge_base pkb ON kd.knowledge_base_id = pkb.id
-        WHERE pkb.persona_id = %s
+        WHERE pkb.persona_id = :persona_id
     """
-    doc_stats = db.session.execute(doc_stats_sql, (persona_id,)).fetchone()
+    doc_stats = db.session.execute(text(doc_stats_sql), {"persona_id": persona_id}).fetchone()
 
     return {
         "knowledge_base_count": int(kb_count),
@@ -0,0 +1,286 @@
+"""
+페르소나별 시맨틱 답변 캐시
+
+수업 중 여러 학생이 같은 튜터 페르소나에 거의 같은 첫 질문("변수가 뭐예요?")을 보내면
+매번 전체 생성을 하는 대신, 첫 턴 질문을 임베딩해 가까운 이전 질문의 답변을 즉시 스트리밍합니다.
+
+  - 페르소나 설정(semantic_cache_enabled)으로 켜는 선택 기능이며, 첫 턴·텍스트 질문에만 적용
+  - 저장소: PostgreSQL이면 semantic_cache_entry 테이블(pgvector 코사인 거리),
+            그 외(SQLite 개발 환경)는 프로세스 내부 numpy 인덱스
+  - 네임스페이스: role_key + 공급사 + 모델 + 시스템 프롬프트 + 페르소나 수정 시각의 해시.
+    프롬프트나 페르소나 설정이 바뀌면 네임스페이스가 달라져 이전 답변은 더 이상 조회되지 않으며,
+    프롬프트 저장 시 purge_semantic_cache()로 해당 페르소나 항목을 즉시 삭제합니다.
+    RAG 페르소나는 답변이 지식 베이스에 따라 달라지므로 문서 버전(처리 완료 문서 수 + 최근 처리 시각)도 해시에 넣고,
+    문서 처리 완료/삭제 시에도 purge_semantic_cache()를 호출합니다.
+  - TTL(SEMANTIC_CACHE_TTL)이 지난 항목은 조회에서 제외되고 다음 저장 때 정리되며,
+    네임스페이스별 SEMANTIC_CACHE_MAX_ENTRIES를 넘으면 가장 오래 쓰이지 않은 항목부터 제거합니다.
+"""
+
+import datetime
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+from sqlalchemy import text
+
+from extensions import db
+from models import SemanticCacheEntry
+
+SEMANTIC_CACHE_TTL = int(os.environ.get("SEMANTIC_CACHE_TTL", "3600"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", "200"))
+SEMANTIC_CACHE_MAX_QUESTION_CHARS = int(os.environ.get("SEMANTIC_CACHE_MAX_QUESTION_CHARS", "300"))
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+_REPLAY_CHUNK_CHARS = 200
+
+_stats = {"lookups": 0, "hits": 0, "stores": 0, "evictions": 0, "errors": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name, n=1):
+    with _stats_lock:
+        _stats[name] += n
+
+
+def _knowledge_version(persona_id):
+    """활성 지식 베이스의 처리 완료 문서 수와 최근 처리 시각 (문서 추가/재처리/삭제 시 달라짐)"""
+    row = db.session.execute(
+        text("""
+            SELECT COUNT(kd.id), MAX(kd.processed_at)
+            FROM knowledge_document kd
+            JOIN persona_knowledge_base kb ON kd.knowledge_base_id = kb.id
+            WHERE kb.persona_id = :persona_id AND kb.is_active AND kd.processing_status = 'completed'
+        """),
+        {"persona_id": persona_id},
+    ).first()
+    return f"{row[0]}:{row[1]}" if row else ""
+
+
+def cache_namespace(persona, provider, model_id, system_prompt):
+    """답변이 유효한 범위 키 (프롬프트/설정/지식 베이스 변경 시 자동으로 달라짐)"""
+    updated_at = persona.updated_at.isoformat() if persona.updated_at else ""
+    knowledge = _knowledge_version(persona.id) if persona.use_rag else ""
+    raw = "\x1f".join((persona.role_key, provider, model_id, updated_at, knowledge, system_prompt or ""))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def is_cacheable_question(persona, is_new_session, message, image_paths):
+    """첫 턴의 짧은 텍스트 질문이고 페르소나가 캐시를 켠 경우만 대상"""
+    return bool(
+        persona.semantic_cache_enabled
+        and is_new_session
+        and not image_paths
+        and message
+        and len(message) <= SEMANTIC_CACHE_MAX_QUESTION_CHARS
+    )
+
+
+def iter_answer_chunks(answer):
+    """캐시된 답변을 스트리밍 청크 크기로 분할"""
+    for start in range(0, len(answer), _REPLAY_CHUNK_CHARS):
+        yield answer[start:start + _REPLAY_CHUNK_CHARS]
+
+
+def _normalize(vec):
+    arr = np.asarray(vec, dtype=np.float32)
+    norm = np.linalg.norm(arr)
+    return arr / norm if norm else arr
+
+
+# ----------------------------------------------------------------------
+# 저장소
+# ----------------------------------------------------------------------
+
+class _MemoryStore:
+    """프로세스 내부 인덱스 (네임스페이스별 정규화 벡터 행렬로 내적 검색)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spaces = {}   # namespace -> {"role_key", "entries": [dict]}
+
+    def lookup(self, namespace, vec, threshold, now):
+        with self._lock:
+            space = self._spaces.get(namespace)
+            if not space:
+                return None
+            entries = [e for e in space["entries"] if e["expires_at"] > now]
+            space["entries"] = entries
+            if not entries:
+                return None
+            scores = np.stack([e["vec"] for e in entries]) @ vec
+            best = int(np.argmax(scores))
+            if float(scores[best]) < threshold:
+                return None
+            entry = entries[best]
+            entry["hits"] += 1
+            entry["last_hit_at"] = now
+            return entry["answer"], float(scores[best])
+
+    def store(self, namespace, role_key, question, vec, answer, now):
+        with self._lock:
+            space = self._spaces.setdefault(namespace, {"role_key": role_key, "entries": []})
+            entries = [e for e in space["entries"] if e["expires_at"] > now]
+            entries.append({
+                "question": question,
+                "answer": answer,
+                "vec": vec,
+                "hits": 0,
+                "created_at": now,
+                "last_hit_at": now,
+                "expires_at": now + datetime.timedelta(seconds=SEMANTIC_CACHE_TTL),
+            })
+            evicted = max(0, len(entries) - SEMANTIC_CACHE_MAX_ENTRIES)
+            if evicted:
+                entries.sort(key=lambda e: e["last_hit_at"])
+                entries = entries[evicted:]
+            space["entries"] = entries
+            return evicted
+
+    def purge(self, role_key):
+        with self._lock:
+            for namespace in [ns for ns, s in self._spaces.items() if s["role_key"] == role_key]:
+                del self._spaces[namespace]
+
+    def size(self):
+        with self._lock:
+            return sum(len(s["entries"]) for s in self._spaces.values())
+
+
+class _PgVectorStore:
+    """semantic_cache_entry 테이블 (워커 간 공유, 코사인 거리 정렬)"""
+
+    def lookup(self, namespace, vec, threshold, now):
+        distance = SemanticCacheEntry.embedding.cosine_distance(vec.tolist())
+        row = (
+            db.session.query(SemanticCacheEntry.id, SemanticCacheEntry.answer, distance.label("distance"))
+            .filter(SemanticCacheEntry.namespace == namespace, SemanticCacheEntry.expires_at > now)
+            .order_by(distance)
+            .limit(1)
+            .first()
+        )
+        if row is None or 1 - row.distance < threshold:
+            return None
+        SemanticCacheEntry.query.filter_by(id=row.id).update({
+            SemanticCacheEntry.hits: SemanticCacheEntry.hits + 1,
+            SemanticCacheEntry.last_hit_at: now,
+        }, synchronize_session=False)
+        db.session.commit()
+        return row.answer, 1 - row.distance
+
+    def store(self, namespace, role_key, question, vec, answer, now):
+        SemanticCacheEntry.query.filter(
+            SemanticCacheEntry.namespace == namespace, SemanticCacheEntry.expires_at <= now
+        ).delete(synchronize_session=False)
+        db.session.add(SemanticCacheEntry(
+            namespace=namespace,
+            role_key=role_key,
+            question=question,
+            answer=answer,
+            embedding=vec.tolist(),
+            created_at=now,
+            last_hit_at=now,
+            expires_at=now + datetime.timedelta(seconds=SEMANTIC_CACHE_TTL),
+        ))
+        db.session.flush()
+        stale_ids = [
+            r[0] for r in db.session.query(SemanticCacheEntry.id)
+            .filter(SemanticCacheEntry.namespace == namespace)
+            .order_by(SemanticCacheEntry.last_hit_at.desc())
+            .offset(SEMANTIC_CACHE_MAX_ENTRIES)
+            .all()
+        ]
+        if stale_ids:
+            SemanticCacheEntry.query.filter(SemanticCacheEntry.id.in_(stale_ids)).delete(synchronize_session=False)
+        db.session.commit()
+        return len(stale_ids)
+
+    def purge(self, role_key):
+        SemanticCacheEntry.query.filter_by(role_key=role_key).delete(synchronize_session=False)
+        db.session.commit()
+
+    def size(self):
+        return SemanticCacheEntry.query.count()
+
+
+_memory_store = _MemoryStore()
+_pg_store = _PgVectorStore()
+
+
+def _store():
+    return _pg_store if db.engine.dialect.name == "postgresql" else _memory_store
+
+
+# ----------------------------------------------------------------------
+# 공개 API
+# ----------------------------------------------------------------------
+
+def lookup_answer(namespace, role_key, question, threshold=None, user_id=None):
+    """
+    유사 질문의 캐시된 답변 조회.
+
+    Returns:
+        (answer 또는 None, 질문 임베딩 또는 None) — 미적중 시 임베딩을 store_answer()에 재사용.
+        임베딩/저장소 오류는 미적중으로 처리합니다.
+    """
+    from services.embedding_service import generate_embedding
+
+    _count("lookups")
+    try:
+        vec = _normalize(generate_embedding(question, user_id=user_id, role_key=role_key))
+        found = _store().lookup(
+            namespace, vec, threshold or DEFAULT_SIMILARITY_THRESHOLD, datetime.datetime.utcnow()
+        )
+    except Exception as e:
+        db.session.rollback()
+        _count("errors")
+        print(f"⚠️ 시맨틱 캐시 조회 실패: {e}")
+        return None, None
+    if found is None:
+        return None, vec
+    _count("hits")
+    return found[0], vec
+
+
+def store_answer(namespace, role_key, question, vec, answer):
+    """생성된 답변을 캐시에 저장 (TTL 만료 항목 정리 + 최대 개수 초과 시 LRU 제거)"""
+    if vec is None or not answer:
+        return
+    try:
+        evicted = _store().store(namespace, role_key, question, vec, answer, datetime.datetime.utcnow())
+    except Exception as e:
+        db.session.rollback()
+        _count("errors")
+        print(f"⚠️ 시맨틱 캐시 저장 실패: {e}")
+        return
+    _count("stores")
+    _count("evictions", evicted)
+
+
+def purge_semantic_cache(role_key):
+    """
+    페르소나의 캐시 항목 전체 삭제 (시스템 프롬프트 변경, 지식 문서 처리 완료/삭제 시).
+    메모리 인덱스는 현재 워커만 비워지며, 다른 워커의 이전 항목은 네임스페이스 변경으로 조회되지 않습니다.
+    """
+    try:
+        _store().purge(role_key)
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️ 시맨틱 캐시 삭제 실패: {e}")
+
+
+def semantic_cache_stats():
+    """조회/적중/저장/제거 횟수 (관리자 모니터링용, 워커별)"""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["lookups"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    stats["backend"] = "pgvector" if _store() is _pg_store else "memory"
+    stats["ttl"] = SEMANTIC_CACHE_TTL
+    stats["max_entries"] = SEMANTIC_CACHE_MAX_ENTRIES
+    try:
+        stats["size"] = _store().size()
+    except Exception:
+        db.session.rollback()
+        stats["size"] = None
+    return stats
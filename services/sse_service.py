@@ -0,0 +1,153 @@
+"""
+SSE 스트리밍 유틸리티
+
+공급사에 따라 delta 하나가 1~2글자인 경우가 많아, delta마다 SSE 프레임을 만들면
+답변 하나에 수천 번의 작은 write가 gevent와 리버스 프록시를 통과합니다.
+coalesce_deltas()는 delta를 잠시 모았다가 시간 창(SSE_FLUSH_INTERVAL_MS) 또는
+바이트 임계치(SSE_FLUSH_BYTES)에 도달하면 한 번에 내보냅니다.
+
+- 첫 토큰은 버퍼링 없이 즉시 전송 (체감 응답 시간 유지)
+- 상류 delta는 읽기 스레드(gevent 환경에서는 그린렛)가 큐로 넘기고, 버퍼가 있으면 시간 창이 끝날 때까지만 기다림
+  → 공급사가 문장 사이에서 멈춰도 모아 둔 텍스트가 다음 delta를 기다리지 않고 제때 전송됨
+- 스트림이 끝나면 남은 버퍼를 모두 전송, 상류 예외는 소비 쪽에서 그대로 다시 발생
+- SSE_FLUSH_INTERVAL_MS=0 이면 병합하지 않고 delta를 그대로 전달
+"""
+
+import os
+import queue
+import threading
+import time
+
+SSE_FLUSH_INTERVAL_MS = int(os.getenv("SSE_FLUSH_INTERVAL_MS", "40"))
+SSE_FLUSH_BYTES = int(os.getenv("SSE_FLUSH_BYTES", "2048"))
+
+_DONE = object()
+
+
+def _read_ahead(deltas, stop):
+    """상류 iterator를 별도 스레드에서 읽어 큐로 전달 ((delta, None) / (None, 예외) / _DONE)"""
+    items = queue.Queue()
+
+    def pump():
+        iterator = iter(deltas)
+        try:
+            for delta in iterator:
+                if stop.is_set():
+                    break
+                items.put((delta, None))
+        except Exception as e:
+            items.put((None, e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except Exception:
+                    pass
+            items.put(_DONE)
+
+    threading.Thread(target=pump, name="sse-read-ahead", daemon=True).start()
+    return items
+
+
+def coalesce_deltas(deltas, label="sse", flush_interval_ms=None, flush_bytes=None):
+    """
+    텍스트 delta 스트림을 병합된 청크 스트림으로 변환합니다.
+
+    Args:
+        deltas: 텍스트 조각을 yield하는 iterable (generate_ai_response_stream 등)
+        label: 통계 로그에 표시할 스트림 이름
+        flush_interval_ms: 시간 창(ms). None이면 SSE_FLUSH_INTERVAL_MS
+        flush_bytes: 바이트 임계치. None이면 SSE_FLUSH_BYTES
+
+    Yields:
+        병합된 텍스트 청크 (빈 문자열은 yield하지 않음)
+    """
+    interval = (SSE_FLUSH_INTERVAL_MS if flush_interval_ms is None else flush_interval_ms) / 1000.0
+    max_bytes = SSE_FLUSH_BYTES if flush_bytes is None else flush_bytes
+
+    started = time.monotonic()
+    first_token_at = None
+    last_flush = started
+    buffer = []
+    buffered_bytes = 0
+    delta_count = 0
+    frame_count = 0
+
+    if interval <= 0:
+        items = None
+        stop = None
+    else:
+        stop = threading.Event()
+        items = _read_ahead(deltas, stop)
+
+    try:
+        if items is None:
+            for delta in deltas:
+                if not delta:
+                    continue
+                delta_count += 1
+                if first_token_at is None:
+                    first_token_at = time.monotonic()
+                frame_count += 1
+                yield delta
+            return
+
+        while True:
+            # 버퍼가 있으면 시간 창이 끝나는 시점까지만 기다렸다가 flush
+            timeout = None
+            if buffer:
+                timeout = max(last_flush + interval - time.monotonic(), 0)
+            try:
+                item = items.get(timeout=timeout)
+            except queue.Empty:
+                last_flush = time.monotonic()
+                frame_count += 1
+                chunk = "".join(buffer)
+                buffer = []
+                buffered_bytes = 0
+                yield chunk
+                continue
+
+            if item is _DONE:
+                break
+            delta, error = item
+            if error is not None:
+                raise error
+            if not delta:
+                continue
+            delta_count += 1
+            now = time.monotonic()
+
+            if first_token_at is None:
+                first_token_at = now
+                last_flush = now
+                frame_count += 1
+                yield delta
+                continue
+
+            buffer.append(delta)
+            buffered_bytes += len(delta.encode("utf-8"))
+            if buffered_bytes >= max_bytes or now - last_flush >= interval:
+                last_flush = now
+                frame_count += 1
+                chunk = "".join(buffer)
+                buffer = []
+                buffered_bytes = 0
+                yield chunk
+
+        if buffer:
+            frame_count += 1
+            yield "".join(buffer)
+    finally:
+        if stop is not None:
+            # 소비 쪽이 먼저 끝나면(클라이언트 종료/오류) 읽기 스레드가 상류를 닫고 멈추도록
+            stop.set()
+        # 클라이언트가 중간에 끊어도(GeneratorExit) 통계는 남긴다
+        if delta_count:
+            first_ms = (first_token_at - started) * 1000 if first_token_at else 0
+            total_ms = (time.monotonic() - started) * 1000
+            print(
+                f"📡 SSE 병합 [{label}]: delta {delta_count}개 → 프레임 {frame_count}개, "
+                f"첫 토큰 {first_ms:.0f}ms, 전체 {total_ms:.0f}ms"
+            )
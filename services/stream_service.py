@@ -0,0 +1,214 @@
+"""
+재개 가능한(resumable) 채팅 스트림
+
+AI 응답 생성을 HTTP 연결과 분리합니다. 생성은 백그라운드 워커(gevent 환경에서는 그린렛)가 담당하고,
+공급사 스트림을 턴(turn) 단위 Redis Stream에 순번 ID와 함께 기록합니다.
+SSE 응답은 그 스트림을 읽어 전달만 하므로, 연결이 끊겨도 생성·DB 저장은 계속되고
+클라이언트는 Last-Event-ID 이후부터 다시 받아 이어서 표시할 수 있습니다.
+
+저장소:
+  - CELERY_BROKER_URL 설정 시: Redis Stream (XADD/XREAD, 캐시와 같은 Redis DB 1)
+  - 미설정 시(로컬 개발): 프로세스 내부 메모리 (단일 워커에서만 재개 가능)
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+
+from services.cache_utils import get_redis_client
+
+CHAT_STREAM_TTL = int(os.getenv("CHAT_STREAM_TTL", "900"))          # 턴 스트림 보관 시간(초)
+CHAT_STREAM_IDLE_TIMEOUT = int(os.getenv("CHAT_STREAM_IDLE_TIMEOUT", "120"))  # 새 이벤트 없이 기다릴 최대 시간
+CHAT_STREAM_MAXLEN = 20000
+_BLOCK_MS = 15000  # 한 번에 대기할 시간 (이후 keep-alive 주석 전송)
+
+_STREAM_KEY = "chat_stream:{session_id}:{turn_id}"
+_META_KEY = "chat_stream_meta:{session_id}:{turn_id}"
+
+
+def new_turn_id():
+    return uuid.uuid4().hex
+
+
+def is_terminal_event(payload):
+    """스트림 종료 이벤트(done/error) 여부"""
+    return bool(payload.get("done") or payload.get("error"))
+
+
+def format_sse(payload, event_id=None):
+    """SSE 프레임 문자열 (id 포함 시 클라이언트가 Last-Event-ID로 재개 가능)"""
+    frame = f"data: {json.dumps(payload)}\n\n"
+    if event_id is not None:
+        frame = f"id: {event_id}\n" + frame
+    return frame
+
+
+class _RedisTurnStore:
+    """Redis Stream 기반 저장소 (워커 간 공유)"""
+
+    def __init__(self, client):
+        self._redis = client
+
+    def create(self, session_id, turn_id, meta):
+        key = _META_KEY.format(session_id=session_id, turn_id=turn_id)
+        self._redis.set(key, json.dumps(meta), ex=CHAT_STREAM_TTL)
+
+    def get_meta(self, session_id, turn_id):
+        raw = self._redis.get(_META_KEY.format(session_id=session_id, turn_id=turn_id))
+        return json.loads(raw) if raw else None
+
+    def append(self, session_id, turn_id, payload):
+        key = _STREAM_KEY.format(session_id=session_id, turn_id=turn_id)
+        pipe = self._redis.pipeline()
+        pipe.xadd(key, {"d": json.dumps(payload)}, maxlen=CHAT_STREAM_MAXLEN, approximate=True)
+        pipe.expire(key, CHAT_STREAM_TTL)
+        event_id = pipe.execute()[0]
+        return event_id.decode() if isinstance(event_id, bytes) else event_id
+
+    def read(self, session_id, turn_id, last_id, block_ms):
+        key = _STREAM_KEY.format(session_id=session_id, turn_id=turn_id)
+        result = self._redis.xread({key: last_id or "0-0"}, block=block_ms, count=200)
+        events = []
+        for _, entries in result or []:
+            for event_id, fields in entries:
+                if isinstance(event_id, bytes):
+                    event_id = event_id.decode()
+                events.append((event_id, json.loads(fields[b"d"])))
+        return events
+
+
+class _MemoryTurnStore:
+    """프로세스 내부 저장소 (Redis 미설정 로컬 개발용)"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._turns = {}
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        for key in [k for k, t in self._turns.items() if t["expires_at"] < now]:
+            del self._turns[key]
+
+    def create(self, session_id, turn_id, meta):
+        with self._cond:
+            self._purge_expired()
+            self._turns[(session_id, turn_id)] = {
+                "meta": meta,
+                "events": [],
+                "expires_at": time.monotonic() + CHAT_STREAM_TTL,
+            }
+
+    def get_meta(self, session_id, turn_id):
+        turn = self._turns.get((session_id, turn_id))
+        return turn["meta"] if turn else None
+
+    def append(self, session_id, turn_id, payload):
+        with self._cond:
+            turn = self._turns.get((session_id, turn_id))
+            if turn is None:
+                return None
+            turn["events"].append(payload)
+            self._cond.notify_all()
+            return str(len(turn["events"]))
+
+    def read(self, session_id, turn_id, last_id, block_ms):
+        start = int(last_id) if last_id and str(last_id).isdigit() else 0
+        deadline = time.monotonic() + block_ms / 1000.0
+        with self._cond:
+            while True:
+                turn = self._turns.get((session_id, turn_id))
+                if turn is None:
+                    return []
+                events = turn["events"]
+                if len(events) > start:
+                    return [(str(i + 1), events[i]) for i in range(start, len(events))]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._cond.wait(remaining)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                client = get_redis_client()
+                _store = _RedisTurnStore(client) if client is not None else _MemoryTurnStore()
+    return _store
+
+
+def start_turn_stream(app, session_id, user_id, producer):
+    """
+    턴 스트림을 만들고 백그라운드에서 producer를 실행합니다.
+
+    Args:
+        app: Flask 앱 (백그라운드 워커에서 app context를 열기 위해 사용)
+        session_id: 채팅 세션 ID
+        user_id: 턴 소유자 (재개 요청 권한 확인용)
+        producer: emit(payload) 콜백을 받아 이벤트를 기록하는 함수.
+                  종료 시 done 또는 error 이벤트를 반드시 기록해야 합니다.
+
+    Returns:
+        turn_id
+    """
+    store = _get_store()
+    turn_id = new_turn_id()
+    store.create(session_id, turn_id, {"user_id": user_id, "created_at": time.time()})
+
+    def emit(payload):
+        return store.append(session_id, turn_id, payload)
+
+    def run():
+        with app.app_context():
+            try:
+                producer(emit)
+            except Exception as e:
+                print(f"⚠️ 채팅 스트림 생성 오류 (session_id={session_id}): {e}")
+                emit({"error": str(e)})
+
+    threading.Thread(target=run, name=f"chat-turn-{turn_id[:8]}", daemon=True).start()
+    return turn_id
+
+
+def get_turn_owner(session_id, turn_id):
+    """턴 소유자 user_id (만료되었거나 없으면 None)"""
+    meta = _get_store().get_meta(session_id, turn_id)
+    return meta.get("user_id") if meta else None
+
+
+def iter_turn_events(session_id, turn_id, last_event_id=None):
+    """
+    턴 스트림 이벤트를 SSE 프레임으로 yield 합니다 (last_event_id 이후부터, 종료 이벤트까지).
+
+    클라이언트 연결이 끊기면 읽기만 중단되고 생성은 백그라운드에서 계속됩니다.
+    """
+    store = _get_store()
+    last_id = last_event_id
+    idle_since = time.monotonic()
+
+    while True:
+        events = store.read(session_id, turn_id, last_id, _BLOCK_MS)
+        if not events:
+            if store.get_meta(session_id, turn_id) is None:
+                yield format_sse({"error": "만료되었거나 존재하지 않는 응답 스트림입니다."})
+                return
+            if time.monotonic() - idle_since > CHAT_STREAM_IDLE_TIMEOUT:
+                yield format_sse({"error": "응답 스트림이 중단되었습니다. 다시 시도해주세요."})
+                return
+            # 프록시 유휴 타임아웃 방지용 주석 프레임
+            yield ": keep-alive\n\n"
+            continue
+
+        idle_since = time.monotonic()
+        for event_id, payload in events:
+            last_id = event_id
+            yield format_sse(payload, event_id)
+            if is_terminal_event(payload):
+                return
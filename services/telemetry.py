@@ -0,0 +1,297 @@
+"""
+LLM 스트리밍 지연/처리량 텔레메트리
+
+느린 응답이 우리 DB 때문인지, 대기열(admission) 때문인지, 공급사 때문인지 구분할 수 있도록
+채팅/분석 스트림마다 요청 수신 → 첫 토큰 → 마지막 토큰 시점과 출력 토큰 속도, 프롬프트 크기,
+오류 종류를 provider / model_id / role_key(+ path) 라벨로 기록합니다.
+
+- 누적 히스토그램/카운터: Prometheus 텍스트 형식으로 /metrics에 노출
+- 롤링 히스토그램: 최근 TELEMETRY_WINDOW_MINUTES분을 분 단위 버킷으로 보관 (관리자 화면의 p50/p95/p99)
+- 워커 간 집계: Redis가 있으면 각 워커가 TELEMETRY_PUBLISH_SECONDS마다 자기 스냅샷을 올리고
+  조회 시 합산. 없으면(단일 프로세스 로컬 개발) 현재 프로세스 값만 사용
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+
+TELEMETRY_WINDOW_MINUTES = int(os.getenv("TELEMETRY_WINDOW_MINUTES", "15"))
+TELEMETRY_PUBLISH_SECONDS = 10
+_SNAPSHOT_KEY = "telemetry:worker:{host}:{pid}"
+_SNAPSHOT_PATTERN = "telemetry:worker:*"
+_SNAPSHOT_TTL = 24 * 3600
+
+LABEL_NAMES = ("path", "provider", "model_id", "role_key")
+
+_SECONDS_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60, 120)
+_TPS_BUCKETS = (1, 5, 10, 20, 40, 60, 100, 150, 250)
+_PROMPT_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+
+# name: (help, buckets)
+HISTOGRAMS = {
+    "llm_time_to_first_token_seconds": ("요청 수신부터 첫 토큰 전송까지", _SECONDS_BUCKETS),
+    "llm_generation_seconds": ("첫 토큰부터 마지막 토큰까지", _SECONDS_BUCKETS),
+    "llm_request_duration_seconds": ("요청 수신부터 마지막 토큰까지", _SECONDS_BUCKETS),
+    "llm_output_tokens_per_second": ("첫 토큰 이후 출력 토큰 속도", _TPS_BUCKETS),
+    "llm_prompt_tokens": ("입력 프롬프트 토큰 수", _PROMPT_BUCKETS),
+}
+# name: (help, 추가 라벨)
+COUNTERS = {
+    "llm_requests_total": ("스트림 요청 수 (outcome=ok|error)", ("outcome", "error_class")),
+    "llm_output_tokens_total": ("출력 토큰 합계", ()),
+}
+
+
+class _Registry:
+    """프로세스 내부 집계 (누적 + 분 단위 롤링). 모든 값은 합산 가능한 형태로 보관"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {name: {} for name in HISTOGRAMS}   # name -> labels -> [counts..., sum, count]
+        self.rolling = {name: {} for name in HISTOGRAMS}      # name -> labels -> {minute: [counts...]}
+        self.counters = {name: {} for name in COUNTERS}       # name -> labels -> value
+        self._last_publish = 0.0
+
+    def observe(self, name, labels, value):
+        buckets = HISTOGRAMS[name][1]
+        index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+        minute = int(time.time() // 60)
+        with self._lock:
+            series = self.histograms[name].setdefault(labels, [0] * (len(buckets) + 1) + [0.0, 0])
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+            per_minute = self.rolling[name].setdefault(labels, {})
+            counts = per_minute.setdefault(minute, [0] * (len(buckets) + 1))
+            counts[index] += 1
+            oldest = minute - TELEMETRY_WINDOW_MINUTES
+            for old in [m for m in per_minute if m <= oldest]:
+                del per_minute[old]
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            self.counters[name][labels] = self.counters[name].get(labels, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "histograms": {n: [[list(k), list(v)] for k, v in s.items()] for n, s in self.histograms.items()},
+                "rolling": {
+                    n: [[list(k), {str(m): list(c) for m, c in per.items()}] for k, per in s.items()]
+                    for n, s in self.rolling.items()
+                },
+                "counters": {n: [[list(k), v] for k, v in s.items()] for n, s in self.counters.items()},
+            }
+
+    def maybe_publish(self):
+        """워커 스냅샷을 Redis에 주기적으로 게시 (워커 간 합산용)"""
+        now = time.monotonic()
+        if now - self._last_publish < TELEMETRY_PUBLISH_SECONDS:
+            return
+        self._last_publish = now
+        publish_snapshot(self)
+
+
+_registry = _Registry()
+
+
+def publish_snapshot(registry=None):
+    from services.cache_utils import get_redis_client
+    client = get_redis_client()
+    if client is None:
+        return
+    try:
+        client.set(_SNAPSHOT_KEY.format(host=socket.gethostname(), pid=os.getpid()),
+                   json.dumps((registry or _registry).snapshot()), ex=_SNAPSHOT_TTL)
+    except Exception as e:
+        print(f"⚠️ 텔레메트리 스냅샷 게시 실패: {e}")
+
+
+# ----------------------------------------------------------------------
+# 기록 API
+# ----------------------------------------------------------------------
+
+def error_class(error):
+    """예외를 라벨용 오류 종류로 변환 (SDK 예외 클래스명: RateLimitError, APITimeoutError 등)"""
+    if error is None:
+        return ""
+    if isinstance(error, str):
+        return error
+    return type(error).__name__
+
+
+class StreamSpan:
+    """
+    스트림 하나의 시점 기록.
+
+        span = StreamSpan("chat", role_key, received_at)
+        ... 첫 청크 전송 시 span.first_token()
+        span.finish(provider, model_id, output_tokens=..., prompt_tokens=..., error=None)
+    """
+
+    def __init__(self, path, role_key=None, received_at=None):
+        self.path = path
+        self.role_key = role_key or "-"
+        self.received_at = received_at if received_at is not None else time.monotonic()
+        self.first_token_at = None
+        self.finished = False
+
+    def first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+
+    def finish(self, provider, model_id, output_tokens=0, prompt_tokens=None, error=None):
+        if self.finished:
+            return
+        self.finished = True
+        now = time.monotonic()
+        labels = (self.path, provider or "-", model_id or "-", self.role_key)
+        try:
+            if self.first_token_at is not None:
+                _registry.observe("llm_time_to_first_token_seconds", labels,
+                                  self.first_token_at - self.received_at)
+                generation = now - self.first_token_at
+                _registry.observe("llm_generation_seconds", labels, generation)
+                if output_tokens and generation > 0:
+                    _registry.observe("llm_output_tokens_per_second", labels, output_tokens / generation)
+            _registry.observe("llm_request_duration_seconds", labels, now - self.received_at)
+            if prompt_tokens:
+                _registry.observe("llm_prompt_tokens", labels, prompt_tokens)
+            if output_tokens:
+                _registry.inc("llm_output_tokens_total", labels, output_tokens)
+            outcome = "error" if error is not None else "ok"
+            _registry.inc("llm_requests_total", labels + (outcome, error_class(error)))
+            _registry.maybe_publish()
+        except Exception as e:
+            print(f"⚠️ 텔레메트리 기록 실패: {e}")
+
+
+# ----------------------------------------------------------------------
+# 조회 (워커 합산)
+# ----------------------------------------------------------------------
+
+def _collect_snapshots():
+    from services.cache_utils import get_redis_client
+    client = get_redis_client()
+    if client is None:
+        return [_registry.snapshot()]
+    publish_snapshot()
+    snapshots = []
+    try:
+        keys = list(client.scan_iter(match=_SNAPSHOT_PATTERN, count=100))
+        for raw in client.mget(keys) if keys else []:
+            if raw:
+                snapshots.append(json.loads(raw))
+    except Exception as e:
+        print(f"⚠️ 텔레메트리 스냅샷 조회 실패: {e}")
+        return [_registry.snapshot()]
+    return snapshots
+
+
+def _merge(snapshots):
+    histograms = {name: {} for name in HISTOGRAMS}
+    rolling = {name: {} for name in HISTOGRAMS}
+    counters = {name: {} for name in COUNTERS}
+    min_minute = int(time.time() // 60) - TELEMETRY_WINDOW_MINUTES
+    for snap in snapshots:
+        for name, series in snap.get("histograms", {}).items():
+            for labels, values in series:
+                merged = histograms[name].setdefault(tuple(labels), [0] * len(values))
+                for i, v in enumerate(values):
+                    merged[i] += v
+        for name, series in snap.get("rolling", {}).items():
+            size = len(HISTOGRAMS[name][1]) + 1
+            for labels, per_minute in series:
+                merged = rolling[name].setdefault(tuple(labels), [0] * size)
+                for minute, counts in per_minute.items():
+                    if int(minute) > min_minute:
+                        for i, v in enumerate(counts):
+                            merged[i] += v
+        for name, series in snap.get("counters", {}).items():
+            for labels, value in series:
+                key = tuple(labels)
+                counters[name][key] = counters[name].get(key, 0) + value
+    return histograms, rolling, counters
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}"
+
+
+def render_prometheus():
+    """Prometheus 텍스트 노출 형식 (워커 합산 누적값)"""
+    histograms, _, counters = _merge(_collect_snapshots())
+    lines = []
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, values in sorted(histograms[name].items()):
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ["+Inf"], values[:len(buckets) + 1]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{name}_bucket{_label_str(LABEL_NAMES, labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_label_str(LABEL_NAMES, labels)} {values[-2]}")
+            lines.append(f"{name}_count{_label_str(LABEL_NAMES, labels)} {values[-1]}")
+    for name, (help_text, extra_labels) in COUNTERS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for labels, value in sorted(counters[name].items()):
+            lines.append(f"{name}{_label_str(LABEL_NAMES + extra_labels, labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _quantile(buckets, counts, q):
+    """버킷 카운트로 분위수 추정 (버킷 안에서 선형 보간, +Inf 버킷은 마지막 경계값)"""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    lower = 0.0
+    for i, count in enumerate(counts):
+        upper = buckets[i] if i < len(buckets) else buckets[-1]
+        if cumulative + count >= rank:
+            if count == 0 or i >= len(buckets):
+                return float(upper)
+            return lower + (upper - lower) * (rank - cumulative) / count
+        cumulative += count
+        lower = upper
+    return float(buckets[-1])
+
+
+def rolling_summary(group_by=("path", "provider", "model_id")):
+    """
+    최근 TELEMETRY_WINDOW_MINUTES분 롤링 히스토그램의 p50/p95/p99 (관리자 모니터링용).
+
+    Args:
+        group_by: 합산 기준 라벨 (LABEL_NAMES 중 선택). role_key를 넣으면 페르소나별로 분리
+    """
+    _, rolling, _ = _merge(_collect_snapshots())
+    indexes = [LABEL_NAMES.index(name) for name in group_by]
+    rows = {}
+    for name, (_, buckets) in HISTOGRAMS.items():
+        grouped = {}
+        for labels, counts in rolling[name].items():
+            key = tuple(labels[i] for i in indexes)
+            merged = grouped.setdefault(key, [0] * len(counts))
+            for i, v in enumerate(counts):
+                merged[i] += v
+        for key, counts in grouped.items():
+            row = rows.setdefault(key, dict(zip(group_by, key)))
+            row[name] = {
+                "count": sum(counts),
+                "p50": _quantile(buckets, counts, 0.50),
+                "p95": _quantile(buckets, counts, 0.95),
+                "p99": _quantile(buckets, counts, 0.99),
+            }
+    return {"window_minutes": TELEMETRY_WINDOW_MINUTES, "series": list(rows.values())}
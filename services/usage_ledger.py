@@ -0,0 +1,214 @@
+"""
+토큰 사용량 / 비용 원장
+
+공급사 응답의 usage 블록(Anthropic message_delta usage, OpenAI 호환 stream_options.include_usage,
+Gemini usage_metadata, 임베딩 usage)을 호출마다 기록합니다.
+
+  - record_usage():   호출 1건을 write-behind 큐에 적재 (요청 경로에서 DB 쓰기 없음)
+  - write_usage_rows(): 플러셔가 배치로 usage_event INSERT + usage_daily UPSERT를 한 트랜잭션에 반영
+  - usage_report():   관리자용 일별 비용/토큰 집계 (usage_daily만 조회)
+
+비용은 AVAILABLE_MODELS의 input_price/output_price(USD / 1M tokens)로 산정합니다.
+캐시 읽기/쓰기 단가는 공급사별 배율로 근사하며, usage를 받지 못한 호출은 토큰 수를 추정해 estimated로 표시합니다.
+"""
+
+import datetime
+
+from sqlalchemy import func, insert
+
+from extensions import db
+from models import UsageDaily, UsageEvent, User
+
+# 공급사별 캐시 단가 배율 (입력 단가 대비: 쓰기, 읽기)
+_CACHE_PRICE_RATIOS = {
+    "anthropic": (1.25, 0.10),
+    "openai": (1.0, 0.50),
+    "google": (1.0, 0.25),
+    "xai": (1.0, 0.25),
+}
+
+_SUM_COLUMNS = (
+    "requests", "estimated_requests", "input_tokens", "output_tokens",
+    "cache_read_tokens", "cache_write_tokens", "cost_usd",
+)
+GROUP_COLUMNS = {
+    "user": "user_id",
+    "persona": "role_key",
+    "model": "model_id",
+    "feature": "feature",
+}
+
+
+def _model_price(model_id):
+    """(provider, 입력 단가, 출력 단가) — 등록되지 않은 모델은 단가 0"""
+    from services.ai_service import AVAILABLE_MODELS
+    from services.embedding_service import EMBEDDING_MODEL, EMBEDDING_PRICE_PER_1M
+
+    if model_id == EMBEDDING_MODEL:
+        return "openai", EMBEDDING_PRICE_PER_1M, 0.0
+    info = AVAILABLE_MODELS.get(model_id) or {}
+    return info.get("provider"), info.get("input_price", 0.0), info.get("output_price", 0.0)
+
+
+def estimate_cost(model_id, input_tokens=0, output_tokens=0, cache_read_tokens=0, cache_write_tokens=0):
+    """토큰 수로 비용(USD) 산정"""
+    provider, input_price, output_price = _model_price(model_id)
+    write_ratio, read_ratio = _CACHE_PRICE_RATIOS.get(provider, (1.0, 1.0))
+    cost = (
+        input_tokens * input_price
+        + cache_write_tokens * input_price * write_ratio
+        + cache_read_tokens * input_price * read_ratio
+        + output_tokens * output_price
+    ) / 1_000_000
+    return round(cost, 8)
+
+
+def record_usage(feature, model_id, usage, user_id=None, role_key=None, provider=None,
+                 estimated_input=0, estimated_output=0):
+    """
+    호출 1건의 사용량을 원장에 기록 예약.
+
+    Args:
+        feature: 'chat', 'analysis', 'rag_summary', 'session_summary', 'embedding', 'image_prompt', 'music_prompt'
+        usage: ai_service가 채운 usage dict (input_tokens, output_tokens, cache_*_input_tokens)
+        estimated_input/estimated_output: usage가 비어 있을 때 기록할 추정 토큰 수
+    """
+    usage = usage or {}
+    estimated = not (usage.get("input_tokens") or usage.get("output_tokens"))
+    row = {
+        "input_tokens": int(usage.get("input_tokens") or 0),
+        "output_tokens": int(usage.get("output_tokens") or 0),
+        "cache_read_tokens": int(usage.get("cache_read_input_tokens") or 0),
+        "cache_write_tokens": int(usage.get("cache_creation_input_tokens") or 0),
+    }
+    if estimated:
+        row["input_tokens"], row["output_tokens"] = int(estimated_input or 0), int(estimated_output or 0)
+        if not (row["input_tokens"] or row["output_tokens"]):
+            return
+
+    from services.write_behind import write_behind
+    write_behind.enqueue({
+        "type": "usage",
+        "created_at": datetime.datetime.utcnow().isoformat(),
+        "user_id": user_id,
+        "role_key": role_key,
+        "feature": feature,
+        "provider": provider or _model_price(model_id)[0],
+        "model_id": model_id,
+        "estimated": estimated,
+        "cost_usd": estimate_cost(model_id, **row),
+        **row,
+    })
+
+
+def _daily_upsert(rows):
+    """usage_daily 누적 (PostgreSQL/SQLite는 ON CONFLICT, 그 외는 조회 후 갱신)"""
+    dialect = db.engine.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(UsageDaily).values(rows)
+        table = UsageDaily.__table__
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["day", "user_id", "role_key", "model_id", "feature"],
+            set_={col: table.c[col] + stmt.excluded[col] for col in _SUM_COLUMNS},
+        )
+        db.session.execute(stmt)
+        return
+
+    for row in rows:
+        existing = UsageDaily.query.filter_by(
+            day=row["day"], user_id=row["user_id"], role_key=row["role_key"],
+            model_id=row["model_id"], feature=row["feature"],
+        ).first()
+        if existing is None:
+            db.session.add(UsageDaily(**row))
+            continue
+        for col in _SUM_COLUMNS:
+            setattr(existing, col, getattr(existing, col) + row[col])
+
+
+def write_usage_rows(ops):
+    """write-behind 배치 반영: 원장 INSERT와 일별 집계 UPSERT (커밋은 호출자 트랜잭션)"""
+    if not ops:
+        return
+    events, daily = [], {}
+    for op in ops:
+        created_at = datetime.datetime.fromisoformat(op["created_at"])
+        events.append({
+            "created_at": created_at,
+            "user_id": op.get("user_id"),
+            "role_key": op.get("role_key"),
+            "feature": op["feature"],
+            "provider": op.get("provider"),
+            "model_id": op["model_id"],
+            "input_tokens": op["input_tokens"],
+            "output_tokens": op["output_tokens"],
+            "cache_read_tokens": op["cache_read_tokens"],
+            "cache_write_tokens": op["cache_write_tokens"],
+            "cost_usd": op["cost_usd"],
+            "estimated": op["estimated"],
+        })
+        key = (created_at.date(), op.get("user_id") or 0, op.get("role_key") or "", op["model_id"], op["feature"])
+        agg = daily.setdefault(key, dict.fromkeys(_SUM_COLUMNS, 0))
+        agg["requests"] += 1
+        agg["estimated_requests"] += 1 if op["estimated"] else 0
+        for col in ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens", "cost_usd"):
+            agg[col] += op[col]
+
+    db.session.execute(insert(UsageEvent), events)
+    _daily_upsert([
+        {"day": day, "user_id": user_id, "role_key": role_key, "model_id": model_id, "feature": feature, **agg}
+        for (day, user_id, role_key, model_id, feature), agg in daily.items()
+    ])
+
+
+def usage_report(days=30, group_by=("model",)):
+    """
+    최근 days일의 일별 합계와 group_by 기준 합계.
+
+    Returns:
+        {"days", "totals", "daily": [{day, ...합계}], "groups": [{그룹 컬럼..., ...합계}]}
+    """
+    since = datetime.datetime.utcnow().date() - datetime.timedelta(days=days - 1)
+    sums = [func.sum(getattr(UsageDaily, col)).label(col) for col in _SUM_COLUMNS]
+
+    def _row(row, keys):
+        data = {key: getattr(row, key) for key in keys}
+        for col in _SUM_COLUMNS:
+            value = getattr(row, col) or 0
+            data[col] = round(float(value), 6) if col == "cost_usd" else int(value)
+        return data
+
+    daily_rows = (
+        db.session.query(UsageDaily.day, *sums)
+        .filter(UsageDaily.day >= since)
+        .group_by(UsageDaily.day).order_by(UsageDaily.day).all()
+    )
+    daily = [{**_row(r, ()), "day": r.day.isoformat()} for r in daily_rows]
+
+    group_cols = [GROUP_COLUMNS[name] for name in group_by]
+    group_rows = (
+        db.session.query(*[getattr(UsageDaily, col) for col in group_cols], *sums)
+        .filter(UsageDaily.day >= since)
+        .group_by(*[getattr(UsageDaily, col) for col in group_cols])
+        .order_by(func.sum(UsageDaily.cost_usd).desc()).all()
+    )
+    groups = [_row(r, group_cols) for r in group_rows]
+
+    if "user_id" in group_cols:
+        user_ids = {g["user_id"] for g in groups if g["user_id"]}
+        names = dict(
+            db.session.query(User.id, User.username).filter(User.id.in_(user_ids)).all()
+        ) if user_ids else {}
+        for g in groups:
+            g["username"] = names.get(g["user_id"], "(system)" if not g["user_id"] else None)
+
+    totals = dict.fromkeys(_SUM_COLUMNS, 0)
+    for d in daily:
+        for col in _SUM_COLUMNS:
+            totals[col] += d[col]
+    totals["cost_usd"] = round(totals["cost_usd"], 6)
+    return {"days": days, "since": since.isoformat(), "totals": totals, "daily": daily, "groups": groups}
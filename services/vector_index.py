@@ -0,0 +1,413 @@
+"""
+document_chunk.embedding ANN 인덱스 관리 (PostgreSQL + pgvector 전용)
+
+인덱스가 없으면 RAG 검색은 페르소나의 청크를 모두 읽는 정확 순차 스캔이 됩니다.
+이 모듈은 HNSW 또는 IVFFlat 인덱스를 운영 중단 없이(CREATE INDEX CONCURRENTLY) 만들고 교체하며,
+쿼리마다 페르소나의 검색 품질 설정(rag_search_quality)에 맞춰 hnsw.ef_search / ivfflat.probes를 지정합니다.
+
+  - build_vector_index(): 새 이름으로 동시 생성 → 기존 인덱스 동시 삭제 → 이름 교체 (Celery 작업에서 실행)
+  - rebuild_reason():     인덱스가 없음(청크 VECTOR_INDEX_MIN_ROWS 이상) / 무효 / IVFFlat lists가 현재 행 수에 비해 작음 / 관리 기록 없음
+  - persona_index_plan(): 검색 가능 청크가 VECTOR_INDEX_PERSONA_MIN_ROWS 이상인 페르소나의 부분 인덱스
+                          (WHERE persona_id = N AND is_searchable) 생성 / 삭제된 페르소나 인덱스 정리 대상
+  - apply_search_params(): 검색 트랜잭션에 SET LOCAL (pgvector 0.8+면 HNSW 반복 스캔으로 페르소나 필터 후에도 k개 보장)
+  - vector_index_status(): 종류·크기·유효 여부·빌드 상태/진행률 (지식 베이스 통계 API)
+
+페르소나 부분 인덱스가 있으면 검색 쿼리의 필터와 인덱스 조건이 일치해 해당 페르소나 청크만 담긴 그래프를 탐색하고,
+없으면(작은 페르소나) persona_id B-tree 인덱스로 청크를 골라 정확 정렬하거나 전체 인덱스를 사용합니다.
+
+IVFFlat lists는 행 수 기준(100만 이하: rows/1000, 초과: sqrt(rows))으로 정하며,
+빈 테이블에서 학습된 중심점은 검색 품질이 낮으므로 행 수가 lists 권장값의 2배를 넘게 늘면 재생성합니다.
+"""
+
+import datetime
+import json
+import math
+import os
+
+from sqlalchemy import text
+
+from extensions import db
+from models import SystemConfig
+from services.cache_utils import LRUCache
+
+VECTOR_INDEX_NAME = "idx_document_chunk_embedding"
+VECTOR_INDEX_KIND = os.getenv("VECTOR_INDEX_KIND", "hnsw")          # 'hnsw' | 'ivfflat'
+VECTOR_INDEX_MIN_ROWS = int(os.getenv("VECTOR_INDEX_MIN_ROWS", "5000"))
+VECTOR_INDEX_PERSONA_MIN_ROWS = int(os.getenv("VECTOR_INDEX_PERSONA_MIN_ROWS", "2000"))
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+VECTOR_INDEX_MAINTENANCE_WORK_MEM = os.getenv("VECTOR_INDEX_MAINTENANCE_WORK_MEM")  # 예: '1GB'
+INDEX_KINDS = ("hnsw", "ivfflat", "none")
+
+# 페르소나 검색 품질 → HNSW 후보 수 / IVFFlat 탐색 리스트 비율
+SEARCH_QUALITY = {
+    "fast": {"ef_search": 40, "probes_ratio": 0.01},
+    "balanced": {"ef_search": 100, "probes_ratio": 0.03},
+    "accurate": {"ef_search": 200, "probes_ratio": 0.10},
+}
+DEFAULT_SEARCH_QUALITY = "balanced"
+
+BUILD_LOCK_KEY = "vector_index_build_lock"
+_CONFIG_KEY = "vector_index_state"
+_PERSONA_INDEX_PREFIX = f"{VECTOR_INDEX_NAME}_p"
+_index_cache = LRUCache(maxsize=4, ttl=60)
+
+
+def ivfflat_lists(rows):
+    """행 수에 맞는 IVFFlat lists (pgvector 권장값)"""
+    if rows <= 1_000_000:
+        return max(10, rows // 1000)
+    return int(math.sqrt(rows))
+
+
+def _is_postgres():
+    return db.engine.dialect.name == "postgresql"
+
+
+# ----------------------------------------------------------------------
+# 조회
+# ----------------------------------------------------------------------
+
+def _pgvector_version():
+    version = _index_cache.get("pgvector_version")
+    if version is None:
+        row = db.session.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).first()
+        version = tuple(int(p) for p in row[0].split(".")[:2]) if row else (0, 0)
+        _index_cache.set("pgvector_version", version)
+    return version
+
+
+def persona_index_name(persona_id):
+    return f"{_PERSONA_INDEX_PREFIX}{int(persona_id)}"
+
+
+def _ann_indexes(refresh=False):
+    """document_chunk.embedding의 모든 ANN 인덱스 {이름: 정보} (60초 캐시)"""
+    indexes = None if refresh else _index_cache.get("indexes")
+    if indexes is None:
+        rows = db.session.execute(text("""
+            SELECT c.relname, am.amname, i.indisvalid, pg_relation_size(c.oid), c.reloptions,
+                   i.indpred IS NOT NULL
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_am am ON am.oid = c.relam
+            WHERE i.indrelid = 'document_chunk'::regclass
+              AND am.amname IN ('hnsw', 'ivfflat')
+        """)).all()
+        indexes = {
+            row[0]: {
+                "name": row[0],
+                "kind": row[1],
+                "valid": bool(row[2]),
+                "size_bytes": int(row[3]),
+                "options": dict(opt.split("=", 1) for opt in (row[4] or [])),
+                "partial": bool(row[5]),
+            }
+            for row in rows
+        }
+        _index_cache.set("indexes", indexes)
+    return indexes
+
+
+def current_index(refresh=False):
+    """
+    document_chunk.embedding의 전체(부분 인덱스 제외) ANN 인덱스 정보 (없으면 None, 60초 캐시).
+
+    Returns:
+        {"name", "kind": 'hnsw'|'ivfflat', "valid", "size_bytes", "options": {"lists": "100", ...}}
+    """
+    if not _is_postgres():
+        return None
+    candidates = [i for i in _ann_indexes(refresh).values() if not i["partial"]]
+    candidates.sort(key=lambda i: (i["name"] == VECTOR_INDEX_NAME, i["valid"]), reverse=True)
+    return candidates[0] if candidates else None
+
+
+def persona_index(persona_id, refresh=False):
+    """페르소나 전용 부분 ANN 인덱스 정보 (없으면 None)"""
+    if not _is_postgres() or persona_id is None:
+        return None
+    return _ann_indexes(refresh).get(persona_index_name(persona_id))
+
+
+def _chunk_rows():
+    return db.session.execute(
+        text("SELECT COUNT(*) FROM document_chunk WHERE embedding IS NOT NULL")
+    ).scalar() or 0
+
+
+def get_index_state():
+    """마지막 빌드 기록 (SystemConfig vector_index_state)"""
+    row = SystemConfig.query.filter_by(key=_CONFIG_KEY).first()
+    if not row:
+        return {}
+    try:
+        return json.loads(row.value)
+    except (TypeError, ValueError):
+        return {}
+
+
+def _save_index_state(state):
+    row = SystemConfig.query.filter_by(key=_CONFIG_KEY).first()
+    if row is None:
+        row = SystemConfig(key=_CONFIG_KEY, value="{}")
+        db.session.add(row)
+    row.value = json.dumps(state, ensure_ascii=False)
+    db.session.commit()
+
+
+def rebuild_reason(rows=None):
+    """재생성이 필요한 이유 (필요 없으면 None)"""
+    if not _is_postgres():
+        return None
+    index = current_index(refresh=True)
+    rows = _chunk_rows() if rows is None else rows
+    state = get_index_state()
+    if state.get("state") == "building" and not _build_stale(state):
+        return None
+    if index is None:
+        return "missing" if rows >= VECTOR_INDEX_MIN_ROWS and state.get("kind") != "none" else None
+    if not index["valid"]:
+        return "invalid"
+    if index["kind"] == "ivfflat":
+        if not state.get("built_at"):
+            return "untracked"   # 마이그레이션에서 빈 테이블로 만든 인덱스 등
+        lists = int(index["options"].get("lists", 0) or 0)
+        if ivfflat_lists(rows) >= 2 * max(lists, 1):
+            return "grown"
+    return None
+
+
+def _build_stale(state):
+    """building 기록이 작업 제한 시간(1시간)을 넘겨 남아 있으면 워커가 중단된 것으로 간주"""
+    try:
+        started = datetime.datetime.fromisoformat(state["started_at"])
+    except (KeyError, TypeError, ValueError):
+        return True
+    return datetime.datetime.utcnow() - started > datetime.timedelta(hours=1)
+
+
+def build_progress():
+    """진행 중인 CREATE INDEX의 단계/진행률 (pg_stat_progress_create_index)"""
+    row = db.session.execute(text("""
+        SELECT phase, blocks_done, blocks_total, tuples_done, tuples_total
+        FROM pg_stat_progress_create_index
+        WHERE relid = 'document_chunk'::regclass
+    """)).first()
+    if row is None:
+        return None
+    return {
+        "phase": row[0],
+        "blocks_done": row[1], "blocks_total": row[2],
+        "tuples_done": row[3], "tuples_total": row[4],
+    }
+
+
+def persona_index_plan():
+    """
+    페르소나 부분 인덱스 점검 결과.
+
+    Returns:
+        {"build": [{"persona_id", "rows", "reason": 'missing'|'invalid'|'grown'}],
+         "drop": [검색 가능 청크가 없는(삭제된) 페르소나의 인덱스 이름]}
+    """
+    plan = {"build": [], "drop": []}
+    if not _is_postgres() or VECTOR_INDEX_KIND == "none":
+        return plan
+    counts = dict(db.session.execute(text("""
+        SELECT persona_id, COUNT(*)
+        FROM document_chunk
+        WHERE is_searchable AND persona_id IS NOT NULL AND embedding IS NOT NULL
+        GROUP BY persona_id
+    """)).all())
+    indexes = {name: info for name, info in _ann_indexes(refresh=True).items()
+               if name.startswith(_PERSONA_INDEX_PREFIX) and name[len(_PERSONA_INDEX_PREFIX):].isdigit()}
+    for persona_id, rows in counts.items():
+        index = indexes.get(persona_index_name(persona_id))
+        reason = None
+        if index is None:
+            reason = "missing" if rows >= VECTOR_INDEX_PERSONA_MIN_ROWS else None
+        elif not index["valid"]:
+            reason = "invalid"
+        elif index["kind"] == "ivfflat":
+            lists = int(index["options"].get("lists", 0) or 0)
+            if ivfflat_lists(rows) >= 2 * max(lists, 1):
+                reason = "grown"
+        if reason:
+            plan["build"].append({"persona_id": persona_id, "rows": rows, "reason": reason})
+    plan["drop"] = [name for name in indexes
+                    if int(name[len(_PERSONA_INDEX_PREFIX):]) not in counts]
+    return plan
+
+
+def vector_index_status(persona_id=None):
+    """지식 베이스 통계용 인덱스 상태 (PostgreSQL이 아니면 로컬 벡터 저장소 상태)"""
+    if not _is_postgres():
+        from services.local_vector_store import local_store_status
+        return {**local_store_status(persona_id), "kind": None}
+    index = current_index(refresh=True)
+    rows = _chunk_rows()
+    state = get_index_state()
+    status = {
+        "backend": "pgvector",
+        "kind": index["kind"] if index else None,
+        "name": index["name"] if index else None,
+        "valid": index["valid"] if index else None,
+        "size_bytes": index["size_bytes"] if index else 0,
+        "options": index["options"] if index else {},
+        "rows": rows,
+        "build": state,
+        "rebuild_reason": rebuild_reason(rows),
+    }
+    if state.get("state") == "building":
+        status["progress"] = build_progress()
+    if persona_id is not None:
+        status["persona_index"] = persona_index(persona_id)
+    return status
+
+
+# ----------------------------------------------------------------------
+# 생성 / 교체
+# ----------------------------------------------------------------------
+
+def _index_ddl(kind, rows, name, where=None):
+    if kind == "hnsw":
+        params = {"m": HNSW_M, "ef_construction": HNSW_EF_CONSTRUCTION}
+        with_clause = f"WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})"
+    else:
+        params = {"lists": ivfflat_lists(rows)}
+        with_clause = f"WITH (lists = {params['lists']})"
+    ddl = (
+        f"CREATE INDEX CONCURRENTLY {name} ON document_chunk "
+        f"USING {kind} (embedding vector_cosine_ops) {with_clause}"
+    )
+    if where:
+        ddl += f" WHERE {where}"
+    return ddl, params
+
+
+def _ddl_connection():
+    """CONCURRENTLY DDL용 AUTOCOMMIT 연결 (maintenance_work_mem 적용)"""
+    conn = db.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+    if VECTOR_INDEX_MAINTENANCE_WORK_MEM:
+        conn.execute(text("SELECT set_config('maintenance_work_mem', :v, false)"),
+                     {"v": VECTOR_INDEX_MAINTENANCE_WORK_MEM})
+    return conn
+
+
+def _create_and_swap(conn, name, kind, rows, where=None):
+    """{name}_new로 동시 생성 → 기존 {name} 동시 삭제 → 이름 교체 (kind='none'이면 삭제만)"""
+    new_name = f"{name}_new"
+    # 이전 빌드가 중단되며 남긴 무효 인덱스 정리
+    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {new_name}"))
+    if kind == "none":
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        return {}
+    ddl, params = _index_ddl(kind, rows, new_name, where)
+    conn.execute(text(ddl))
+    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    conn.execute(text(f"ALTER INDEX {new_name} RENAME TO {name}"))
+    return params
+
+
+def build_vector_index(kind=None, reason="manual"):
+    """
+    ANN 인덱스를 새로 만들어 기존 인덱스와 교체 (kind='none'이면 삭제만).
+
+    CONCURRENTLY는 트랜잭션 밖에서 실행해야 하므로 AUTOCOMMIT 연결을 사용하며,
+    생성 중에도 검색/청크 INSERT는 막히지 않습니다. 진행 상태는 SystemConfig vector_index_state에 기록합니다.
+    """
+    if not _is_postgres():
+        raise ValueError("ANN 인덱스는 PostgreSQL(pgvector)에서만 지원합니다.")
+    kind = kind or VECTOR_INDEX_KIND
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"지원하지 않는 인덱스 종류: {kind}")
+
+    rows = _chunk_rows()
+    started = datetime.datetime.utcnow()
+    state = {"state": "building", "kind": kind, "reason": reason, "rows": rows,
+             "started_at": started.isoformat()}
+    _save_index_state(state)
+    db.session.close()
+
+    try:
+        with _ddl_connection() as conn:
+            params = _create_and_swap(conn, VECTOR_INDEX_NAME, kind, rows)
+    except Exception as e:
+        state.update({"state": "failed", "error": str(e)[:500],
+                      "finished_at": datetime.datetime.utcnow().isoformat()})
+        _save_index_state(state)
+        raise
+
+    finished = datetime.datetime.utcnow()
+    state.update({
+        "state": "ready", "params": params, "error": None,
+        "built_at": finished.isoformat(), "finished_at": finished.isoformat(),
+        "duration_s": round((finished - started).total_seconds(), 1),
+    })
+    _save_index_state(state)
+    _index_cache.delete("indexes")
+    return state
+
+
+def apply_persona_index_plan(plan):
+    """
+    persona_index_plan() 결과 실행: 페르소나 부분 인덱스 생성/교체 및 고아 인덱스 삭제.
+
+    조건식(persona_id = N AND is_searchable)은 검색 쿼리의 WHERE와 같아야 플래너가 부분 인덱스를 사용합니다.
+    페르소나 하나의 실패는 기록 후 다음 페르소나로 넘어갑니다.
+
+    Returns:
+        {"built": [persona_id], "dropped": [index name], "failed": {persona_id: error}}
+    """
+    if not _is_postgres():
+        raise ValueError("ANN 인덱스는 PostgreSQL(pgvector)에서만 지원합니다.")
+    result = {"built": [], "dropped": [], "failed": {}}
+    db.session.close()
+    with _ddl_connection() as conn:
+        for item in plan.get("build", []):
+            persona_id = int(item["persona_id"])
+            try:
+                _create_and_swap(conn, persona_index_name(persona_id), VECTOR_INDEX_KIND, item["rows"],
+                                 where=f"persona_id = {persona_id} AND is_searchable")
+                result["built"].append(persona_id)
+            except Exception as e:
+                result["failed"][persona_id] = str(e)[:500]
+        for name in plan.get("drop", []):
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+            result["dropped"].append(name)
+    _index_cache.delete("indexes")
+    return result
+
+
+# ----------------------------------------------------------------------
+# 쿼리별 검색 파라미터
+# ----------------------------------------------------------------------
+
+def apply_search_params(quality=None, limit=10, persona_id=None):
+    """
+    현재 트랜잭션의 ANN 검색 파라미터 지정 (SET LOCAL — 커밋/롤백 시 원복).
+
+    Args:
+        quality: 'fast' | 'balanced' | 'accurate' (페르소나 rag_search_quality)
+        limit: 쿼리 LIMIT (HNSW 후보 수는 최소 이 값 이상)
+        persona_id: 페르소나 부분 인덱스가 있으면 그 종류/lists 기준으로 지정
+    """
+    if not _is_postgres():
+        return
+    index = persona_index(persona_id)
+    if index is None or not index["valid"]:
+        index = current_index()
+    if index is None or not index["valid"]:
+        return
+    preset = SEARCH_QUALITY.get(quality) or SEARCH_QUALITY[DEFAULT_SEARCH_QUALITY]
+    if index["kind"] == "hnsw":
+        db.session.execute(text("SELECT set_config('hnsw.ef_search', :v, true)"),
+                           {"v": str(max(preset["ef_search"], limit))})
+        if _pgvector_version() >= (0, 8):
+            # 페르소나 필터로 후보가 걸러져도 LIMIT만큼 찾을 때까지 계속 탐색 (정렬 순서 유지)
+            db.session.execute(text("SELECT set_config('hnsw.iterative_scan', 'strict_order', true)"))
+    else:
+        lists = int(index["options"].get("lists", 100) or 100)
+        probes = min(lists, max(1, math.ceil(lists * preset["probes_ratio"])))
+        db.session.execute(text("SELECT set_config('ivfflat.probes', :v, true)"), {"v": str(probes)})
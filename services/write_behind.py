@@ -0,0 +1,381 @@
+"""
+채팅 부수 쓰기(write-behind) 큐
+
+채팅 한 턴마다 요청 경로에서 동기로 처리하던 쓰기 작업을 큐에 넣고,
+백그라운드 플러셔가 짧은 주기(WRITE_BEHIND_FLUSH_MS)로 모아 한 트랜잭션에 반영합니다.
+
+작업 종류:
+  - message:       Message INSERT (사용자 질문 / AI 답변)
+  - relink_files:  ChatFile.session_id 재연결
+  - alert_check:   조기 개입 알림 감지 (커밋 이후 실행)
+  - summary:       세션 롤링 요약 예약 (커밋 이후 실행 → 방금 저장된 답변까지 요약 대상)
+  - usage:         토큰 사용량 원장 INSERT + 일별 집계 UPSERT (services.usage_ledger)
+
+보장 수준:
+  - 배치 커밋이 실패하면 작업을 하나씩 다시 시도하고, 실패한 작업은 재시도 횟수를 올려 다시 큐에 넣는다
+    (at-least-once). 재전송된 message는 write_key로 이미 저장된 행을 건너뛰어 중복 저장을 막는다.
+  - 재시도(MAX_ATTEMPTS)를 다 써도 버리지 않는다. Redis 보류 리스트(없으면 프로세스 메모리)로 옮기고
+    DEAD_LETTER_RETRY_SECONDS마다 다시 시도한다 (DB 장애가 1분보다 길어도 유실 없음).
+  - 메모리 버퍼(WRITE_BEHIND_BUFFER)가 가득 차면 Redis 리스트로 넘기고, Redis도 없으면 호출자 쪽에서 즉시 저장한다.
+  - 프로세스 종료 시(atexit) 버퍼와 백오프 대기 중인 작업까지 모두 반영하고,
+    그래도 실패한 작업은 Redis 보류 리스트에 남긴다.
+"""
+
+import atexit
+import datetime
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+from sqlalchemy import insert
+
+from extensions import db
+from models import ChatFile, Message
+from services.cache_utils import get_redis_client
+
+WRITE_BEHIND_FLUSH_MS = int(os.getenv("WRITE_BEHIND_FLUSH_MS", "100"))
+WRITE_BEHIND_BATCH = int(os.getenv("WRITE_BEHIND_BATCH", "200"))
+WRITE_BEHIND_BUFFER = int(os.getenv("WRITE_BEHIND_BUFFER", "5000"))
+MAX_ATTEMPTS = 6  # 백오프 합계 약 1분
+DEAD_LETTER_RETRY_SECONDS = float(os.getenv("WRITE_BEHIND_DEAD_LETTER_RETRY_SECONDS", "300"))
+
+_OVERFLOW_KEY = "write_behind:overflow"
+_DEAD_LETTER_KEY = "write_behind:dead_letter"   # 재시도를 다 쓴 작업 (워커 간 공유, 만료 없음)
+_OVERFLOW_CHECK_INTERVAL = 5.0   # 다른 워커가 넘긴 작업도 주기적으로 가져감
+_DB_OPS = ("message", "relink_files", "usage")
+
+
+def _now_iso():
+    return datetime.datetime.utcnow().isoformat()
+
+
+class WriteBehindQueue:
+    """프로세스당 하나의 버퍼와 플러셔 스레드(gevent 환경에서는 그린렛)"""
+
+    def __init__(self):
+        self._app = None
+        self._buffer = deque()
+        self._cond = threading.Condition()
+        self._pid = None
+        self._overflow_pending = False
+        self._pending_retries = {}   # id(op) -> (Timer, op): 백오프 대기 중인 작업 (종료 시 flush가 회수)
+        self._parked = []            # Redis가 없을 때의 보류 작업
+        self._closing = False
+        self.stats = {"enqueued": 0, "flushed": 0, "batches": 0, "retries": 0, "dropped": 0, "overflowed": 0,
+                      "parked": 0}
+
+    def init_app(self, app):
+        self._app = app
+        atexit.register(self.flush)
+
+    # ------------------------------------------------------------------
+    # 적재
+    # ------------------------------------------------------------------
+
+    def enqueue(self, op):
+        op.setdefault("attempts", 0)
+        self._ensure_worker()
+        with self._cond:
+            if len(self._buffer) < WRITE_BEHIND_BUFFER:
+                self._buffer.append(op)
+                self.stats["enqueued"] += 1
+                self._cond.notify()
+                return
+        if self._push_overflow(op):
+            return
+        # 버퍼도 Redis도 쓸 수 없으면 호출자 쪽에서 즉시 저장 (유실 방지)
+        print("⚠️ write-behind 버퍼 초과, 동기 저장으로 전환")
+        self._apply(self._with_context, [op])
+
+    def _push_overflow(self, op):
+        client = get_redis_client()
+        if client is None:
+            return False
+        try:
+            client.rpush(_OVERFLOW_KEY, json.dumps(op))
+            self.stats["overflowed"] += 1
+            self._overflow_pending = True
+            return True
+        except Exception as e:
+            print(f"⚠️ write-behind Redis 오버플로 실패: {e}")
+            return False
+
+    def _pop_overflow(self, limit, key=_OVERFLOW_KEY):
+        client = get_redis_client()
+        if client is None:
+            return []
+        try:
+            raw = client.lpop(key, limit) or []
+        except Exception as e:
+            print(f"⚠️ write-behind Redis 오버플로 조회 실패: {e}")
+            return []
+        return [json.loads(r) for r in raw]
+
+    def _park(self, op):
+        """재시도를 다 쓴 작업 보류 (Redis 보류 리스트 → 없으면 프로세스 메모리)"""
+        self.stats["parked"] += 1
+        client = get_redis_client()
+        if client is not None:
+            try:
+                client.rpush(_DEAD_LETTER_KEY, json.dumps(op))
+                print(f"🚨 write-behind 작업 보류 (재시도 {op['attempts']}회 초과, {DEAD_LETTER_RETRY_SECONDS:.0f}초 후 재시도)")
+                return
+            except Exception as e:
+                print(f"⚠️ write-behind Redis 보류 실패: {e}")
+        if self._closing:
+            # 종료 중이고 Redis도 없으면 남길 곳이 없다 → 복구용으로 전체 내용을 로그에 남긴다
+            self.stats["dropped"] += 1
+            print(f"🚨 write-behind 작업 저장 실패 (종료 중): {json.dumps(op, ensure_ascii=False)}")
+            return
+        with self._cond:
+            self._parked.append(op)
+
+    def _take_parked(self, limit):
+        """보류 작업을 한 번 더 시도하도록 꺼냄 (한 번 더 실패하면 다시 보류)"""
+        with self._cond:
+            ops, self._parked = self._parked[:limit], self._parked[limit:]
+        if len(ops) < limit:
+            ops.extend(self._pop_overflow(limit - len(ops), key=_DEAD_LETTER_KEY))
+        for op in ops:
+            op["attempts"] = MAX_ATTEMPTS - 1
+        return ops
+
+    # ------------------------------------------------------------------
+    # 플러시
+    # ------------------------------------------------------------------
+
+    def _ensure_worker(self):
+        # gunicorn fork 이후 워커 프로세스마다 플러셔를 새로 띄운다
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="write-behind", daemon=True).start()
+
+    def _drain(self, limit):
+        with self._cond:
+            batch = []
+            while self._buffer and len(batch) < limit:
+                batch.append(self._buffer.popleft())
+            return batch
+
+    def _run(self):
+        last_overflow_check = time.monotonic()
+        last_dead_letter_check = time.monotonic()
+        while True:
+            with self._cond:
+                if not self._buffer:
+                    self._cond.wait(timeout=1.0)
+                has_work = bool(self._buffer)
+            if has_work:
+                # 짧은 시간 창 동안 들어오는 작업을 모아 한 번에 커밋
+                time.sleep(WRITE_BEHIND_FLUSH_MS / 1000.0)
+
+            batch = self._drain(WRITE_BEHIND_BATCH)
+            now = time.monotonic()
+            if len(batch) < WRITE_BEHIND_BATCH and (
+                self._overflow_pending or now - last_overflow_check > _OVERFLOW_CHECK_INTERVAL
+            ):
+                last_overflow_check = now
+                overflow = self._pop_overflow(WRITE_BEHIND_BATCH - len(batch))
+                self._overflow_pending = bool(overflow)
+                batch.extend(overflow)
+            if len(batch) < WRITE_BEHIND_BATCH and now - last_dead_letter_check > DEAD_LETTER_RETRY_SECONDS:
+                last_dead_letter_check = now
+                batch.extend(self._take_parked(WRITE_BEHIND_BATCH - len(batch)))
+
+            if batch:
+                try:
+                    self._apply(self._with_context, batch)
+                except Exception as e:
+                    print(f"⚠️ write-behind 플러시 오류: {e}")
+
+    def flush(self):
+        """
+        버퍼와 백오프 대기 중인 작업을 현재 스레드에서 모두 반영 (종료 시/테스트용).
+        이때 실패한 작업은 다시 기다리지 않고 보류 리스트로 옮긴다.
+        """
+        if self._app is None:
+            return
+        self._closing = True
+        try:
+            with self._cond:
+                pending = list(self._pending_retries.values())
+                self._pending_retries.clear()
+                for timer, op in pending:
+                    timer.cancel()
+                    self._buffer.append(op)
+                # 프로세스 메모리에 보류된 작업도 마지막으로 한 번 더 시도
+                self._buffer.extend(self._parked)
+                self._parked = []
+            while True:
+                batch = self._drain(WRITE_BEHIND_BATCH)
+                if not batch:
+                    return
+                self._apply(self._with_context, batch)
+        finally:
+            self._closing = False
+
+    def _with_context(self, fn):
+        with self._app.app_context():
+            return fn()
+
+    def _apply(self, run, ops):
+        """작업 묶음을 한 트랜잭션으로 반영, 실패 시 개별 재시도"""
+        db_ops = [op for op in ops if op["type"] in _DB_OPS]
+        post_ops = [op for op in ops if op["type"] not in _DB_OPS]
+
+        if db_ops:
+            if run(lambda: _commit_db_ops(db_ops)):
+                self.stats["batches"] += 1
+                self.stats["flushed"] += len(db_ops)
+            elif len(db_ops) > 1:
+                # 문제 작업 하나가 배치 전체를 막지 않도록 하나씩 다시 시도
+                for op in db_ops:
+                    self._apply(run, [op])
+            else:
+                self._retry(db_ops[0])
+
+        if post_ops:
+            run(lambda: _run_post_ops(post_ops))
+            self.stats["flushed"] += len(post_ops)
+
+    def _retry(self, op):
+        op["attempts"] = op.get("attempts", 0) + 1
+        if op["attempts"] >= MAX_ATTEMPTS or self._closing:
+            self._park(op)
+            return
+        self.stats["retries"] += 1
+        # DB 장애가 길어져도 바로 소진되지 않도록 지수 백오프 후 재적재
+        delay = min(2 ** op["attempts"], 30)
+        timer = threading.Timer(delay, self._requeue, args=(op,))
+        timer.daemon = True
+        with self._cond:
+            self._pending_retries[id(op)] = (timer, op)
+        timer.start()
+
+    def _requeue(self, op):
+        with self._cond:
+            if self._pending_retries.pop(id(op), None) is None:
+                return   # 종료 시 flush가 이미 회수함
+            self._buffer.append(op)
+            self._cond.notify()
+
+
+def _commit_db_ops(ops):
+    try:
+        _write_db_ops(ops)
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️ write-behind 커밋 실패 ({len(ops)}건): {e}")
+        return False
+
+
+def _write_db_ops(ops):
+    messages = [op for op in ops if op["type"] == "message"]
+    if messages:
+        # 재전송분만 이미 저장됐는지 확인 (첫 시도는 조회 없이 바로 INSERT)
+        retried_keys = [op["write_key"] for op in messages if op.get("attempts")]
+        existing = set()
+        if retried_keys:
+            existing = {
+                row[0] for row in db.session.query(Message.write_key)
+                .filter(Message.write_key.in_(retried_keys)).all()
+            }
+        rows = [
+            {
+                "session_id": op["session_id"],
+                "user_id": op["user_id"],
+                "is_user": op["is_user"],
+                "content": op["content"],
+                "image_path": op.get("image_path"),
+                "provider": op.get("provider"),
+                "timestamp": datetime.datetime.fromisoformat(op["timestamp"]),
+                "write_key": op["write_key"],
+            }
+            for op in messages if op["write_key"] not in existing
+        ]
+        if rows:
+            db.session.execute(insert(Message), rows)
+
+    for op in ops:
+        if op["type"] == "relink_files" and op["file_ids"]:
+            ChatFile.query.filter(
+                ChatFile.id.in_(op["file_ids"]),
+                ChatFile.user_id == op["user_id"],
+            ).update({"session_id": op["session_id"]}, synchronize_session=False)
+
+    usage_ops = [op for op in ops if op["type"] == "usage"]
+    if usage_ops:
+        from services.usage_ledger import write_usage_rows
+        write_usage_rows(usage_ops)
+
+
+def _run_post_ops(ops):
+    for op in ops:
+        try:
+            if op["type"] == "alert_check":
+                from services.alert_service import check_and_create_alerts
+                check_and_create_alerts(op["user_id"], op["session_id"], op["role_key"], op["content"])
+            elif op["type"] == "summary":
+                from services.history_service import request_session_summary
+                request_session_summary(op["session_id"], op["token_budget"])
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ write-behind 후처리 실패 ({op['type']}): {e}")
+
+
+write_behind = WriteBehindQueue()
+
+
+def enqueue_message(session_id, user_id, is_user, content, provider=None, image_path=None):
+    """Message INSERT 예약 (timestamp는 적재 시점으로 고정해 대화 순서를 보존)"""
+    write_behind.enqueue({
+        "type": "message",
+        "write_key": uuid.uuid4().hex,
+        "session_id": session_id,
+        "user_id": user_id,
+        "is_user": is_user,
+        "content": content,
+        "provider": provider,
+        "image_path": image_path,
+        "timestamp": _now_iso(),
+    })
+
+
+def enqueue_file_relink(file_ids, session_id, user_id):
+    """업로드 파일을 세션에 연결 (소유자 파일만)"""
+    if file_ids:
+        write_behind.enqueue({
+            "type": "relink_files",
+            "file_ids": list(file_ids),
+            "session_id": session_id,
+            "user_id": user_id,
+        })
+
+
+def enqueue_alert_check(user_id, session_id, role_key, content):
+    """사용자 메시지 저장 이후 조기 개입 알림 감지"""
+    write_behind.enqueue({
+        "type": "alert_check",
+        "user_id": user_id,
+        "session_id": session_id,
+        "role_key": role_key,
+        "content": content,
+    })
+
+
+def enqueue_session_summary(session_id, token_budget):
+    """답변 저장 이후 세션 롤링 요약 예약"""
+    write_behind.enqueue({
+        "type": "summary",
+        "session_id": session_id,
+        "token_budget": token_budget,
+    })
@@ -79,6 +79,52 @@ window.App.registerModule((ctx) => {
         }
     }
 
+    /**
+     * SSE 응답 본문을 읽어 data 이벤트마다 콜백을 호출한다.
+     * id 줄은 Last-Event-ID 재개용으로 streamState.lastEventId에 기록한다.
+     * @param {Response} response - fetch 응답
+     * @param {Function} onData - 파싱된 data 객체를 받는 콜백
+     * @param {Object} streamState - { sessionId, turnId, lastEventId, finished }
+     */
+    async function readSseStream(response, onData, streamState) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder("utf-8");
+        let buffer = "";
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+
+            // 네트워크 청크 경계에서 줄이 잘릴 수 있으므로 마지막 미완성 줄은 버퍼에 남긴다
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+
+            for (const line of lines) {
+                if (line.startsWith('id: ')) {
+                    streamState.lastEventId = line.substring(4).trim();
+                } else if (line.startsWith('data: ')) {
+                    let data;
+                    try {
+                        data = JSON.parse(line.substring(6));
+                    } catch (err) {
+                        console.error("SSE parse error", err, line);
+                        continue;
+                    }
+                    if (data.turn_id) {
+                        streamState.turnId = data.turn_id;
+                        streamState.sessionId = data.session_id;
+                    }
+                    if (data.done || data.error) {
+                        streamState.finished = true;
+                    }
+                    // 렌더링 오류는 파싱 오류로 삼키지 않고 호출자에게 전달
+                    onData(data);
+                }
+            }
+        }
+    }
+
     /**
      * 메시지를 서버로 전송하고 스트리밍 응답을 렌더링한다.
      * @param {string} message - 전송할 메시지
@@ -125,7 +171,9 @@ window.App.registerModule((ctx) => {
             if (!response.ok) {
                 let errorMessage = `서버 오류 (${response.status})`;
                 try {
-                    const errorData = await response.json();
+                    // 사용 한도 초과(429)는 SSE 형식 한 줄로 온다
+                    const body = await response.text();
+                    const errorData = JSON.parse(body.startsWith('data: ') ? body.slice(6) : body);
                     if (errorData.error) {
                         errorMessage = errorData.error;
                     }
@@ -133,75 +181,114 @@ window.App.registerModule((ctx) => {
                 throw new Error(errorMessage);
             }
 
-            // 응답 스트리밍 읽기
-            const reader = response.body.getReader();
-            const decoder = new TextDecoder("utf-8");
+            // 응답 스트리밍 읽기 (연결이 끊기면 turn_id + Last-Event-ID로 이어받기)
             let accumulatedText = "";
             let isFirstChunk = true;
+            const streamState = { sessionId: null, turnId: null, lastEventId: null, finished: false };
+
+            const handleData = (data) => {
+                // 서버 오류(대기 시간 초과, 공급사 장애 등)는 스트림 종료 이벤트 → 말풍선에 표시하고 마무리
+                if (data.error) {
+                    const errorP = document.createElement('p');
+                    errorP.style.color = 'red';
+                    errorP.textContent = `🚫 오류가 발생했습니다: ${data.error}`;
+                    if (accumulatedText) {
+                        contentDiv.innerHTML = ctx.messages.processCodeBlocksInHtml(window.marked.parse(accumulatedText));
+                    } else {
+                        contentDiv.innerHTML = "";
+                    }
+                    contentDiv.appendChild(errorP);
+                    return;
+                }
 
-            while (true) {
-                const { done, value } = await reader.read();
-                if (done) break;
 
-                const chunkString = decoder.decode(value, { stream: true });
-                const lines = chunkString.split('\n');
+                // 공급사 동시 요청 한도 초과로 대기 중 → 순번 표시
+                if (data.queued && isFirstChunk) {
+                    contentDiv.innerHTML = `
+                        <div style="display: flex; align-items: center; gap: 4px;">
+                            <div class="loading-spinner"></div>
+                            <span>요청이 많아 대기 중입니다... (${data.position}번째)</span>
+                        </div>
+                    `;
+                }
 
-                for (const line of lines) {
-                    if (line.startsWith('data: ')) {
-                        try {
-                            const data = JSON.parse(line.substring(6));
+                // 선택한 공급사 장애 감지 → 다른 허용 모델로 자동 전환됨을 표시
+                if (data.failover && isFirstChunk) {
+                    contentDiv.innerHTML = `
+                        <div style="display: flex; align-items: center; gap: 4px;">
+                            <div class="loading-spinner"></div>
+                            <span>선택한 AI가 응답하지 않아 다른 모델(${data.model_id})로 전환 중입니다...</span>
+                        </div>
+                    `;
+                }
 
-                            if (data.error) {
-                                throw new Error(data.error);
-                            }
-                            
-                            // 스트리밍 문자열 이어붙이기
-                            if (data.chunk !== undefined) {
-                                if (isFirstChunk) {
-                                    contentDiv.innerHTML = "";
-                                    isFirstChunk = false;
-                                }
-                                accumulatedText += data.chunk;
-                                // 스트리밍 도중엔 단순 text 변환 (최종 완료 시 마크다운 변환)
-                                contentDiv.innerText = accumulatedText;
-                                dom.chatWindow.scrollTop = dom.chatWindow.scrollHeight;
-                            }
+                // 스트리밍 문자열 이어붙이기
+                if (data.chunk !== undefined) {
+                    if (isFirstChunk) {
+                        contentDiv.innerHTML = "";
+                        isFirstChunk = false;
+                    }
+                    accumulatedText += data.chunk;
+                    // 스트리밍 도중엔 단순 text 변환 (최종 완료 시 마크다운 변환)
+                    contentDiv.innerText = accumulatedText;
+                    dom.chatWindow.scrollTop = dom.chatWindow.scrollHeight;
+                }
 
-                            if (data.session_id && !state.currentSessionId) {
-                                state.currentSessionId = data.session_id;
-                                ctx.sessions.fetchHistory(selectedModel);
-                            }
+                if (data.session_id && !state.currentSessionId) {
+                    state.currentSessionId = data.session_id;
+                    ctx.sessions.fetchHistory(selectedModel);
+                }
 
-                            // 이미지 생성 백그라운드 태스크 시작됨 → 폴링 시작
-                            if (data.image_pending && data.task_id) {
-                                contentDiv.innerHTML = "🎨 이미지 생성 중...";
-                                pollImageTask(data.task_id, contentDiv, data.session_id);
-                            }
+                // 이미지 생성 백그라운드 태스크 시작됨 → 폴링 시작
+                if (data.image_pending && data.task_id) {
+                    contentDiv.innerHTML = "🎨 이미지 생성 중...";
+                    pollImageTask(data.task_id, contentDiv, data.session_id);
+                }
 
-                            // 스트리밍 종료 처리
-                            if (data.done) {
-                                // 마크다운 렌더링 호출
-                                const rawHtml = window.marked.parse(accumulatedText);
-                                contentDiv.innerHTML = ctx.messages.processCodeBlocksInHtml(rawHtml);
-                                
-                                // 코드 추출 로직 실행
-                                if (state.currentSessionId) {
-                                    ctx.messages.extractCodeAndSaveFile(accumulatedText, state.currentSessionId);
-                                    if (accumulatedText.includes("\`\`\`")) {
-                                        const codeBlockRegex = /\`\`\`(\\w+)?\\s*([\\s\\S]*?)\`\`\`/;
-                                        const match = codeBlockRegex.exec(accumulatedText);
-                                        if (match) {
-                                            ctx.canvas.openCanvas(match[2].trim(), match[1] || 'txt');
-                                        }
-                                    }
-                                }
+                // 스트리밍 종료 처리
+                if (data.done) {
+                    // 마크다운 렌더링 호출
+                    const rawHtml = window.marked.parse(accumulatedText);
+                    contentDiv.innerHTML = ctx.messages.processCodeBlocksInHtml(rawHtml);
+                    
+                    // 코드 추출 로직 실행
+                    if (state.currentSessionId) {
+                        ctx.messages.extractCodeAndSaveFile(accumulatedText, state.currentSessionId);
+                        if (accumulatedText.includes("\`\`\`")) {
+                            const codeBlockRegex = /\`\`\`(\\w+)?\\s*([\\s\\S]*?)\`\`\`/;
+                            const match = codeBlockRegex.exec(accumulatedText);
+                            if (match) {
+                                ctx.canvas.openCanvas(match[2].trim(), match[1] || 'txt');
                             }
-
-                        } catch (err) {
-                            console.error("SSE parse error", err, line);
                         }
                     }
                 }
+            };
+
+            try {
+                await readSseStream(response, handleData, streamState);
+            } catch (readErr) {
+                console.warn('SSE connection lost', readErr);
+            }
+
+            // 응답 도중 연결이 끊긴 경우: 서버는 계속 생성 중이므로 마지막 이벤트 이후부터 이어받는다
+            let resumeAttempts = 0;
+            while (!streamState.finished && streamState.turnId && resumeAttempts < 5) {
+                resumeAttempts++;
+                await new Promise(r => setTimeout(r, 1000 * resumeAttempts));
+                try {
+                    const headers = {};
+                    if (streamState.lastEventId) headers['Last-Event-ID'] = streamState.lastEventId;
+                    const resumeRes = await fetch(`/api/chat/stream/${streamState.sessionId}/${streamState.turnId}`, { headers });
+                    if (resumeRes.status === 403 || resumeRes.status === 404) break;
+                    if (!resumeRes.ok) continue;
+                    await readSseStream(resumeRes, handleData, streamState);
+                } catch (resumeErr) {
+                    console.warn('SSE resume failed', resumeErr);
+                }
+            }
+            if (!streamState.finished && streamState.turnId) {
+                throw new Error("연결이 끊어졌습니다. 대화 목록을 새로고침하면 저장된 답변을 볼 수 있습니다.");
             }
 
         } catch (error) {
@@ -282,6 +282,7 @@ async function loadPersonaDetails(persona) {
         _renderOrderList(provider, lst);
     }
     document.getElementById('maxTokens').value = persona.max_tokens || 4096;
+    document.getElementById('historyTokenBudget').value = persona.history_token_budget || 6000;
 
     // RAG 설정
     document.getElementById('useRag').checked = persona.use_rag || false;
@@ -293,6 +294,11 @@ async function loadPersonaDetails(persona) {
     document.getElementById('ragMaxK').value = persona.rag_max_k || 7;
     document.getElementById('ragSimilarityThreshold').value = persona.rag_similarity_threshold || 0.5;
     document.getElementById('ragGapThreshold').value = persona.rag_gap_threshold || 0.1;
+    document.getElementById('ragSearchQuality').value = persona.rag_search_quality || 'balanced';
+
+    // 시맨틱 답변 캐시
+    document.getElementById('semanticCacheEnabled').checked = persona.semantic_cache_enabled || false;
+    document.getElementById('semanticCacheThreshold').value = persona.semantic_cache_threshold || 0.95;
 
     // RAG 설정 표시/숨김
     toggleRagSettings();
@@ -384,7 +390,7 @@ function toggleRagSettings() {
 function toggleRagStrategySettings() {
     const strategy = document.getElementById('retrievalStrategy').value;
 
-    if (strategy === 'soft_topk') {
+    if (strategy === 'soft_topk' || strategy === 'hybrid') {
         document.getElementById('softTopkSettings').style.display = 'block';
         document.getElementById('gapBasedSettings').style.display = 'none';
     } else if (strategy === 'gap_based') {
@@ -437,6 +443,7 @@ function createNewPersona() {
         if (ol) { if (ol._sortable) ol._sortable.destroy(); ol.innerHTML = ''; }
     }
     document.getElementById('maxTokens').value = '4096';
+    document.getElementById('historyTokenBudget').value = '6000';
 
     document.getElementById('useRag').checked = false;
     document.getElementById('retrievalStrategy').value = 'soft_topk';
@@ -444,6 +451,9 @@ function createNewPersona() {
     document.getElementById('ragMaxK').value = '7';
     document.getElementById('ragSimilarityThreshold').value = '0.5';
     document.getElementById('ragGapThreshold').value = '0.1';
+    document.getElementById('ragSearchQuality').value = 'balanced';
+    document.getElementById('semanticCacheEnabled').checked = false;
+    document.getElementById('semanticCacheThreshold').value = '0.95';
 
     toggleRagSettings();
     toggleRagStrategySettings();
@@ -517,6 +527,7 @@ async function savePersona() {
             };
         })(),
         max_tokens: parseInt(document.getElementById('maxTokens').value),
+        history_token_budget: parseInt(document.getElementById('historyTokenBudget').value),
 
         use_rag: document.getElementById('useRag').checked,
         chunk_strategy: document.getElementById('chunkStrategy').value,
@@ -527,6 +538,10 @@ async function savePersona() {
         rag_max_k: parseInt(document.getElementById('ragMaxK').value),
         rag_similarity_threshold: parseFloat(document.getElementById('ragSimilarityThreshold').value),
         rag_gap_threshold: parseFloat(document.getElementById('ragGapThreshold').value),
+        rag_search_quality: document.getElementById('ragSearchQuality').value,
+
+        semantic_cache_enabled: document.getElementById('semanticCacheEnabled').checked,
+        semantic_cache_threshold: parseFloat(document.getElementById('semanticCacheThreshold').value),
 
         allow_user: document.getElementById('allowUser').checked,
         allow_teacher: document.getElementById('allowTeacher').checked,
@@ -1582,6 +1597,36 @@ async function deleteKnowledgeDocument(docId) {
     }
 }
 
+/**
+ * 벡터 인덱스 상태 한 줄 요약
+ */
+function formatVectorIndexStatus(index) {
+    if (index && index.backend === 'local') {
+        const sizeMB = ((index.size_bytes || 0) / 1024 / 1024).toFixed(1);
+        return `벡터 인덱스: 로컬 파일 (${index.dtype}, 청크 ${index.rows || 0}개, ${sizeMB} MB)`;
+    }
+    if (!index || index.backend !== 'pgvector') return '';
+    const build = index.build || {};
+    if (build.state === 'building') {
+        const p = index.progress;
+        const pct = p && p.tuples_total ? ` ${Math.round(p.tuples_done / p.tuples_total * 100)}%` : '';
+        return `벡터 인덱스: ${build.kind} 생성 중${pct}`;
+    }
+    const own = index.persona_index;
+    if (!index.kind && !own) {
+        return `벡터 인덱스: 없음 (전체 청크 ${index.rows}개 순차 검색)`;
+    }
+    const sizeMB = (index.size_bytes / 1024 / 1024).toFixed(1);
+    let text = index.kind
+        ? `벡터 인덱스: ${index.kind.toUpperCase()} ${sizeMB} MB • 전체 청크 ${index.rows}개`
+        : `벡터 인덱스: 전체 인덱스 없음 • 전체 청크 ${index.rows}개`;
+    if (!index.valid) text += ' • ⚠️ 무효';
+    if (build.state === 'failed') text += ' • ⚠️ 마지막 재생성 실패';
+    if (index.rebuild_reason) text += ` • 재생성 예정(${index.rebuild_reason})`;
+    if (own) text += ` • 이 페르소나 전용 ${own.kind.toUpperCase()} ${(own.size_bytes / 1024 / 1024).toFixed(1)} MB${own.valid ? '' : ' (⚠️ 무효)'}`;
+    return text;
+}
+
 /**
  * RAG 통계 로드
  */
@@ -1599,6 +1644,7 @@ async function loadKnowledgeStats() {
             document.getElementById('statProcessingDocs').textContent = stats.processing_count;
             document.getElementById('statFailedDocs').textContent = stats.failed_count;
             document.getElementById('statTotalChunks').textContent = stats.chunk_count;
+            document.getElementById('statVectorIndex').textContent = formatVectorIndexStatus(stats.vector_index);
         } else {
             document.getElementById('ragStats').style.display = 'none';
         }
@@ -244,6 +244,7 @@ window.App.registerModule((ctx) => {
             // loadModelConfig(); // 제거됨 - 중복 기능
             loadProviderStatus();
             loadProviderModels();
+            loadQuotas();
         });
     }
     if (dom.adminBackToListBtn) dom.adminBackToListBtn.addEventListener('click', showUserListView);
@@ -266,13 +267,16 @@ window.App.registerModule((ctx) => {
             providers.forEach(p => {
                 const status = statuses[p];
                 const isActive = status === 'active';
+                // degraded: 서킷 브레이커가 장애를 감지해 자동 설정 (복구되면 자동으로 active)
+                const isDegraded = status === 'degraded';
                 tr.innerHTML += `
                     <td>
                         <div class="provider-status-cell">
                             <div class="provider-name">${p.toUpperCase()}</div>
                             <select class="provider-status-select" data-provider="${p}">
                                 <option value="active" ${isActive ? 'selected' : ''}>사용 가능</option>
-                                <option value="restricted" ${!isActive ? 'selected' : ''}>제한하기</option>
+                                ${isDegraded ? '<option value="degraded" selected disabled>장애 감지(자동)</option>' : ''}
+                                <option value="restricted" ${!isActive && !isDegraded ? 'selected' : ''}>제한하기</option>
                             </select>
                         </div>
                     </td>
@@ -294,6 +298,77 @@ window.App.registerModule((ctx) => {
         }
     }
 
+    const QUOTA_SCOPE_LABELS = { user: '사용자', role: '역할', persona: '페르소나' };
+    const QUOTA_FIELDS = ['tokens_day', 'tokens_hour', 'requests_day', 'requests_hour'];
+
+    /**
+     * 사용 한도 설정 테이블을 로드한다.
+     */
+    async function loadQuotas() {
+        const body = document.getElementById('admin-quota-body');
+        if (!body) return;
+        try {
+            const response = await fetch('/api/admin/quotas');
+            if (!response.ok) throw new Error('Failed to fetch quotas');
+            const data = await response.json();
+            body.innerHTML = '';
+            Object.entries(data.quotas).forEach(([scope, entries]) => {
+                Object.entries(entries).forEach(([key, limits]) => {
+                    const tr = document.createElement('tr');
+                    tr.innerHTML = `
+                        <td>${QUOTA_SCOPE_LABELS[scope] || scope}</td>
+                        <td>${key}</td>
+                        ${QUOTA_FIELDS.map(f => `<td>${limits[f] ? limits[f].toLocaleString() : '-'}</td>`).join('')}
+                        <td><button class="btn-secondary">수정</button></td>
+                    `;
+                    // 수정: 아래 입력 행에 현재 값을 채운다
+                    tr.querySelector('button').addEventListener('click', () => {
+                        const form = document.getElementById('admin-quota-form');
+                        form.querySelector('[data-quota-field="scope"]').value = scope;
+                        form.querySelector('[data-quota-field="key"]').value = key;
+                        QUOTA_FIELDS.forEach(f => {
+                            form.querySelector(`[data-quota-field="${f}"]`).value = limits[f] || 0;
+                        });
+                    });
+                    body.appendChild(tr);
+                });
+            });
+            if (!body.children.length) {
+                body.innerHTML = '<tr><td colspan="7">설정된 한도가 없습니다 (무제한).</td></tr>';
+            }
+        } catch (error) {
+            console.error(error);
+            body.innerHTML = '<tr><td colspan="7">로드 실패</td></tr>';
+        }
+    }
+
+    const saveQuotaBtn = document.getElementById('save-quota-btn');
+    if (saveQuotaBtn) {
+        saveQuotaBtn.addEventListener('click', async () => {
+            const form = document.getElementById('admin-quota-form');
+            const payload = {};
+            form.querySelectorAll('[data-quota-field]').forEach(input => {
+                payload[input.dataset.quotaField] = input.value.trim();
+            });
+            try {
+                const response = await fetch('/api/admin/set_quota', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify(payload)
+                });
+                const result = await response.json();
+                if (!response.ok) {
+                    alert('한도 저장 실패: ' + (result.error || response.status));
+                    return;
+                }
+                loadQuotas();
+            } catch (error) {
+                console.error(error);
+                alert('서버 오류');
+            }
+        });
+    }
+
     /**
      * 공급사 상태를 토글한다(서버 저장).
      * @param {string} provider - 공급사 키
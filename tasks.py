@@ -8,13 +8,13 @@ Celery 백그라운드 작업 시스템
 import os
 import base64
 import datetime
-import requests as http_requests
 from celery import Celery
 from flask import Flask
 
 from services.file_service import extract_text_from_file
 from services.chunking_service import chunk_text
 from services.embedding_service import generate_embeddings_batch
+from services.http_transport import LONG_TIMEOUT, get_http_client
 
 # Celery 앱 초기화 (CELERY_BROKER_URL 미설정 시 로컬 메모리 브로커 사용)
 _celery_broker = os.getenv('CELERY_BROKER_URL')
@@ -64,6 +64,48 @@ def init_celery(app: Flask):
     return celery
 
 
+def _select_cheap_model_id():
+    """요약 등 보조 작업용 저렴하고 빠른 모델 선택 (Gemini 2.5 Flash 우선, 없으면 gpt-4.1-mini)"""
+    if os.getenv("GOOGLE_API_KEY"):
+        return "gemini-2.5-flash"
+    if os.getenv("OPENAI_API_KEY"):
+        return "gpt-4.1-mini"
+    return "grok-4-1-fast-reasoning"
+
+
+def _record_task_usage(feature, model_id, usage, user_id, session_id, prompt_text, output_text):
+    """백그라운드 작업의 LLM 사용량을 원장에 기록 (세션 페르소나 기준, usage 미수신 시 추정치)"""
+    from extensions import db
+    from models import ChatSession
+    from services.history_service import count_tokens
+    from services.usage_ledger import record_usage
+
+    try:
+        role_key = db.session.query(ChatSession.role_key).filter_by(id=session_id).scalar()
+        record_usage(
+            feature, usage.get("model_id", model_id), usage, user_id=user_id, role_key=role_key,
+            estimated_input=count_tokens(prompt_text), estimated_output=count_tokens(output_text),
+        )
+    except Exception as e:
+        print(f"⚠️ 사용량 기록 실패 ({feature}): {e}")
+
+
+def _settle_task_quota(reservation, usage, prompt_text, output_text):
+    """라우트가 잡아 둔 사용 한도 예약을 프롬프트 변환의 실제 토큰으로 정산 (usage 미수신 시 추정치)"""
+    from services.ai_service import is_error_response
+    from services.history_service import count_tokens
+
+    prompt_tokens = (
+        usage.get("input_tokens", 0)
+        + usage.get("cache_creation_input_tokens", 0)
+        + usage.get("cache_read_input_tokens", 0)
+    )
+    output_tokens = usage.get("output_tokens", 0)
+    if not usage and not is_error_response(output_text):
+        prompt_tokens, output_tokens = count_tokens(prompt_text), count_tokens(output_text)
+    reservation.settle(prompt_tokens + output_tokens)
+
+
 @celery.task(bind=True, max_retries=3)
 def process_document_async(self, document_id: int):
     """
@@ -91,7 +133,7 @@ def process_document_async(self, document_id: int):
         Exception: 처리 실패 시 재시도 또는 에러 저장
     """
     from extensions import db
-    from models import KnowledgeDocument, DocumentChunk, PersonaKnowledgeBase
+    from models import KnowledgeDocument, DocumentChunk, PersonaKnowledgeBase, PersonaDefinition
 
     start_time = datetime.datetime.utcnow()
 
@@ -101,8 +143,11 @@ def process_document_async(self, document_id: int):
         raise ValueError(f"문서를 찾을 수 없습니다: document_id={document_id}")
 
     try:
-        # 상태 업데이트: processing
+        # 상태 업데이트: processing (재처리 중에는 기존 청크를 검색에서 제외)
         doc.processing_status = 'processing'
+        DocumentChunk.query.filter_by(document_id=doc.id).update(
+            {DocumentChunk.is_searchable: False}, synchronize_session=False
+        )
         db.session.commit()
 
         print(f"📄 문서 처리 시작: {doc.filename} (ID: {document_id})")
@@ -129,6 +174,9 @@ def process_document_async(self, document_id: int):
             raise ValueError(f"지식 베이스를 찾을 수 없습니다: {doc.knowledge_base_id}")
 
         print(f"  ├─ 청킹 시작 (전략: {kb.chunk_strategy}, 크기: {kb.chunk_size}, 중복: {kb.chunk_overlap})")
+        persona = db.session.get(PersonaDefinition, kb.persona_id)
+        kb_role_key = persona.role_key if persona else None
+        uploader_id = doc.uploaded_by
         chunks = chunk_text(
             extracted_text,
             strategy=kb.chunk_strategy,
@@ -144,6 +192,8 @@ def process_document_async(self, document_id: int):
         # 3.5. Smart Indexing (Contextual Retrieval) - 청크별 문맥 요약 생성
         print(f"  ├─ 청크별 문맥 요약(Context) 생성 중...")
         from services.ai_service import generate_ai_response
+        from services.history_service import count_tokens
+        from services.usage_ledger import record_usage
         
         # 전체 문서의 앞부분(최대 1000자)을 사용하여 문서의 전반적인 맥락을 파악
         document_context = extracted_text[:1000]
@@ -158,21 +208,28 @@ def process_document_async(self, document_id: int):
         )
         
         chunk_summaries = []
-        # 빠르고 저렴한 모델 사용 (Gemini 2.5 Flash 우선, 없으면 gpt-4.1-mini)
-        summary_model_id = "gemini-2.5-flash" if os.getenv("GOOGLE_API_KEY") else ("gpt-4.1-mini" if os.getenv("OPENAI_API_KEY") else "grok-4-1-fast-reasoning")
+        # 빠르고 저렴한 모델 사용
+        summary_model_id = _select_cheap_model_id()
         
         from concurrent.futures import ThreadPoolExecutor
 
         def _summarize_one(idx_chunk):
             i, chunk_content = idx_chunk
             user_prompt = f"[전체 문서 맥락 (앞부분)]\n{document_context}\n\n[현재 청크]\n{chunk_content}"
+            usage = {}
             try:
                 summary = generate_ai_response(
                     model_id=summary_model_id,
                     system_prompt=system_prompt,
                     messages=[{"role": "user", "content": user_prompt}],
                     max_tokens=150,
-                    upload_folder=""
+                    upload_folder="",
+                    usage=usage,
+                )
+                record_usage(
+                    "rag_summary", usage.get("model_id", summary_model_id), usage,
+                    user_id=uploader_id, role_key=kb_role_key,
+                    estimated_input=count_tokens(system_prompt + user_prompt), estimated_output=count_tokens(summary),
                 )
                 return summary.strip()
             except Exception as e:
@@ -185,7 +242,7 @@ def process_document_async(self, document_id: int):
 
         # 4. 임베딩 생성 (배치) - 원본 텍스트가 아닌 '요약본 + 원본 텍스트'를 함께 임베딩
         print(f"  ├─ 임베딩 생성 중... (OpenAI API 호출)")
-        embeddings = generate_embeddings_batch(chunk_summaries)
+        embeddings = generate_embeddings_batch(chunk_summaries, role_key=kb_role_key)
 
         if len(embeddings) != len(chunks):
             raise ValueError(f"임베딩 수 불일치: {len(embeddings)} != {len(chunks)}")
@@ -196,9 +253,11 @@ def process_document_async(self, document_id: int):
         print(f"  ├─ DB 저장 중...")
 
         # 기존 청크 삭제 (재처리 시)
+        old_chunk_ids = [row[0] for row in db.session.query(DocumentChunk.id).filter_by(document_id=doc.id)]
         DocumentChunk.query.filter_by(document_id=doc.id).delete()
 
         # 새 청크 저장
+        new_chunks = []
         for i, (chunk_content, summary, embedding) in enumerate(zip(chunks, chunk_summaries, embeddings)):
             chunk = DocumentChunk(
                 document_id=doc.id,
@@ -206,9 +265,13 @@ def process_document_async(self, document_id: int):
                 content=chunk_content,
                 content_length=len(chunk_content),
                 embedding=embedding,
-                chunk_metadata={"context_summary": summary}
+                chunk_metadata={"context_summary": summary},
+                knowledge_base_id=kb.id,
+                persona_id=kb.persona_id,
+                is_searchable=bool(kb.is_active)
             )
             db.session.add(chunk)
+            new_chunks.append(chunk)
 
         # 문서 상태 업데이트: completed
         doc.chunk_count = len(chunks)
@@ -218,12 +281,25 @@ def process_document_async(self, document_id: int):
 
         db.session.commit()
 
+        # SQLite 배포: 로컬 벡터 저장소에 반영 (이전 청크 압축 제거 + 새 청크 추가)
+        from services.local_vector_store import append as append_local, local_store_enabled, remove as remove_local
+        if local_store_enabled():
+            remove_local(kb.persona_id, old_chunk_ids)
+            append_local(kb.persona_id, [c.id for c in new_chunks], embeddings)
+
+        # 이전 자료에 근거한 시맨틱 캐시 답변 삭제 (네임스페이스의 문서 버전도 바뀜)
+        from services.semantic_cache import purge_semantic_cache
+        purge_semantic_cache(kb.persona.role_key)
+
         # 처리 시간 계산
         end_time = datetime.datetime.utcnow()
         processing_time = (end_time - start_time).total_seconds()
 
         print(f"  └─ ✅ 처리 완료! (소요 시간: {processing_time:.2f}초)")
 
+        # 청크 수가 늘었으므로 ANN 인덱스 생성/재생성 필요 여부 점검
+        maintain_vector_index.delay()
+
         return {
             "success": True,
             "document_id": document_id,
@@ -259,10 +335,12 @@ def cleanup_old_failed_documents():
     - pending 상태로 24시간 이상 방치된 문서 failed로 변경
     """
     from extensions import db
-    from models import KnowledgeDocument
+    from models import DocumentChunk, KnowledgeDocument
+    from services.local_vector_store import local_store_enabled, remove as remove_local
 
     now = datetime.datetime.utcnow()
     deleted_count = 0
+    removed_chunks = {}   # persona_id -> 문서와 함께 CASCADE 삭제되는 청크 ID (로컬 벡터 저장소 정리용)
 
     try:
         # 1. 7일 이상 지난 failed 문서 삭제
@@ -272,6 +350,13 @@ def cleanup_old_failed_documents():
             KnowledgeDocument.uploaded_at < cutoff_failed
         ).all()
 
+        if old_failed_docs and local_store_enabled():
+            rows = db.session.query(DocumentChunk.persona_id, DocumentChunk.id).filter(
+                DocumentChunk.document_id.in_([doc.id for doc in old_failed_docs])
+            )
+            for persona_id, chunk_id in rows:
+                removed_chunks.setdefault(persona_id, []).append(chunk_id)
+
         for doc in old_failed_docs:
             # 파일도 함께 삭제
             if os.path.exists(doc.file_path):
@@ -296,6 +381,9 @@ def cleanup_old_failed_documents():
 
         db.session.commit()
 
+        for persona_id, chunk_ids in removed_chunks.items():
+            remove_local(persona_id, chunk_ids)
+
         print(f"🧹 정리 완료: {deleted_count}개 문서 삭제, {len(stuck_docs)}개 문서 failed로 변경")
 
         return {
@@ -345,9 +433,91 @@ def reprocess_failed_documents():
         raise
 
 
+@celery.task
+def rebuild_vector_index_async(kind=None, reason="manual"):
+    """
+    document_chunk.embedding ANN 인덱스 생성/교체 (CREATE INDEX CONCURRENTLY)
+
+    Args:
+        kind: 'hnsw' | 'ivfflat' | 'none' (None이면 VECTOR_INDEX_KIND)
+        reason: 기록용 사유 ('manual', 'missing', 'grown' 등)
+    """
+    from extensions import cache
+    from services.vector_index import BUILD_LOCK_KEY, build_vector_index
+
+    # 대용량 HNSW 빌드는 수십 분 걸릴 수 있으므로 동시에 하나만 실행
+    if not cache.add(BUILD_LOCK_KEY, 1, timeout=3600):
+        print("⏭️ 벡터 인덱스 생성이 이미 진행 중입니다.")
+        return {"success": False, "error": "이미 진행 중"}
+    try:
+        state = build_vector_index(kind, reason)
+        print(f"🧭 벡터 인덱스 {state['kind']} 생성 완료 ({state['rows']}개 청크, {state['duration_s']}초)")
+        return {"success": True, **state}
+    except Exception as e:
+        print(f"❌ 벡터 인덱스 생성 실패: {e}")
+        return {"success": False, "error": str(e)}
+    finally:
+        cache.delete(BUILD_LOCK_KEY)
+
+
+@celery.task
+def maintain_vector_index():
+    """
+    ANN 인덱스 점검 (주기적 실행 + 문서 처리 완료 시)
+
+    - 청크가 VECTOR_INDEX_MIN_ROWS 이상인데 인덱스가 없거나 무효면 생성
+    - IVFFlat은 lists가 현재 행 수 권장값의 절반 이하로 작아졌으면 재생성
+    - 청크가 VECTOR_INDEX_PERSONA_MIN_ROWS 이상인 페르소나는 부분 인덱스 생성, 삭제된 페르소나 인덱스는 제거
+    """
+    from services.vector_index import get_index_state, persona_index_plan, rebuild_reason
+
+    reason = rebuild_reason()
+    if reason:
+        kind = get_index_state().get("kind")
+        # 관리 기록이 없는 인덱스(마이그레이션 생성)는 기본 종류로 교체
+        rebuild_vector_index_async.delay(
+            kind=kind if kind in ("hnsw", "ivfflat") and reason != "untracked" else None,
+            reason=reason,
+        )
+    plan = persona_index_plan()
+    if plan["build"] or plan["drop"]:
+        build_persona_vector_indexes_async.delay(plan)
+    return {"rebuild_reason": reason, "persona_indexes": plan}
+
+
+@celery.task
+def build_persona_vector_indexes_async(plan):
+    """
+    페르소나별 부분 ANN 인덱스 생성/교체/삭제 (maintain_vector_index가 만든 계획 실행)
+
+    Args:
+        plan: persona_index_plan() 결과 {"build": [...], "drop": [...]}
+    """
+    from extensions import cache
+    from services.vector_index import BUILD_LOCK_KEY, apply_persona_index_plan
+
+    # 전체 인덱스 빌드와 같은 잠금 사용 (같은 테이블의 CONCURRENTLY 빌드는 서로를 기다림)
+    if not cache.add(BUILD_LOCK_KEY, 1, timeout=3600):
+        print("⏭️ 벡터 인덱스 생성이 이미 진행 중입니다. 다음 점검에서 다시 시도합니다.")
+        return {"success": False, "error": "이미 진행 중"}
+    try:
+        result = apply_persona_index_plan(plan)
+        print(f"🧭 페르소나 벡터 인덱스: 생성 {result['built']}, 삭제 {result['dropped']}, 실패 {list(result['failed'])}")
+        return {"success": not result["failed"], **result}
+    except Exception as e:
+        print(f"❌ 페르소나 벡터 인덱스 처리 실패: {e}")
+        return {"success": False, "error": str(e)}
+    finally:
+        cache.delete(BUILD_LOCK_KEY)
+
+
+IMAGE_PROMPT_MAX_TOKENS = 200   # 이미지 생성 프롬프트 변환 응답 길이 (채팅 라우트의 사용 한도 예약에도 사용)
+
+
 @celery.task(bind=True, max_retries=2)
 def generate_image_async(self, session_id, user_id, provider, selected_model_id,
-                          prompt_model_id, system_prompt, user_message, upload_folder):
+                          prompt_model_id, system_prompt, user_message, upload_folder,
+                          quota_reservation=None):
     """
     이미지 생성 백그라운드 작업
 
@@ -360,16 +530,27 @@ def generate_image_async(self, session_id, user_id, provider, selected_model_id,
     from extensions import db
     from models import Message, ChatFile
     from services.ai_service import generate_ai_response
+    from services.quota_service import QuotaReservation
+
+    # 라우트가 잡아 둔 사용 한도 예약 (QuotaReservation.to_payload)
+    reservation = QuotaReservation.from_payload(quota_reservation)
 
     try:
         # 1. 프롬프트 최적화 (텍스트 → 이미지 프롬프트)
+        prompt_usage = {}
         final_prompt = generate_ai_response(
             model_id=prompt_model_id,
             system_prompt=system_prompt or "Convert to English image generation prompt",
             messages=[{"role": "user", "content": user_message}],
-            max_tokens=200,
+            max_tokens=IMAGE_PROMPT_MAX_TOKENS,
             upload_folder=upload_folder,
+            usage=prompt_usage,
         ).strip()
+        _record_task_usage(
+            "image_prompt", prompt_model_id, prompt_usage, user_id, session_id,
+            (system_prompt or "") + user_message, final_prompt,
+        )
+        _settle_task_quota(reservation, prompt_usage, (system_prompt or "") + user_message, final_prompt)
 
         if final_prompt.startswith("⚠️") or "차단" in final_prompt or "Error" in final_prompt:
             final_prompt = user_message
@@ -388,10 +569,10 @@ def generate_image_async(self, session_id, user_id, provider, selected_model_id,
                     "https://generativelanguage.googleapis.com/v1beta/models/"
                     f"imagen-4.0-generate-001:predict?key={os.getenv('GOOGLE_API_KEY')}"
                 )
-                response = http_requests.post(api_url, headers={"Content-Type": "application/json"}, json={
+                response = get_http_client().post(api_url, headers={"Content-Type": "application/json"}, json={
                     "instances": [{"prompt": final_prompt}],
                     "parameters": {"sampleCount": 1, "aspectRatio": "1:1"},
-                })
+                }, timeout=LONG_TIMEOUT)
                 if response.status_code != 200:
                     raise Exception(f"Google API Error ({response.status_code}): {response.text}")
                 result = response.json()
@@ -429,7 +610,7 @@ def generate_image_async(self, session_id, user_id, provider, selected_model_id,
             response = openai_client.images.generate(
                 model="dall-e-3", prompt=final_prompt, size="1024x1024", quality="standard", n=1,
             )
-            img_data = http_requests.get(response.data[0].url).content
+            img_data = get_http_client().get(response.data[0].url, timeout=LONG_TIMEOUT).content
             generated_image_filename = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_dalle.png"
 
         elif provider == "xai":
@@ -438,7 +619,7 @@ def generate_image_async(self, session_id, user_id, provider, selected_model_id,
             if not xai_client:
                 raise ValueError("xAI API Key Missing")
             response = xai_client.images.generate(model=selected_model_id, prompt=final_prompt, n=1)
-            img_data = http_requests.get(response.data[0].url).content
+            img_data = get_http_client().get(response.data[0].url, timeout=LONG_TIMEOUT).content
             generated_image_filename = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_grok.png"
 
         else:
@@ -482,13 +663,22 @@ def generate_image_async(self, session_id, user_id, provider, selected_model_id,
     except Exception as e:
         print(f"Image generation task error: {e}")
         if self.request.retries < self.max_retries:
-            raise self.retry(exc=e, countdown=5)
+            # 정산을 마쳤다면 재시도의 프롬프트 변환 토큰은 예약 없이 실제 사용량만 더한다
+            raise self.retry(exc=e, countdown=5, kwargs={
+                **self.request.kwargs, "quota_reservation": reservation.to_payload(),
+            })
+        # 프롬프트 변환 전에 실패했다면 예약분을 돌려준다 (정산을 마쳤다면 무시됨)
+        reservation.settle(0)
         return {"success": False, "error": str(e)}
 
 
+MUSIC_PROMPT_MAX_TOKENS = 300   # 음악 생성 프롬프트 변환 응답 길이
+
+
 @celery.task(bind=True, max_retries=2)
 def generate_music_async(self, session_id, user_id, provider, selected_model_id,
-                          prompt_model_id, system_prompt, user_message, upload_folder):
+                          prompt_model_id, system_prompt, user_message, upload_folder,
+                          quota_reservation=None):
     """
     음악 생성 백그라운드 작업
 
@@ -501,16 +691,27 @@ def generate_music_async(self, session_id, user_id, provider, selected_model_id,
     from extensions import db
     from models import Message, ChatFile
     from services.ai_service import generate_ai_response
+    from services.quota_service import QuotaReservation
+
+    # 라우트가 잡아 둔 사용 한도 예약 (QuotaReservation.to_payload)
+    reservation = QuotaReservation.from_payload(quota_reservation)
 
     try:
         # 1. 프롬프트 최적화 (텍스트 → 음악 작곡/가사 프롬프트)
+        prompt_usage = {}
         final_prompt = generate_ai_response(
             model_id=prompt_model_id,
             system_prompt=system_prompt or "Convert to English music generation prompt including style, mood, and lyrics if necessary.",
             messages=[{"role": "user", "content": user_message}],
-            max_tokens=300,
+            max_tokens=MUSIC_PROMPT_MAX_TOKENS,
             upload_folder=upload_folder,
+            usage=prompt_usage,
         ).strip()
+        _record_task_usage(
+            "music_prompt", prompt_model_id, prompt_usage, user_id, session_id,
+            (system_prompt or "") + user_message, final_prompt,
+        )
+        _settle_task_quota(reservation, prompt_usage, (system_prompt or "") + user_message, final_prompt)
 
         if final_prompt.startswith("⚠️") or "차단" in final_prompt or "Error" in final_prompt:
             final_prompt = user_message
@@ -529,10 +730,10 @@ def generate_music_async(self, session_id, user_id, provider, selected_model_id,
                 "https://generativelanguage.googleapis.com/v1beta/models/"
                 f"{selected_model_id}:predict?key={os.getenv('GOOGLE_API_KEY')}"
             )
-            response = http_requests.post(api_url, headers={"Content-Type": "application/json"}, json={
+            response = get_http_client().post(api_url, headers={"Content-Type": "application/json"}, json={
                 "instances": [{"prompt": final_prompt}],
                 "parameters": {"sampleCount": 1},
-            })
+            }, timeout=LONG_TIMEOUT)
             
             if response.status_code != 200:
                 raise Exception(f"Google Music API Error ({response.status_code}): {response.text}")
@@ -560,7 +761,7 @@ def generate_music_async(self, session_id, user_id, provider, selected_model_id,
             payload = {"prompt": final_prompt, "model": selected_model_id}
             
             # 1. 생성 요청 (Task 생성)
-            resp = http_requests.post(mureka_api_url, headers=headers, json=payload)
+            resp = get_http_client().post(mureka_api_url, headers=headers, json=payload, timeout=LONG_TIMEOUT)
             if resp.status_code != 200:
                 raise Exception(f"Mureka API Error: {resp.text}")
                 
@@ -573,7 +774,7 @@ def generate_music_async(self, session_id, user_id, provider, selected_model_id,
             status_url = f"https://api.mureka.ai/v1/tasks/{task_id}"
             audio_url = None
             for _ in range(60): # 최대 5분 대기 (5초 간격 * 60)
-                status_resp = http_requests.get(status_url, headers=headers)
+                status_resp = get_http_client().get(status_url, headers=headers)
                 if status_resp.status_code == 200:
                     status_data = status_resp.json()
                     status = status_data.get("status")
@@ -588,7 +789,7 @@ def generate_music_async(self, session_id, user_id, provider, selected_model_id,
                 raise Exception("Mureka 오디오 생성 타임아웃 (5분 초과)")
                 
             # 3. 오디오 다운로드
-            audio_data = http_requests.get(audio_url).content
+            audio_data = get_http_client().get(audio_url, timeout=LONG_TIMEOUT).content
             generated_audio_filename = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_mureka.mp3"
 
         else:
@@ -636,10 +837,136 @@ def generate_music_async(self, session_id, user_id, provider, selected_model_id,
     except Exception as e:
         print(f"Music generation task error: {e}")
         if self.request.retries < self.max_retries:
-            raise self.retry(exc=e, countdown=5)
+            # 정산을 마쳤다면 재시도의 프롬프트 변환 토큰은 예약 없이 실제 사용량만 더한다
+            raise self.retry(exc=e, countdown=5, kwargs={
+                **self.request.kwargs, "quota_reservation": reservation.to_payload(),
+            })
+        # 프롬프트 변환 전에 실패했다면 예약분을 돌려준다 (정산을 마쳤다면 무시됨)
+        reservation.settle(0)
         return {"success": False, "error": str(e)}
 
 
+SESSION_SUMMARY_SYSTEM_PROMPT = (
+    "당신은 학생과 AI 튜터의 대화를 요약하는 도우미입니다. "
+    "[기존 요약]과 [새 대화]를 합쳐 하나의 누적 요약을 작성하세요. "
+    "학생이 무엇을 질문했고, 어떤 설명/코드/결론이 나왔는지, 아직 해결되지 않은 질문이 무엇인지를 "
+    "이후 대화를 이어가는 데 필요한 만큼만 간결하게 정리하세요. "
+    "답변은 요약된 텍스트만 출력하세요."
+)
+SESSION_SUMMARY_MAX_TOKENS = 800
+SESSION_SUMMARY_MESSAGE_CHARS = 4000  # 요약 입력에서 메시지 1개당 최대 글자 수
+
+
+@celery.task(bind=True, max_retries=1)
+def summarize_session_async(self, session_id, token_budget=None):
+    """
+    긴 채팅 세션의 오래된 대화를 누적 요약으로 접는 백그라운드 작업
+
+    - 요약 경계((summary_upto_timestamp, summary_upto_message_id)) 이후 메시지 중 최근 대화(예산의 일부)는 원문으로 남기고
+      그 이전 대화를 기존 요약과 합쳐 새 요약을 만든다.
+    - 채팅 라우트는 이후 요약 + 최근 대화만 전송하므로 세션 길이와 무관하게 프롬프트 크기가 일정하다.
+
+    Args:
+        session_id: 채팅 세션 ID
+        token_budget: 페르소나의 대화 이력 토큰 예산
+    """
+    from extensions import db, cache
+    from models import ChatSession, Message
+    from services.ai_service import generate_ai_response, is_error_response
+    from services.history_service import (
+        DEFAULT_HISTORY_TOKEN_BUDGET,
+        SUMMARY_LOCK_KEY,
+        SUMMARY_TAIL_RATIO,
+        after_boundary,
+        count_message_tokens,
+        count_tokens,
+        summary_boundary,
+    )
+
+    lock_key = SUMMARY_LOCK_KEY.format(session_id=session_id)
+    retrying = False
+    try:
+        chat_session = db.session.get(ChatSession, session_id)
+        if not chat_session:
+            return {"success": False, "error": "세션 없음"}
+
+        query = Message.query.filter(Message.session_id == session_id)
+        boundary = summary_boundary(chat_session)
+        if boundary:
+            query = after_boundary(query, boundary)
+        messages = query.order_by(Message.timestamp.asc(), Message.id.asc()).all()
+
+        # 최근 대화(tail)는 원문으로 유지: 뒤에서부터 tail 예산만큼
+        budget = token_budget or DEFAULT_HISTORY_TOKEN_BUDGET
+        tail_budget = int(budget * SUMMARY_TAIL_RATIO)
+        split, tail_tokens = len(messages), 0
+        for i in range(len(messages) - 1, -1, -1):
+            m = messages[i]
+            image_count = len([p for p in (m.image_path or "").split(",") if p])
+            tokens = count_message_tokens(m.content, image_count)
+            if tail_tokens + tokens > tail_budget:
+                break
+            tail_tokens += tokens
+            split = i
+        # 원문 구간은 사용자 메시지로 시작하도록 경계 조정
+        while split < len(messages) and not messages[split].is_user:
+            split += 1
+
+        to_fold = messages[:split]
+        if not to_fold:
+            return {"success": True, "session_id": session_id, "folded": 0}
+
+        transcript = "\n\n".join(
+            f"{'학생' if m.is_user else 'AI'}: {(m.content or '')[:SESSION_SUMMARY_MESSAGE_CHARS]}"
+            for m in to_fold
+        )
+        user_prompt = (
+            f"[기존 요약]\n{chat_session.summary or '(없음)'}\n\n"
+            f"[새 대화]\n{transcript}"
+        )
+
+        summary_model_id = _select_cheap_model_id()
+        summary_usage = {}
+        summary = generate_ai_response(
+            model_id=summary_model_id,
+            system_prompt=SESSION_SUMMARY_SYSTEM_PROMPT,
+            messages=[{"role": "user", "content": user_prompt}],
+            max_tokens=SESSION_SUMMARY_MAX_TOKENS,
+            upload_folder="",
+            usage=summary_usage,
+        ).strip()
+        _record_task_usage(
+            "session_summary", summary_model_id, summary_usage, chat_session.user_id, session_id,
+            SESSION_SUMMARY_SYSTEM_PROMPT + user_prompt, summary,
+        )
+        if not summary:
+            raise ValueError("요약 결과가 비어있습니다.")
+        if is_error_response(summary):
+            # 안전 차단/공급사 오류 문구를 요약으로 저장하면 이후 모든 턴의 문맥이 오염되므로 재시도(실패 시 기존 요약 유지)
+            raise ValueError(f"요약 대신 오류 응답을 받았습니다: {summary[:100]}")
+
+        chat_session.summary = summary
+        chat_session.summary_upto_message_id = to_fold[-1].id
+        chat_session.summary_upto_timestamp = to_fold[-1].timestamp
+        chat_session.summary_tokens = count_tokens(summary)
+        db.session.commit()
+
+        print(f"📝 세션 요약 완료: session_id={session_id}, {len(to_fold)}개 메시지 → {chat_session.summary_tokens} 토큰")
+        return {"success": True, "session_id": session_id, "folded": len(to_fold)}
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ 세션 요약 실패 (session_id={session_id}): {e}")
+        if self.request.retries < self.max_retries:
+            retrying = True  # 재시도 동안은 락 유지 (중복 예약 방지)
+            raise self.retry(exc=e, countdown=30)
+        return {"success": False, "error": str(e)}
+
+    finally:
+        if not retrying:
+            cache.delete(lock_key)
+
+
 # Celery Beat 스케줄 (주기적 작업)
 celery.conf.beat_schedule = {
     'cleanup-old-failed-documents': {
@@ -650,4 +977,8 @@ celery.conf.beat_schedule = {
         'task': 'tasks.reprocess_failed_documents',
         'schedule': 3600.0,  # 1시간마다
     },
+    'maintain-vector-index': {
+        'task': 'tasks.maintain_vector_index',
+        'schedule': 3600.0,  # 1시간마다
+    },
 }